@@ -4,14 +4,35 @@ OrganizadorDeLotes
 A QGIS plugin to organize lots within a block.
 """
 from qgis.PyQt.QtCore import QSettings, QTranslator, QCoreApplication, Qt
-from qgis.PyQt.QtGui import QIcon
-from qgis.PyQt.QtWidgets import QAction, QMessageBox
-from qgis.gui import QgsMapToolIdentifyFeature
-from qgis.core import QgsProject, QgsFeature, QgsProcessing, QgsProcessingFeedback, QgsMessageLog, Qgis
+from qgis.PyQt.QtGui import QIcon, QColor
+from qgis.PyQt.QtWidgets import QAction, QMessageBox, QInputDialog
+from qgis.gui import QgsMapToolIdentifyFeature, QgsHighlight
+from qgis.core import (QgsProject, QgsFeatureRequest, QgsExpression, QgsProcessingFeedback, QgsMessageLog, Qgis,
+                       QgsApplication, NULL)
 
 from .OrganizadorLotesdialog import OrganizadorDeLotesDialog
+from .conexao_pg import abrir_conexao, abrir_conexao_leitura, ATRASO_MAXIMO_REPLICA, PoliticaRetentativa, Sessao
+from .novaordem import (existe_quadra, excluir_quadra, desfazer_quadras, posicao_lote, inserir_lote, remover_lote,
+                        GRAVADA, OCUPADA, MODOS_GRAVACAO, MODO_SUBSTITUIR)
+from .lotes import LotesColunares, IndiceOrdem
+from .execucao_quadras import ERRO
+from .execucoes import Execucao, MOTOR_QGIS, LEITURA, cronometrar
+from .reorganizacao import DestinoBanco, reorganizar_lotes
+from .fonte_camada import FonteLotesCamada
+from .resumo_quadras import CacheResumoQuadras
+from .perfil import perfilar
+from .tarefa_escuta import TarefaEscuta
+from .municipios import Municipio, obter_municipio, PADRAO
+from .camada_ordem import CamadaOrdem
+from .cache_quadras import CacheQuadras
+from .pre_carga import FerramentaQuadra, TarefaPreCarga
+from .primeiro_lote import IndiceLotesQuadra, FerramentaPrimeiroLote
+from collections import OrderedDict
+from functools import partial
 import os.path
-import processing
+
+# Quantas quadras mantêm o índice de ordens em memória (as mais recentes)
+MAX_INDICES_ORDEM = 32
 
 class OrganizadorDeLotes:
 
@@ -21,6 +42,18 @@ class OrganizadorDeLotes:
         self.tool = None
         self.dlg = None
         self.first_start = True
+        self.resumos = CacheResumoQuadras()
+        self.indices_ordem = OrderedDict()
+        self.indices_espaciais = OrderedDict()
+        self.destaque = None
+        self.tarefa_escuta = None
+        self.municipio_ativo = Municipio()
+        self.camada_ordem = None
+        self.pre_carga = CacheQuadras()
+        self.tarefa_pre_carga = None
+        # Camada de lotes cujas alterações invalidam o cache (ver observar_camada_lotes)
+        self.camada_observada = None
+        self.versao_lotes = 0
 
         # Carregar tradução
         locale = QSettings().value('locale/userLocale')[0:2]
@@ -68,7 +101,9 @@ class OrganizadorDeLotes:
                 if hasattr(self.dlg, 'spinOrdemPrimeira'):
                     self.dlg.spinOrdemPrimeira.setValue(1)
                 if hasattr(self.dlg, 'cmbConexao') and self.dlg.cmbConexao.count() > 0:
-                    self.dlg.cmbConexao.setCurrentIndex(0)
+                    # A conexão do município ativo, se for uma das conexões salvas
+                    self.dlg.cmbConexao.setCurrentIndex(
+                        max(0, self.dlg.cmbConexao.findText(self.municipio_ativo.conexao or '')))
 
             QgsMessageLog.logMessage("Valores do plugin resetados com sucesso", 'OrganizadorDeLotes', Qgis.Info)
         except Exception as e:
@@ -83,11 +118,44 @@ class OrganizadorDeLotes:
             parent=self.iface.mainWindow()
         )
         self.first_start = True
+        self.iniciar_escuta()
 
     def unload(self):
         for action in self.actions:
             self.iface.removePluginVectorMenu(self.tr(u'&OrganizadorDeLotes'), action)
             self.iface.removeToolBarIcon(action)
+        if self.tarefa_escuta is not None:
+            self.tarefa_escuta.cancel()
+            self.tarefa_escuta = None
+        self.cancelar_pre_carga()
+        self.observar_camada_lotes(None)
+
+    def iniciar_escuta(self):
+        """
+        Inicia a reorganização contínua em segundo plano se QSettings
+        'OrganizadorDeLotes/escutar' estiver ligado (ver tarefa_escuta)
+        """
+        settings = QSettings()
+        if str(settings.value('OrganizadorDeLotes/escutar', '')).lower() not in ('1', 'true'):
+            return
+        try:
+            municipio = self.municipio()
+        except Exception as e:
+            QgsMessageLog.logMessage(f"Reorganização contínua não iniciada: {str(e)}", 'OrganizadorDeLotes',
+                                     Qgis.Warning)
+            return
+        conexao = settings.value('OrganizadorDeLotes/conexao_escuta', '') or municipio.conexao
+        if not conexao:
+            QgsMessageLog.logMessage("Reorganização contínua ligada sem 'OrganizadorDeLotes/conexao_escuta'",
+                                     'OrganizadorDeLotes', Qgis.Warning)
+            return
+        self.tarefa_escuta = TarefaEscuta(conexao, canal=municipio.canal, tabela_lotes=municipio.tabela_lotes,
+                                          modo=self.modo_gravacao(),
+                                          conexao_leitura=settings.value('OrganizadorDeLotes/conexao_leitura', '')
+                                          or municipio.conexao_leitura,
+                                          esquema=municipio.esquema, tabela=municipio.tabela_novaordem,
+                                          campos=municipio.campos)
+        QgsApplication.taskManager().addTask(self.tarefa_escuta)
 
     def listar_conexoes_postgis(self):
         settings = QSettings()
@@ -96,22 +164,266 @@ class OrganizadorDeLotes:
         settings.endGroup()
         return conexoes
 
+    def modo_gravacao(self):
+        """Modo de gravação na novaordem (QSettings 'OrganizadorDeLotes/modo_gravacao')"""
+        modo = QSettings().value('OrganizadorDeLotes/modo_gravacao', MODO_SUBSTITUIR)
+        return modo if modo in MODOS_GRAVACAO else MODO_SUBSTITUIR
+
+    def municipio(self):
+        """
+        Município ativo: QSettings 'OrganizadorDeLotes/municipio' no arquivo de perfis
+        'OrganizadorDeLotes/municipios' (ver municipios). Sem perfis, o padrão, com a
+        tabela de lotes de 'OrganizadorDeLotes/tabela_lotes'.
+        """
+        municipio = obter_municipio()
+        if municipio.nome == PADRAO:
+            municipio = municipio.com(tabela_lotes=QSettings().value('OrganizadorDeLotes/tabela_lotes', '') or None)
+        return municipio
+
+    def abrir_leitura(self, conexao):
+        """
+        Conexão somente leitura: a réplica em QSettings 'OrganizadorDeLotes/conexao_leitura'
+        (nome de conexão ou DSN), se o atraso dela não passar de
+        'OrganizadorDeLotes/atraso_maximo_replica' segundos; senão o primário 'conexao'
+        """
+        return self.fabrica_leitura(conexao)()
+
+    def fabrica_leitura(self, conexao):
+        """abrir_leitura com as configurações já lidas, para abrir a conexão fora da linha principal"""
+        settings = QSettings()
+        conexao_leitura = (settings.value('OrganizadorDeLotes/conexao_leitura', '')
+                           or self.municipio_ativo.conexao_leitura)
+        atraso_maximo = float(settings.value('OrganizadorDeLotes/atraso_maximo_replica', ATRASO_MAXIMO_REPLICA))
+        return partial(abrir_conexao_leitura, conexao, conexao_leitura, atraso_maximo)
+
+    def chave_quadra(self, conexao, ins_quadra):
+        return (self.municipio_ativo.nome, conexao, ins_quadra)
+
+    def quadra_pre_carregada(self, ins_quadra):
+        """Lotes e novaordem da quadra pré-carregados pela ferramenta de seleção, ou None"""
+        conexao = self.dlg.cmbConexao.currentText() if self.dlg else ''
+        return self.pre_carga.obter(self.chave_quadra(conexao, ins_quadra)) if conexao else None
+
+    def pre_carregar(self, ins_quadra):
+        """Pré-carrega em segundo plano a quadra sob o cursor (ver pre_carga), se ainda não estiver no cache"""
+        conexao = self.dlg.cmbConexao.currentText() if self.dlg else ''
+        camada_lotes = self.camada_lotes()
+        if not conexao or not camada_lotes:
+            return
+        self.observar_camada_lotes(camada_lotes)
+        chave = self.chave_quadra(conexao, ins_quadra)
+        if self.pre_carga.obter(chave) is not None:
+            return
+        if self.tarefa_pre_carga is not None and self.tarefa_pre_carga.chave == chave:
+            return
+        self.cancelar_pre_carga()
+        municipio = self.municipio_ativo
+        self.tarefa_pre_carga = TarefaPreCarga(chave, ins_quadra, camada_lotes, municipio.campos,
+                                               self.fabrica_leitura(conexao), municipio.esquema,
+                                               municipio.tabela_novaordem,
+                                               partial(self.pre_carga_concluida, versao=self.versao_lotes))
+        QgsApplication.taskManager().addTask(self.tarefa_pre_carga)
+
+    def cancelar_pre_carga(self):
+        tarefa, self.tarefa_pre_carga = self.tarefa_pre_carga, None
+        if tarefa is None:
+            return
+        try:
+            tarefa.cancel()
+        except RuntimeError:
+            # A tarefa já terminou e foi destruída pelo gerenciador
+            pass
+
+    def observar_camada_lotes(self, camada):
+        """
+        Liga as alterações da camada de lotes (edição ou gravação de feições e
+        atributos) a lotes_alterados, desligando a camada observada antes.
+        """
+        if camada is self.camada_observada:
+            return
+        sinais = ('dataChanged', 'committedFeaturesAdded', 'committedFeaturesRemoved',
+                  'committedAttributeValuesChanges', 'committedGeometriesChanges')
+        if self.camada_observada is not None:
+            for sinal in sinais:
+                try:
+                    getattr(self.camada_observada, sinal).disconnect(self.lotes_alterados)
+                except (RuntimeError, TypeError):
+                    # A camada já foi removida do projeto (ou o sinal, desligado)
+                    pass
+        self.camada_observada = camada
+        if camada is not None:
+            for sinal in sinais:
+                getattr(camada, sinal).connect(self.lotes_alterados)
+
+    def lotes_alterados(self, *args):
+        """
+        A camada de lotes mudou: as quadras pré-carregadas (e os índices lidos
+        dela) deixam de valer, e a pré-carga em andamento é descartada.
+        """
+        self.versao_lotes += 1
+        self.cancelar_pre_carga()
+        self.pre_carga.limpar()
+        self.indices_ordem.clear()
+        self.indices_espaciais.clear()
+
+    def pre_carga_concluida(self, chave, quadra, versao=None):
+        if self.tarefa_pre_carga is not None and self.tarefa_pre_carga.chave == chave:
+            self.tarefa_pre_carga = None
+        if versao is not None and versao != self.versao_lotes:
+            # Lida antes de uma alteração da camada de lotes
+            return
+        self.pre_carga.guardar(chave, quadra)
+        _, _, ins_quadra = chave
+        # A prévia da quadra já escolhida passa a sair do cache
+        if self.dlg is not None and self.dlg.spinInsQuadra.value() == ins_quadra:
+            self.indices_ordem.pop(ins_quadra, None)
+            self.atualizar_previa(self.dlg.spinOrdemPrimeira.value())
+
+    def carregar_resumos(self, forcar=False):
+        """Carrega (uma consulta) o resumo de todas as quadras da conexão selecionada"""
+        conexao = self.dlg.cmbConexao.currentText() if self.dlg else ''
+        municipio = self.municipio_ativo
+        # O cache vale para o par (município, conexão)
+        chave = (municipio.nome, conexao)
+        if not conexao or not (forcar or self.resumos.vencido(chave)):
+            return
+        try:
+            conn = self.abrir_leitura(conexao)
+            try:
+                quantidade = self.resumos.carregar(conn, municipio.tabela_lotes, chave, municipio.esquema,
+                                                   municipio.tabela_novaordem, campos=municipio.campos)
+            finally:
+                conn.close()
+            QgsMessageLog.logMessage(f"Resumo de {quantidade} quadras carregado", 'OrganizadorDeLotes', Qgis.Info)
+        except Exception as e:
+            QgsMessageLog.logMessage(f"Erro ao carregar o resumo das quadras: {str(e)}",
+                                     'OrganizadorDeLotes', Qgis.Warning)
+        self.atualizar_limites_quadra(self.dlg.spinInsQuadra.value())
+
+    def atualizar_limites_quadra(self, ins_quadra):
+        """Limita spinOrdemPrimeira às ordens da quadra e mostra o resumo dela"""
+        if not self.dlg or not hasattr(self.dlg, 'lblResumoQuadra'):
+            return
+        resumo = self.resumos.get(ins_quadra)
+        if resumo is None or resumo.ordem_maxima is None:
+            # Sem resumo carregado (ou quadra sem ordens) o campo fica com os limites do .ui
+            self.dlg.spinOrdemPrimeira.setRange(*self.limites_ordem_primeira)
+            self.dlg.lblResumoQuadra.setText(
+                f"Quadra {ins_quadra} sem lotes com ordem na tabela de origem." if len(self.resumos) else "")
+            self.atualizar_previa(self.dlg.spinOrdemPrimeira.value())
+            return
+
+        self.dlg.spinOrdemPrimeira.setRange(max(1, resumo.ordem_minima), max(1, resumo.ordem_maxima))
+        texto = f"{resumo.lotes} lotes, ordem de {resumo.ordem_minima} a {resumo.ordem_maxima}. "
+        if resumo.ultima_reorganizacao is not None:
+            quando = resumo.ultima_reorganizacao.astimezone().strftime('%d/%m/%Y %H:%M')
+            texto += f"Reorganizada em {quando}."
+        elif resumo.reorganizada:
+            texto += "Já tem registros na novaordem."
+        else:
+            texto += "Ainda não reorganizada."
+        self.dlg.lblResumoQuadra.setText(texto)
+        self.atualizar_previa(self.dlg.spinOrdemPrimeira.value())
+
+    def camada_lotes(self):
+        """Camada de lotes do projeto (a camada_lotes do município, ou qualquer uma com 'lote' no nome)"""
+        camadas = list(QgsProject.instance().mapLayers().values())
+        nome = self.municipio_ativo.camada_lotes.lower()
+        for layer in camadas:
+            if nome in layer.name().lower():
+                return layer
+        for layer in camadas:
+            if 'lote' in layer.name().lower():
+                return layer
+        return None
+
+    def indice_ordem(self, ins_quadra):
+        """Índice de ordens da quadra (lido da camada uma vez e mantido para as próximas prévias)"""
+        indice = self.indices_ordem.get(ins_quadra)
+        if indice is not None:
+            self.indices_ordem.move_to_end(ins_quadra)
+            return indice
+
+        pre_carregada = self.quadra_pre_carregada(ins_quadra)
+        if pre_carregada is not None:
+            indice = IndiceOrdem.de_lotes(pre_carregada.lotes, pre_carregada.ids)
+        else:
+            camada_lotes = self.camada_lotes()
+            if not camada_lotes:
+                return None
+            matricula, quadra, ordem = self.municipio_ativo.campos
+            request = QgsFeatureRequest()
+            request.setFilterExpression(QgsExpression.createFieldEqualityExpression(quadra, ins_quadra))
+            request.setFlags(QgsFeatureRequest.NoGeometry)
+            request.setSubsetOfAttributes([matricula, ordem], camada_lotes.fields())
+            ids = []
+            pares = []
+            for f in camada_lotes.getFeatures(request):
+                ids.append(f.id())
+                pares.append((f[matricula], f[ordem]))
+            indice = IndiceOrdem.de_lotes(LotesColunares.de_quadra(ins_quadra, pares), ids)
+
+        self.indices_ordem[ins_quadra] = indice
+        if len(self.indices_ordem) > MAX_INDICES_ORDEM:
+            self.indices_ordem.popitem(last=False)
+        return indice
+
+    def atualizar_previa(self, ordem_primeira):
+        """Mostra o início e o fim da nova sequência e destaca no mapa o lote que vira o 1"""
+        if not self.dlg or not hasattr(self.dlg, 'lblPrevia'):
+            return
+        self.limpar_destaque()
+        try:
+            indice = self.indice_ordem(self.dlg.spinInsQuadra.value())
+        except Exception as e:
+            QgsMessageLog.logMessage(f"Erro ao montar a prévia: {str(e)}", 'OrganizadorDeLotes', Qgis.Warning)
+            indice = None
+        if not indice:
+            self.dlg.lblPrevia.setText("")
+            return
+
+        inicio, fim = indice.previa(ordem_primeira)
+        texto = ", ".join(f"{n_ordem} (era {ordem})" for n_ordem, ordem, _ in inicio)
+        if fim:
+            texto += " ... " + ", ".join(f"{n_ordem} (era {ordem})" for n_ordem, ordem, _ in fim)
+        self.dlg.lblPrevia.setText(f"Nova sequência: {texto}")
+
+        primeiro = indice.primeiro(ordem_primeira)
+        if primeiro is None or not self.iface:
+            return
+        camada_lotes = self.camada_lotes()
+        lote = camada_lotes.getFeature(indice.ids[primeiro])
+        if lote.hasGeometry():
+            self.destaque = QgsHighlight(self.iface.mapCanvas(), lote.geometry(), camada_lotes)
+            self.destaque.setColor(QColor(255, 0, 0))
+            self.destaque.setWidth(3)
+            self.destaque.show()
+
+    def limpar_destaque(self):
+        if self.destaque is not None:
+            self.destaque.hide()
+            if self.iface:
+                self.iface.mapCanvas().scene().removeItem(self.destaque)
+            self.destaque = None
+
     def ativarFerramentaSelecao(self):
         if not self.iface or not self.dlg:
             return
 
+        nome_camada = self.municipio_ativo.camada_quadras
         quadra_layer = None
         for layer in QgsProject.instance().mapLayers().values():
-            if layer.name() == "Quadra":
+            if layer.name() == nome_camada:
                 quadra_layer = layer
                 break
 
         if not quadra_layer:
-            QMessageBox.warning(self.iface.mainWindow(), "Aviso", "Camada 'Quadra' não encontrada!")
+            QMessageBox.warning(self.iface.mainWindow(), "Aviso", f"Camada '{nome_camada}' não encontrada!")
             return
 
-        self.tool = QgsMapToolIdentifyFeature(self.iface.mapCanvas())
-        self.tool.setLayer(quadra_layer)
+        # Parar o cursor sobre uma quadra já pré-carrega os lotes dela
+        self.tool = FerramentaQuadra(self.iface.mapCanvas(), quadra_layer, self.municipio_ativo.campos.quadra,
+                                     self.pre_carregar, self.cancelar_pre_carga)
         self.tool.featureIdentified.connect(self.capturarInsQuadra)
         self.iface.mapCanvas().setMapTool(self.tool)
         self.iface.mainWindow().setCursor(Qt.PointingHandCursor)
@@ -121,8 +433,10 @@ class OrganizadorDeLotes:
             return
 
         if feature.isValid():
-            if 'ins_quadra' in feature.fields().names():
-                ins_quadra = feature['ins_quadra']
+            campo_quadra = self.municipio_ativo.campos.quadra
+            if campo_quadra in feature.fields().names():
+                ins_quadra = feature[campo_quadra]
+                self.pre_carregar(ins_quadra)
                 QMessageBox.information(self.dlg, "Quadra Capturada", f"Quadra capturada: {ins_quadra}")
                 if hasattr(self.dlg, 'spinInsQuadra'):
                     self.dlg.spinInsQuadra.setValue(ins_quadra)
@@ -131,6 +445,225 @@ class OrganizadorDeLotes:
             self.iface.mainWindow().unsetCursor()
             self.tool = None
 
+    def mostrar_camada_ordem(self):
+        """Carrega (uma consulta) a camada de rótulos de n_ordem de todo o município (ver camada_ordem)"""
+        conexao = self.dlg.cmbConexao.currentText()
+        if not conexao:
+            QMessageBox.warning(self.dlg, "Aviso", "Selecione uma conexão PostgreSQL!")
+            return
+        # A mesma camada é recarregada (carregar() tira a anterior do projeto)
+        if self.camada_ordem is None or self.camada_ordem.municipio.nome != self.municipio_ativo.nome:
+            self.remover_camada_ordem()
+            self.camada_ordem = CamadaOrdem(self.municipio_ativo, self.iface.mapCanvas() if self.iface else None)
+        try:
+            conn = self.abrir_leitura(conexao)
+            try:
+                quantidade = self.camada_ordem.carregar(conn)
+            finally:
+                conn.close()
+        except Exception as e:
+            self.remover_camada_ordem()
+            QgsMessageLog.logMessage(f"Erro ao carregar a camada de ordem: {str(e)}", 'OrganizadorDeLotes',
+                                     Qgis.Critical)
+            QMessageBox.critical(self.dlg, "Erro", f"Erro ao carregar a camada de ordem: {str(e)}")
+            return
+        QgsMessageLog.logMessage(f"Camada de ordem carregada com {quantidade} lotes", 'OrganizadorDeLotes',
+                                 Qgis.Info)
+
+    def remover_camada_ordem(self):
+        """Tira do projeto a camada de rótulos de n_ordem (se carregada) e a esquece"""
+        if self.camada_ordem is not None:
+            self.camada_ordem.remover()
+            self.camada_ordem = None
+
+    def atualizar_camada_ordem(self, conexao, quadras):
+        """Troca na camada de rótulos (se carregada) só as feições das quadras gravadas"""
+        if self.camada_ordem is None or not self.camada_ordem.ativa():
+            return
+        try:
+            # Lido do primário: a réplica pode ainda não ter a gravação
+            conn = abrir_conexao(conexao)
+            try:
+                self.camada_ordem.atualizar_quadras(conn, quadras)
+            finally:
+                conn.close()
+        except Exception as e:
+            QgsMessageLog.logMessage(f"Erro ao atualizar a camada de ordem: {str(e)}", 'OrganizadorDeLotes',
+                                     Qgis.Warning)
+
+    def indice_espacial(self, ins_quadra):
+        """Índice espacial dos lotes da quadra (lido da camada uma vez, como o indice_ordem)"""
+        indice = self.indices_espaciais.get(ins_quadra)
+        if indice is not None:
+            self.indices_espaciais.move_to_end(ins_quadra)
+            return indice
+        camada_lotes = self.camada_lotes()
+        if not camada_lotes:
+            return None
+        indice = IndiceLotesQuadra(camada_lotes, ins_quadra, self.municipio_ativo.campos)
+        self.indices_espaciais[ins_quadra] = indice
+        if len(self.indices_espaciais) > MAX_INDICES_ORDEM:
+            self.indices_espaciais.popitem(last=False)
+        return indice
+
+    def ativarFerramentaPrimeiroLote(self):
+        """Ferramenta de clique no lote da quadra capturada que passa a ser o primeiro (escolherPrimeiroLote)"""
+        if not self.iface or not self.dlg:
+            return
+
+        ins_quadra = self.dlg.spinInsQuadra.value()
+        try:
+            indice = self.indice_espacial(ins_quadra)
+        except Exception as e:
+            QgsMessageLog.logMessage(f"Erro ao indexar os lotes da quadra {ins_quadra}: {str(e)}",
+                                     'OrganizadorDeLotes', Qgis.Warning)
+            indice = None
+        if indice is None:
+            QMessageBox.warning(self.iface.mainWindow(), "Aviso", "Camada de lotes não encontrada no projeto!")
+            return
+        if not len(indice):
+            QMessageBox.warning(self.dlg, "Aviso", f"A quadra {ins_quadra} não tem lotes na camada. "
+                                                   "Selecione a quadra primeiro.")
+            return
+
+        self.tool = FerramentaPrimeiroLote(self.iface.mapCanvas(), indice, self.escolherPrimeiroLote)
+        self.iface.mapCanvas().setMapTool(self.tool)
+        self.iface.mainWindow().setCursor(Qt.PointingHandCursor)
+
+    def escolherPrimeiroLote(self, ident):
+        """Leva a ordem do lote clicado para spinOrdemPrimeira (e, por ela, para a prévia)"""
+        if not self.dlg or self.tool is None:
+            return
+        barra = self.iface.mainWindow().statusBar()
+        if ident is None:
+            # A ferramenta continua ativa para outro clique
+            barra.showMessage(f"Clique num lote da quadra {self.tool.indice.ins_quadra}.", 5000)
+            return
+
+        valor = self.tool.indice.ordens[ident]
+        ordem = None
+        # Atributo vazio na camada vem como NULL (QVariant), não como None
+        if valor not in (None, NULL):
+            try:
+                ordem = int(valor)
+            except (TypeError, ValueError):
+                pass
+        minimo, maximo = self.dlg.spinOrdemPrimeira.minimum(), self.dlg.spinOrdemPrimeira.maximum()
+        if ordem is None or not minimo <= ordem <= maximo:
+            barra.showMessage(f"O lote clicado não tem uma ordem válida ({valor}).", 5000)
+            return
+        barra.clearMessage()
+        self.iface.mapCanvas().unsetMapTool(self.tool)
+        self.iface.mainWindow().unsetCursor()
+        self.tool = None
+        self.dlg.spinOrdemPrimeira.setValue(ordem)
+
+    def ativarFerramentaLote(self):
+        """Ferramenta de clique num lote para inseri-lo na novaordem ou removê-lo (editarLote)"""
+        if not self.iface or not self.dlg:
+            return
+
+        camada_lotes = self.camada_lotes()
+        if not camada_lotes:
+            QMessageBox.warning(self.iface.mainWindow(), "Aviso", "Camada de lotes não encontrada no projeto!")
+            return
+
+        self.tool = QgsMapToolIdentifyFeature(self.iface.mapCanvas())
+        self.tool.setLayer(camada_lotes)
+        self.tool.featureIdentified.connect(self.editarLote)
+        self.iface.mapCanvas().setMapTool(self.tool)
+        self.iface.mainWindow().setCursor(Qt.PointingHandCursor)
+
+    def editarLote(self, feature):
+        """
+        Remove o lote clicado da novaordem, se ele estiver nela, ou o insere numa
+        posição escolhida. Só os lotes depois da posição são deslocados.
+        """
+        if self.iface:
+            self.iface.mapCanvas().unsetMapTool(self.tool)
+            self.iface.mainWindow().unsetCursor()
+            self.tool = None
+        if not self.dlg or not feature.isValid():
+            return
+
+        conexao = self.dlg.cmbConexao.currentText()
+        matricula_campo, quadra_campo, _ = self.municipio_ativo.campos
+        if not conexao:
+            QMessageBox.warning(self.dlg, "Aviso", "Selecione uma conexão PostgreSQL!")
+            return
+        if not {matricula_campo, quadra_campo} <= set(feature.fields().names()):
+            QMessageBox.warning(self.dlg, "Aviso", f"O lote não tem os campos {matricula_campo} e {quadra_campo}!")
+            return
+        matricula, ins_quadra = feature[matricula_campo], feature[quadra_campo]
+        municipio = self.municipio_ativo
+        opcoes = {'esquema': municipio.esquema, 'tabela': municipio.tabela_novaordem}
+
+        try:
+            conn = abrir_conexao(conexao)
+            try:
+                atual, ultima = posicao_lote(conn, ins_quadra, matricula, **opcoes)
+            finally:
+                conn.close()
+
+            if atual is not None:
+                resposta = QMessageBox.question(
+                    self.dlg, "Remover Lote",
+                    f"Remover a matrícula {matricula} (ordem {atual}) da quadra {ins_quadra} na novaordem?\n\n"
+                    f"Os lotes depois dela sobem uma posição.",
+                    QMessageBox.Yes | QMessageBox.No)
+                if resposta == QMessageBox.No:
+                    return
+                operacao = partial(remover_lote, ins_quadra=ins_quadra, matricula=matricula, aguardar=False,
+                                   **opcoes)
+            else:
+                n_ordem, ok = QInputDialog.getInt(
+                    self.dlg, "Inserir Lote",
+                    f"Posição da matrícula {matricula} na quadra {ins_quadra} (os lotes dali em diante "
+                    f"descem uma posição):", (ultima or 0) + 1, 1, (ultima or 0) + 1)
+                if not ok:
+                    return
+                operacao = partial(inserir_lote, ins_quadra=ins_quadra, matricula=matricula, n_ordem=n_ordem,
+                                   aguardar=False, **opcoes)
+
+            with Sessao(partial(abrir_conexao, conexao)) as sessao:
+                tentativas = []
+
+                def alterar():
+                    if tentativas:
+                        # A conexão pode ter caído depois do COMMIT da tentativa anterior: a
+                        # alteração não é idempotente, então confere antes de repeti-la
+                        agora, _ = posicao_lote(sessao.conn, ins_quadra, matricula, **opcoes)
+                        if (agora is None) != (atual is None):
+                            return {'situacao': GRAVADA, 'deslocados': None,
+                                    'n_ordem': atual if atual is not None else agora}
+                    tentativas.append(True)
+                    return operacao(sessao.conn)
+
+                resultado, _, _ = PoliticaRetentativa().executar(alterar, sessao.reabrir)
+        except Exception as e:
+            QgsMessageLog.logMessage(f"Erro ao alterar o lote {matricula}: {str(e)}", 'OrganizadorDeLotes',
+                                     Qgis.Critical)
+            QMessageBox.critical(self.dlg, "Erro", f"Erro ao alterar o lote: {str(e)}")
+            return
+
+        if resultado['situacao'] == OCUPADA:
+            QMessageBox.warning(self.dlg, "Quadra em uso",
+                                f"A quadra {ins_quadra} está sendo reorganizada por outro usuário. "
+                                "Tente novamente em instantes.")
+            return
+        acao = "removida da" if atual is not None else "inserida na"
+        # deslocados None: a alteração já tinha sido confirmada numa tentativa anterior
+        deslocados = "" if resultado['deslocados'] is None else f", {resultado['deslocados']} lotes deslocados"
+        QgsMessageLog.logMessage(
+            f"Matrícula {matricula} {acao} quadra {ins_quadra} (ordem {resultado['n_ordem']}){deslocados}",
+            'OrganizadorDeLotes', Qgis.Info)
+        self.dlg.spinInsQuadra.setValue(ins_quadra)
+        self.carregar_resumos(forcar=True)
+        self.pre_carga.descartar(self.chave_quadra(conexao, ins_quadra))
+        self.atualizar_camada_ordem(conexao, [ins_quadra])
+        QMessageBox.information(self.dlg, "Sucesso",
+                                f"Matrícula {matricula} {acao} quadra {ins_quadra} na ordem {resultado['n_ordem']}.")
+
     def executar_organizacao(self):
         # Aqui vai todo o seu código de execução original
         pass
@@ -138,99 +671,21 @@ class OrganizadorDeLotes:
     def verificar_ins_quadra_existe(self, conexao, ins_quadra):
         """Verifica se já existe registros na tabela novaordem para a ins_quadra"""
         try:
-            # Abordagem mais simples: Tentar buscar um registro específico
-            # Se a consulta retornar dados, existe; se não retornar, não existe
-            alg_params = {
-                'DATABASE': conexao,
-                'SQL': f'''
-                    SELECT 1 as existe 
-                    FROM comercial_umc.novaordem 
-                    WHERE ins_quadra = {ins_quadra} 
-                    LIMIT 1
-                ''',
-                'OUTPUT': 'memory:temp_verificacao'
-            }
-            
+            # Consulta preparada uma vez por conexão e executada com ins_quadra vinculado
+            conn = self.abrir_leitura(conexao)
             try:
-                result = processing.run('native:postgisexecuteandloadsql', alg_params)
-                
-                # Verificar se a camada de resultado tem features
-                output_layer = result['OUTPUT']
-                feature_count = output_layer.featureCount()
-                
-                QgsMessageLog.logMessage(
-                    f"Verificação ins_quadra {ins_quadra}: {feature_count} registros encontrados", 
-                    'OrganizadorDeLotes', 
-                    Qgis.Info
-                )
-                
-                # Se tem features, existem registros na tabela
-                return feature_count > 0
-                
-            except Exception as e_inner:
-                QgsMessageLog.logMessage(
-                    f"Erro na consulta SQL para ins_quadra {ins_quadra}: {str(e_inner)}", 
-                    'OrganizadorDeLotes', 
-                    Qgis.Warning
-                )
-                
-                # Se deu erro na consulta, pode ser que a tabela não existe ou está vazia
-                # Vamos tentar uma abordagem ainda mais simples
-                try:
-                    alg_params_simples = {
-                        'DATABASE': conexao,
-                        'SQL': f'SELECT COUNT(*) FROM comercial_umc.novaordem WHERE ins_quadra = {ins_quadra}'
-                    }
-                    
-                    # Usar apenas postgisexecutesql sem tentar carregar resultado
-                    processing.run('native:postgisexecutesql', alg_params_simples)
-                    
-                    # Se chegou até aqui, a tabela existe
-                    # Agora vamos tentar uma consulta que falhe apenas se não houver dados
-                    alg_params_teste = {
-                        'DATABASE': conexao,
-                        'SQL': f'''
-                            DO $
-                            DECLARE
-                                rec_count INTEGER;
-                            BEGIN
-                                SELECT COUNT(*) INTO rec_count 
-                                FROM comercial_umc.novaordem 
-                                WHERE ins_quadra = {ins_quadra};
-                                
-                                IF rec_count = 0 THEN
-                                    RAISE EXCEPTION 'NO_RECORDS_FOUND';
-                                END IF;
-                            END $;
-                        '''
-                    }
-                    
-                    processing.run('native:postgisexecutesql', alg_params_teste)
-                    
-                    # Se chegou até aqui sem erro, existem registros
-                    QgsMessageLog.logMessage(
-                        f"Registros confirmados para ins_quadra {ins_quadra} via DO block", 
-                        'OrganizadorDeLotes', 
-                        Qgis.Info
-                    )
-                    return True
-                    
-                except Exception as e_do:
-                    error_msg = str(e_do).lower()
-                    if 'no_records_found' in error_msg:
-                        QgsMessageLog.logMessage(
-                            f"Nenhum registro encontrado para ins_quadra {ins_quadra}", 
-                            'OrganizadorDeLotes', 
-                            Qgis.Info
-                        )
-                        return False
-                    else:
-                        QgsMessageLog.logMessage(
-                            f"Erro no DO block para ins_quadra {ins_quadra}: {str(e_do)}", 
-                            'OrganizadorDeLotes', 
-                            Qgis.Warning
-                        )
-                        return False
+                existe = existe_quadra(conn, ins_quadra, self.municipio_ativo.esquema,
+                                       self.municipio_ativo.tabela_novaordem)
+            finally:
+                conn.close()
+
+            QgsMessageLog.logMessage(
+                f"Verificação ins_quadra {ins_quadra}: "
+                f"{'existem registros' if existe else 'nenhum registro encontrado'}", 
+                'OrganizadorDeLotes', 
+                Qgis.Info
+            )
+            return existe
                 
         except Exception as e:
             QgsMessageLog.logMessage(
@@ -247,25 +702,24 @@ class OrganizadorDeLotes:
         Se existir pelo menos 1 registro com a ins_quadra, TODOS serão excluídos
         """
         try:
-            # SQL que exclui TODOS os registros com a ins_quadra capturada
-            sql_exclusao = f'DELETE FROM comercial_umc.novaordem WHERE ins_quadra = {ins_quadra}'
-            
             QgsMessageLog.logMessage(
-                f"Executando SQL de exclusão: {sql_exclusao}", 
+                f"Excluindo registros da quadra {ins_quadra} da tabela novaordem", 
                 'OrganizadorDeLotes', 
                 Qgis.Info
             )
             
-            # Usar processing para executar o DELETE na conexão PostgreSQL
-            alg_params = {
-                'DATABASE': conexao,
-                'SQL': sql_exclusao
-            }
-            
-            processing.run('native:postgisexecutesql', alg_params)
+            # DELETE preparado, com ins_quadra como parâmetro e sob o bloqueio da quadra,
+            # repetido após erros transitórios (a espera pelo bloqueio tem tempo-limite)
+            with Sessao(partial(abrir_conexao, conexao)) as sessao:
+                excluidos, retentativas, _ = PoliticaRetentativa().executar(
+                    lambda: excluir_quadra(sessao.conn, ins_quadra, esquema=self.municipio_ativo.esquema,
+                                           tabela=self.municipio_ativo.tabela_novaordem), sessao.reabrir)
+            if retentativas:
+                QgsMessageLog.logMessage(f"Exclusão da quadra {ins_quadra} concluída após {retentativas} retentativas",
+                                         'OrganizadorDeLotes', Qgis.Warning)
             
             QgsMessageLog.logMessage(
-                f"TODOS os registros da quadra {ins_quadra} foram excluídos da tabela novaordem com sucesso!", 
+                f"TODOS os registros da quadra {ins_quadra} ({excluidos}) foram excluídos da tabela novaordem com sucesso!", 
                 'OrganizadorDeLotes', 
                 Qgis.Info
             )
@@ -279,77 +733,95 @@ class OrganizadorDeLotes:
             )
             return False
 
-    def organizar_ordem_lote(self, conexao, ins_quadra, ordem_primeira, feedback=None):
+    def desfazer_ultima_gravacao(self):
+        """Volta a quadra selecionada ao que estava antes da última gravação (histórico da novaordem)"""
+        conexao = self.dlg.cmbConexao.currentText()
+        ins_quadra = self.dlg.spinInsQuadra.value()
+        if not conexao:
+            QMessageBox.warning(self.dlg, "Aviso", "Selecione uma conexão PostgreSQL!")
+            return
+        resposta = QMessageBox.question(
+            self.dlg,
+            "Confirmar Operação",
+            f"Desfazer a última gravação da quadra {ins_quadra} na tabela novaordem?",
+            QMessageBox.Yes | QMessageBox.No
+        )
+        if resposta == QMessageBox.No:
+            return
+        try:
+            # Uma instrução troca a quadra pela versão guardada no histórico,
+            # repetida após erros transitórios como a gravação
+            with Sessao(partial(abrir_conexao, conexao)) as sessao:
+                desfeitas, retentativas, _ = PoliticaRetentativa().executar(
+                    lambda: desfazer_quadras(sessao.conn, [ins_quadra], esquema=self.municipio_ativo.esquema,
+                                             tabela=self.municipio_ativo.tabela_novaordem), sessao.reabrir)
+        except Exception as e:
+            QgsMessageLog.logMessage(f"Erro ao desfazer a quadra {ins_quadra}: {str(e)}",
+                                     'OrganizadorDeLotes', Qgis.Critical)
+            QMessageBox.critical(self.dlg, "Erro", f"Erro ao desfazer: {str(e)}")
+            return
+        if ins_quadra not in desfeitas:
+            QMessageBox.warning(self.dlg, "Aviso", f"A quadra {ins_quadra} não tem gravações no histórico.")
+            return
+        excluidos, restaurados = desfeitas[ins_quadra]
+        QgsMessageLog.logMessage(
+            f"Quadra {ins_quadra} desfeita: {excluidos} registros substituídos por {restaurados} "
+            f"da versão anterior" + (f" após {retentativas} retentativas" if retentativas else ""),
+            'OrganizadorDeLotes', Qgis.Info)
+        self.carregar_resumos(forcar=True)
+        self.pre_carga.descartar(self.chave_quadra(conexao, ins_quadra))
+        self.atualizar_camada_ordem(conexao, [ins_quadra])
+        QMessageBox.information(self.dlg, "Sucesso",
+                                f"Quadra {ins_quadra} voltou à versão anterior ({restaurados} registros).")
+
+    def organizar_ordem_lote(self, conexao, ins_quadra, ordem_primeira, feedback=None, aguardar=True):
         results = {}
+        modo = self.modo_gravacao()
+        municipio = self.municipio_ativo
+        execucao = Execucao(conexao, MOTOR_QGIS, modo)
+        duracoes = {}
+        gravacao = {'situacao': ERRO}
         try:
-            camada_lotes = None
-            for layer in QgsProject.instance().mapLayers().values():
-                if 'gis_boletim_lote' in layer.name().lower() or 'lote' in layer.name().lower():
-                    camada_lotes = layer
-                    break
-            
+            camada_lotes = self.camada_lotes()
             if not camada_lotes:
                 raise Exception("Camada de lotes não encontrada no projeto!")
 
-            # Extrair lotes da quadra
-            alg_params = {
-                'FIELD': 'ins_quadra',
-                'INPUT': camada_lotes,
-                'OPERATOR': 0,
-                'VALUE': str(ins_quadra),
-                'OUTPUT': QgsProcessing.TEMPORARY_OUTPUT
-            }
-            outputs = processing.run('native:extractbyattribute', alg_params, feedback=feedback)
-            camada_filtrada = outputs['OUTPUT']
-
-            # Calcular offset
-            offset = sum(1 for f in camada_filtrada.getFeatures() if f['ordem'] >= ordem_primeira)
-
-            # Recalcular ordem
-            expressao_ordem = f'''
-                CASE
-                    WHEN "ordem" >= {ordem_primeira} THEN "ordem" - ({ordem_primeira} - 1)
-                    WHEN "ordem" < {ordem_primeira} THEN "ordem" + {offset}
-                END
-            '''
-
-            # Garantir que o campo de saída se chama 'n_ordem'
-            alg_params = {
-                'FIELDS_MAPPING': [
-                    {'expression': '"matricula"', 'length': -1, 'name': 'matricula', 'precision': 0, 'type': 2},
-                    {'expression': '"ins_quadra"', 'length': -1, 'name': 'ins_quadra', 'precision': 0, 'type': 2},
-                    {'expression': expressao_ordem, 'length': -1, 'name': 'n_ordem', 'precision': 0, 'type': 4}
-                ],
-                'INPUT': camada_filtrada,
-                'OUTPUT': QgsProcessing.TEMPORARY_OUTPUT
-            }
-            outputs = processing.run('native:refactorfields', alg_params, feedback=feedback)
-            camada_processada = outputs['OUTPUT']
-
-            # Exportar para PostgreSQL (tabela 'novaordem', coluna 'n_ordem')
-            alg_params = {
-                'ADDFIELDS': False,
-                'APPEND': True,
-                'A_SRS': 'EPSG:31984',
-                'CLIP': False,
-                'DATABASE': conexao,
-                'DIM': 0,
-                'GEOCOLUMN': '',
-                'GTYPE': 0,
-                'INDEX': False,
-                'INPUT': camada_processada,
-                'LAUNDER': False,
-                'MAKEVALID': False,
-                'OPTIONS': '',
-                'OVERWRITE': False,
-                'PK': 'id',
-                'PRECISION': True,
-                'PROMOTETOMULTI': True,
-                'SCHEMA': 'comercial_umc',
-                'TABLE': 'novaordem',
-            }
-            processing.run('gdal:importvectorintopostgisdatabaseavailableconnections', alg_params, feedback=feedback)
-
+            with cronometrar(duracoes, LEITURA):
+                pre_carregada = self.pre_carga.obter(self.chave_quadra(conexao, ins_quadra))
+                if pre_carregada is not None:
+                    lotes = pre_carregada.lotes
+                else:
+                    lotes = FonteLotesCamada(camada_lotes, municipio.campos).ler_quadra(ins_quadra)
+
+            # Calcular a nova ordem (mesma rotação do antigo CASE do refactorfields) e
+            # excluir e inserir na mesma transação, com bloqueio consultivo da quadra,
+            # para que outro operador não intercale a escrita da mesma ins_quadra.
+            # Erros transitórios (conflito, tempo de bloqueio esgotado, conexão perdida)
+            # repetem a transação inteira, com espera exponencial.
+            # A execução é registrada no livro (novaordem_runs) pela mesma conexão.
+            with Sessao(partial(abrir_conexao, conexao)) as sessao:
+                destino = DestinoBanco(sessao.conn, municipio.esquema, municipio.tabela_novaordem, sessao)
+                gravacao, retentativas, espera = PoliticaRetentativa().executar(
+                    lambda: reorganizar_lotes(destino, ins_quadra, lotes, ordem_primeira,
+                                              aguardar=aguardar, modo=modo, duracoes=duracoes),
+                    destino.reconectar)
+                gravacao.update(retentativas=retentativas, espera_retentativas=espera)
+                self.registrar_execucao(conexao, destino.conn, execucao, gravacao, ins_quadra, ordem_primeira,
+                                        duracoes)
+
+            if gravacao['situacao'] == OCUPADA:
+                results['success'] = False
+                results['ocupada'] = True
+                results['message'] = (f"A quadra {ins_quadra} está sendo reorganizada por outro "
+                                      "usuário. Tente novamente em instantes.")
+                return results
+
+            self.resumos.registrar_reorganizacao(ins_quadra, lotes)
+            self.pre_carga.descartar(self.chave_quadra(conexao, ins_quadra))
+            self.atualizar_camada_ordem(conexao, [ins_quadra])
+            results['excluidos'] = gravacao['excluidos']
+            results['inseridos'] = gravacao['inseridos']
+            results['retentativas'] = gravacao['retentativas']
             results['success'] = True
             results['message'] = f"Nova ordem atualizada com sucesso!"
             
@@ -357,10 +829,41 @@ class OrganizadorDeLotes:
             results['success'] = False
             results['message'] = f"Erro: {str(e)}"
             QgsMessageLog.logMessage(f"Erro: {str(e)}", 'OrganizadorDeLotes', Qgis.Critical)
+            if gravacao['situacao'] == ERRO:
+                gravacao['mensagem'] = str(e)
+                self.registrar_execucao(conexao, None, execucao, gravacao, ins_quadra, ordem_primeira, duracoes)
             
         return results
 
+    def registrar_execucao(self, conexao, conn, execucao, gravacao, ins_quadra, ordem_primeira, duracoes):
+        """
+        Grava a reorganização da quadra no livro de execuções (novaordem_runs).
+        Sem 'conn' (erro antes da gravação), abre uma conexão só para o registro.
+        """
+        execucao.adicionar(dict(gravacao, ins_quadra=ins_quadra, ordem_primeira=ordem_primeira,
+                                duracoes=duracoes))
+        try:
+            propria = conn is None
+            if propria:
+                conn = abrir_conexao(conexao)
+            try:
+                registrada = execucao.gravar(conn, self.municipio_ativo.esquema)
+            finally:
+                if propria:
+                    conn.close()
+        except Exception as e:
+            registrada = False
+            QgsMessageLog.logMessage(f"Erro ao registrar a execução: {str(e)}", 'OrganizadorDeLotes', Qgis.Warning)
+        if registrada:
+            QgsMessageLog.logMessage(f"Execução {execucao.id} registrada em novaordem_runs",
+                                     'OrganizadorDeLotes', Qgis.Info)
+
     def executar_organizacao(self):
+        # Com o modo de perfilamento ligado, grava cProfile/tracemalloc da execução
+        with perfilar('dialogo'):
+            self._executar_organizacao()
+
+    def _executar_organizacao(self):
         try:
             conexao = self.dlg.cmbConexao.currentText()
             ins_quadra = self.dlg.spinInsQuadra.value()
@@ -379,11 +882,25 @@ class OrganizadorDeLotes:
                 QMessageBox.warning(self.dlg, "Aviso", "A ordem da primeira deve ser maior que 1!")
                 return
 
+            erro = self.resumos.validar_ordem_primeira(ins_quadra, ordem_primeira)
+            if erro:
+                QMessageBox.warning(self.dlg, "Aviso", erro)
+                return
+
+            # Com a quadra pré-carregada, o aviso já diz quantos registros existem
+            pre_carregada = self.quadra_pre_carregada(ins_quadra)
+            if pre_carregada is None:
+                aviso = (f"ATENÇÃO: Todos os registros existentes da quadra {ins_quadra} na tabela novaordem "
+                         "serão substituídos!")
+            elif pre_carregada.novaordem:
+                aviso = (f"ATENÇÃO: Os {len(pre_carregada.novaordem)} registros existentes da quadra {ins_quadra} "
+                         "na tabela novaordem serão substituídos!")
+            else:
+                aviso = f"A quadra {ins_quadra} ainda não tem registros na tabela novaordem."
             resposta = QMessageBox.question(
                 self.dlg,
                 "Confirmar Operação",
-                f"Reorganizar lotes da quadra {ins_quadra} a partir da ordem {ordem_primeira}?\n\n"
-                f"ATENÇÃO: Todos os registros existentes da quadra {ins_quadra} na tabela novaordem serão substituídos!",
+                f"Reorganizar lotes da quadra {ins_quadra} a partir da ordem {ordem_primeira}?\n\n{aviso}",
                 QMessageBox.Yes | QMessageBox.No
             )
             
@@ -398,27 +915,22 @@ class OrganizadorDeLotes:
                 duration=2
             )
             
-            # PASSO 1: SEMPRE excluir registros existentes da ins_quadra
+            # Exclusão dos registros existentes e inserção da nova ordem acontecem
+            # numa única transação, sob bloqueio consultivo da quadra
             QgsMessageLog.logMessage(
-                f"PASSO 1: Excluindo registros existentes da quadra {ins_quadra}...", 
+                f"Substituindo registros da quadra {ins_quadra} na novaordem...", 
                 'OrganizadorDeLotes', 
                 Qgis.Info
             )
             
-            if not self.excluir_ins_quadra_existente(conexao, ins_quadra):
-                QMessageBox.critical(self.dlg, "Erro", 
-                    f"Erro ao excluir registros existentes da quadra {ins_quadra}.\n"
-                    "O processo foi interrompido.")
+            # No diálogo não se espera pelo bloqueio: se outro operador estiver
+            # gravando a mesma quadra, avisa em vez de congelar o QGIS
+            resultados = self.organizar_ordem_lote(conexao, ins_quadra, ordem_primeira, feedback,
+                                                   aguardar=False)
+
+            if resultados.get('ocupada', False):
+                QMessageBox.warning(self.dlg, "Quadra em uso", resultados['message'])
                 return
-            
-            # PASSO 2: Inserir novos registros
-            QgsMessageLog.logMessage(
-                f"PASSO 2: Inserindo novos registros da quadra {ins_quadra}...", 
-                'OrganizadorDeLotes', 
-                Qgis.Info
-            )
-            
-            resultados = self.organizar_ordem_lote(conexao, ins_quadra, ordem_primeira, feedback)
 
             if resultados.get('success', False):
                 QMessageBox.information(
@@ -438,6 +950,15 @@ class OrganizadorDeLotes:
 
     def run(self):
         """Abre o diálogo do Qt Designer"""
+        # O município ativo pode ter sido trocado nas configurações desde a última abertura
+        try:
+            self.municipio_ativo = self.municipio()
+        except Exception as e:
+            parent = self.iface.mainWindow() if self.iface else None
+            QMessageBox.warning(parent, "Aviso", f"Perfil de município inválido: {str(e)}")
+            return
+        if self.camada_ordem is not None and self.camada_ordem.municipio.nome != self.municipio_ativo.nome:
+            self.remover_camada_ordem()
         self.resetar_valores_plugin()
 
         if self.first_start:
@@ -460,6 +981,30 @@ class OrganizadorDeLotes:
             if hasattr(self.dlg, 'btnExecutar'):
                 self.dlg.btnExecutar.clicked.connect(self.executar_organizacao)
 
+            if hasattr(self.dlg, 'btnPrimeiroLote') and self.iface:
+                self.dlg.btnPrimeiroLote.clicked.connect(self.ativarFerramentaPrimeiroLote)
+
+            if hasattr(self.dlg, 'btnEditarLote') and self.iface:
+                self.dlg.btnEditarLote.clicked.connect(self.ativarFerramentaLote)
+
+            if hasattr(self.dlg, 'btnCamadaOrdem'):
+                self.dlg.btnCamadaOrdem.clicked.connect(self.mostrar_camada_ordem)
+
+            if hasattr(self.dlg, 'btnDesfazer'):
+                self.dlg.btnDesfazer.clicked.connect(self.desfazer_ultima_gravacao)
+
+            self.limites_ordem_primeira = (self.dlg.spinOrdemPrimeira.minimum(),
+                                           self.dlg.spinOrdemPrimeira.maximum())
+            self.dlg.spinInsQuadra.valueChanged.connect(self.atualizar_limites_quadra)
+            self.dlg.spinOrdemPrimeira.valueChanged.connect(self.atualizar_previa)
+            self.dlg.finished.connect(lambda _: self.limpar_destaque())
+            self.dlg.cmbConexao.currentTextChanged.connect(lambda _: self.carregar_resumos())
+
+        # A camada de lotes pode ter sido editada desde a última abertura
+        self.indices_ordem.clear()
+        self.indices_espaciais.clear()
+        self.pre_carga.limpar()
+        self.carregar_resumos()
         self.dlg.show()
         if hasattr(self.dlg, 'exec_'):
             self.dlg.exec_()
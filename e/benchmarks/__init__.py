@@ -0,0 +1,2 @@
+# -*- coding: utf-8 -*-
+"""Benchmarks do OrganizadorDeLotes (executados fora do QGIS, com python -m e.benchmarks.<nome>)."""
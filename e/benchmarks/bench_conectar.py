@@ -0,0 +1,120 @@
+# -*- coding: utf-8 -*-
+"""
+Benchmark do algoritmo 'Conectar polígonos' contra o original do umcgeo.
+
+    python -m e.benchmarks.bench_conectar --quadras 40 --processos 4
+
+Gera uma cidade sintética de quadras com duas fileiras de lotes, a dos fundos
+deslocada meio lote (toda divisa vira uma junção em T), e mede lotes/s de:
+
+- original: o laço O(n²) do Cad_ConnectPolygons (todos os pares de lotes e,
+  por segmento, a busca do primeiro vértice vizinho a até a tolerância, com o
+  teste 'ponto in coordenadas'), portado para Python puro com a distância
+  ponto-segmento no lugar do buffer do QgsGeometry;
+- conectar_poligonos com 1 processo e com --processos processos.
+
+Na cidade sintética nenhum segmento recebe mais de um vértice, então os
+resultados têm de ser iguais. Falha (código de saída 1) se diferirem ou se a
+versão com índice, em 1 processo, não for pelo menos --ganho-minimo vezes mais
+rápida que o original.
+"""
+import argparse
+import sys
+import time
+
+from ..conectar_poligonos import conectar_poligonos, vizinhos_por_envelope, envelope, TOLERANCIA
+
+GANHO_MINIMO = 20.0
+
+
+def cidade(quadras, lotes_por_fileira=10, largura=10.0, profundidade=25.0, rua=12.0):
+    """{id: [anel]} de 'quadras' quadras em grade, com 2 * lotes_por_fileira lotes cada"""
+    colunas = max(1, int(quadras ** 0.5))
+    poligonos = {}
+    for q in range(quadras):
+        x0 = (q % colunas) * (lotes_por_fileira * largura + rua)
+        y0 = (q // colunas) * (2 * profundidade + rua)
+        # Fileira da frente e fileira dos fundos deslocada meio lote (os das pontas ficam maiores)
+        frente = [x0 + i * largura for i in range(lotes_por_fileira + 1)]
+        fundos = [x0] + [x0 + (i + 0.5) * largura for i in range(lotes_por_fileira)] + [frente[-1]]
+        for fileira, (divisas, ya, yb) in enumerate(((frente, y0, y0 + profundidade),
+                                                     (fundos, y0 + profundidade, y0 + 2 * profundidade))):
+            for i, (xa, xb) in enumerate(zip(divisas, divisas[1:])):
+                poligonos[(q, fileira, i)] = [[(xa, ya), (xb, ya), (xb, yb), (xa, yb), (xa, ya)]]
+    return poligonos
+
+
+def _distancia2(px, py, x1, y1, x2, y2):
+    dx, dy = x2 - x1, y2 - y1
+    comprimento2 = dx * dx + dy * dy
+    t = ((px - x1) * dx + (py - y1) * dy) / comprimento2 if comprimento2 else 0.0
+    t = min(1.0, max(0.0, t))
+    ex, ey = x1 + t * dx - px, y1 + t * dy - py
+    return ex * ex + ey * ey
+
+
+def original(poligonos, tolerancia=TOLERANCIA):
+    """Porte do laço do Cad_ConnectPolygons (só o anel externo, um vértice por segmento)"""
+    idents = list(poligonos)
+    coordenadas = {ident: list(poligonos[ident][0]) for ident in idents}
+    tolerancia2 = tolerancia * tolerancia
+    for a in idents:
+        for b in idents:
+            if a == b:
+                continue
+            axmin, aymin, axmax, aymax = envelope([coordenadas[a]])
+            bxmin, bymin, bxmax, bymax = envelope([coordenadas[b]])
+            # geom_a.intersects(geom_b), aproximado pelos envelopes com a tolerância
+            if not (axmin - tolerancia <= bxmax and bxmin <= axmax + tolerancia
+                    and aymin - tolerancia <= bymax and bymin <= aymax + tolerancia):
+                continue
+            coord_a, coord_b = coordenadas[a], coordenadas[b]
+            novo = []
+            for (x1, y1), (x2, y2) in zip(coord_b, coord_b[1:]):
+                novo.append((x1, y1))
+                for ponto in coord_a:
+                    if ponto not in coord_b and _distancia2(ponto[0], ponto[1], x1, y1, x2, y2) <= tolerancia2:
+                        novo.append(ponto)
+                        break
+            novo.append(coord_b[-1])
+            coordenadas[b] = novo
+    return coordenadas
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--quadras', type=int, default=40)
+    parser.add_argument('--processos', type=int, default=4)
+    parser.add_argument('--ganho-minimo', type=float, default=GANHO_MINIMO)
+    args = parser.parse_args(argv)
+
+    poligonos = cidade(args.quadras)
+    print(f'{len(poligonos)} lotes em {args.quadras} quadras')
+
+    inicio = time.perf_counter()
+    esperado = original(poligonos)
+    tempo_original = time.perf_counter() - inicio
+
+    tempos = {}
+    iguais = True
+    for processos in (1, args.processos):
+        inicio = time.perf_counter()
+        # O índice espacial faz parte do custo
+        resultado = conectar_poligonos(poligonos, vizinhos_por_envelope(poligonos), processos=processos)
+        tempos[processos] = time.perf_counter() - inicio
+        iguais = iguais and {ident: aneis[0] for ident, (aneis, _) in resultado.items()} == esperado
+
+    print(f'{"versão":<22}{"s":>8}{"lotes/s":>12}')
+    print(f'{"original":<22}{tempo_original:>8.2f}{len(poligonos) / tempo_original:>12.0f}')
+    for processos, tempo in tempos.items():
+        print(f'{f"índice, {processos} processo(s)":<22}{tempo:>8.2f}{len(poligonos) / tempo:>12.0f}')
+
+    ganho = tempo_original / tempos[1]
+    falhou = not iguais or ganho < args.ganho_minimo
+    print(f'resultados {"iguais" if iguais else "DIFERENTES"}; ganho em 1 processo: {ganho:.0f}x '
+          f'(mínimo {args.ganho_minimo:.0f}x) {"REGRESSÃO" if falhou else "OK"}')
+    return 1 if falhou else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,118 @@
+# -*- coding: utf-8 -*-
+"""
+Benchmark do fluxo completo de reorganização, sem QGIS.
+
+    python -m e.benchmarks.bench_fluxo --quadras 2000 --lotes-por-quadra 50 --trabalhadores 4
+    python -m e.benchmarks.bench_fluxo --dsn "host=localhost dbname=teste" --quadras 500
+
+Roda execucao_quadras.executar_quadras (leitura -> cálculo -> gravação, com
+o executor em threads) sobre a fonte em memória e o destino em memória ou,
+com --dsn, sobre uma novaordem provisionada num esquema descartável do
+PostgreSQL informado. Falha (código de saída 1) se a vazão ficar abaixo do
+limite, para servir de portão de regressão no CI.
+
+Limites documentados (máquina de CI modesta, com folga de ~3x):
+- memória: até 10 µs por lote (cálculo + gravação) e pelo menos 2000 quadras/s;
+- PostgreSQL local: até 250 µs por lote e pelo menos 100 quadras/s (µs somados entre
+  os trabalhadores, que gravam em paralelo).
+"""
+import argparse
+import os
+import sys
+import time
+from contextlib import contextmanager
+
+from ..conexao_pg import abrir_conexao
+from ..execucao_quadras import executar_quadras
+from ..novaordem import GRAVADA, MODOS_GRAVACAO, MODO_SUBSTITUIR
+from ..provisionamento import provisionar_novaordem
+from ..reorganizacao import FonteLotesMemoria, DestinoMemoria, DestinoBanco, backend_memoria
+
+# destino: (µs por lote no máximo, quadras/s no mínimo)
+LIMITES = {
+    'memoria': (10.0, 2000.0),
+    'banco': (250.0, 100.0),
+}
+
+
+def _gerar(quadras, lotes_por_quadra):
+    # Matrículas realistas; ordens embaralhadas de forma determinística
+    return {100_000 + q: [(10_000_000 + q * lotes_por_quadra + i, (i * 7) % lotes_por_quadra + 1)
+                          for i in range(lotes_por_quadra)]
+            for q in range(quadras)}
+
+
+@contextmanager
+def _backend_banco(dsn, esquema, fonte):
+    conn = abrir_conexao(dsn)
+    try:
+        yield fonte, DestinoBanco(conn, esquema=esquema)
+    finally:
+        conn.close()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--quadras', type=int, default=2000)
+    parser.add_argument('--lotes-por-quadra', type=int, default=50)
+    parser.add_argument('--trabalhadores', type=int, default=4)
+    parser.add_argument('--modo', choices=MODOS_GRAVACAO, default=MODO_SUBSTITUIR)
+    parser.add_argument('--dsn', help='PostgreSQL descartável; sem ele o destino é em memória')
+    args = parser.parse_args(argv)
+
+    quadras = _gerar(args.quadras, args.lotes_por_quadra)
+    fonte = FonteLotesMemoria(quadras)
+    tarefas = [(q, 1 + q % args.lotes_por_quadra) for q in quadras]
+
+    esquema = None
+    if args.dsn:
+        destino_nome = 'banco'
+        esquema = 'organizador_bench_%d' % os.getpid()
+        conn = abrir_conexao(args.dsn)
+        provisionar_novaordem(conn, esquema=esquema)
+        backend = lambda: _backend_banco(args.dsn, esquema, fonte)  # noqa: E731
+    else:
+        destino_nome = 'memoria'
+        backend = backend_memoria(fonte, DestinoMemoria())
+
+    try:
+        inicio = time.perf_counter()
+        resultados = executar_quadras(args.dsn, tarefas, trabalhadores=args.trabalhadores, modo=args.modo,
+                                      registrar=False, backend=backend)
+        total = time.perf_counter() - inicio
+    finally:
+        if esquema:
+            with conn, conn.cursor() as cursor:
+                cursor.execute('DROP SCHEMA %s CASCADE' % esquema)
+            conn.close()
+
+    falhas = sum(1 for r in resultados if r['situacao'] != GRAVADA)
+    lotes = args.quadras * args.lotes_por_quadra
+    etapas = {}
+    for resultado in resultados:
+        for etapa, segundos in resultado.get('duracoes', {}).items():
+            etapas[etapa] = etapas.get(etapa, 0.0) + segundos
+
+    us_por_lote = (etapas.get('calculo', 0.0) + etapas.get('gravacao', 0.0)) / lotes * 1e6
+    quadras_por_s = args.quadras / total
+    maximo_us, minimo_quadras = LIMITES[destino_nome]
+
+    print(f'destino {destino_nome}, {args.quadras} quadras x {args.lotes_por_quadra} lotes, '
+          f'{args.trabalhadores} trabalhadores, modo {args.modo}')
+    for etapa, segundos in sorted(etapas.items()):
+        print(f'  {etapa:<10}{segundos * 1000:>10.1f} ms{segundos / lotes * 1e6:>10.2f} µs/lote')
+    print(f'  total     {total * 1000:>10.1f} ms{quadras_por_s:>10.0f} quadras/s')
+
+    regressao = []
+    if us_por_lote > maximo_us:
+        regressao.append(f'{us_por_lote:.2f} µs/lote > {maximo_us}')
+    if quadras_por_s < minimo_quadras:
+        regressao.append(f'{quadras_por_s:.0f} quadras/s < {minimo_quadras:.0f}')
+    if falhas:
+        regressao.append(f'{falhas} quadras não gravadas')
+    print('REGRESSÃO: ' + '; '.join(regressao) if regressao else 'OK')
+    return 1 if regressao else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
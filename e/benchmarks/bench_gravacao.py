@@ -0,0 +1,108 @@
+# -*- coding: utf-8 -*-
+"""
+Benchmark dos modos de gravação da novaordem: substituir (delete+insert) x upsert.
+
+    python -m e.benchmarks.bench_gravacao --dsn "host=localhost dbname=teste" --quadras 200 --lotes 60
+
+Requer PostgreSQL 15+ (pg_stat_force_next_flush). Usa um esquema descartável
+com autovacuum desligado na tabela, para que o inchaço (tuplas mortas e
+tamanho em disco) de cada modo fique visível.
+Cenários por rodada:
+- reexecucao: mesma ordem_primeira (nenhum n_ordem muda);
+- alteracao: um lote entra e outro sai em cada quadra;
+- rotacao: nova ordem_primeira (quase todos os n_ordem mudam).
+"""
+import argparse
+import random
+import time
+
+from ..conexao_pg import _psycopg2
+from ..novaordem import gravar_quadra, MODOS_GRAVACAO
+from ..lotes import LotesColunares
+from ..provisionamento import provisionar_novaordem
+
+ESQUEMA = 'organizador_bench'
+CENARIOS = ('reexecucao', 'alteracao', 'rotacao')
+
+
+def _registros(ins_quadra, matriculas, ordem_primeira):
+    lotes = LotesColunares.de_quadra(ins_quadra, zip(matriculas, range(1, len(matriculas) + 1)))
+    return lotes.reordenados(ordem_primeira)
+
+
+def _estatisticas(conn):
+    with conn.cursor() as cursor:
+        cursor.execute('SELECT pg_stat_force_next_flush()')
+        cursor.execute('''
+            SELECT n_dead_tup, pg_relation_size(relid), pg_indexes_size(relid)
+            FROM pg_stat_user_tables WHERE schemaname = %s AND relname = 'novaordem'
+        ''', (ESQUEMA,))
+        mortas, tabela, indices = cursor.fetchone()
+    conn.commit()
+    return mortas, tabela, indices
+
+
+def medir(dsn, modo, quadras, lotes, rodadas, semente=1):
+    psycopg2 = _psycopg2()
+    aleatorio = random.Random(semente)
+    conn = psycopg2.connect(dsn)
+    try:
+        with conn, conn.cursor() as cursor:
+            cursor.execute(f'DROP SCHEMA IF EXISTS {ESQUEMA} CASCADE')
+        provisionar_novaordem(conn, esquema=ESQUEMA)
+        with conn, conn.cursor() as cursor:
+            cursor.execute(f'ALTER TABLE {ESQUEMA}.novaordem SET (autovacuum_enabled = false)')
+
+        proxima = quadras * lotes
+        matriculas = {q: list(range(q * lotes, (q + 1) * lotes)) for q in range(quadras)}
+        primeiras = {q: 1 for q in range(quadras)}
+        for q in range(quadras):
+            gravar_quadra(conn, q, _registros(q, matriculas[q], 1), modo=modo, esquema=ESQUEMA)
+        base = _estatisticas(conn)
+
+        linhas = []
+        for cenario in CENARIOS:
+            inicio = time.perf_counter()
+            for _ in range(rodadas):
+                for q in range(quadras):
+                    if cenario == 'alteracao':
+                        matriculas[q].pop(aleatorio.randrange(len(matriculas[q])))
+                        matriculas[q].insert(aleatorio.randrange(len(matriculas[q])), proxima)
+                        proxima += 1
+                    elif cenario == 'rotacao':
+                        primeiras[q] = aleatorio.randint(1, lotes)
+                    gravar_quadra(conn, q, _registros(q, matriculas[q], primeiras[q]),
+                                  modo=modo, esquema=ESQUEMA)
+            duracao = time.perf_counter() - inicio
+            mortas, tabela, indices = _estatisticas(conn)
+            linhas.append((cenario, duracao, mortas - base[0], tabela, indices))
+            base = (mortas, tabela, indices)
+
+        with conn, conn.cursor() as cursor:
+            cursor.execute(f'DROP SCHEMA {ESQUEMA} CASCADE')
+        return linhas
+    finally:
+        conn.close()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--dsn', required=True, help='DSN de um PostgreSQL descartável')
+    parser.add_argument('--quadras', type=int, default=200)
+    parser.add_argument('--lotes', type=int, default=60, help='lotes por quadra')
+    parser.add_argument('--rodadas', type=int, default=3)
+    args = parser.parse_args(argv)
+
+    print(f'{args.quadras} quadras x {args.lotes} lotes, {args.rodadas} rodadas por cenário')
+    print(f'{"modo":<11}{"cenário":<12}{"tempo (s)":>10}{"quadras/s":>11}'
+          f'{"tuplas mortas":>15}{"tabela (kB)":>13}{"índices (kB)":>14}')
+    for modo in MODOS_GRAVACAO:
+        for cenario, duracao, mortas, tabela, indices in medir(args.dsn, modo, args.quadras,
+                                                               args.lotes, args.rodadas):
+            vazao = args.quadras * args.rodadas / duracao
+            print(f'{modo:<11}{cenario:<12}{duracao:>10.2f}{vazao:>11.0f}'
+                  f'{mortas:>15}{tabela // 1024:>13}{indices // 1024:>14}')
+
+
+if __name__ == '__main__':
+    main()
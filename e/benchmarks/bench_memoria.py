@@ -0,0 +1,70 @@
+# -*- coding: utf-8 -*-
+"""
+Benchmark de memória da representação dos lotes.
+
+    python -m e.benchmarks.bench_memoria --lotes 1000000
+
+Mede com tracemalloc quanto ocupam N lotes (matricula, ins_quadra, ordem) como
+lista de tuplas, lista de Lote (__slots__) e LotesColunares (array('q')),
+e falha (código de saída 1) se a representação colunar passar do orçamento.
+
+Orçamento documentado, por milhão de lotes:
+- LotesColunares: até 32 MiB (3 colunas x 8 bytes = 24 MB + folga de crescimento dos arrays);
+- Lote (__slots__): até 128 MiB (objeto de 48 bytes + dois inteiros grandes de 28 bytes
+  + ponteiro da lista); só para lotes avulsos, não para lotes em massa.
+"""
+import argparse
+import sys
+import tracemalloc
+
+from ..lotes import Lote, LotesColunares
+
+MIB = 1024 * 1024
+ORCAMENTO_COLUNAR_POR_MILHAO = 32 * MIB
+ORCAMENTO_LOTE_POR_MILHAO = 128 * MIB
+
+
+def _gerar(quantidade):
+    # Matrículas e quadras realistas (fora do cache de inteiros pequenos do Python)
+    for i in range(quantidade):
+        yield 10_000_000 + i, 100_000 + i // 50, i % 50 + 1
+
+
+def medir(construtor, quantidade):
+    tracemalloc.start()
+    try:
+        objeto = construtor(_gerar(quantidade))
+        atual, _ = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    del objeto
+    return atual
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--lotes', type=int, default=1_000_000)
+    args = parser.parse_args(argv)
+    escala = args.lotes / 1_000_000
+
+    representacoes = [
+        ('tuplas', lambda tuplas: [tuple(t) for t in tuplas], None),
+        ('Lote', lambda tuplas: [Lote(*t) for t in tuplas], ORCAMENTO_LOTE_POR_MILHAO),
+        ('LotesColunares', LotesColunares.de_tuplas, ORCAMENTO_COLUNAR_POR_MILHAO),
+    ]
+
+    excedeu = False
+    print(f'{"representação":<16}{"MiB":>10}{"MiB/milhão":>12}{"orçamento":>11}')
+    for nome, construtor, orcamento in representacoes:
+        ocupado = medir(construtor, args.lotes)
+        por_milhao = ocupado / escala
+        situacao = ''
+        if orcamento is not None:
+            situacao = f'{orcamento / MIB:>8.0f}' + (' OK' if por_milhao <= orcamento else ' EXCEDIDO')
+            excedeu = excedeu or por_milhao > orcamento
+        print(f'{nome:<16}{ocupado / MIB:>10.1f}{por_milhao / MIB:>12.1f}{situacao:>11}')
+    return 1 if excedeu else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
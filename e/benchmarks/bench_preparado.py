@@ -0,0 +1,97 @@
+# -*- coding: utf-8 -*-
+"""
+Benchmark de latência: SQL textual (valor interpolado, planejado a cada chamada)
+x instruções preparadas do registro (instrucoes.REGISTRO).
+
+    python -m e.benchmarks.bench_preparado --dsn "host=localhost dbname=teste" --quadras 2000
+
+Cria um esquema descartável com uma tabela de lotes e uma novaordem indexadas
+por ins_quadra e mede, para cada instrução por quadra, a latência média por chamada.
+"""
+import argparse
+import time
+
+from ..conexao_pg import _psycopg2
+from ..instrucoes import RegistroInstrucoes, INSTRUCOES
+from ..provisionamento import provisionar_novaordem
+from ..reorganizacao import CAMPOS_LOTES
+
+ESQUEMA = 'organizador_bench_preparado'
+
+# nome da instrução no registro: SQL textual equivalente (como era montado antes)
+TEXTUAIS = {
+    'existe_quadra': 'SELECT EXISTS (SELECT 1 FROM {esquema}.novaordem WHERE ins_quadra = {ins_quadra})',
+    'ler_lotes_quadra': 'SELECT matricula, ordem FROM {esquema}.lotes WHERE ins_quadra = {ins_quadra}',
+    'excluir_quadra': 'DELETE FROM {esquema}.novaordem WHERE ins_quadra = {ins_quadra}',
+}
+
+
+def _preparar_base(conn, quadras, lotes):
+    provisionar_novaordem(conn, esquema=ESQUEMA)
+    with conn, conn.cursor() as cursor:
+        cursor.execute(f'''
+            CREATE TABLE {ESQUEMA}.lotes AS
+            SELECT q * 1000 + l AS matricula, q AS ins_quadra, l AS ordem
+            FROM generate_series(1, %s) q, generate_series(1, %s) l
+        ''', (quadras, lotes))
+        cursor.execute(f'CREATE INDEX ON {ESQUEMA}.lotes (ins_quadra)')
+        cursor.execute(f'INSERT INTO {ESQUEMA}.novaordem (matricula, ins_quadra, n_ordem) '
+                       f'SELECT matricula, ins_quadra, ordem FROM {ESQUEMA}.lotes')
+        cursor.execute(f'ANALYZE {ESQUEMA}.lotes')
+        cursor.execute(f'ANALYZE {ESQUEMA}.novaordem')
+
+
+def _medir(conn, quadras, executar):
+    inicio = time.perf_counter()
+    with conn.cursor() as cursor:
+        for ins_quadra in range(1, quadras + 1):
+            executar(cursor, ins_quadra)
+            if cursor.description:
+                cursor.fetchall()
+    conn.rollback()
+    return (time.perf_counter() - inicio) / quadras
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--dsn', required=True, help='DSN de um PostgreSQL descartável')
+    parser.add_argument('--quadras', type=int, default=2000)
+    parser.add_argument('--lotes', type=int, default=40, help='lotes por quadra')
+    args = parser.parse_args(argv)
+
+    conn = _psycopg2().connect(args.dsn)
+    try:
+        with conn, conn.cursor() as cursor:
+            cursor.execute(f'DROP SCHEMA IF EXISTS {ESQUEMA} CASCADE')
+        _preparar_base(conn, args.quadras, args.lotes)
+
+        registro = RegistroInstrucoes()
+        tabelas = {'tabela': f'{ESQUEMA}.novaordem', 'lotes': f'{ESQUEMA}.lotes', **CAMPOS_LOTES._asdict()}
+        print(f'{args.quadras} quadras x {args.lotes} lotes; latência média por chamada')
+        print(f'{"instrução":<18}{"textual (µs)":>14}{"preparada (µs)":>16}{"ganho":>8}')
+        for nome, textual in TEXTUAIS.items():
+            def executar_textual(cursor, ins_quadra):
+                cursor.execute(textual.format(esquema=ESQUEMA, ins_quadra=ins_quadra))
+
+            usadas = {chave: valor for chave, valor in tabelas.items()
+                      if '{' + chave + '}' in INSTRUCOES[nome][1]}
+
+            def executar_preparada(cursor, ins_quadra):
+                registro.executar(cursor, nome, (ins_quadra,), **usadas)
+
+            # Uma passada de aquecimento de cada forma antes de medir
+            _medir(conn, args.quadras, executar_textual)
+            _medir(conn, args.quadras, executar_preparada)
+            tempo_textual = _medir(conn, args.quadras, executar_textual)
+            tempo_preparada = _medir(conn, args.quadras, executar_preparada)
+            print(f'{nome:<18}{tempo_textual * 1e6:>14.1f}{tempo_preparada * 1e6:>16.1f}'
+                  f'{tempo_textual / tempo_preparada:>7.2f}x')
+
+        with conn, conn.cursor() as cursor:
+            cursor.execute(f'DROP SCHEMA {ESQUEMA} CASCADE')
+    finally:
+        conn.close()
+
+
+if __name__ == '__main__':
+    main()
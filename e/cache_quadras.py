@@ -0,0 +1,59 @@
+# -*- coding: utf-8 -*-
+"""
+OrganizadorDeLotes - quadras pré-carregadas
+Cache pequeno e limitado das quadras lidas em segundo plano pela ferramenta
+de seleção (ver pre_carga): os lotes da camada (LotesColunares e os ids das
+feições) e as linhas atuais da novaordem. A prévia e a gravação partem
+dele em vez de ler a camada de novo. As entradas valem por pouco tempo e
+saem quando a quadra é gravada, para não reaproveitar dados velhos.
+"""
+import time
+from collections import OrderedDict, namedtuple
+
+# lotes: LotesColunares da camada; ids: ids das feições, posição a posição;
+# novaordem: [(matricula, n_ordem)] da quadra na novaordem, em ordem de n_ordem
+QuadraPreCarregada = namedtuple('QuadraPreCarregada', 'lotes ids novaordem')
+
+# Quadras guardadas (as mais recentes) e validade de cada uma, em segundos
+MAX_QUADRAS = 8
+VALIDADE = 120
+
+
+class CacheQuadras:
+    """QuadraPreCarregada por chave (município, conexão, ins_quadra), das mais recentes"""
+
+    def __init__(self, capacidade=MAX_QUADRAS, validade=VALIDADE, relogio=time.monotonic):
+        self.capacidade = capacidade
+        self.validade = validade
+        self.relogio = relogio
+        self._quadras = OrderedDict()
+
+    def __len__(self):
+        return len(self._quadras)
+
+    def __contains__(self, chave):
+        return self.obter(chave) is not None
+
+    def guardar(self, chave, quadra):
+        self._quadras[chave] = (self.relogio(), quadra)
+        self._quadras.move_to_end(chave)
+        while len(self._quadras) > self.capacidade:
+            self._quadras.popitem(last=False)
+
+    def obter(self, chave):
+        """A quadra guardada, ou None se não houver ou se tiver vencido"""
+        guardada = self._quadras.get(chave)
+        if guardada is None:
+            return None
+        quando, quadra = guardada
+        if self.relogio() - quando > self.validade:
+            del self._quadras[chave]
+            return None
+        self._quadras.move_to_end(chave)
+        return quadra
+
+    def descartar(self, chave):
+        self._quadras.pop(chave, None)
+
+    def limpar(self):
+        self._quadras.clear()
@@ -0,0 +1,127 @@
+# -*- coding: utf-8 -*-
+"""
+OrganizadorDeLotes - camada de rótulos de n_ordem no mapa
+Em vez de unir a novaordem à camada de lotes (a junção é refeita para a
+camada inteira a cada desenho), o plugin mantém uma camada de memória de
+pontos com matrícula, quadra e n_ordem, rotulada pelo n_ordem. Ela é
+carregada uma vez (rotulos_ordem.ler_rotulos) e, depois de cada gravação,
+só as feições das quadras gravadas são trocadas, direto no provedor, sem
+buffer de edição. O redesenho é só da camada de rótulos e só quando a quadra
+está à vista; fora dela, fica marcado para o próximo desenho do mapa.
+"""
+from qgis.core import (QgsVectorLayer, QgsFeature, QgsGeometry, QgsPointXY, QgsRectangle, QgsProject,
+                       QgsPalLayerSettings, QgsVectorLayerSimpleLabeling, QgsCoordinateTransform)
+
+from .rotulos_ordem import ler_rotulos
+
+NOME_CAMADA = 'Ordem dos lotes'
+
+
+class CamadaOrdem:
+    """Camada de rótulos de n_ordem do município ('municipio', ver municipios)"""
+
+    def __init__(self, municipio, canvas=None, nome=NOME_CAMADA):
+        self.municipio = municipio
+        self.canvas = canvas
+        self.nome = nome
+        self.camada = None
+        # ins_quadra -> ([ids das feições], extensão)
+        self.quadras = {}
+
+    def ativa(self):
+        """Indica se a camada foi carregada e continua no projeto"""
+        return self.camada is not None and QgsProject.instance().mapLayer(self.camada.id()) is not None
+
+    def _criar_camada(self):
+        camada = QgsVectorLayer(f'Point?crs=EPSG:{self.municipio.srid}&field=matricula:long'
+                                '&field=ins_quadra:integer&field=n_ordem:integer&index=yes', self.nome, 'memory')
+        rotulo = QgsPalLayerSettings()
+        rotulo.fieldName = 'n_ordem'
+        rotulo.placement = QgsPalLayerSettings.OverPoint
+        camada.setLabeling(QgsVectorLayerSimpleLabeling(rotulo))
+        camada.setLabelsEnabled(True)
+        # Só os rótulos aparecem; o ponto fica sem símbolo
+        camada.renderer().symbol().setOpacity(0)
+        return camada
+
+    def remover(self):
+        """Tira a camada do projeto, se ela ainda estiver nele"""
+        if self.ativa():
+            QgsProject.instance().removeMapLayer(self.camada.id())
+        self.camada = None
+        self.quadras = {}
+
+    def carregar(self, conn):
+        """(Re)carrega todas as quadras da novaordem numa camada nova, adicionada ao projeto"""
+        self.remover()
+        self.camada = self._criar_camada()
+        self.quadras = {}
+        self._adicionar(self._rotulos(conn, None))
+        self.camada.updateExtents()
+        QgsProject.instance().addMapLayer(self.camada)
+        return self.camada.featureCount()
+
+    def atualizar_quadras(self, conn, quadras):
+        """
+        Troca só as feições das 'quadras' pelas da novaordem atual e redesenha a
+        camada se a extensão delas (antes ou depois) estiver à vista.
+        """
+        if not self.ativa():
+            return
+        quadras = list(quadras)
+        extensao = QgsRectangle()
+        extensao.setMinimal()
+        removidas = []
+        for ins_quadra in quadras:
+            ids, anterior = self.quadras.pop(ins_quadra, ((), None))
+            removidas.extend(ids)
+            if anterior is not None:
+                extensao.combineExtentWith(anterior)
+        if removidas:
+            self.camada.dataProvider().deleteFeatures(removidas)
+        for nova in self._adicionar(self._rotulos(conn, quadras)):
+            extensao.combineExtentWith(nova)
+        self.camada.updateExtents()
+        self._redesenhar(extensao)
+
+    def _rotulos(self, conn, quadras):
+        municipio = self.municipio
+        return ler_rotulos(conn, quadras, coluna_geometria=municipio.coluna_geometria,
+                           tabela_lotes=municipio.tabela_lotes, esquema=municipio.esquema,
+                           tabela=municipio.tabela_novaordem, campos=municipio.campos, srid=municipio.srid)
+
+    def _adicionar(self, rotulos):
+        """Adiciona as feições de {ins_quadra: [(matricula, n_ordem, x, y)]}; retorna as extensões das quadras"""
+        extensoes = []
+        campos = self.camada.fields()
+        for ins_quadra, lotes in rotulos.items():
+            feicoes = []
+            for matricula, n_ordem, x, y in lotes:
+                if x is None:
+                    continue
+                feicao = QgsFeature(campos)
+                feicao.setAttributes([matricula, ins_quadra, n_ordem])
+                feicao.setGeometry(QgsGeometry.fromPointXY(QgsPointXY(x, y)))
+                feicoes.append(feicao)
+            if not feicoes:
+                continue
+            _, adicionadas = self.camada.dataProvider().addFeatures(feicoes)
+            extensao = QgsRectangle()
+            extensao.setMinimal()
+            for feicao in adicionadas:
+                extensao.combineExtentWith(feicao.geometry().boundingBox())
+            self.quadras[ins_quadra] = ([feicao.id() for feicao in adicionadas], extensao)
+            extensoes.append(extensao)
+        return extensoes
+
+    def _redesenhar(self, extensao):
+        if extensao.isNull():
+            return
+        if self.canvas is None:
+            self.camada.triggerRepaint()
+            return
+        transformacao = QgsCoordinateTransform(self.camada.crs(), self.canvas.mapSettings().destinationCrs(),
+                                               QgsProject.instance())
+        visivel = self.canvas.extent().intersects(transformacao.transformBoundingBox(extensao))
+        # Fora da vista: só marca a camada para o próximo desenho do mapa
+        self.camada.triggerRepaint(not visivel)
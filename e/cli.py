@@ -0,0 +1,500 @@
+# -*- coding: utf-8 -*-
+"""
+OrganizadorDeLotes - linha de comando
+Reorganiza quadras sem abrir o QGIS:
+
+    python -m e.cli --conexao "service=cadastro" --quadras 101,102 --ordem-primeira 1
+    python -m e.cli --conexao "host=... dbname=..." --arquivo quadras.csv --trabalhadores 4 --pular-ocupadas
+    python -m e.cli --conexao "service=cadastro" --provisionar --modo upsert --quadras 101
+    python -m e.cli --conexao "service=cadastro" --validar
+    python -m e.cli --conexao "service=cadastro" --validar --local
+    python -m e.cli --conexao "service=cadastro" --arquivo quadras.csv --retomar
+    python -m e.cli --conexao "service=cadastro" --instalar-gatilho --escutar --espera 5
+    python -m e.cli --conexao "service=cadastro" --exportar rotas/ --formato geojsonseq --por distrito \
+        --coluna-distrito distrito --gzip
+    python -m e.cli --municipios municipios.json --municipio todos --arquivo quadras.csv
+    python -m e.cli --conexao "service=cadastro" --provisionar --particionada --criar-particoes distrito \
+        --coluna-distrito distrito
+    python -m e.cli --conexao "service=cadastro" --recarregar-particao centro --arquivo centro.csv
+    python -m e.cli --conexao "service=cadastro" --provisionar --historico
+    python -m e.cli --conexao "service=cadastro" --desfazer 1 --quadras 101,102
+
+O arquivo CSV tem as colunas ins_quadra e ordem_primeira (e, opcionalmente,
+municipio: linhas sem ela valem para todos os municípios selecionados).
+Com --municipio, conexão, esquema, tabelas, campos e orçamento de conexões
+vêm dos perfis (ver municipios); vários municípios rodam ao mesmo tempo, cada
+um com as suas conexões.
+Com a tabela novaordem_checkpoints provisionada, cada quadra gravada vira um
+ponto de controle do lote; se a execução cair, o mesmo comando com --retomar
+faz só as quadras que faltam.
+Com --escutar, fica em LISTEN e reorganiza as quadras alteradas na tabela de
+lotes assim que o gatilho (--instalar-gatilho) as notifica (ver escuta).
+Com --particionada, a novaordem é particionada por faixas de ins_quadra (um
+distrito por partição com --criar-particoes distrito) e --recarregar-particao
+refaz as quadras de uma partição numa carga trocada de uma vez (ver particoes).
+Com o histórico (--provisionar --historico), cada gravação guarda a versão
+anterior da quadra e --desfazer N volta as quadras informadas a antes das
+suas N últimas gravações.
+"""
+import argparse
+import csv
+import logging
+import os
+import sys
+import threading
+
+from .execucao_quadras import TABELA_LOTES, ERRO
+from .conexao_pg import (abrir_conexao, abrir_conexao_leitura, ATRASO_MAXIMO_REPLICA, TEMPO_LIMITE_INSTRUCAO,
+                         TEMPO_LIMITE_BLOQUEIO, TENTATIVAS)
+from .novaordem import OCUPADA, MODOS_GRAVACAO, MODO_SUBSTITUIR, desfazer_quadras, podar_historico
+from .provisionamento import (provisionar_novaordem, provisionar_execucoes, provisionar_checkpoints,
+                              provisionar_historico, provisionar_gatilho, remover_gatilho)
+from .escuta import Escuta, CANAL, ESPERA, ESPERA_MAXIMA, TAMANHO_LOTE
+from .exportacao import exportar, FORMATOS, CSV, AGRUPAMENTOS, POR_QUADRA, COLUNA_GEOMETRIA
+from .municipios import (Municipio, carregar_municipios, arquivo_municipios, selecionar_municipios,
+                         executar_municipios, TODOS)
+from .particoes import faixas, faixas_por_distrito, criar_particoes, recarregar_particao
+from .reorganizacao import FonteLotesBanco
+from .retomada import identificar_lote, checkpoints_disponiveis, preparar_lote
+from .validacao import validar_sql, validar_local, resumir
+from .perfil import perfilar
+
+
+def ler_tarefas(args, municipio=None):
+    """Tarefas de --quadras/--arquivo; com 'municipio', só as linhas dele ou sem município"""
+    tarefas = []
+    if args.quadras:
+        for valor in args.quadras.split(','):
+            if valor.strip():
+                tarefas.append((int(valor), args.ordem_primeira))
+    if args.arquivo:
+        with open(args.arquivo, newline='', encoding='utf-8') as arquivo:
+            for linha in csv.DictReader(arquivo):
+                if municipio is not None and linha.get('municipio') not in (None, '', municipio.nome):
+                    continue
+                tarefas.append((int(linha['ins_quadra']),
+                                int(linha.get('ordem_primeira') or args.ordem_primeira)))
+    return tarefas
+
+
+def ler_municipios(args):
+    """
+    Municípios da execução: os de --municipio no arquivo de perfis, ou um
+    único montado de --conexao/--tabela-lotes/--trabalhadores. --conexao,
+    --conexao-leitura, --tabela-lotes e --coluna-geometria, se informados,
+    sobrepõem os do perfil.
+    """
+    sobrepostos = {'conexao': args.conexao, 'conexao_leitura': args.conexao_leitura,
+                   'tabela_lotes': args.tabela_lotes, 'coluna_geometria': args.coluna_geometria}
+    if not args.municipio:
+        if not args.conexao:
+            raise Exception('Informe --conexao ou --municipio')
+        return [Municipio(conexoes=args.trabalhadores or 1).com(**sobrepostos)]
+    caminho = args.municipios or arquivo_municipios()
+    if not caminho:
+        raise Exception('--municipio requer o arquivo de perfis (--municipios ou ORGANIZADOR_MUNICIPIOS)')
+    municipios = [municipio.com(**sobrepostos)
+                  for municipio in selecionar_municipios(carregar_municipios(caminho), args.municipio)]
+    sem_conexao = [municipio.nome for municipio in municipios if not municipio.conexao]
+    if sem_conexao:
+        raise Exception(f"Municípios sem conexão no perfil: {', '.join(sem_conexao)}")
+    return municipios
+
+
+def _trabalhadores(args, municipio):
+    return municipio.conexoes if args.trabalhadores is None else min(args.trabalhadores, municipio.conexoes)
+
+
+def _prefixo(municipio, municipios):
+    return f'[{municipio.nome}] ' if len(municipios) > 1 else ''
+
+
+def criar_parser():
+    parser = argparse.ArgumentParser(prog='organizador-lotes',
+                                     description='Reorganiza a ordem dos lotes de várias quadras.')
+    parser.add_argument('--conexao',
+                        help='DSN/URI libpq ou nome de uma conexão PostgreSQL do QGIS '
+                             '(obrigatória sem --municipio)')
+    parser.add_argument('--municipios', metavar='ARQUIVO',
+                        help='arquivo JSON de perfis de municípios (padrão: ORGANIZADOR_MUNICIPIOS)')
+    parser.add_argument('--municipio', metavar='NOMES',
+                        help=f'municípios do arquivo de perfis, separados por vírgula, ou {TODOS}')
+    parser.add_argument('--conexao-leitura',
+                        help='réplica de leitura (DSN ou nome de conexão do QGIS) para a validação e '
+                             'a leitura dos lotes; a gravação continua em --conexao')
+    parser.add_argument('--atraso-maximo', type=float, default=ATRASO_MAXIMO_REPLICA,
+                        help='atraso de replicação tolerado, em segundos, antes de voltar a ler '
+                             f'do primário (padrão: {ATRASO_MAXIMO_REPLICA:g})')
+    parser.add_argument('--quadras', help='lista de ins_quadra separadas por vírgula')
+    parser.add_argument('--arquivo', help='CSV com as colunas ins_quadra e ordem_primeira')
+    parser.add_argument('--ordem-primeira', type=int, default=1,
+                        help='ordem do lote que passa a ser o primeiro (padrão: 1)')
+    parser.add_argument('--tabela-lotes',
+                        help=f'tabela de origem dos lotes (padrão: a do município, ou {TABELA_LOTES})')
+    parser.add_argument('--trabalhadores', type=int,
+                        help='conexões em paralelo, até o orçamento de conexões de cada município '
+                             '(padrão: o orçamento do município, ou 1)')
+    parser.add_argument('--pular-ocupadas', action='store_true',
+                        help='pula quadras que outra sessão esteja gravando em vez de aguardar')
+    parser.add_argument('--modo', choices=MODOS_GRAVACAO, default=MODO_SUBSTITUIR,
+                        help='substituir: delete+insert da quadra; upsert: ON CONFLICT só nas '
+                             'linhas alteradas (padrão: substituir)')
+    parser.add_argument('--provisionar', action='store_true',
+                        help='cria a tabela novaordem, o índice único (ins_quadra, matricula), o '
+                             'livro de execuções novaordem_runs e a tabela de pontos de controle '
+                             'novaordem_checkpoints se faltarem (sem --quadras/--arquivo, só provisiona)')
+    parser.add_argument('--particionada', action='store_true',
+                        help='com --provisionar, cria a novaordem particionada por faixas de ins_quadra '
+                             '(ou converte a existente)')
+    parser.add_argument('--criar-particoes', metavar='INICIO:FIM:TAMANHO|distrito',
+                        help='cria as partições que faltam: faixas de TAMANHO quadras em [INICIO, FIM) '
+                             'ou uma por distrito da tabela de lotes (com --coluna-distrito)')
+    parser.add_argument('--recarregar-particao', metavar='NOME',
+                        help='refaz as quadras de --quadras/--arquivo numa carga da partição NOME e a '
+                             'troca pela partição atual (as demais quadras dela são mantidas)')
+    parser.add_argument('--historico', action='store_true',
+                        help='com --provisionar, cria também o histórico das quadras ({novaordem}_historico): '
+                             'cada gravação passa a guardar a versão anterior da quadra')
+    parser.add_argument('--desfazer', type=int, metavar='N',
+                        help='volta as quadras de --quadras/--arquivo a antes das suas N últimas gravações')
+    parser.add_argument('--podar-historico', type=int, metavar='N',
+                        help='mantém no histórico só as N versões mais recentes de cada quadra')
+    parser.add_argument('--operador', help='operador registrado no livro de execuções '
+                                           '(padrão: usuário do sistema)')
+    parser.add_argument('--sem-registro', action='store_true',
+                        help='não grava a execução no livro de execuções')
+    parser.add_argument('--validar', action='store_true',
+                        help='em vez de reorganizar, valida a novaordem de todas as quadras '
+                             '(duplicados, lacunas, matrículas faltantes/sobrando e regra de rotação)')
+    parser.add_argument('--local', action='store_true',
+                        help='com --validar, lê a novaordem e os lotes para esta máquina e valida com numpy, '
+                             'em vez de validar no servidor')
+    parser.add_argument('--lote', help='identificador do lote retomável (padrão: derivado das quadras, '
+                                       'da tabela de origem e do modo)')
+    parser.add_argument('--retomar', '--resume', action='store_true',
+                        help='retoma o lote: pula as quadras já concluídas numa execução anterior')
+    parser.add_argument('--exportar', metavar='PASTA',
+                        help='em vez de reorganizar, exporta as rotas (novaordem em ordem de n_ordem) '
+                             'para PASTA, só das quadras informadas se houver --quadras/--arquivo')
+    parser.add_argument('--formato', choices=FORMATOS, default=CSV, help=f'formato das rotas (padrão: {CSV})')
+    parser.add_argument('--por', choices=AGRUPAMENTOS, default=POR_QUADRA,
+                        help=f'um arquivo por quadra ou por distrito (padrão: {POR_QUADRA})')
+    parser.add_argument('--coluna-distrito',
+                        help='coluna de distrito da tabela de lotes (para --por distrito e '
+                             '--criar-particoes distrito)')
+    parser.add_argument('--coluna-geometria',
+                        help=f'coluna de geometria da tabela de lotes; vazia exporta sem geometria '
+                             f'(padrão: a do perfil do município ou {COLUNA_GEOMETRIA})')
+    parser.add_argument('--gzip', action='store_true', help='compacta as rotas exportadas')
+    parser.add_argument('--instalar-gatilho', action='store_true',
+                        help='instala na tabela de lotes o gatilho que notifica as quadras alteradas')
+    parser.add_argument('--remover-gatilho', action='store_true',
+                        help='remove o gatilho de notificação da tabela de lotes')
+    parser.add_argument('--escutar', action='store_true',
+                        help='fica em LISTEN e reorganiza as quadras notificadas pelo gatilho '
+                             '(Ctrl+C encerra)')
+    parser.add_argument('--canal', help=f'canal de notificação (padrão: o do município, ou {CANAL})')
+    parser.add_argument('--espera', type=float, default=ESPERA,
+                        help=f'segundos sem notificações antes de processar (padrão: {ESPERA:g})')
+    parser.add_argument('--espera-maxima', type=float, default=ESPERA_MAXIMA,
+                        help='espera máxima de uma quadra notificada, mesmo com notificações '
+                             f'contínuas (padrão: {ESPERA_MAXIMA:g})')
+    parser.add_argument('--tempo-limite', type=float,
+                        help='statement_timeout de cada instrução, em segundos; 0 desliga '
+                             f'(padrão: ORGANIZADOR_TEMPO_LIMITE ou {TEMPO_LIMITE_INSTRUCAO:g})')
+    parser.add_argument('--tempo-limite-bloqueio', type=float,
+                        help='lock_timeout, em segundos; 0 desliga '
+                             f'(padrão: ORGANIZADOR_TEMPO_LIMITE_BLOQUEIO ou {TEMPO_LIMITE_BLOQUEIO:g})')
+    parser.add_argument('--tentativas', type=int,
+                        help='tentativas por quadra após erros transitórios '
+                             f'(padrão: ORGANIZADOR_TENTATIVAS ou {TENTATIVAS})')
+    parser.add_argument('--perfil', action='store_true',
+                        help='perfila a execução (cProfile + tracemalloc), como ORGANIZADOR_PERFIL=1')
+    return parser
+
+
+def validar(args, municipios):
+    problemas = 0
+    for municipio in municipios:
+        conn = abrir_conexao_leitura(municipio.conexao, municipio.conexao_leitura, args.atraso_maximo)
+        funcao = validar_local if args.local else validar_sql
+        try:
+            linhas, estatisticas = funcao(conn, municipio.tabela_lotes, municipio.novaordem,
+                                          campos=municipio.campos)
+        finally:
+            conn.close()
+        if len(municipios) > 1:
+            print(f'Município {municipio.nome}')
+        print(resumir(linhas, estatisticas))
+        problemas += len(linhas)
+    return 1 if problemas else 0
+
+
+def main(argv=None):
+    args = criar_parser().parse_args(argv)
+    # Valem para todas as conexões e quadras do processo (conexao_pg.configuracao)
+    for variavel, valor in (('ORGANIZADOR_TEMPO_LIMITE', args.tempo_limite),
+                            ('ORGANIZADOR_TEMPO_LIMITE_BLOQUEIO', args.tempo_limite_bloqueio),
+                            ('ORGANIZADOR_TENTATIVAS', args.tentativas)):
+        if valor is not None:
+            os.environ[variavel] = str(valor)
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s %(levelname)s %(message)s')
+    with perfilar('cli', ativo=True if args.perfil else None):
+        return executar(args)
+
+
+def exportar_rotas(args, municipios):
+    for municipio in municipios:
+        quadras = ([ins_quadra for ins_quadra, _ in ler_tarefas(args, municipio)]
+                   if args.quadras or args.arquivo else None)
+        # Vários municípios: uma subpasta por município
+        pasta = os.path.join(args.exportar, municipio.nome) if len(municipios) > 1 else args.exportar
+        conn = abrir_conexao_leitura(municipio.conexao, municipio.conexao_leitura, args.atraso_maximo)
+        try:
+            resultado = exportar(conn, pasta, args.formato, args.por, args.coluna_distrito,
+                                 municipio.coluna_geometria or None, quadras, args.gzip, municipio.tabela_lotes,
+                                 municipio.esquema, municipio.tabela_novaordem, campos=municipio.campos,
+                                 srid=municipio.srid)
+        finally:
+            conn.close()
+        print(f"{_prefixo(municipio, municipios)}{resultado['lotes']} lotes exportados em "
+              f"{len(resultado['arquivos'])} arquivos para {pasta}")
+    return 0
+
+
+def escutar(args, municipios):
+    escutas = [Escuta(municipio.conexao, args.canal or municipio.canal, municipio.tabela_lotes, args.espera,
+                      args.espera_maxima, TAMANHO_LOTE, _trabalhadores(args, municipio), args.modo,
+                      operador=args.operador, registrar=not args.sem_registro,
+                      conexao_leitura=municipio.conexao_leitura, esquema=municipio.esquema,
+                      tabela=municipio.tabela_novaordem, campos=municipio.campos)
+               for municipio in municipios]
+    # Uma escuta (e uma conexão em LISTEN) por município
+    threads = [threading.Thread(target=escuta.executar, name=f'escuta-{municipio.nome}', daemon=True)
+               for escuta, municipio in zip(escutas, municipios)]
+    for thread in threads:
+        thread.start()
+    try:
+        while any(thread.is_alive() for thread in threads):
+            for thread in threads:
+                thread.join(0.5)
+    except KeyboardInterrupt:
+        for escuta in escutas:
+            escuta.parar.set()
+        for thread in threads:
+            thread.join()
+    return 0
+
+
+def gatilho(args, municipios):
+    for municipio in municipios:
+        canal = args.canal or municipio.canal
+        conn = abrir_conexao(municipio.conexao)
+        try:
+            if args.remover_gatilho:
+                remover_gatilho(conn, municipio.tabela_lotes)
+                print(f'{_prefixo(municipio, municipios)}Gatilho de notificação removido de {municipio.tabela_lotes}')
+            else:
+                provisionar_gatilho(conn, municipio.tabela_lotes, canal, municipio.campos)
+                print(f'{_prefixo(municipio, municipios)}Gatilho de notificação instalado em '
+                      f'{municipio.tabela_lotes} (canal {canal})')
+        finally:
+            conn.close()
+
+
+def ler_particoes(args, conn, municipio):
+    """Partições de --criar-particoes: INICIO:FIM:TAMANHO ou uma por distrito"""
+    if args.criar_particoes == 'distrito':
+        if not args.coluna_distrito:
+            raise Exception('--criar-particoes distrito requer --coluna-distrito')
+        return faixas_por_distrito(conn, municipio.tabela_lotes, args.coluna_distrito, municipio.campos.quadra)
+    try:
+        inicio, fim, tamanho = (int(valor) for valor in args.criar_particoes.split(':'))
+    except ValueError:
+        raise Exception(f'--criar-particoes inválido: {args.criar_particoes} (use INICIO:FIM:TAMANHO ou distrito)')
+    return faixas(inicio, fim, tamanho)
+
+
+def provisionar(args, conn, municipio):
+    """--provisionar: novaordem (--particionada), livro de execuções, pontos de controle e --historico"""
+    provisionar_novaordem(conn, municipio.esquema, municipio.tabela_novaordem, args.particionada)
+    provisionar_execucoes(conn, municipio.esquema)
+    provisionar_checkpoints(conn, municipio.esquema)
+    if args.historico:
+        provisionar_historico(conn, municipio.esquema, municipio.tabela_novaordem)
+
+
+def provisionar_municipios(args, municipios):
+    """--provisionar sem quadras a executar: só provisiona cada município"""
+    erros = 0
+    for municipio in municipios:
+        prefixo = _prefixo(municipio, municipios)
+        try:
+            conn = abrir_conexao(municipio.conexao)
+            try:
+                provisionar(args, conn, municipio)
+            finally:
+                conn.close()
+            print(f'{prefixo}Tabelas de {municipio.novaordem} provisionadas')
+        except Exception as e:
+            print(f'{prefixo}{e}', file=sys.stderr)
+            erros += 1
+    return 1 if erros else 0
+
+
+def particionar(args, municipios):
+    """--provisionar/--criar-particoes/--recarregar-particao de cada município"""
+    erros = 0
+    for municipio in municipios:
+        prefixo = _prefixo(municipio, municipios)
+        conn = abrir_conexao(municipio.conexao)
+        try:
+            if args.provisionar:
+                provisionar(args, conn, municipio)
+            if args.criar_particoes:
+                criadas = criar_particoes(conn, ler_particoes(args, conn, municipio), municipio.esquema,
+                                          municipio.tabela_novaordem)
+                for particao in criadas:
+                    print(f'{prefixo}Partição {particao.nome} criada '
+                          f'(quadras {particao.inicio} a {particao.fim - 1})')
+                if not criadas:
+                    print(f'{prefixo}Nenhuma partição nova')
+            if args.recarregar_particao:
+                tarefas = ler_tarefas(args, municipio)
+                if not tarefas:
+                    raise Exception('Nenhuma quadra informada (use --quadras ou --arquivo).')
+                fonte = FonteLotesBanco(conn, municipio.tabela_lotes, campos=municipio.campos)
+                resultados = recarregar_particao(conn, args.recarregar_particao, tarefas, fonte,
+                                                 municipio.esquema, municipio.tabela_novaordem)
+                print(f'{prefixo}Partição {args.recarregar_particao} recarregada: {len(resultados)} quadras, '
+                      f"{sum(r.get('inseridos') or 0 for r in resultados)} lotes")
+        except Exception as e:
+            print(f'{prefixo}{e}', file=sys.stderr)
+            erros += 1
+        finally:
+            conn.close()
+    return 1 if erros else 0
+
+
+def historico(args, municipios):
+    """--desfazer/--podar-historico de cada município"""
+    erros = 0
+    for municipio in municipios:
+        prefixo = _prefixo(municipio, municipios)
+        conn = abrir_conexao(municipio.conexao)
+        try:
+            if args.desfazer is not None:
+                quadras = [ins_quadra for ins_quadra, _ in ler_tarefas(args, municipio)]
+                if not quadras:
+                    raise Exception('Nenhuma quadra informada (use --quadras ou --arquivo).')
+                desfeitas = desfazer_quadras(conn, quadras, args.desfazer, municipio.esquema,
+                                             municipio.tabela_novaordem)
+                for ins_quadra, (excluidos, restaurados) in desfeitas.items():
+                    print(f'{prefixo}Quadra {ins_quadra}: {excluidos} registros substituídos por '
+                          f'{restaurados} da versão anterior')
+                sem_historico = sorted(set(quadras) - set(desfeitas))
+                if sem_historico:
+                    print(f"{prefixo}Sem histórico: {', '.join(map(str, sem_historico))}", file=sys.stderr)
+            if args.podar_historico is not None:
+                removidas = podar_historico(conn, args.podar_historico, municipio.esquema,
+                                            municipio.tabela_novaordem)
+                print(f'{prefixo}{removidas} versões removidas do histórico')
+        except Exception as e:
+            print(f'{prefixo}{e}', file=sys.stderr)
+            erros += 1
+        finally:
+            conn.close()
+    return 1 if erros else 0
+
+
+def preparar(args, municipio, tarefas, prefixo=''):
+    """
+    Provisiona (--provisionar) e prepara o lote retomável do município.
+    Retorna (tarefas, lote), com lote None se não houver pontos de controle,
+    ou None se --retomar não tiver o que retomar.
+    """
+    lote = args.lote or identificar_lote(tarefas, municipio.tabela_lotes, args.modo)
+    conn = abrir_conexao(municipio.conexao)
+    try:
+        if args.provisionar:
+            provisionar(args, conn, municipio)
+        if checkpoints_disponiveis(conn, municipio.esquema):
+            total = len(tarefas)
+            tarefas = preparar_lote(conn, lote, tarefas, args.retomar, municipio.esquema)
+            print(f'{prefixo}Lote {lote}: {len(tarefas)} de {total} quadras a executar')
+        elif args.retomar:
+            print(f'{prefixo}Não há pontos de controle para retomar (use --provisionar).', file=sys.stderr)
+            return None
+        else:
+            lote = None
+    finally:
+        conn.close()
+    return tarefas, lote
+
+
+def executar(args):
+    try:
+        municipios = ler_municipios(args)
+    except Exception as e:
+        print(str(e), file=sys.stderr)
+        return 2
+
+    if args.instalar_gatilho or args.remover_gatilho:
+        gatilho(args, municipios)
+        if not (args.escutar or args.quadras or args.arquivo or args.provisionar):
+            return 0
+    if args.escutar:
+        return escutar(args, municipios)
+    if args.exportar:
+        return exportar_rotas(args, municipios)
+    if args.validar:
+        return validar(args, municipios)
+    if args.criar_particoes or args.recarregar_particao:
+        return particionar(args, municipios)
+    if args.desfazer is not None or args.podar_historico is not None:
+        return historico(args, municipios)
+    if args.provisionar and not (args.quadras or args.arquivo):
+        return provisionar_municipios(args, municipios)
+
+    # Um município que não pôde ser preparado não impede os demais
+    execucoes, nao_preparados = [], 0
+    for municipio in municipios:
+        tarefas = ler_tarefas(args, municipio)
+        if not tarefas:
+            continue
+        prefixo = _prefixo(municipio, municipios)
+        try:
+            preparado = preparar(args, municipio, tarefas, prefixo)
+        except Exception as e:
+            print(f'{prefixo}{e}', file=sys.stderr)
+            preparado = None
+        if preparado is None:
+            nao_preparados += 1
+            continue
+        execucoes.append((municipio, *preparado))
+    if not execucoes:
+        if not nao_preparados:
+            print('Nenhuma quadra informada (use --quadras ou --arquivo).', file=sys.stderr)
+        return 2
+
+    por_municipio = executar_municipios(execucoes, args.trabalhadores, pular_ocupadas=args.pular_ocupadas,
+                                        modo=args.modo, registrar=not args.sem_registro,
+                                        operador=args.operador, atraso_maximo=args.atraso_maximo)
+    erros = 0
+    for municipio, _, _ in execucoes:
+        resultados = por_municipio[municipio.nome]
+        prefixo = _prefixo(municipio, municipios)
+        ocupadas = sum(1 for r in resultados if r['situacao'] == OCUPADA)
+        com_erro = sum(1 for r in resultados if r['situacao'] == ERRO)
+        retentativas = sum(r.get('retentativas') or 0 for r in resultados)
+        espera = sum(r.get('espera_retentativas') or 0.0 for r in resultados)
+        print(f'{prefixo}{len(resultados) - ocupadas - com_erro} quadras gravadas, '
+              f'{ocupadas} puladas (ocupadas), {com_erro} com erro')
+        if retentativas:
+            print(f'{prefixo}{retentativas} retentativas, {espera:.1f} s de espera')
+        erros += com_erro
+    return 1 if erros or nao_preparados else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,287 @@
+# -*- coding: utf-8 -*-
+"""
+OrganizadorDeLotes - conexão topológica de polígonos vizinhos
+Versão sem QGIS do núcleo do algoritmo 'Conectar polígonos' (e_conectar_algorithm),
+reescrito a partir do Cad_ConnectPolygons do umcgeo: todo vértice de um lote
+que fica a até 'tolerancia' de um segmento de um lote vizinho (e que ainda
+não é vértice dele) é inserido nesse segmento, para que os dois compartilhem
+o vértice.
+
+O original comparava todos os pares de lotes e, para cada segmento, montava
+um buffer por vértice: O(n²) em lotes e inviável para a cidade inteira. Aqui:
+
+- os vizinhos candidatos de cada lote vêm de um índice espacial
+  (QgsSpatialIndex no QGIS; vizinhos_por_envelope fora dele);
+- os lotes se separam em grupos de vizinhança (na prática, as quadras) e cada
+  grupo tem a sua GradeVertices: um hash de células com os vértices do grupo,
+  consultado pelo envelope de cada segmento, em vez de interseções de buffers;
+- os grupos são independentes e podem ir para processos em paralelo (novos
+  interpretadores Python, ver contexto_processos).
+
+Os polígonos circulam como listas de anéis (o externo primeiro) de tuplas
+(x, y), fechados (primeiro ponto = último). Diferente do original, os furos
+são mantidos e tratados como os demais anéis, e um segmento recebe todos os
+vértices vizinhos que caem nele (em ordem ao longo do segmento), não só o
+primeiro encontrado.
+"""
+from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor
+from math import floor
+import multiprocessing
+import os
+import sys
+
+# Tolerância padrão para a aderência, em unidades do SRC (metros)
+TOLERANCIA = 0.01
+
+# Grupos enviados de uma vez a cada processo (reduz o custo de serialização)
+GRUPOS_POR_TAREFA = 64
+
+
+class GradeVertices:
+    """
+    Índice de vértices em células quadradas de lado 'celula': cada célula
+    guarda (x, y, dono) dos vértices que caem nela.
+    """
+
+    def __init__(self, celula):
+        self.celula = celula
+        self._celulas = defaultdict(list)
+
+    def adicionar(self, x, y, dono):
+        self._celulas[(floor(x / self.celula), floor(y / self.celula))].append((x, y, dono))
+
+    def no_envelope(self, xmin, ymin, xmax, ymax):
+        """Vértices das células que o envelope toca (um superconjunto dos que estão dentro dele)"""
+        celula = self.celula
+        celulas = self._celulas
+        for i in range(floor(xmin / celula), floor(xmax / celula) + 1):
+            for j in range(floor(ymin / celula), floor(ymax / celula) + 1):
+                vertices = celulas.get((i, j))
+                if vertices:
+                    yield from vertices
+
+
+def envelope(aneis):
+    """(xmin, ymin, xmax, ymax) de um polígono"""
+    xs = [x for anel in aneis for x, _ in anel]
+    ys = [y for anel in aneis for _, y in anel]
+    return min(xs), min(ys), max(xs), max(ys)
+
+
+def vizinhos_por_envelope(poligonos, tolerancia=TOLERANCIA):
+    """
+    {id: set(ids)} dos polígonos cujos envelopes, ampliados pela tolerância, se
+    tocam. Faz o papel do QgsSpatialIndex fora do QGIS (testes e benchmarks).
+    """
+    envelopes = {ident: envelope(aneis) for ident, aneis in poligonos.items()}
+    if not envelopes:
+        return {}
+    # Lado da célula: o tamanho mediano dos envelopes (um polígono grande só ocupa mais células)
+    tamanhos = sorted(max(xmax - xmin, ymax - ymin) for xmin, ymin, xmax, ymax in envelopes.values())
+    celula = tamanhos[len(tamanhos) // 2] or 1.0
+    grade = defaultdict(list)
+    for ident, (xmin, ymin, xmax, ymax) in envelopes.items():
+        for i in range(floor((xmin - tolerancia) / celula), floor((xmax + tolerancia) / celula) + 1):
+            for j in range(floor((ymin - tolerancia) / celula), floor((ymax + tolerancia) / celula) + 1):
+                grade[(i, j)].append(ident)
+    vizinhos = {ident: set() for ident in poligonos}
+    for idents in grade.values():
+        for a in idents:
+            axmin, aymin, axmax, aymax = envelopes[a]
+            for b in idents:
+                if a == b or b in vizinhos[a]:
+                    continue
+                bxmin, bymin, bxmax, bymax = envelopes[b]
+                if (axmin - tolerancia <= bxmax and bxmin <= axmax + tolerancia
+                        and aymin - tolerancia <= bymax and bymin <= aymax + tolerancia):
+                    vizinhos[a].add(b)
+                    vizinhos[b].add(a)
+    return vizinhos
+
+
+def grupos_vizinhanca(vizinhos):
+    """Componentes conexos do grafo de vizinhança (union-find); cada um é processado à parte"""
+    pai = {ident: ident for ident in vizinhos}
+
+    def raiz(ident):
+        while pai[ident] != ident:
+            pai[ident] = pai[pai[ident]]
+            ident = pai[ident]
+        return ident
+
+    for a, dos_vizinhos in vizinhos.items():
+        for b in dos_vizinhos:
+            ra, rb = raiz(a), raiz(b)
+            if ra != rb:
+                pai[rb] = ra
+    grupos = defaultdict(list)
+    for ident in vizinhos:
+        grupos[raiz(ident)].append(ident)
+    return list(grupos.values())
+
+
+def _celula(poligonos, tolerancia):
+    """Lado da célula: o comprimento médio dos segmentos, para poucas células por consulta"""
+    soma = quantidade = 0
+    for aneis in poligonos.values():
+        for anel in aneis:
+            for (x1, y1), (x2, y2) in zip(anel, anel[1:]):
+                soma += abs(x2 - x1) + abs(y2 - y1)
+                quantidade += 1
+    return max(soma / quantidade if quantidade else 0.0, 4 * tolerancia, 1e-9)
+
+
+def _conectar_anel(anel, grade, vizinhos, tolerancia):
+    """Anel com os vértices dos 'vizinhos' que caem nos seus segmentos; retorna (anel, inseridos)"""
+    proprios = set(anel)
+    tolerancia2 = tolerancia * tolerancia
+    novo = []
+    inseridos = 0
+    for (x1, y1), (x2, y2) in zip(anel, anel[1:]):
+        novo.append((x1, y1))
+        dx, dy = x2 - x1, y2 - y1
+        comprimento2 = dx * dx + dy * dy
+        no_segmento = {}
+        for x, y, dono in grade.no_envelope(min(x1, x2) - tolerancia, min(y1, y2) - tolerancia,
+                                            max(x1, x2) + tolerancia, max(y1, y2) + tolerancia):
+            if dono not in vizinhos or (x, y) in proprios or (x, y) in no_segmento:
+                continue
+            t = ((x - x1) * dx + (y - y1) * dy) / comprimento2 if comprimento2 else 0.0
+            t = 0.0 if t < 0.0 else 1.0 if t > 1.0 else t
+            px, py = x1 + t * dx - x, y1 + t * dy - y
+            if px * px + py * py <= tolerancia2:
+                no_segmento[(x, y)] = t
+        if no_segmento:
+            novo.extend(sorted(no_segmento, key=no_segmento.get))
+            inseridos += len(no_segmento)
+    novo.append(anel[-1])
+    return novo, inseridos
+
+
+def conectar_grupo(poligonos, vizinhos, tolerancia=TOLERANCIA):
+    """
+    Conecta os polígonos de um grupo ({id: anéis}) aos seus vizinhos
+    ({id: ids}, todos no grupo). Só os vértices originais são usados, então o
+    resultado não depende da ordem dos lotes. Retorna {id: (anéis, inseridos)}.
+    """
+    grade = GradeVertices(_celula(poligonos, tolerancia))
+    for ident, aneis in poligonos.items():
+        for anel in aneis:
+            # O último ponto repete o primeiro
+            for x, y in anel[:-1]:
+                grade.adicionar(x, y, ident)
+
+    resultado = {}
+    for ident, aneis in poligonos.items():
+        dos_vizinhos = vizinhos.get(ident)
+        if not dos_vizinhos:
+            resultado[ident] = (aneis, 0)
+            continue
+        novos, inseridos = [], 0
+        for anel in aneis:
+            novo, quantidade = _conectar_anel(anel, grade, dos_vizinhos, tolerancia)
+            novos.append(novo)
+            inseridos += quantidade
+        resultado[ident] = (novos, inseridos)
+    return resultado
+
+
+def _conectar_grupos(tarefas, tolerancia):
+    resultado = {}
+    for poligonos, vizinhos in tarefas:
+        resultado.update(conectar_grupo(poligonos, vizinhos, tolerancia))
+    return resultado
+
+
+def tarefas_por_grupo(poligonos, vizinhos):
+    """(poligonos, vizinhos) de cada grupo de vizinhança"""
+    return [({ident: poligonos[ident] for ident in grupo}, {ident: vizinhos[ident] for ident in grupo})
+            for grupo in grupos_vizinhanca(vizinhos)]
+
+
+def interpretador_python():
+    """
+    Caminho do interpretador Python em execução, ou None se não for achado.
+    Dentro do QGIS, sys.executable é o executável do QGIS, não o do Python:
+    o interpretador é procurado em sys.exec_prefix (python.exe no Windows,
+    bin/python3 no Linux e no macOS).
+    """
+    if os.path.basename(sys.executable).lower().startswith('python'):
+        return sys.executable
+    if sys.platform == 'win32':
+        candidatos = [os.path.join(sys.exec_prefix, 'python.exe'), os.path.join(sys.exec_prefix, 'python3.exe')]
+    else:
+        versao = f'python{sys.version_info.major}.{sys.version_info.minor}'
+        candidatos = [os.path.join(sys.exec_prefix, 'bin', nome) for nome in ('python3', versao, 'python')]
+    for candidato in candidatos:
+        if os.path.isfile(candidato):
+            return candidato
+    return None
+
+
+def contexto_processos():
+    """
+    Contexto 'spawn' do multiprocessing apontado para interpretador_python(), ou
+    None se não houver interpretador. Nunca 'fork': copiar o processo do QGIS
+    (Qt, conexões abertas) não é seguro; e o spawn padrão, no QGIS, reabriria o
+    próprio QGIS em cada processo.
+    """
+    executavel = interpretador_python()
+    if executavel is None:
+        return None
+    contexto = multiprocessing.get_context('spawn')
+    contexto.set_executable(executavel)
+    return contexto
+
+
+def executar_grupos(funcao, tarefas, argumentos=(), processos=1, progresso=None, cancelado=None):
+    """
+    Chama funcao(lote de tarefas, *argumentos) para lotes de GRUPOS_POR_TAREFA
+    tarefas, num ProcessPoolExecutor (ver contexto_processos) se processos > 1
+    ('funcao' deve ser de nível de módulo); sem interpretador Python achado,
+    tudo roda no próprio processo. progresso(feitos, total) é chamado a cada
+    lote; se cancelado() retornar True, os lotes restantes não são feitos. Gera
+    o resultado de cada lote, na ordem das tarefas.
+    """
+    lotes = [tarefas[i:i + GRUPOS_POR_TAREFA] for i in range(0, len(tarefas), GRUPOS_POR_TAREFA)]
+    feitos = 0
+    contexto = contexto_processos() if processos > 1 and len(lotes) > 1 else None
+    if contexto is not None:
+        with ProcessPoolExecutor(max_workers=processos, mp_context=contexto) as executor:
+            futuros = [executor.submit(funcao, lote, *argumentos) for lote in lotes]
+            for futuro, lote in zip(futuros, lotes):
+                if cancelado is not None and cancelado():
+                    for pendente in futuros:
+                        pendente.cancel()
+                    return
+                resultado = futuro.result()
+                feitos += len(lote)
+                if progresso is not None:
+                    progresso(feitos, len(tarefas))
+                yield resultado
+        return
+
+    for lote in lotes:
+        if cancelado is not None and cancelado():
+            return
+        resultado = funcao(lote, *argumentos)
+        feitos += len(lote)
+        if progresso is not None:
+            progresso(feitos, len(tarefas))
+        yield resultado
+
+
+def conectar_poligonos(poligonos, vizinhos, tolerancia=TOLERANCIA, processos=1, progresso=None,
+                       cancelado=None):
+    """
+    Conecta todos os polígonos ({id: anéis}) com os vizinhos candidatos do índice
+    espacial ({id: ids}). Com processos > 1 os grupos de vizinhança vão para um
+    ProcessPoolExecutor (ver executar_grupos); se cancelado() retornar True, os
+    grupos restantes ficam fora do resultado. Retorna {id: (anéis, inseridos)}.
+    """
+    resultado = {}
+    for parcial in executar_grupos(_conectar_grupos, tarefas_por_grupo(poligonos, vizinhos), (tolerancia,),
+                                   processos, progresso, cancelado):
+        resultado.update(parcial)
+    return resultado
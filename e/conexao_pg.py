@@ -0,0 +1,301 @@
+# -*- coding: utf-8 -*-
+"""
+OrganizadorDeLotes - conexões PostgreSQL
+Abre conexões psycopg2 a partir das conexões PostGIS cadastradas no QGIS
+(ou de uma DSN, para os executores em lote fora do QGIS).
+
+Leituras (existência da quadra, resumo, validação, lotes da quadra no
+executor em lote) podem ser roteadas para uma réplica de leitura com
+abrir_conexao_leitura; a gravação na novaordem continua no primário. Se a
+réplica estiver inacessível ou atrasada além do limite, a leitura volta
+para o primário.
+
+Toda conexão sai com statement_timeout e lock_timeout (ORGANIZADOR_TEMPO_LIMITE /
+ORGANIZADOR_TEMPO_LIMITE_BLOQUEIO ou as chaves QSettings
+'OrganizadorDeLotes/tempo_limite' e 'OrganizadorDeLotes/tempo_limite_bloqueio',
+em segundos; 0 desliga), de modo que uma espera por bloqueio na novaordem
+não congele o QGIS. PoliticaRetentativa repete uma transação inteira após
+falhas transitórias (serialização, deadlock, tempo de bloqueio esgotado,
+conexão perdida), com espera exponencial e jitter, reabrindo a Sessao se a
+conexão caiu (ORGANIZADOR_TENTATIVAS / 'OrganizadorDeLotes/tentativas').
+"""
+import logging
+import os
+import random
+import sys
+import threading
+import time
+
+LOGGER = logging.getLogger('OrganizadorDeLotes')
+
+# Padrões (segundos / tentativas), sobrepostos pelo ambiente ou pelas QSettings
+TEMPO_LIMITE_INSTRUCAO = 60.0
+TEMPO_LIMITE_BLOQUEIO = 15.0
+TENTATIVAS = 4
+
+# SQLSTATEs transitórios: serialization_failure, deadlock_detected, lock_not_available
+# (lock_timeout esgotado). Os da classe 08 e admin/crash_shutdown indicam conexão perdida.
+SQLSTATES_TRANSITORIOS = frozenset(('40001', '40P01', '55P03'))
+SQLSTATES_CONEXAO = frozenset(('57P01', '57P02', '57P03'))
+
+# Atraso de replicação tolerado por padrão, em segundos
+ATRASO_MAXIMO_REPLICA = 30.0
+
+# Atraso da réplica em segundos (0 se já reproduziu tudo o que recebeu, ou se
+# o servidor não é uma réplica). Sem escrita no primário o timestamp da última
+# transação reproduzida envelhece, por isso a comparação de LSN vem primeiro.
+SQL_ATRASO_REPLICA = '''
+SELECT CASE
+    WHEN NOT pg_is_in_recovery() THEN 0
+    WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0
+    ELSE COALESCE(extract(epoch FROM now() - pg_last_xact_replay_timestamp())::double precision,
+                  'Infinity'::double precision)
+END
+'''
+
+# Valores possíveis de sslmode gravados pelo QGIS (enum QgsDataSourceUri.SslMode)
+_SSLMODES = {
+    '0': 'prefer', 'SslPrefer': 'prefer',
+    '1': 'disable', 'SslDisable': 'disable',
+    '2': 'allow', 'SslAllow': 'allow',
+    '3': 'require', 'SslRequire': 'require',
+    '4': 'verify-ca', 'SslVerifyCa': 'verify-ca',
+    '5': 'verify-full', 'SslVerifyFull': 'verify-full',
+}
+
+
+def _psycopg2():
+    try:
+        import psycopg2
+        import psycopg2.extras  # noqa: F401
+        import psycopg2.sql  # noqa: F401
+    except ImportError as e:
+        raise Exception("O módulo psycopg2 não está disponível neste Python. "
+                        "Ele acompanha as instalações do QGIS (OSGeo4W) e pode ser "
+                        "instalado com 'pip install psycopg2'.") from e
+    return psycopg2
+
+
+def eh_dsn(conexao):
+    """Indica se o valor informado é uma DSN/URI e não o nome de uma conexão do QGIS"""
+    return '=' in conexao or conexao.startswith(('postgres://', 'postgresql://'))
+
+
+def parametros_conexao(nome):
+    """Lê os parâmetros da conexão PostgreSQL 'nome' cadastrada nas QSettings do QGIS"""
+    from qgis.PyQt.QtCore import QSettings
+
+    settings = QSettings()
+    settings.beginGroup(f'PostgreSQL/connections/{nome}')
+    if not settings.childKeys():
+        settings.endGroup()
+        raise Exception(f"Conexão PostgreSQL '{nome}' não encontrada nas configurações do QGIS!")
+
+    parametros = {
+        'service': settings.value('service', ''),
+        'host': settings.value('host', ''),
+        'port': settings.value('port', ''),
+        'dbname': settings.value('database', ''),
+        'user': settings.value('username', ''),
+        'password': settings.value('password', ''),
+        'sslmode': _SSLMODES.get(str(settings.value('sslmode', '')), ''),
+    }
+    authcfg = settings.value('authcfg', '')
+    settings.endGroup()
+
+    if authcfg:
+        from qgis.core import QgsApplication, QgsAuthMethodConfig
+        config = QgsAuthMethodConfig()
+        QgsApplication.authManager().loadAuthenticationConfig(authcfg, config, True)
+        parametros['user'] = config.config('username', parametros['user'])
+        parametros['password'] = config.config('password', parametros['password'])
+
+    return {chave: str(valor) for chave, valor in parametros.items() if valor}
+
+
+def configuracao(variavel, chave, padrao):
+    """Valor numérico da variável de ambiente 'variavel', senão da chave QSettings 'chave', senão 'padrao'"""
+    valor = os.environ.get(variavel)
+    if valor is None:
+        try:
+            from qgis.PyQt.QtCore import QSettings
+        except ImportError:
+            return padrao
+        valor = QSettings().value(chave, None)
+    if valor in (None, ''):
+        return padrao
+    try:
+        return type(padrao)(float(valor))
+    except (TypeError, ValueError):
+        LOGGER.warning("Valor inválido para %s/%s: %r; usando %s", variavel, chave, valor, padrao)
+        return padrao
+
+
+def _opcoes_tempo_limite(tempo_limite, tempo_limite_bloqueio):
+    if tempo_limite is None:
+        tempo_limite = configuracao('ORGANIZADOR_TEMPO_LIMITE', 'OrganizadorDeLotes/tempo_limite',
+                                    TEMPO_LIMITE_INSTRUCAO)
+    if tempo_limite_bloqueio is None:
+        tempo_limite_bloqueio = configuracao('ORGANIZADOR_TEMPO_LIMITE_BLOQUEIO',
+                                             'OrganizadorDeLotes/tempo_limite_bloqueio', TEMPO_LIMITE_BLOQUEIO)
+    return (f'-c statement_timeout={int(tempo_limite * 1000)} '
+            f'-c lock_timeout={int(tempo_limite_bloqueio * 1000)}')
+
+
+def abrir_conexao(conexao, application_name='OrganizadorDeLotes', tempo_limite=None, tempo_limite_bloqueio=None):
+    """
+    Abre uma conexão psycopg2. 'conexao' pode ser o nome de uma conexão do QGIS
+    (como listado em cmbConexao) ou uma DSN/URI libpq. tempo_limite e
+    tempo_limite_bloqueio (segundos, 0 desliga) valem para toda instrução da
+    sessão; None usa a configuração.
+    """
+    psycopg2 = _psycopg2()
+    opcoes = _opcoes_tempo_limite(tempo_limite, tempo_limite_bloqueio)
+    if eh_dsn(conexao):
+        # Opções já presentes na DSN (ex.: search_path) são mantidas
+        existentes = psycopg2.extensions.parse_dsn(conexao).get('options')
+        if existentes:
+            opcoes = f'{existentes} {opcoes}'
+        return psycopg2.connect(conexao, application_name=application_name, options=opcoes)
+    return psycopg2.connect(application_name=application_name, options=opcoes, **parametros_conexao(conexao))
+
+
+def conexao_perdida(erro):
+    """Indica se o erro significa que a conexão caiu (e precisa ser reaberta)"""
+    # Sem psycopg2 carregado, o erro não veio de uma conexão
+    psycopg2 = sys.modules.get('psycopg2')
+    if psycopg2 is None:
+        return False
+    if isinstance(erro, psycopg2.InterfaceError):
+        return True
+    if not isinstance(erro, psycopg2.OperationalError):
+        return False
+    pgcode = getattr(erro, 'pgcode', None)
+    return pgcode is None or pgcode.startswith('08') or pgcode in SQLSTATES_CONEXAO
+
+
+def erro_transitorio(erro):
+    """Indica se vale repetir a transação que falhou com 'erro'"""
+    return getattr(erro, 'pgcode', None) in SQLSTATES_TRANSITORIOS or conexao_perdida(erro)
+
+
+class PoliticaRetentativa:
+    """
+    Repete uma operação transacional após erros transitórios, até 'tentativas'
+    vezes no total, esperando entre elas um tempo sorteado entre 0 e
+    min(espera_maxima, espera_inicial * 2 ** n) (backoff exponencial com
+    jitter completo, para que trabalhadores em conflito não voltem juntos).
+    """
+
+    def __init__(self, tentativas=None, espera_inicial=0.2, espera_maxima=5.0, sortear=random.random,
+                 dormir=time.sleep):
+        if tentativas is None:
+            tentativas = configuracao('ORGANIZADOR_TENTATIVAS', 'OrganizadorDeLotes/tentativas', TENTATIVAS)
+        self.tentativas = max(1, tentativas)
+        self.espera_inicial = espera_inicial
+        self.espera_maxima = espera_maxima
+        self._sortear = sortear
+        self._dormir = dormir
+
+    def espera(self, tentativa):
+        """Segundos a esperar depois da falha da tentativa 'tentativa' (a partir de 0)"""
+        return self._sortear() * min(self.espera_maxima, self.espera_inicial * 2 ** tentativa)
+
+    def executar(self, operacao, reconectar=None):
+        """
+        Chama operacao() até ela concluir ou falhar de forma não transitória
+        (ou esgotar as tentativas, quando o último erro é propagado). Se a
+        conexão caiu, chama reconectar() antes de repetir. Retorna
+        (valor, retentativas, segundos de espera).
+        """
+        retentativas, espera_total = 0, 0.0
+        while True:
+            try:
+                return operacao(), retentativas, espera_total
+            except Exception as e:
+                if not erro_transitorio(e) or retentativas + 1 >= self.tentativas:
+                    raise
+                espera = self.espera(retentativas)
+                LOGGER.warning("Erro transitório (%s), nova tentativa em %.2f s: %s",
+                               getattr(e, 'pgcode', None) or type(e).__name__, espera, e)
+                retentativas += 1
+                espera_total += espera
+                self._dormir(espera)
+                if reconectar is not None and conexao_perdida(e):
+                    try:
+                        reconectar()
+                    except Exception as erro_conexao:
+                        # Conta como mais uma tentativa falha; a próxima volta tenta de novo
+                        LOGGER.warning("Falha ao reabrir a conexão: %s", erro_conexao)
+
+
+class Sessao:
+    """
+    Conexão reaberta sob demanda. 'abrir' é chamado sem argumentos para abrir
+    a conexão; quem compartilha a mesma Sessao recebe a mesma conexão reaberta.
+    """
+
+    def __init__(self, abrir):
+        self._abrir = abrir
+        self._trava = threading.Lock()
+        self.conn = abrir()
+
+    def reabrir(self, velha=None):
+        """Reabre a conexão, a menos que 'velha' já tenha sido substituída; retorna a atual"""
+        with self._trava:
+            if velha is None or velha is self.conn:
+                try:
+                    self.conn.close()
+                except Exception:
+                    pass
+                self.conn = self._abrir()
+            return self.conn
+
+    def close(self):
+        self.conn.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *excecao):
+        self.close()
+
+
+def atraso_replica(conn):
+    """Atraso de replicação do servidor de 'conn', em segundos (0 fora de uma réplica)"""
+    with conn:
+        with conn.cursor() as cursor:
+            cursor.execute(SQL_ATRASO_REPLICA)
+            return cursor.fetchone()[0]
+
+
+def abrir_conexao_leitura(conexao, conexao_leitura=None, atraso_maximo=ATRASO_MAXIMO_REPLICA,
+                          application_name='OrganizadorDeLotes', **opcoes):
+    """
+    Abre uma conexão somente leitura. Com 'conexao_leitura' (nome de conexão do
+    QGIS ou DSN da réplica), usa a réplica enquanto o atraso de replicação for
+    de até 'atraso_maximo' segundos; se ela estiver inacessível ou atrasada,
+    ou sem 'conexao_leitura', usa o primário 'conexao'. 'opcoes' vão para
+    abrir_conexao (tempos-limite).
+    """
+    if conexao_leitura and conexao_leitura != conexao:
+        try:
+            conn = abrir_conexao(conexao_leitura, application_name=f'{application_name} (leitura)', **opcoes)
+        except Exception as e:
+            LOGGER.warning("Réplica de leitura indisponível, lendo do primário: %s", e)
+        else:
+            try:
+                atraso = atraso_replica(conn)
+            except Exception as e:
+                atraso = None
+                LOGGER.warning("Não foi possível medir o atraso da réplica, lendo do primário: %s", e)
+            if atraso is not None and atraso <= atraso_maximo:
+                conn.set_session(readonly=True)
+                return conn
+            if atraso is not None:
+                LOGGER.warning("Réplica atrasada %.1f s (limite %.1f s), lendo do primário", atraso, atraso_maximo)
+            conn.close()
+
+    conn = abrir_conexao(conexao, application_name=application_name, **opcoes)
+    conn.set_session(readonly=True)
+    return conn
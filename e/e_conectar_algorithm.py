@@ -0,0 +1,129 @@
+from qgis.PyQt.QtCore import QCoreApplication
+from qgis.core import (QgsProcessing, QgsProcessingAlgorithm, QgsProcessingException, QgsProcessingParameterNumber,
+                       QgsProcessingParameterFeatureSource, QgsProcessingParameterFeatureSink,
+                       QgsProcessingOutputNumber, QgsFeatureSink, QgsFeature, QgsGeometry, QgsPointXY,
+                       QgsSpatialIndex, QgsWkbTypes)
+from .conectar_poligonos import conectar_poligonos, interpretador_python, TOLERANCIA
+
+
+def ler_lotes(lotes, tolerancia, feedback):
+    """
+    Uma passada pela fonte de lotes: ({id: atributos}, {id: anéis como tuplas},
+    {id: ids dos vizinhos candidatos no QgsSpatialIndex}). Feições multipartes
+    são erro; as vazias ficam só nos atributos (sem anéis nem vizinhos), para
+    quem precisar repassá-las. Cancelado, retorna o que leu até ali.
+    """
+    indice = QgsSpatialIndex()
+    atributos, poligonos, envelopes = {}, {}, {}
+    for feicao in lotes.getFeatures():
+        if feedback.isCanceled():
+            break
+        geometria = feicao.geometry()
+        if geometria.isMultipart():
+            raise QgsProcessingException(
+                QCoreApplication.translate('Processing', 'Feição de id {} é multiparte! '
+                                           'Feições multipartes não são permitidas!').format(feicao.id()))
+        atributos[feicao.id()] = feicao.attributes()
+        if geometria.isEmpty():
+            continue
+        poligonos[feicao.id()] = [[(p.x(), p.y()) for p in anel] for anel in geometria.asPolygon()]
+        envelopes[feicao.id()] = geometria.boundingBox().buffered(tolerancia)
+        indice.addFeature(feicao)
+    vizinhos = {ident: {vizinho for vizinho in indice.intersects(envelope) if vizinho != ident}
+                for ident, envelope in envelopes.items()}
+    return atributos, poligonos, vizinhos
+
+
+class aConectarPoligonosAlgorithm(QgsProcessingAlgorithm):
+    INPUT = 'INPUT'
+    TOLERANCIA = 'TOLERANCIA'
+    PROCESSOS = 'PROCESSOS'
+    OUTPUT = 'OUTPUT'
+    VERTICES = 'VERTICES'
+
+    def initAlgorithm(self, config):
+        self.addParameter(QgsProcessingParameterFeatureSource(
+            self.INPUT, self.tr('Lotes'), [QgsProcessing.TypeVectorPolygon]))
+        self.addParameter(QgsProcessingParameterNumber(
+            self.TOLERANCIA, self.tr('Tolerância para a aderência (metros)'),
+            QgsProcessingParameterNumber.Double, TOLERANCIA, minValue=0.001))
+        self.addParameter(QgsProcessingParameterNumber(
+            self.PROCESSOS, self.tr('Processos em paralelo (1: no próprio QGIS)'),
+            QgsProcessingParameterNumber.Integer, 1, minValue=1))
+        self.addParameter(QgsProcessingParameterFeatureSink(self.OUTPUT, self.tr('Lotes conectados')))
+        self.addOutput(QgsProcessingOutputNumber(self.VERTICES, self.tr('Vértices inseridos')))
+
+    def processAlgorithm(self, parameters, context, feedback):
+        lotes = self.parameterAsSource(parameters, self.INPUT, context)
+        if lotes is None:
+            raise QgsProcessingException(self.invalidSourceError(parameters, self.INPUT))
+        tolerancia = self.parameterAsDouble(parameters, self.TOLERANCIA, context)
+        processos = self.parameterAsInt(parameters, self.PROCESSOS, context)
+        if processos > 1 and interpretador_python() is None:
+            feedback.reportError(self.tr('Interpretador Python não encontrado; os grupos serão processados '
+                                         'no próprio QGIS.'), False)
+        if lotes.sourceCrs().isGeographic():
+            # Metros para graus, como no original
+            tolerancia /= 111000
+
+        (sink, dest_id) = self.parameterAsSink(parameters, self.OUTPUT, context, lotes.fields(),
+                                               QgsWkbTypes.Polygon, lotes.sourceCrs())
+        if sink is None:
+            raise QgsProcessingException(self.invalidSinkError(parameters, self.OUTPUT))
+
+        feedback.pushInfo(self.tr('Lendo os lotes e montando o índice espacial...'))
+        atributos, poligonos, vizinhos = ler_lotes(lotes, tolerancia, feedback)
+        if feedback.isCanceled():
+            return {self.OUTPUT: dest_id, self.VERTICES: 0}
+
+        feedback.pushInfo(self.tr('Verificando e corrigindo a conectividade...'))
+
+        def progresso(feitos, total):
+            feedback.setProgress(int(feitos * 100 / total))
+
+        conectados = conectar_poligonos(poligonos, vizinhos, tolerancia, processos, progresso,
+                                        feedback.isCanceled)
+
+        inseridos = 0
+        for ident, (aneis, quantidade) in conectados.items():
+            feicao = QgsFeature(lotes.fields())
+            feicao.setAttributes(atributos[ident])
+            feicao.setGeometry(QgsGeometry.fromPolygonXY([[QgsPointXY(x, y) for x, y in anel] for anel in aneis]))
+            sink.addFeature(feicao, QgsFeatureSink.FastInsert)
+            inseridos += quantidade
+
+        # Lotes sem geometria não entram na conexão, mas seguem para a saída como estão
+        vazios = [ident for ident in atributos if ident not in poligonos]
+        for ident in vazios:
+            feicao = QgsFeature(lotes.fields())
+            feicao.setAttributes(atributos[ident])
+            sink.addFeature(feicao, QgsFeatureSink.FastInsert)
+        if vazios:
+            feedback.pushInfo(self.tr('{} lotes sem geometria copiados sem alteração').format(len(vazios)))
+
+        feedback.pushInfo(self.tr('{} vértices inseridos em {} lotes').format(inseridos, len(conectados)))
+        return {self.OUTPUT: dest_id, self.VERTICES: inseridos}
+
+    def name(self):
+        return 'conectar_poligonos'
+
+    def displayName(self):
+        return self.tr('Conectar polígonos')
+
+    def shortHelpString(self):
+        return self.tr('Insere nos segmentos de cada lote os vértices dos lotes vizinhos que caem neles '
+                       '(até a tolerância), para a perfeita conectividade entre eles. Os vizinhos vêm de um '
+                       'índice espacial e cada grupo de lotes vizinhos (quadra) é processado à parte, '
+                       'opcionalmente em processos paralelos.')
+
+    def group(self):
+        return self.tr('Ferramentas UMC')
+
+    def groupId(self):
+        return 'umc_ferramentas'
+
+    def tr(self, string):
+        return QCoreApplication.translate('Processing', string)
+
+    def createInstance(self):
+        return aConectarPoligonosAlgorithm()
@@ -0,0 +1,97 @@
+from qgis.PyQt.QtCore import QCoreApplication, QVariant
+from qgis.core import (QgsProcessing, QgsProcessingAlgorithm, QgsProcessingException, QgsProcessingParameterNumber,
+                       QgsProcessingParameterFeatureSource, QgsProcessingParameterFeatureSink,
+                       QgsProcessingParameterBoolean, QgsFeatureSink, QgsFeature, QgsFields, QgsField, QgsGeometry,
+                       QgsPointXY, QgsWkbTypes)
+from .conectar_poligonos import interpretador_python, TOLERANCIA
+from .e_conectar_algorithm import ler_lotes
+from .linhas_lotes import linhas_lotes, CONFRONTACAO
+
+
+class aConfrontacoesAlgorithm(QgsProcessingAlgorithm):
+    INPUT = 'INPUT'
+    TOLERANCIA = 'TOLERANCIA'
+    CONECTAR = 'CONECTAR'
+    PROCESSOS = 'PROCESSOS'
+    OUTPUT = 'OUTPUT'
+
+    def initAlgorithm(self, config):
+        self.addParameter(QgsProcessingParameterFeatureSource(
+            self.INPUT, self.tr('Lotes'), [QgsProcessing.TypeVectorPolygon]))
+        self.addParameter(QgsProcessingParameterNumber(
+            self.TOLERANCIA, self.tr('Tolerância (metros)'),
+            QgsProcessingParameterNumber.Double, TOLERANCIA, minValue=0.001))
+        self.addParameter(QgsProcessingParameterBoolean(
+            self.CONECTAR, self.tr('Conectar os lotes antes (vértices dos vizinhos nos segmentos)'), True))
+        self.addParameter(QgsProcessingParameterNumber(
+            self.PROCESSOS, self.tr('Processos em paralelo (1: no próprio QGIS)'),
+            QgsProcessingParameterNumber.Integer, 1, minValue=1))
+        self.addParameter(QgsProcessingParameterFeatureSink(self.OUTPUT, self.tr('Linhas de confrontação')))
+
+    def processAlgorithm(self, parameters, context, feedback):
+        lotes = self.parameterAsSource(parameters, self.INPUT, context)
+        if lotes is None:
+            raise QgsProcessingException(self.invalidSourceError(parameters, self.INPUT))
+        tolerancia = self.parameterAsDouble(parameters, self.TOLERANCIA, context)
+        conectar = self.parameterAsBool(parameters, self.CONECTAR, context)
+        processos = self.parameterAsInt(parameters, self.PROCESSOS, context)
+        if processos > 1 and interpretador_python() is None:
+            feedback.reportError(self.tr('Interpretador Python não encontrado; as quadras serão processadas '
+                                         'no próprio QGIS.'), False)
+        if lotes.sourceCrs().isGeographic():
+            tolerancia /= 111000
+
+        # ID1 == ID2: testada do lote ID1; senão, divisa de ID1 com ID2
+        campos = QgsFields()
+        campos.append(QgsField('ID1', QVariant.Int))
+        campos.append(QgsField('ID2', QVariant.Int))
+        (sink, dest_id) = self.parameterAsSink(parameters, self.OUTPUT, context, campos,
+                                               QgsWkbTypes.LineString, lotes.sourceCrs())
+        if sink is None:
+            raise QgsProcessingException(self.invalidSinkError(parameters, self.OUTPUT))
+
+        feedback.pushInfo(self.tr('Lendo os lotes e montando o índice espacial...'))
+        _, poligonos, vizinhos = ler_lotes(lotes, tolerancia, feedback)
+        if feedback.isCanceled():
+            return {self.OUTPUT: dest_id}
+
+        feedback.pushInfo(self.tr('Identificando as linhas de confrontação por quadra...'))
+
+        def progresso(feitos, total):
+            feedback.setProgress(int(feitos * 100 / total))
+
+        quantidade = 0
+        for id1, id2, coordenadas in linhas_lotes(poligonos, vizinhos, CONFRONTACAO, tolerancia=tolerancia,
+                                                  conectar=conectar, processos=processos, progresso=progresso,
+                                                  cancelado=feedback.isCanceled):
+            feicao = QgsFeature(campos)
+            feicao.setGeometry(QgsGeometry.fromPolylineXY([QgsPointXY(x, y) for x, y in coordenadas]))
+            feicao.setAttributes([id1, id2])
+            sink.addFeature(feicao, QgsFeatureSink.FastInsert)
+            quantidade += 1
+
+        feedback.pushInfo(self.tr('{} linhas de confrontação').format(quantidade))
+        return {self.OUTPUT: dest_id}
+
+    def name(self):
+        return 'linhas_confrontacao'
+
+    def displayName(self):
+        return self.tr('Linhas de confrontação')
+
+    def shortHelpString(self):
+        return self.tr('Gera as linhas de divisa entre lotes vizinhos (ID1, ID2, uma para cada lado) e as de '
+                       'testada (ID1 = ID2). Cada quadra tem um índice de segmentos com as pontas encaixadas na '
+                       'tolerância; as quadras podem ser processadas em processos paralelos.')
+
+    def group(self):
+        return self.tr('Ferramentas UMC')
+
+    def groupId(self):
+        return 'umc_ferramentas'
+
+    def tr(self, string):
+        return QCoreApplication.translate('Processing', string)
+
+    def createInstance(self):
+        return aConfrontacoesAlgorithm()
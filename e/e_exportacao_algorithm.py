@@ -0,0 +1,103 @@
+from qgis.PyQt.QtCore import QCoreApplication
+from qgis.core import (QgsProcessingAlgorithm, QgsProcessingParameterString, QgsProcessingParameterEnum,
+                       QgsProcessingParameterBoolean, QgsProcessingParameterFolderDestination,
+                       QgsProcessingOutputNumber)
+from .conexao_pg import abrir_conexao_leitura
+from .execucao_quadras import TABELA_LOTES
+from .exportacao import exportar, FORMATOS, AGRUPAMENTOS, COLUNA_GEOMETRIA
+from .municipios import Municipio, obter_municipio
+
+
+class aExportacaoAlgorithm(QgsProcessingAlgorithm):
+    MUNICIPIO = 'MUNICIPIO'
+    CONEXAO = 'CONEXAO'
+    CONEXAO_LEITURA = 'CONEXAO_LEITURA'
+    TABELA_LOTES = 'TABELA_LOTES'
+    FORMATO = 'FORMATO'
+    AGRUPAMENTO = 'AGRUPAMENTO'
+    COLUNA_DISTRITO = 'COLUNA_DISTRITO'
+    COLUNA_GEOMETRIA = 'COLUNA_GEOMETRIA'
+    SEM_GEOMETRIA = 'SEM_GEOMETRIA'
+    COMPACTAR = 'COMPACTAR'
+    PASTA = 'PASTA'
+    ARQUIVOS = 'ARQUIVOS'
+    LOTES = 'LOTES'
+
+    def initAlgorithm(self, config):
+        self.addParameter(QgsProcessingParameterString(
+            self.MUNICIPIO, self.tr('Município (perfil; se informado, vale no lugar da conexão e da tabela)'), optional=True))
+        self.addParameter(QgsProcessingParameterString(
+            self.CONEXAO, self.tr('Conexão PostgreSQL (nome salvo no QGIS ou DSN)'), 'postgres'))
+        self.addParameter(QgsProcessingParameterString(
+            self.CONEXAO_LEITURA, self.tr('Réplica de leitura (opcional)'), optional=True))
+        self.addParameter(QgsProcessingParameterString(
+            self.TABELA_LOTES, self.tr('Tabela de lotes de origem'), TABELA_LOTES))
+        self.addParameter(QgsProcessingParameterEnum(
+            self.FORMATO, self.tr('Formato'), options=['CSV', 'GeoJSON-seq'], defaultValue=0))
+        self.addParameter(QgsProcessingParameterEnum(
+            self.AGRUPAMENTO, self.tr('Um arquivo por'), options=[self.tr('Quadra'), self.tr('Distrito')],
+            defaultValue=0))
+        self.addParameter(QgsProcessingParameterString(
+            self.COLUNA_DISTRITO, self.tr('Coluna de distrito (para um arquivo por distrito)'), optional=True))
+        self.addParameter(QgsProcessingParameterString(
+            self.COLUNA_GEOMETRIA,
+            self.tr('Coluna de geometria (vazia: a do município, ou {})').format(COLUNA_GEOMETRIA),
+            optional=True))
+        self.addParameter(QgsProcessingParameterBoolean(
+            self.SEM_GEOMETRIA, self.tr('Exportar sem geometria'), False))
+        self.addParameter(QgsProcessingParameterBoolean(
+            self.COMPACTAR, self.tr('Compactar (gzip)'), False))
+        self.addParameter(QgsProcessingParameterFolderDestination(self.PASTA, self.tr('Pasta das rotas')))
+        self.addOutput(QgsProcessingOutputNumber(self.ARQUIVOS, self.tr('Arquivos exportados')))
+        self.addOutput(QgsProcessingOutputNumber(self.LOTES, self.tr('Lotes exportados')))
+
+    def processAlgorithm(self, parameters, context, feedback):
+        conexao = self.parameterAsString(parameters, self.CONEXAO, context)
+        conexao_leitura = self.parameterAsString(parameters, self.CONEXAO_LEITURA, context)
+        tabela_lotes = self.parameterAsString(parameters, self.TABELA_LOTES, context)
+        formato = FORMATOS[self.parameterAsEnum(parameters, self.FORMATO, context)]
+        agrupamento = AGRUPAMENTOS[self.parameterAsEnum(parameters, self.AGRUPAMENTO, context)]
+        coluna_distrito = self.parameterAsString(parameters, self.COLUNA_DISTRITO, context)
+        coluna_geometria = self.parameterAsString(parameters, self.COLUNA_GEOMETRIA, context)
+        sem_geometria = self.parameterAsBool(parameters, self.SEM_GEOMETRIA, context)
+        compactar = self.parameterAsBool(parameters, self.COMPACTAR, context)
+        pasta = self.parameterAsString(parameters, self.PASTA, context)
+        nome = self.parameterAsString(parameters, self.MUNICIPIO, context)
+        municipio = (obter_municipio(nome) if nome else
+                     Municipio(conexao=conexao, conexao_leitura=conexao_leitura or None, tabela_lotes=tabela_lotes))
+        coluna_geometria = None if sem_geometria else coluna_geometria or municipio.coluna_geometria or None
+
+        def progresso(arquivos, lotes):
+            feedback.setProgressText(self.tr('{} arquivos, {} lotes').format(arquivos, lotes))
+
+        feedback.pushInfo(self.tr('Exportando as rotas para {}...').format(pasta))
+        conn = abrir_conexao_leitura(municipio.conexao, municipio.conexao_leitura)
+        try:
+            resultado = exportar(conn, pasta, formato, agrupamento, coluna_distrito or None, coluna_geometria,
+                                 compactar=compactar, tabela_lotes=municipio.tabela_lotes, esquema=municipio.esquema,
+                                 tabela=municipio.tabela_novaordem, progresso=progresso,
+                                 cancelado=feedback.isCanceled, campos=municipio.campos, srid=municipio.srid)
+        finally:
+            conn.close()
+
+        feedback.pushInfo(self.tr('{} lotes exportados em {} arquivos').format(
+            resultado['lotes'], len(resultado['arquivos'])))
+        return {self.PASTA: pasta, self.ARQUIVOS: len(resultado['arquivos']), self.LOTES: resultado['lotes']}
+
+    def name(self):
+        return 'exportar_rotas'
+
+    def displayName(self):
+        return self.tr('Exportar rotas de leitura')
+
+    def group(self):
+        return self.tr('Ferramentas UMC')
+
+    def groupId(self):
+        return 'umc_ferramentas'
+
+    def tr(self, string):
+        return QCoreApplication.translate('Processing', string)
+
+    def createInstance(self):
+        return aExportacaoAlgorithm()
@@ -0,0 +1,71 @@
+from qgis.PyQt.QtCore import QCoreApplication
+from qgis.core import (QgsProcessingAlgorithm, QgsProcessingParameterString, QgsProcessingParameterBoolean,
+                       QgsProcessingOutputString)
+from .conexao_pg import abrir_conexao
+from .execucao_quadras import TABELA_LOTES
+from .municipios import Municipio, obter_municipio
+from .provisionamento import provisionar_gatilho, remover_gatilho
+
+
+class aGatilhoAlgorithm(QgsProcessingAlgorithm):
+    MUNICIPIO = 'MUNICIPIO'
+    CONEXAO = 'CONEXAO'
+    TABELA_LOTES = 'TABELA_LOTES'
+    CANAL = 'CANAL'
+    REMOVER = 'REMOVER'
+    SITUACAO = 'SITUACAO'
+
+    def initAlgorithm(self, config):
+        self.addParameter(QgsProcessingParameterString(
+            self.MUNICIPIO, self.tr('Município (perfil; se informado, vale no lugar da conexão e da tabela)'), optional=True))
+        self.addParameter(QgsProcessingParameterString(
+            self.CONEXAO, self.tr('Conexão PostgreSQL (nome salvo no QGIS ou DSN)'), 'postgres'))
+        self.addParameter(QgsProcessingParameterString(
+            self.TABELA_LOTES, self.tr('Tabela de lotes de origem'), TABELA_LOTES))
+        self.addParameter(QgsProcessingParameterString(
+            self.CANAL, self.tr('Canal de notificação (padrão: o do município)'), optional=True))
+        self.addParameter(QgsProcessingParameterBoolean(
+            self.REMOVER, self.tr('Remover o gatilho'), False))
+        self.addOutput(QgsProcessingOutputString(self.SITUACAO, self.tr('Situação')))
+
+    def processAlgorithm(self, parameters, context, feedback):
+        conexao = self.parameterAsString(parameters, self.CONEXAO, context)
+        tabela_lotes = self.parameterAsString(parameters, self.TABELA_LOTES, context)
+        canal = self.parameterAsString(parameters, self.CANAL, context)
+        remover = self.parameterAsBool(parameters, self.REMOVER, context)
+        nome = self.parameterAsString(parameters, self.MUNICIPIO, context)
+        municipio = obter_municipio(nome) if nome else Municipio(conexao=conexao, tabela_lotes=tabela_lotes)
+        tabela_lotes = municipio.tabela_lotes
+        canal = canal or municipio.canal
+
+        conn = abrir_conexao(municipio.conexao)
+        try:
+            if remover:
+                remover_gatilho(conn, tabela_lotes)
+                situacao = self.tr('Gatilho de notificação removido de {}').format(tabela_lotes)
+            else:
+                provisionar_gatilho(conn, tabela_lotes, canal, municipio.campos)
+                situacao = self.tr('Gatilho de notificação instalado em {} (canal {})').format(tabela_lotes, canal)
+        finally:
+            conn.close()
+
+        feedback.pushInfo(situacao)
+        return {self.SITUACAO: situacao}
+
+    def name(self):
+        return 'gatilho_notificacao'
+
+    def displayName(self):
+        return self.tr('Instalar gatilho de notificação')
+
+    def group(self):
+        return self.tr('Ferramentas UMC')
+
+    def groupId(self):
+        return 'umc_ferramentas'
+
+    def tr(self, string):
+        return QCoreApplication.translate('Processing', string)
+
+    def createInstance(self):
+        return aGatilhoAlgorithm()
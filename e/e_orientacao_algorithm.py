@@ -0,0 +1,136 @@
+from qgis.PyQt.QtCore import QCoreApplication
+from qgis.core import (QgsProcessing, QgsProcessingAlgorithm, QgsProcessingException, QgsProcessingParameterNumber,
+                       QgsProcessingParameterVectorLayer, QgsProcessingParameterBoolean, QgsProcessingParameterEnum,
+                       QgsProcessingParameterFeatureSink, QgsFeatureSink, QgsFeature, QgsGeometry, QgsPointXY,
+                       QgsSpatialIndex, QgsWkbTypes)
+from .conectar_poligonos import TOLERANCIA
+from .orientacao_poligonos import orientar_poligonos, HORARIO, NORTE
+
+
+class aOrientacaoAlgorithm(QgsProcessingAlgorithm):
+    INPUT = 'INPUT'
+    SELECIONADOS = 'SELECIONADOS'
+    SENTIDO = 'SENTIDO'
+    PRIMEIRO = 'PRIMEIRO'
+    TESTADA = 'TESTADA'
+    TOLERANCIA = 'TOLERANCIA'
+    OUTPUT = 'OUTPUT'
+
+    def initAlgorithm(self, config):
+        self.addParameter(QgsProcessingParameterVectorLayer(
+            self.INPUT, self.tr('Lotes'), [QgsProcessing.TypeVectorPolygon]))
+        self.addParameter(QgsProcessingParameterBoolean(
+            self.SELECIONADOS, self.tr('Apenas selecionados (os demais lotes contam como vizinhos)'), False))
+        self.addParameter(QgsProcessingParameterEnum(
+            self.SENTIDO, self.tr('Orientação'),
+            options=[self.tr('Horário'), self.tr('Anti-horário'), self.tr('Não alterar')], defaultValue=HORARIO))
+        self.addParameter(QgsProcessingParameterEnum(
+            self.PRIMEIRO, self.tr('Primeiro vértice'),
+            options=[self.tr('Sequência do polígono (não alterar)'), self.tr('Mais ao Norte'),
+                     self.tr('Mais ao Sul'), self.tr('Mais ao Leste'), self.tr('Mais ao Oeste')],
+            defaultValue=NORTE))
+        self.addParameter(QgsProcessingParameterBoolean(
+            self.TESTADA, self.tr('Primeiro vértice com vante confrontando o sistema viário'), False))
+        self.addParameter(QgsProcessingParameterNumber(
+            self.TOLERANCIA, self.tr('Tolerância das divisas (metros)'),
+            QgsProcessingParameterNumber.Double, TOLERANCIA, minValue=0.001))
+        self.addParameter(QgsProcessingParameterFeatureSink(self.OUTPUT, self.tr('Lotes orientados')))
+
+    def processAlgorithm(self, parameters, context, feedback):
+        camada = self.parameterAsVectorLayer(parameters, self.INPUT, context)
+        if camada is None:
+            raise QgsProcessingException(self.invalidSourceError(parameters, self.INPUT))
+        selecionados = self.parameterAsBool(parameters, self.SELECIONADOS, context)
+        sentido = self.parameterAsEnum(parameters, self.SENTIDO, context)
+        primeiro = self.parameterAsEnum(parameters, self.PRIMEIRO, context)
+        testada = self.parameterAsBool(parameters, self.TESTADA, context)
+        tolerancia = self.parameterAsDouble(parameters, self.TOLERANCIA, context)
+        if camada.crs().isGeographic():
+            tolerancia /= 111000
+
+        multi = QgsWkbTypes.isMultiType(camada.wkbType())
+        (sink, dest_id) = self.parameterAsSink(parameters, self.OUTPUT, context, camada.fields(),
+                                               QgsWkbTypes.MultiPolygon if multi else QgsWkbTypes.Polygon,
+                                               camada.crs())
+        if sink is None:
+            raise QgsProcessingException(self.invalidSinkError(parameters, self.OUTPUT))
+
+        # Uma leitura da camada: anéis e índice espacial de todos os lotes (os não
+        # selecionados também são vizinhos), atributos só dos que serão orientados
+        feedback.pushInfo(self.tr('Lendo os lotes...'))
+        ids_selecionados = set(camada.selectedFeatureIds()) if selecionados else None
+        indice = QgsSpatialIndex()
+        poligonos, atributos, envelopes = {}, {}, {}
+        # Lotes sem geometria: não são orientados, mas seguem para a saída como estão
+        vazios = []
+        for feicao in camada.getFeatures():
+            if feedback.isCanceled():
+                return {self.OUTPUT: dest_id}
+            geometria = feicao.geometry()
+            if geometria is None or geometria.isEmpty():
+                if ids_selecionados is None or feicao.id() in ids_selecionados:
+                    vazios.append(feicao.attributes())
+                continue
+            partes = geometria.asMultiPolygon() if geometria.isMultipart() else [geometria.asPolygon()]
+            poligonos[feicao.id()] = [[[(p.x(), p.y()) for p in anel] for anel in aneis] for aneis in partes]
+            if ids_selecionados is None or feicao.id() in ids_selecionados:
+                atributos[feicao.id()] = feicao.attributes()
+                envelopes[feicao.id()] = geometria.boundingBox().buffered(tolerancia)
+            if testada:
+                indice.addFeature(feicao)
+
+        vizinhos = {}
+        if testada:
+            vizinhos = {ident: [vizinho for vizinho in indice.intersects(envelope) if vizinho != ident]
+                        for ident, envelope in envelopes.items()}
+
+        feedback.pushInfo(self.tr('Orientando polígonos...'))
+        total = 100.0 / len(atributos) if atributos else 0
+        na_testada = 0
+        for atual, (ident, partes, quantidade) in enumerate(
+                orientar_poligonos(poligonos, vizinhos, primeiro, sentido, testada, tolerancia, list(atributos))):
+            if feedback.isCanceled():
+                break
+            feicao = QgsFeature(camada.fields())
+            feicao.setAttributes(atributos[ident])
+            pontos = [[[QgsPointXY(x, y) for x, y in anel] for anel in aneis] for aneis in partes]
+            geometria = QgsGeometry.fromMultiPolygonXY(pontos) if multi else QgsGeometry.fromPolygonXY(pontos[0])
+            feicao.setGeometry(geometria)
+            sink.addFeature(feicao, QgsFeatureSink.FastInsert)
+            na_testada += quantidade
+            feedback.setProgress(int((atual + 1) * total))
+
+        for valores in vazios:
+            feicao = QgsFeature(camada.fields())
+            feicao.setAttributes(valores)
+            sink.addFeature(feicao, QgsFeatureSink.FastInsert)
+        if vazios:
+            feedback.pushInfo(self.tr('{} lotes sem geometria copiados sem alteração').format(len(vazios)))
+
+        if testada:
+            feedback.pushInfo(self.tr('{} polígonos começando na testada').format(na_testada))
+        return {self.OUTPUT: dest_id}
+
+    def name(self):
+        return 'orientar_poligonos'
+
+    def displayName(self):
+        return self.tr('Orientar polígonos')
+
+    def shortHelpString(self):
+        return self.tr('Orienta os lotes no sentido escolhido, começando no vértice mais ao norte, sul, leste ou '
+                       'oeste, ou no primeiro vértice de testada (onde termina a divisa com um vizinho e começa o '
+                       'trecho voltado para a rua). Os vizinhos vêm de um índice espacial montado uma vez e cada '
+                       'lote é resolvido numa única passada. O resultado vai para uma nova camada.')
+
+    def group(self):
+        return self.tr('Ferramentas UMC')
+
+    def groupId(self):
+        return 'umc_ferramentas'
+
+    def tr(self, string):
+        return QCoreApplication.translate('Processing', string)
+
+    def createInstance(self):
+        return aOrientacaoAlgorithm()
@@ -32,6 +32,13 @@ __revision__ = '$Format:%H$'
 
 from qgis.core import QgsProcessingProvider
 from .e_algorithm import aAlgorithm
+from .e_validacao_algorithm import aValidacaoAlgorithm
+from .e_gatilho_algorithm import aGatilhoAlgorithm
+from .e_exportacao_algorithm import aExportacaoAlgorithm
+from .e_conectar_algorithm import aConectarPoligonosAlgorithm
+from .e_orientacao_algorithm import aOrientacaoAlgorithm
+from .e_testadas_algorithm import aTestadasAlgorithm
+from .e_confrontacoes_algorithm import aConfrontacoesAlgorithm
 
 
 class aProvider(QgsProcessingProvider):
@@ -54,6 +61,13 @@ class aProvider(QgsProcessingProvider):
         Loads all algorithms belonging to this provider.
         """
         self.addAlgorithm(aAlgorithm())
+        self.addAlgorithm(aValidacaoAlgorithm())
+        self.addAlgorithm(aGatilhoAlgorithm())
+        self.addAlgorithm(aExportacaoAlgorithm())
+        self.addAlgorithm(aConectarPoligonosAlgorithm())
+        self.addAlgorithm(aOrientacaoAlgorithm())
+        self.addAlgorithm(aTestadasAlgorithm())
+        self.addAlgorithm(aConfrontacoesAlgorithm())
         # add additional algorithms here
         # self.addAlgorithm(MyOtherAlgorithm())
 
@@ -0,0 +1,106 @@
+from qgis.PyQt.QtCore import QCoreApplication, QVariant
+from qgis.core import (QgsProcessing, QgsProcessingAlgorithm, QgsProcessingException, QgsProcessingParameterNumber,
+                       QgsProcessingParameterFeatureSource, QgsProcessingParameterFeatureSink,
+                       QgsProcessingParameterEnum, QgsProcessingParameterBoolean, QgsFeatureSink, QgsFeature,
+                       QgsField, QgsGeometry, QgsPointXY, QgsWkbTypes)
+from .conectar_poligonos import interpretador_python, TOLERANCIA
+from .e_conectar_algorithm import ler_lotes
+from .linhas_lotes import linhas_lotes, TESTADA
+from .orientacao_poligonos import NORTE
+
+
+class aTestadasAlgorithm(QgsProcessingAlgorithm):
+    INPUT = 'INPUT'
+    INICIO = 'INICIO'
+    TOLERANCIA = 'TOLERANCIA'
+    CONECTAR = 'CONECTAR'
+    PROCESSOS = 'PROCESSOS'
+    OUTPUT = 'OUTPUT'
+
+    def initAlgorithm(self, config):
+        self.addParameter(QgsProcessingParameterFeatureSource(
+            self.INPUT, self.tr('Lotes'), [QgsProcessing.TypeVectorPolygon]))
+        self.addParameter(QgsProcessingParameterEnum(
+            self.INICIO, self.tr('Início'),
+            options=[self.tr('Mais ao Norte'), self.tr('Mais ao Sul'), self.tr('Mais ao Leste'),
+                     self.tr('Mais ao Oeste')], defaultValue=0))
+        self.addParameter(QgsProcessingParameterNumber(
+            self.TOLERANCIA, self.tr('Tolerância (metros)'),
+            QgsProcessingParameterNumber.Double, TOLERANCIA, minValue=0.001))
+        self.addParameter(QgsProcessingParameterBoolean(
+            self.CONECTAR, self.tr('Conectar os lotes antes (vértices dos vizinhos nos segmentos)'), True))
+        self.addParameter(QgsProcessingParameterNumber(
+            self.PROCESSOS, self.tr('Processos em paralelo (1: no próprio QGIS)'),
+            QgsProcessingParameterNumber.Integer, 1, minValue=1))
+        self.addParameter(QgsProcessingParameterFeatureSink(self.OUTPUT, self.tr('Linhas de testada')))
+
+    def processAlgorithm(self, parameters, context, feedback):
+        lotes = self.parameterAsSource(parameters, self.INPUT, context)
+        if lotes is None:
+            raise QgsProcessingException(self.invalidSourceError(parameters, self.INPUT))
+        # As opções começam em 'Mais ao Norte'
+        primeiro = NORTE + self.parameterAsEnum(parameters, self.INICIO, context)
+        tolerancia = self.parameterAsDouble(parameters, self.TOLERANCIA, context)
+        conectar = self.parameterAsBool(parameters, self.CONECTAR, context)
+        processos = self.parameterAsInt(parameters, self.PROCESSOS, context)
+        if processos > 1 and interpretador_python() is None:
+            feedback.reportError(self.tr('Interpretador Python não encontrado; as quadras serão processadas '
+                                         'no próprio QGIS.'), False)
+        if lotes.sourceCrs().isGeographic():
+            tolerancia /= 111000
+
+        campos = lotes.fields()
+        campos.append(QgsField('sequencia', QVariant.Int))
+        campos.append(QgsField('comprimento', QVariant.Double))
+        campos.append(QgsField('valor_testada', QVariant.Double))
+        (sink, dest_id) = self.parameterAsSink(parameters, self.OUTPUT, context, campos,
+                                               QgsWkbTypes.LineString, lotes.sourceCrs())
+        if sink is None:
+            raise QgsProcessingException(self.invalidSinkError(parameters, self.OUTPUT))
+
+        feedback.pushInfo(self.tr('Lendo os lotes e montando o índice espacial...'))
+        atributos, poligonos, vizinhos = ler_lotes(lotes, tolerancia, feedback)
+        if feedback.isCanceled():
+            return {self.OUTPUT: dest_id}
+
+        feedback.pushInfo(self.tr('Calculando e sequenciando as testadas por quadra...'))
+
+        def progresso(feitos, total):
+            feedback.setProgress(int(feitos * 100 / total))
+
+        quantidade = 0
+        for ident, coordenadas, sequencia, comprimento, acumulado in linhas_lotes(
+                poligonos, vizinhos, TESTADA, primeiro, tolerancia, conectar, processos, progresso,
+                feedback.isCanceled):
+            feicao = QgsFeature(campos)
+            feicao.setGeometry(QgsGeometry.fromPolylineXY([QgsPointXY(x, y) for x, y in coordenadas]))
+            feicao.setAttributes(atributos[ident] + [sequencia, comprimento, acumulado])
+            sink.addFeature(feicao, QgsFeatureSink.FastInsert)
+            quantidade += 1
+
+        feedback.pushInfo(self.tr('{} linhas de testada').format(quantidade))
+        return {self.OUTPUT: dest_id}
+
+    def name(self):
+        return 'linhas_testada'
+
+    def displayName(self):
+        return self.tr('Linhas de testada')
+
+    def shortHelpString(self):
+        return self.tr('Gera as linhas de testada (trechos dos lotes voltados para a rua), sequenciadas por quadra '
+                       'a partir do vértice extremo escolhido, com comprimento e comprimento acumulado. Cada '
+                       'quadra tem um índice de segmentos com as pontas encaixadas na tolerância; as quadras '
+                       'podem ser processadas em processos paralelos.')
+
+    def group(self):
+        return self.tr('Ferramentas UMC')
+
+    def groupId(self):
+        return 'umc_ferramentas'
+
+    def tr(self, string):
+        return QCoreApplication.translate('Processing', string)
+
+    def createInstance(self):
+        return aTestadasAlgorithm()
@@ -0,0 +1,103 @@
+from qgis.PyQt.QtCore import QCoreApplication
+from qgis.core import (QgsProcessing, QgsProcessingAlgorithm, QgsProcessingException, QgsProcessingParameterString,
+                       QgsProcessingParameterNumber, QgsProcessingParameterFeatureSource, QgsProcessingOutputString,
+                       QgsProcessingOutputNumber, QgsFeatureRequest)
+from .conexao_pg import abrir_conexao_leitura, ATRASO_MAXIMO_REPLICA
+from .execucao_quadras import TABELA_LOTES
+from .lotes import LotesColunares
+from .municipios import Municipio, obter_municipio
+from .validacao import validar_sql, validar_colunas, ler_novaordem_colunas, resumir
+
+
+class aValidacaoAlgorithm(QgsProcessingAlgorithm):
+    MUNICIPIO = 'MUNICIPIO'
+    CONEXAO = 'CONEXAO'
+    CONEXAO_LEITURA = 'CONEXAO_LEITURA'
+    ATRASO_MAXIMO = 'ATRASO_MAXIMO'
+    TABELA_LOTES = 'TABELA_LOTES'
+    CAMADA_LOTES = 'CAMADA_LOTES'
+    RELATORIO = 'RELATORIO'
+    PROBLEMAS = 'PROBLEMAS'
+
+    def initAlgorithm(self, config):
+        self.addParameter(QgsProcessingParameterString(
+            self.MUNICIPIO, self.tr('Município (perfil; se informado, vale no lugar da conexão e da tabela)'), optional=True))
+        self.addParameter(QgsProcessingParameterString(
+            self.CONEXAO, self.tr('Conexão PostgreSQL (nome salvo no QGIS ou DSN)'), 'postgres'))
+        self.addParameter(QgsProcessingParameterString(
+            self.CONEXAO_LEITURA, self.tr('Réplica de leitura (opcional)'), optional=True))
+        self.addParameter(QgsProcessingParameterNumber(
+            self.ATRASO_MAXIMO, self.tr('Atraso máximo da réplica (s)'),
+            QgsProcessingParameterNumber.Double, ATRASO_MAXIMO_REPLICA, minValue=0))
+        self.addParameter(QgsProcessingParameterString(
+            self.TABELA_LOTES, self.tr('Tabela de lotes de origem'), TABELA_LOTES))
+        self.addParameter(QgsProcessingParameterFeatureSource(
+            self.CAMADA_LOTES, self.tr('Camada de lotes de origem (opcional: valida localmente contra ela, '
+                                       'no lugar da tabela)'),
+            [QgsProcessing.TypeVector], optional=True))
+        self.addOutput(QgsProcessingOutputString(self.RELATORIO, self.tr('Relatório')))
+        self.addOutput(QgsProcessingOutputNumber(self.PROBLEMAS, self.tr('Problemas encontrados')))
+
+    def processAlgorithm(self, parameters, context, feedback):
+        conexao = self.parameterAsString(parameters, self.CONEXAO, context)
+        conexao_leitura = self.parameterAsString(parameters, self.CONEXAO_LEITURA, context)
+        atraso_maximo = self.parameterAsDouble(parameters, self.ATRASO_MAXIMO, context)
+        tabela_lotes = self.parameterAsString(parameters, self.TABELA_LOTES, context)
+        nome = self.parameterAsString(parameters, self.MUNICIPIO, context)
+        municipio = (obter_municipio(nome) if nome else
+                     Municipio(conexao=conexao, conexao_leitura=conexao_leitura or None, tabela_lotes=tabela_lotes))
+
+        camada = self.parameterAsSource(parameters, self.CAMADA_LOTES, context)
+
+        feedback.pushInfo(self.tr('Validando a novaordem de todas as quadras...'))
+        conn = abrir_conexao_leitura(municipio.conexao, municipio.conexao_leitura, atraso_maximo)
+        try:
+            if camada is None:
+                linhas, estatisticas = validar_sql(conn, municipio.tabela_lotes, municipio.novaordem,
+                                                   campos=municipio.campos)
+            else:
+                novaordem = ler_novaordem_colunas(conn, municipio.novaordem)
+        finally:
+            conn.close()
+        if camada is not None:
+            linhas, estatisticas = validar_colunas(novaordem, self.ler_camada(camada, municipio.campos, feedback))
+
+        relatorio = resumir(linhas, estatisticas)
+        for linha in relatorio.splitlines():
+            feedback.pushInfo(linha)
+        return {self.RELATORIO: relatorio, self.PROBLEMAS: len(linhas)}
+
+    def ler_camada(self, camada, campos, feedback):
+        """Lotes (matrícula, quadra, ordem) da camada de origem como LotesColunares"""
+        nomes = camada.fields().names()
+        ausentes = [campo for campo in campos if campo not in nomes]
+        if ausentes:
+            raise QgsProcessingException(self.tr('Campos ausentes na camada de lotes: {}').format(
+                ', '.join(ausentes)))
+        request = QgsFeatureRequest()
+        request.setFlags(QgsFeatureRequest.NoGeometry)
+        request.setSubsetOfAttributes(list(campos), camada.fields())
+        lotes = LotesColunares()
+        for feicao in camada.getFeatures(request):
+            if feedback.isCanceled():
+                break
+            lotes.append(feicao[campos.matricula], feicao[campos.quadra], feicao[campos.ordem])
+        return lotes
+
+    def name(self):
+        return 'validar_novaordem'
+
+    def displayName(self):
+        return self.tr('Validar novaordem')
+
+    def group(self):
+        return self.tr('Ferramentas UMC')
+
+    def groupId(self):
+        return 'umc_ferramentas'
+
+    def tr(self, string):
+        return QCoreApplication.translate('Processing', string)
+
+    def createInstance(self):
+        return aValidacaoAlgorithm()
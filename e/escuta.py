@@ -0,0 +1,241 @@
+# -*- coding: utf-8 -*-
+"""
+OrganizadorDeLotes - reorganização contínua por LISTEN/NOTIFY
+Com o gatilho de provisionamento.provisionar_gatilho instalado na tabela de
+lotes, cada instrução que muda (ins_quadra, matricula, ordem) faz NOTIFY com
+as quadras afetadas. A Escuta fica em LISTEN no canal e:
+
+- acumula as quadras notificadas (Acumulador), esperando 'espera' segundos
+  sem novas notificações antes de agir (debounce), mas nunca mais que
+  'espera_maxima' desde a primeira pendente, nem mais que 'tamanho_lote'
+  quadras;
+- reorganiza só as quadras que já estão na novaordem, com a última
+  ordem_primeira gravada no livro de execuções (as demais ficam para o
+  diálogo, a menos que 'ordem_primeira' dê um padrão);
+- relata a defasagem de ponta a ponta de cada quadra: do instante da
+  alteração no servidor até a gravação da nova ordem, no relógio do servidor.
+
+Roda pela linha de comando (cli --escutar) ou dentro do QGIS como QgsTask
+(tarefa_escuta). Notificações emitidas enquanto a escuta está desconectada
+se perdem: ao reconectar, ela segue a partir das novas.
+"""
+import json
+import logging
+import select
+import threading
+import time
+
+from .conexao_pg import _psycopg2, abrir_conexao, conexao_perdida
+from .execucao_quadras import executar_quadras
+from .execucoes import TABELA_EXECUCOES
+from .instrucoes import REGISTRO
+from .novaordem import GRAVADA, ESQUEMA_NOVAORDEM, TABELA_NOVAORDEM, MODO_SUBSTITUIR
+from .reorganizacao import TABELA_LOTES, CAMPOS_LOTES
+
+LOGGER = logging.getLogger('OrganizadorDeLotes')
+
+CANAL = 'organizador_lotes'
+
+# Segundos sem notificações antes de processar, espera máxima da quadra mais
+# antiga e quadras por lote
+ESPERA = 2.0
+ESPERA_MAXIMA = 30.0
+TAMANHO_LOTE = 500
+
+# Intervalo máximo entre verificações do pedido de parada
+INTERVALO_PARADA = 1.0
+
+
+def decodificar(payload):
+    """(quadras, em) de uma notificação do gatilho; 'em' é o epoch do servidor"""
+    dados = json.loads(payload)
+    return [int(ins_quadra) for ins_quadra in dados['quadras']], float(dados['em'])
+
+
+class Acumulador:
+    """
+    Coalesce as quadras notificadas até o lote estar pronto. Guarda, para
+    cada quadra, o instante (servidor) da alteração mais antiga ainda pendente.
+    Os tempos 'agora' são de time.monotonic().
+    """
+
+    def __init__(self, espera=ESPERA, espera_maxima=ESPERA_MAXIMA, tamanho_lote=TAMANHO_LOTE):
+        self.espera = espera
+        self.espera_maxima = espera_maxima
+        self.tamanho_lote = tamanho_lote
+        self.pendentes = {}
+        self._primeira = None
+        self._ultima = None
+
+    def __len__(self):
+        return len(self.pendentes)
+
+    def adicionar(self, quadras, em, agora):
+        for ins_quadra in quadras:
+            anterior = self.pendentes.get(ins_quadra)
+            if anterior is None or em < anterior:
+                self.pendentes[ins_quadra] = em
+        if self.pendentes:
+            if self._primeira is None:
+                self._primeira = agora
+            self._ultima = agora
+
+    def prazo(self, agora):
+        """Segundos até o lote ficar pronto (None se não há pendentes)"""
+        if not self.pendentes:
+            return None
+        if len(self.pendentes) >= self.tamanho_lote:
+            return 0.0
+        return max(0.0, min(self._ultima + self.espera, self._primeira + self.espera_maxima) - agora)
+
+    def pronto(self, agora):
+        prazo = self.prazo(agora)
+        return prazo is not None and prazo <= 0.0
+
+    def retirar(self):
+        """Esvazia o acumulador; retorna {ins_quadra: em}"""
+        pendentes, self.pendentes = self.pendentes, {}
+        self._primeira = self._ultima = None
+        return pendentes
+
+
+class Escuta:
+    """
+    Laço de LISTEN que reorganiza as quadras notificadas. executar() bloqueia
+    até parar.set(); ao_processar(resumo) é chamado depois de cada lote com
+    o dicionário de estatísticas do lote. esquema/tabela/campos como em
+    execucao_quadras.executar_quadras.
+    """
+
+    def __init__(self, conexao, canal=CANAL, tabela_lotes=TABELA_LOTES, espera=ESPERA,
+                 espera_maxima=ESPERA_MAXIMA, tamanho_lote=TAMANHO_LOTE, trabalhadores=1,
+                 modo=MODO_SUBSTITUIR, ordem_primeira=None, operador=None, registrar=True,
+                 conexao_leitura=None, ao_processar=None, esquema=ESQUEMA_NOVAORDEM, tabela=TABELA_NOVAORDEM,
+                 campos=CAMPOS_LOTES):
+        self.conexao = conexao
+        self.canal = canal
+        self.tabela_lotes = tabela_lotes
+        self.trabalhadores = trabalhadores
+        self.modo = modo
+        self.ordem_primeira = ordem_primeira
+        self.operador = operador
+        self.registrar = registrar
+        self.conexao_leitura = conexao_leitura
+        self.ao_processar = ao_processar
+        self.esquema = esquema
+        self.tabela = tabela
+        self.campos = campos
+        self.acumulador = Acumulador(espera, espera_maxima, tamanho_lote)
+        self.parar = threading.Event()
+        self.lotes = 0
+
+    def _conectar(self):
+        conn = abrir_conexao(self.conexao, application_name='OrganizadorDeLotes (escuta)')
+        conn.autocommit = True
+        sql = _psycopg2().sql
+        with conn.cursor() as cursor:
+            cursor.execute(sql.SQL('LISTEN {}').format(sql.Identifier(self.canal)))
+        LOGGER.info("Escutando o canal %s", self.canal)
+        return conn
+
+    def executar(self):
+        espera = 1.0
+        while not self.parar.is_set():
+            try:
+                conn = self._conectar()
+            except Exception as e:
+                LOGGER.warning("Escuta sem conexão (%s); nova tentativa em %.0f s", e, espera)
+                self.parar.wait(espera)
+                espera = min(espera * 2, 60.0)
+                continue
+            espera = 1.0
+            try:
+                self._laco(conn)
+            except Exception as e:
+                if not conexao_perdida(e):
+                    raise
+                LOGGER.warning("Escuta perdeu a conexão: %s", e)
+            finally:
+                conn.close()
+        LOGGER.info("Escuta encerrada")
+
+    def _laco(self, conn):
+        while not self.parar.is_set():
+            prazo = self.acumulador.prazo(time.monotonic())
+            intervalo = INTERVALO_PARADA if prazo is None else min(prazo, INTERVALO_PARADA)
+            if select.select([conn], [], [], intervalo)[0]:
+                conn.poll()
+                while conn.notifies:
+                    notificacao = conn.notifies.pop(0)
+                    try:
+                        quadras, em = decodificar(notificacao.payload)
+                    except (ValueError, KeyError, TypeError) as e:
+                        LOGGER.warning("Notificação ignorada (%s): %r", e, notificacao.payload)
+                        continue
+                    self.acumulador.adicionar(quadras, em, time.monotonic())
+            if self.acumulador.pronto(time.monotonic()):
+                pendentes = self.acumulador.retirar()
+                try:
+                    self.processar(conn, pendentes)
+                except Exception as e:
+                    if conexao_perdida(e):
+                        # Voltam a ficar pendentes para depois da reconexão
+                        for ins_quadra, em in pendentes.items():
+                            self.acumulador.adicionar((ins_quadra,), em, time.monotonic())
+                        raise
+                    # Um lote com problema não derruba a escuta
+                    LOGGER.error("Erro ao processar as quadras %s: %s", sorted(pendentes), e)
+
+    def tarefas(self, conn, quadras):
+        """(ins_quadra, ordem_primeira) das quadras notificadas que devem ser reorganizadas"""
+        execucoes = f'{self.esquema}.{TABELA_EXECUCOES}'
+        with conn.cursor() as cursor:
+            cursor.execute('SELECT to_regclass(%s) IS NOT NULL', (execucoes,))
+            if cursor.fetchone()[0]:
+                nome, tabelas = 'ordens_vigentes', {'execucoes': execucoes}
+            else:
+                nome, tabelas = 'quadras_vigentes', {}
+            REGISTRO.executar(cursor, nome, (sorted(quadras),),
+                              tabela=f'{self.esquema}.{self.tabela}', **tabelas)
+            vigentes = cursor.fetchall()
+        tarefas = []
+        for ins_quadra, ordem_primeira in vigentes:
+            ordem_primeira = ordem_primeira or self.ordem_primeira
+            if ordem_primeira is None:
+                LOGGER.info("Quadra %s sem ordem_primeira registrada; fica para o diálogo", ins_quadra)
+            else:
+                tarefas.append((ins_quadra, ordem_primeira))
+        return tarefas
+
+    def processar(self, conn, pendentes):
+        """Reorganiza as quadras pendentes ({ins_quadra: em}) e relata a defasagem"""
+        tarefas = self.tarefas(conn, pendentes)
+        resultados = executar_quadras(self.conexao, tarefas, self.trabalhadores, tabela_lotes=self.tabela_lotes,
+                                      modo=self.modo, registrar=self.registrar,
+                                      operador=self.operador or 'escuta',
+                                      conexao_leitura=self.conexao_leitura, esquema=self.esquema,
+                                      tabela=self.tabela, campos=self.campos) if tarefas else []
+        with conn.cursor() as cursor:
+            cursor.execute('SELECT extract(epoch FROM clock_timestamp())::double precision')
+            agora = cursor.fetchone()[0]
+
+        defasagens = [agora - pendentes[r['ins_quadra']] for r in resultados if r['situacao'] == GRAVADA]
+        self.lotes += 1
+        resumo = {
+            'lote': self.lotes,
+            'notificadas': len(pendentes),
+            'reorganizadas': len(defasagens),
+            'ignoradas': len(pendentes) - len(tarefas),
+            'falhas': len(resultados) - len(defasagens),
+            'defasagem_media': sum(defasagens) / len(defasagens) if defasagens else None,
+            'defasagem_maxima': max(defasagens) if defasagens else None,
+        }
+        if defasagens:
+            LOGGER.info("Lote %(lote)s: %(reorganizadas)s de %(notificadas)s quadras reorganizadas, "
+                        "defasagem média %(defasagem_media).1f s, máxima %(defasagem_maxima).1f s", resumo)
+        else:
+            LOGGER.info("Lote %(lote)s: nenhuma das %(notificadas)s quadras notificadas reorganizada", resumo)
+        if self.ao_processar is not None:
+            self.ao_processar(resumo)
+        return resumo
+
@@ -0,0 +1,123 @@
+# -*- coding: utf-8 -*-
+"""
+OrganizadorDeLotes - execução em lote
+Reorganiza várias quadras fora do diálogo, lendo os lotes direto do banco.
+Cada trabalhador usa sua própria conexão, na qual as instruções preparadas
+são reaproveitadas de quadra em quadra; o bloqueio consultivo por quadra
+(novaordem.gravar_quadra) garante que trabalhadores concorrentes não gravem
+a mesma quadra ao mesmo tempo. Ao final, a execução é registrada no livro
+de execuções (execucoes.Execucao) com um único INSERT. Com um identificador
+de lote, cada quadra gravada vira um ponto de controle (ver retomada).
+"""
+import logging
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from functools import partial
+
+from .conexao_pg import abrir_conexao, ATRASO_MAXIMO_REPLICA
+from .novaordem import GRAVADA, OCUPADA, MODO_SUBSTITUIR, ESQUEMA_NOVAORDEM, TABELA_NOVAORDEM
+from .reorganizacao import TABELA_LOTES, CAMPOS_LOTES, FonteLotesBanco, DestinoBanco, backend_banco, reorganizar
+from .execucoes import Execucao, MOTOR_BANCO
+from .perfil import perfilado, perfilar_trabalhador
+
+LOGGER = logging.getLogger('OrganizadorDeLotes')
+
+ERRO = 'erro'
+
+
+def ler_lotes_quadra(conn, ins_quadra, tabela_lotes=TABELA_LOTES, campos=CAMPOS_LOTES):
+    """Retorna os lotes da quadra na tabela de origem como LotesColunares"""
+    return FonteLotesBanco(conn, tabela_lotes, campos=campos).ler_quadra(ins_quadra)
+
+
+def reorganizar_quadra(conn, ins_quadra, ordem_primeira, aguardar=True,
+                       tabela_lotes=TABELA_LOTES, modo=MODO_SUBSTITUIR, lote=None,
+                       esquema=ESQUEMA_NOVAORDEM, tabela=TABELA_NOVAORDEM, campos=CAMPOS_LOTES):
+    """
+    Lê os lotes, aplica a nova ordem e grava a quadra na novaordem.
+    O resultado de gravar_quadra ganha 'duracoes' (segundos por etapa).
+    Com 'lote', a quadra é marcada como concluída no lote na mesma transação.
+    """
+    return reorganizar(FonteLotesBanco(conn, tabela_lotes, campos=campos), DestinoBanco(conn, esquema, tabela),
+                       ins_quadra, ordem_primeira,
+                       aguardar, modo, (lote, ordem_primeira) if lote else None)
+
+
+def _trabalhador(backend, tarefas, aguardar, modo, lote, indice=0):
+    with perfilar_trabalhador(f'trabalhador-{indice}'):
+        return _reorganizar_tarefas(backend, tarefas, aguardar, modo, lote)
+
+
+def _reorganizar_tarefas(backend, tarefas, aguardar, modo, lote):
+    resultados = []
+    with backend() as (fonte, destino):
+        for ins_quadra, ordem_primeira in tarefas:
+            try:
+                resultado = reorganizar(fonte, destino, ins_quadra, ordem_primeira, aguardar, modo,
+                                        (lote, ordem_primeira) if lote else None)
+            except Exception as e:
+                LOGGER.error("Erro ao reorganizar a quadra %s: %s", ins_quadra, e)
+                resultado = {'situacao': ERRO, 'mensagem': str(e)}
+            resultado['ins_quadra'] = ins_quadra
+            resultado['ordem_primeira'] = ordem_primeira
+            resultados.append(resultado)
+    return resultados
+
+
+@perfilado('lote')
+def executar_quadras(conexao, tarefas, trabalhadores=1, pular_ocupadas=False,
+                     tabela_lotes=TABELA_LOTES, modo=MODO_SUBSTITUIR, registrar=True, operador=None,
+                     lote=None, backend=None, conexao_leitura=None, atraso_maximo=ATRASO_MAXIMO_REPLICA,
+                     esquema=ESQUEMA_NOVAORDEM, tabela=TABELA_NOVAORDEM, campos=CAMPOS_LOTES):
+    """
+    Reorganiza as quadras de 'tarefas' (sequência de (ins_quadra, ordem_primeira)).
+
+    trabalhadores: quantidade de conexões/threads em paralelo.
+    pular_ocupadas: se True, uma quadra que outro operador ou trabalhador esteja
+        gravando é pulada (situação OCUPADA) em vez de aguardar o bloqueio.
+    modo: MODO_SUBSTITUIR (delete+insert) ou MODO_UPSERT (ver novaordem).
+    registrar: grava a execução no livro de execuções (novaordem_runs),
+        em nome de 'operador' (padrão: usuário do sistema).
+    lote: identificador do lote retomável; cada quadra gravada é marcada
+        como concluída nele (as tarefas já devem vir filtradas por
+        retomada.preparar_lote).
+    backend: fábrica chamada por trabalhador que devolve um gerenciador de
+        contexto com (FonteLotes, DestinoNovaOrdem); padrão: uma conexão
+        por trabalhador em 'conexao' (reorganizacao.backend_banco).
+    conexao_leitura: réplica de onde os lotes são lidos, enquanto o atraso de
+        replicação não passar de 'atraso_maximo' segundos; a gravação vai
+        sempre para 'conexao'.
+    esquema/tabela: onde ficam a novaordem, o livro de execuções e os pontos
+        de controle; campos: colunas da tabela de lotes (ver municipios).
+    """
+    execucao = Execucao(conexao, MOTOR_BANCO, modo, operador) if registrar else None
+    if backend is None:
+        backend = partial(backend_banco, conexao, tabela_lotes, conexao_leitura, atraso_maximo,
+                          esquema, tabela, campos)
+    tarefas = list(tarefas)
+    trabalhadores = max(1, min(trabalhadores, len(tarefas) or 1))
+    fatias = [tarefas[i::trabalhadores] for i in range(trabalhadores)]
+
+    resultados = []
+    with ThreadPoolExecutor(max_workers=trabalhadores) as executor:
+        futuros = [executor.submit(_trabalhador, backend, fatia, not pular_ocupadas, modo, lote, i)
+                   for i, fatia in enumerate(fatias) if fatia]
+        for futuro in as_completed(futuros):
+            resultados.extend(futuro.result())
+
+    for resultado in resultados:
+        if resultado['situacao'] == GRAVADA:
+            LOGGER.info("Quadra %s: %s excluídos, %s inseridos", resultado['ins_quadra'],
+                        resultado['excluidos'], resultado['inseridos'])
+        elif resultado['situacao'] == OCUPADA:
+            LOGGER.warning("Quadra %s pulada: em uso por outra sessão", resultado['ins_quadra'])
+
+    if registrar:
+        for resultado in resultados:
+            execucao.adicionar(resultado)
+        conn = abrir_conexao(conexao)
+        try:
+            if execucao.gravar(conn, esquema):
+                LOGGER.info("Execução %s registrada (%s quadras)", execucao.id, len(resultados))
+        finally:
+            conn.close()
+    return resultados
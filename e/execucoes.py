@@ -0,0 +1,118 @@
+# -*- coding: utf-8 -*-
+"""
+OrganizadorDeLotes - livro de execuções
+Toda reorganização (pelo diálogo, pela linha de comando ou em lote) fica
+registrada na tabela comercial_umc.novaordem_runs: uma linha por quadra, com o
+identificador da execução, operador, conexão, motor, modo de gravação,
+situação, linhas excluídas/inseridas, a duração de cada etapa
+(leitura, cálculo e gravação) e as retentativas após erros transitórios,
+com o tempo total de espera entre elas. As quadras de uma execução são acumuladas
+em memória e gravadas com um único INSERT ... SELECT FROM unnest() no fim.
+
+Exemplo de consulta de vazão por dia:
+
+    SELECT date_trunc('day', inicio), count(*),
+           sum(inseridos) / sum(leitura_ms + calculo_ms + gravacao_ms) * 1000 AS lotes_por_s
+    FROM comercial_umc.novaordem_runs WHERE situacao = 'gravada' GROUP BY 1 ORDER BY 1;
+"""
+import getpass
+import logging
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from datetime import datetime, timezone
+
+from .conexao_pg import _psycopg2, eh_dsn
+from .instrucoes import REGISTRO
+from .novaordem import ESQUEMA_NOVAORDEM
+
+LOGGER = logging.getLogger('OrganizadorDeLotes')
+
+TABELA_EXECUCOES = 'novaordem_runs'
+
+# Motores: de onde vêm os lotes lidos
+MOTOR_QGIS = 'qgis'
+MOTOR_BANCO = 'banco'
+
+# Etapas cronometradas de cada quadra
+LEITURA = 'leitura'
+CALCULO = 'calculo'
+GRAVACAO = 'gravacao'
+ETAPAS = (LEITURA, CALCULO, GRAVACAO)
+
+
+@contextmanager
+def cronometrar(duracoes, etapa):
+    """Soma em duracoes[etapa] o tempo (em segundos) gasto dentro do bloco"""
+    inicio = time.perf_counter()
+    try:
+        yield
+    finally:
+        duracoes[etapa] = duracoes.get(etapa, 0.0) + time.perf_counter() - inicio
+
+
+def descrever_conexao(conexao):
+    """Nome da conexão do QGIS, ou a DSN sem a senha"""
+    if not eh_dsn(conexao):
+        return conexao
+    extensions = _psycopg2().extensions
+    parametros = extensions.parse_dsn(conexao)
+    parametros.pop('password', None)
+    return extensions.make_dsn(**parametros)
+
+
+class Execucao:
+    """Acumula os resultados das quadras de uma execução para gravá-los de uma vez"""
+
+    def __init__(self, conexao, motor, modo, operador=None):
+        self.id = str(uuid.uuid4())
+        self.inicio = datetime.now(timezone.utc)
+        self.fim = None
+        self.operador = operador or getpass.getuser()
+        self.conexao = descrever_conexao(conexao)
+        self.motor = motor
+        self.modo = modo
+        self.quadras = []
+        self._trava = threading.Lock()
+
+    def adicionar(self, resultado):
+        """
+        Registra o resultado de uma quadra (dicionário de reorganizar_quadra /
+        organizar_ordem_lote com ins_quadra, ordem_primeira, situacao e duracoes)
+        """
+        with self._trava:
+            self.quadras.append(resultado)
+
+    def _colunas(self):
+        colunas = ([], [], [], [], [], [], [], [], [], [], [], [])
+        for resultado in self.quadras:
+            duracoes = resultado.get('duracoes', {})
+            espera = resultado.get('espera_retentativas')
+            valores = (resultado['ins_quadra'], resultado.get('ordem_primeira'), resultado['situacao'],
+                       resultado.get('excluidos'), resultado.get('inseridos'), resultado.get('atualizados'),
+                       *(duracoes[etapa] * 1000 if etapa in duracoes else None for etapa in ETAPAS),
+                       resultado.get('mensagem'), resultado.get('retentativas'),
+                       None if espera is None else espera * 1000)
+            for coluna, valor in zip(colunas, valores):
+                coluna.append(valor)
+        return colunas
+
+    def gravar(self, conn, esquema=ESQUEMA_NOVAORDEM, tabela=TABELA_EXECUCOES):
+        """
+        Grava todas as quadras da execução com um único INSERT. Uma falha aqui
+        não desfaz a reorganização: é registrada no log e retorna False.
+        """
+        if self.fim is None:
+            self.fim = datetime.now(timezone.utc)
+        parametros = (self.id, self.inicio, self.fim, self.operador, self.conexao,
+                      self.motor, self.modo) + self._colunas()
+        try:
+            with conn:
+                with conn.cursor() as cursor:
+                    REGISTRO.executar(cursor, 'registrar_execucao', parametros,
+                                      execucoes=f'{esquema}.{tabela}')
+        except Exception as e:
+            LOGGER.warning("Execução %s não registrada em %s.%s: %s", self.id, esquema, tabela, e)
+            return False
+        return True
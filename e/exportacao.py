@@ -0,0 +1,199 @@
+# -*- coding: utf-8 -*-
+"""
+OrganizadorDeLotes - exportação das rotas de leitura
+Percorre a novaordem unida aos lotes (com a geometria, se houver) em ordem
+de (ins_quadra, n_ordem) por um cursor do lado do servidor, em blocos de
+TAMANHO_BLOCO linhas, e grava um arquivo por quadra ou por distrito:
+
+- CSV: ins_quadra, n_ordem, matricula, ordem (e a geometria em WKT);
+- GeoJSON-seq (RFC 8142, uma Feature por linha, em WGS 84), que o GDAL lê
+  como GeoJSONSeq. Geometrias sem SRID declarado são tomadas no 'srid' do
+  município (ver municipios) antes da transformação.
+
+Só um arquivo fica aberto por vez e nenhuma quadra é montada em memória: a
+memória não cresce com o tamanho da exportação. Com compactar=True os
+arquivos saem em gzip (.gz).
+"""
+import csv
+import gzip
+import hashlib
+import json
+import os
+import re
+
+from .conexao_pg import _psycopg2
+from .instrucoes import identificador
+from .novaordem import ESQUEMA_NOVAORDEM, TABELA_NOVAORDEM
+from .reorganizacao import TABELA_LOTES, CAMPOS_LOTES
+
+# SRID das geometrias da tabela de lotes quando a coluna não o declara (SIRGAS 2000 / UTM 24S)
+SRID = 31984
+
+CSV = 'csv'
+GEOJSONSEQ = 'geojsonseq'
+FORMATOS = (CSV, GEOJSONSEQ)
+EXTENSOES = {CSV: '.csv', GEOJSONSEQ: '.geojsons'}
+
+POR_QUADRA = 'quadra'
+POR_DISTRITO = 'distrito'
+AGRUPAMENTOS = (POR_QUADRA, POR_DISTRITO)
+
+COLUNA_GEOMETRIA = 'geom'
+# Linhas trazidas do servidor por FETCH
+TAMANHO_BLOCO = 5000
+
+CAMPOS = ('ins_quadra', 'n_ordem', 'matricula', 'ordem')
+
+# Lotes que saíram da tabela de origem continuam na rota, sem ordem nem geometria
+SQL_EXPORTACAO = '''
+    SELECT {grupo} AS grupo, n.ins_quadra, n.n_ordem, n.matricula, l.{ordem}, {geometria} AS geometria
+    FROM {novaordem} n
+    LEFT JOIN {lotes} l ON l.{quadra} = n.ins_quadra AND l.{matricula} = n.matricula
+    {filtro}
+    ORDER BY 1, n.ins_quadra, n.n_ordem
+'''
+
+
+class EscritorCsv:
+    """Um arquivo CSV de rota (geometria em WKT na última coluna, se houver)"""
+
+    def __init__(self, arquivo, geometria):
+        self.geometria = geometria
+        self._csv = csv.writer(arquivo)
+        self._csv.writerow(CAMPOS + (('wkt',) if geometria else ()))
+
+    def escrever(self, ins_quadra, n_ordem, matricula, ordem, geometria):
+        if self.geometria:
+            self._csv.writerow((ins_quadra, n_ordem, matricula, ordem, geometria))
+        else:
+            self._csv.writerow((ins_quadra, n_ordem, matricula, ordem))
+
+
+class EscritorGeojsonSeq:
+    """Um arquivo GeoJSON-seq de rota (a geometria já chega como texto GeoJSON)"""
+
+    def __init__(self, arquivo, geometria):
+        self._arquivo = arquivo
+
+    def escrever(self, ins_quadra, n_ordem, matricula, ordem, geometria):
+        propriedades = json.dumps({'ins_quadra': ins_quadra, 'n_ordem': n_ordem,
+                                   'matricula': matricula, 'ordem': ordem})
+        self._arquivo.write(f'{{"type":"Feature","geometry":{geometria or "null"},"properties":{propriedades}}}\n')
+
+
+ESCRITORES = {CSV: EscritorCsv, GEOJSONSEQ: EscritorGeojsonSeq}
+
+
+def nome_arquivo(agrupamento, grupo, formato, compactar=False, desambiguar=False):
+    """
+    Nome do arquivo da quadra/distrito 'grupo' (caracteres fora de [\\w.-] viram
+    '_'). Com desambiguar=True o nome leva um trecho do hash do grupo, para
+    grupos diferentes que dariam o mesmo nome ('Vila A/B' e 'Vila A B').
+    """
+    valor = 'sem_distrito' if grupo is None else re.sub(r'[^\w.-]', '_', str(grupo))
+    if desambiguar:
+        valor += '_' + hashlib.sha1(repr(grupo).encode('utf-8')).hexdigest()[:8]
+    return f'{agrupamento}_{valor}{EXTENSOES[formato]}' + ('.gz' if compactar else '')
+
+
+def _abrir(caminho, compactar):
+    if compactar:
+        return gzip.open(caminho, 'wt', encoding='utf-8', newline='')
+    return open(caminho, 'w', encoding='utf-8', newline='')
+
+
+def consulta_exportacao(formato, agrupamento=POR_QUADRA, coluna_distrito=None, coluna_geometria=COLUNA_GEOMETRIA,
+                        quadras=None, tabela_lotes=TABELA_LOTES, esquema=ESQUEMA_NOVAORDEM,
+                        tabela=TABELA_NOVAORDEM, campos=CAMPOS_LOTES, srid=SRID):
+    """SQL composto (psycopg2.sql) da exportação e seus parâmetros"""
+    sql = _psycopg2().sql
+    if agrupamento == POR_DISTRITO:
+        if not coluna_distrito:
+            raise Exception("A exportação por distrito requer a coluna de distrito da tabela de lotes")
+        grupo = sql.SQL('l.{}').format(sql.Identifier(coluna_distrito))
+    else:
+        grupo = sql.SQL('n.ins_quadra')
+
+    if not coluna_geometria:
+        geometria = sql.SQL('NULL::text')
+    elif formato == GEOJSONSEQ:
+        # RFC 7946: coordenadas em WGS 84
+        geometria = sql.SQL('ST_AsGeoJSON(ST_Transform(CASE WHEN ST_SRID(l.{coluna}) = 0 '
+                            'THEN ST_SetSRID(l.{coluna}, {srid}) ELSE l.{coluna} END, 4326))').format(
+            coluna=sql.Identifier(coluna_geometria), srid=sql.Literal(srid))
+    else:
+        geometria = sql.SQL('ST_AsText(l.{})').format(sql.Identifier(coluna_geometria))
+
+    filtro, parametros = sql.SQL(''), {}
+    if quadras is not None:
+        filtro, parametros = sql.SQL('WHERE n.ins_quadra = ANY(%(quadras)s)'), {'quadras': list(quadras)}
+
+    consulta = sql.SQL(SQL_EXPORTACAO).format(
+        grupo=grupo, geometria=geometria, filtro=filtro,
+        novaordem=identificador(f'{esquema}.{tabela}'), lotes=identificador(tabela_lotes),
+        **{chave: sql.Identifier(coluna) for chave, coluna in campos._asdict().items()})
+    return consulta, parametros
+
+
+def exportar(conn, pasta, formato=CSV, agrupamento=POR_QUADRA, coluna_distrito=None,
+             coluna_geometria=COLUNA_GEOMETRIA, quadras=None, compactar=False, tabela_lotes=TABELA_LOTES,
+             esquema=ESQUEMA_NOVAORDEM, tabela=TABELA_NOVAORDEM, tamanho_bloco=TAMANHO_BLOCO,
+             progresso=None, cancelado=None, campos=CAMPOS_LOTES, srid=SRID):
+    """
+    Exporta as rotas para 'pasta', um arquivo por quadra ou por distrito
+    ('agrupamento'). quadras: limita a exportação a essas ins_quadra.
+    progresso(arquivos, lotes) é chamado a cada arquivo concluído; se
+    cancelado() retornar True a exportação para no próximo bloco (o arquivo
+    em andamento fica incompleto). Retorna {'arquivos': [...], 'lotes': n}.
+    """
+    if formato not in FORMATOS:
+        raise Exception(f"Formato de exportação desconhecido: {formato}")
+    if agrupamento not in AGRUPAMENTOS:
+        raise Exception(f"Agrupamento desconhecido: {agrupamento}")
+    consulta, parametros = consulta_exportacao(formato, agrupamento, coluna_distrito, coluna_geometria, quadras,
+                                               tabela_lotes, esquema, tabela, campos, srid)
+    os.makedirs(pasta, exist_ok=True)
+    classe = ESCRITORES[formato]
+    arquivos, lotes = [], 0
+    # Nomes já usados nesta exportação, sem distinção de caixa (Windows, macOS)
+    usados = set()
+    arquivo = escritor = None
+    grupo_atual = object()
+
+    try:
+        with conn:
+            with conn.cursor() as cursor:
+                # A ordenação da cidade inteira pode passar do tempo-limite por instrução
+                cursor.execute('SET LOCAL statement_timeout = 0')
+            # Cursor do lado do servidor: o cliente só guarda um bloco por vez
+            with conn.cursor(name='organizador_exportacao') as cursor:
+                cursor.itersize = tamanho_bloco
+                cursor.execute(consulta, parametros)
+                for indice, (grupo, ins_quadra, n_ordem, matricula, ordem, geometria) in enumerate(cursor):
+                    if indice % tamanho_bloco == 0 and cancelado is not None and cancelado():
+                        break
+                    if grupo != grupo_atual:
+                        if arquivo is not None:
+                            arquivo.close()
+                            if progresso is not None:
+                                progresso(len(arquivos), lotes)
+                        nome = nome_arquivo(agrupamento, grupo, formato, compactar)
+                        if nome.lower() in usados:
+                            # Outro grupo já deu este nome: não sobrescrever o arquivo dele
+                            nome = nome_arquivo(agrupamento, grupo, formato, compactar, desambiguar=True)
+                            if nome.lower() in usados:
+                                raise Exception(f"Nome de arquivo repetido na exportação: {nome}")
+                        usados.add(nome.lower())
+                        caminho = os.path.join(pasta, nome)
+                        arquivo = _abrir(caminho, compactar)
+                        escritor = classe(arquivo, bool(coluna_geometria))
+                        arquivos.append(caminho)
+                        grupo_atual = grupo
+                    escritor.escrever(ins_quadra, n_ordem, matricula, ordem, geometria)
+                    lotes += 1
+    finally:
+        if arquivo is not None:
+            arquivo.close()
+    if progresso is not None and arquivos:
+        progresso(len(arquivos), lotes)
+    return {'arquivos': arquivos, 'lotes': lotes}
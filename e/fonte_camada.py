@@ -0,0 +1,28 @@
+# -*- coding: utf-8 -*-
+"""
+OrganizadorDeLotes - lotes lidos da camada do projeto QGIS
+Implementação de reorganizacao.FonteLotes usada pelo diálogo.
+"""
+from qgis.core import QgsFeatureRequest, QgsExpression
+
+from .lotes import LotesColunares
+from .reorganizacao import FonteLotes, CAMPOS_LOTES
+
+
+class FonteLotesCamada(FonteLotes):
+    """Lotes de uma camada vetorial com os campos de quadra, matrícula e ordem ('campos')"""
+
+    def __init__(self, camada, campos=CAMPOS_LOTES):
+        self.camada = camada
+        self.campos = campos
+
+    def ler_quadra(self, ins_quadra):
+        # Só matricula e ordem dos lotes da quadra, sem geometria, direto
+        # para colunas compactas (em vez de extrair uma camada temporária)
+        matricula, quadra, ordem = self.campos
+        request = QgsFeatureRequest()
+        request.setFilterExpression(QgsExpression.createFieldEqualityExpression(quadra, ins_quadra))
+        request.setFlags(QgsFeatureRequest.NoGeometry)
+        request.setSubsetOfAttributes([matricula, ordem], self.camada.fields())
+        return LotesColunares.de_quadra(
+            ins_quadra, ((f[matricula], f[ordem]) for f in self.camada.getFeatures(request)))
@@ -0,0 +1,275 @@
+# -*- coding: utf-8 -*-
+"""
+OrganizadorDeLotes - instruções SQL preparadas
+Todo SQL por quadra é declarado uma vez em INSTRUCOES, com parâmetros
+posicionais ($1, $2...) e identificadores de tabela como {tabela}/{lotes}
+(ou de coluna, como os campos da tabela de lotes: {matricula}/{quadra}/{ordem}).
+O REGISTRO prepara cada instrução (PREPARE) na primeira vez que ela é usada
+numa conexão e depois só executa (EXECUTE) com os valores vinculados, de modo
+que o servidor reaproveita o plano e nenhum valor é interpolado no texto.
+"""
+import threading
+import weakref
+
+from .conexao_pg import _psycopg2
+
+# nome: (tipos dos parâmetros, SQL)
+INSTRUCOES = {
+    'existe_quadra': (
+        ('integer',),
+        'SELECT EXISTS (SELECT 1 FROM {tabela} WHERE ins_quadra = $1)'
+    ),
+    'bloquear_quadra': (
+        ('text', 'integer'),
+        'SELECT pg_advisory_xact_lock(hashtextextended($1 || $2::text, 0))'
+    ),
+    'tentar_bloquear_quadra': (
+        ('text', 'integer'),
+        'SELECT pg_try_advisory_xact_lock(hashtextextended($1 || $2::text, 0))'
+    ),
+    'excluir_quadra': (
+        ('integer',),
+        'DELETE FROM {tabela} WHERE ins_quadra = $1'
+    ),
+    'inserir_quadra': (
+        ('bigint[]', 'bigint[]', 'bigint[]'),
+        '''INSERT INTO {tabela} (matricula, ins_quadra, n_ordem)
+           SELECT * FROM unnest($1::bigint[], $2::bigint[], $3::bigint[])'''
+    ),
+    'excluir_ausentes': (
+        ('integer', 'bigint[]'),
+        '''DELETE FROM {tabela} n
+           WHERE n.ins_quadra = $1
+             AND NOT EXISTS (SELECT 1 FROM unnest($2::bigint[]) AS m(matricula)
+                             WHERE m.matricula = n.matricula)'''
+    ),
+    # Retorna True para as linhas inseridas: as que não estavam na quadra no
+    # instantâneo da instrução ('antes'). Não usa xmax = 0, que não pode ser lido
+    # de uma novaordem particionada. Linhas com n_ordem inalterado não são
+    # tocadas (nem retornadas).
+    'upsert_quadra': (
+        ('bigint[]', 'bigint[]', 'bigint[]'),
+        '''WITH antes AS (
+               SELECT n.matricula FROM {tabela} n
+               WHERE n.ins_quadra = ($2::bigint[])[1] AND n.matricula = ANY($1::bigint[])
+           ), gravados AS (
+               INSERT INTO {tabela} AS novaordem (matricula, ins_quadra, n_ordem)
+               SELECT * FROM unnest($1::bigint[], $2::bigint[], $3::bigint[])
+               ON CONFLICT (ins_quadra, matricula) DO UPDATE SET n_ordem = EXCLUDED.n_ordem
+               WHERE novaordem.n_ordem IS DISTINCT FROM EXCLUDED.n_ordem
+               RETURNING matricula
+           )
+           SELECT NOT EXISTS (SELECT 1 FROM antes WHERE antes.matricula = gravados.matricula) FROM gravados'''
+    ),
+    # Histórico por quadra ({historico}: uma linha por versão, com as matrículas
+    # e os n_ordem em arrays). No modo substituir, as linhas excluídas vão direto
+    # do DELETE ... RETURNING para o histórico, sem outra leitura da quadra;
+    # retorna a quantidade excluída.
+    'arquivar_quadra': (
+        ('integer',),
+        '''WITH excluidos AS (
+               DELETE FROM {tabela} WHERE ins_quadra = $1 RETURNING matricula, n_ordem
+           )
+           INSERT INTO {historico} (ins_quadra, matriculas, n_ordens)
+           SELECT $1, coalesce(array_agg(matricula ORDER BY n_ordem, matricula), ARRAY[]::integer[]),
+                  coalesce(array_agg(n_ordem ORDER BY n_ordem, matricula), ARRAY[]::bigint[])
+           FROM excluidos
+           RETURNING cardinality(matriculas)'''
+    ),
+    # No modo upsert a quadra não é excluída inteira: a versão é copiada antes
+    'copiar_quadra_historico': (
+        ('integer',),
+        '''INSERT INTO {historico} (ins_quadra, matriculas, n_ordens)
+           SELECT $1, coalesce(array_agg(matricula ORDER BY n_ordem, matricula), ARRAY[]::integer[]),
+                  coalesce(array_agg(n_ordem ORDER BY n_ordem, matricula), ARRAY[]::bigint[])
+           FROM {tabela} WHERE ins_quadra = $1'''
+    ),
+    # Bloqueios de várias quadras em ordem crescente, para não haver impasse
+    'bloquear_quadras': (
+        ('text', 'integer[]'),
+        '''SELECT pg_advisory_xact_lock(hashtextextended($1 || q.ins_quadra::text, 0))
+           FROM (SELECT DISTINCT ins_quadra FROM unnest($2::integer[]) AS u(ins_quadra)
+                 ORDER BY ins_quadra) q'''
+    ),
+    # Volta cada quadra de $1 à versão de antes das suas $2 últimas gravações (ou
+    # à mais antiga guardada) e consome essas versões do histórico. A condição
+    # sobre 'excluidos' faz o DELETE da quadra acontecer antes do INSERT.
+    # Retorna (ins_quadra, excluídos, restaurados) das quadras com histórico.
+    'desfazer_quadras': (
+        ('integer[]', 'integer'),
+        '''WITH versoes AS (
+               SELECT h.id, h.ins_quadra, h.matriculas, h.n_ordens,
+                      row_number() OVER (PARTITION BY h.ins_quadra ORDER BY h.id DESC) AS versao
+               FROM {historico} h WHERE h.ins_quadra = ANY($1::integer[])
+           ), alvo AS (
+               SELECT DISTINCT ON (ins_quadra) id, ins_quadra, matriculas, n_ordens
+               FROM versoes WHERE versao <= $2
+               ORDER BY ins_quadra, id
+           ), consumidas AS (
+               DELETE FROM {historico} h USING alvo
+               WHERE h.ins_quadra = alvo.ins_quadra AND h.id >= alvo.id
+           ), excluidos AS (
+               DELETE FROM {tabela} n USING alvo WHERE n.ins_quadra = alvo.ins_quadra
+               RETURNING n.ins_quadra
+           ), restaurados AS (
+               INSERT INTO {tabela} (matricula, ins_quadra, n_ordem)
+               SELECT u.matricula, alvo.ins_quadra, u.n_ordem
+               FROM alvo, unnest(alvo.matriculas, alvo.n_ordens) AS u(matricula, n_ordem)
+               WHERE (SELECT count(*) FROM excluidos) >= 0
+               RETURNING ins_quadra
+           )
+           SELECT alvo.ins_quadra,
+                  (SELECT count(*) FROM excluidos e WHERE e.ins_quadra = alvo.ins_quadra),
+                  (SELECT count(*) FROM restaurados r WHERE r.ins_quadra = alvo.ins_quadra)
+           FROM alvo ORDER BY alvo.ins_quadra'''
+    ),
+    # Mantém só as $1 versões mais recentes de cada quadra
+    'podar_historico': (
+        ('integer',),
+        '''DELETE FROM {historico} h
+           USING (SELECT id, row_number() OVER (PARTITION BY ins_quadra ORDER BY id DESC) AS versao
+                  FROM {historico}) v
+           WHERE h.id = v.id AND v.versao > $1'''
+    ),
+    # Inserção/remoção de um lote: só as linhas a partir da posição mudam de
+    # n_ordem (a quadra é lida pelo índice (ins_quadra, matricula))
+    'posicao_lote': (
+        ('integer', 'bigint'),
+        '''SELECT max(n_ordem) FILTER (WHERE matricula = $2), max(n_ordem)
+           FROM {tabela} WHERE ins_quadra = $1'''
+    ),
+    'abrir_posicao': (
+        ('integer', 'bigint'),
+        'UPDATE {tabela} SET n_ordem = n_ordem + 1 WHERE ins_quadra = $1 AND n_ordem >= $2'
+    ),
+    'fechar_posicao': (
+        ('integer', 'bigint'),
+        'UPDATE {tabela} SET n_ordem = n_ordem - 1 WHERE ins_quadra = $1 AND n_ordem > $2'
+    ),
+    'inserir_lote': (
+        ('bigint', 'integer', 'bigint'),
+        'INSERT INTO {tabela} (matricula, ins_quadra, n_ordem) VALUES ($1, $2, $3)'
+    ),
+    'remover_lote': (
+        ('integer', 'bigint'),
+        'DELETE FROM {tabela} WHERE ins_quadra = $1 AND matricula = $2'
+    ),
+    'ler_novaordem_quadra': (
+        ('integer',),
+        'SELECT matricula, n_ordem FROM {tabela} WHERE ins_quadra = $1 ORDER BY n_ordem'
+    ),
+    'ler_lotes_quadra': (
+        ('integer',),
+        'SELECT {matricula}, {ordem} FROM {lotes} WHERE {quadra} = $1'
+    ),
+    # Ponto de controle do lote, gravado na mesma transação da quadra
+    'registrar_checkpoint': (
+        ('text', 'integer', 'integer'),
+        '''INSERT INTO {checkpoints} (lote, ins_quadra, ordem_primeira) VALUES ($1, $2, $3)
+           ON CONFLICT (lote, ins_quadra)
+           DO UPDATE SET ordem_primeira = EXCLUDED.ordem_primeira, concluida_em = now()'''
+    ),
+    'quadras_concluidas': (
+        ('text',),
+        'SELECT ins_quadra, ordem_primeira FROM {checkpoints} WHERE lote = $1'
+    ),
+    'reiniciar_lote': (
+        ('text',),
+        'DELETE FROM {checkpoints} WHERE lote = $1'
+    ),
+    # Quadras notificadas que já estão na novaordem, com a última ordem_primeira
+    # gravada no livro de execuções (ou NULL); ver escuta
+    'ordens_vigentes': (
+        ('integer[]',),
+        '''SELECT q.ins_quadra,
+                  (SELECT e.ordem_primeira FROM {execucoes} e
+                   WHERE e.ins_quadra = q.ins_quadra AND e.situacao = 'gravada'
+                   ORDER BY e.inicio DESC, e.id DESC LIMIT 1)
+           FROM unnest($1::integer[]) AS q(ins_quadra)
+           WHERE EXISTS (SELECT 1 FROM {tabela} n WHERE n.ins_quadra = q.ins_quadra)'''
+    ),
+    'quadras_vigentes': (
+        ('integer[]',),
+        '''SELECT q.ins_quadra, NULL::integer
+           FROM unnest($1::integer[]) AS q(ins_quadra)
+           WHERE EXISTS (SELECT 1 FROM {tabela} n WHERE n.ins_quadra = q.ins_quadra)'''
+    ),
+    # Uma linha por quadra da execução ($1..$7 são comuns a todas)
+    'registrar_execucao': (
+        ('uuid', 'timestamptz', 'timestamptz', 'text', 'text', 'text', 'text',
+         'integer[]', 'integer[]', 'text[]', 'integer[]', 'integer[]', 'integer[]',
+         'double precision[]', 'double precision[]', 'double precision[]', 'text[]',
+         'integer[]', 'double precision[]'),
+        '''INSERT INTO {execucoes} (execucao, inicio, fim, operador, conexao, motor, modo,
+                                    ins_quadra, ordem_primeira, situacao, excluidos, inseridos,
+                                    atualizados, leitura_ms, calculo_ms, gravacao_ms, mensagem,
+                                    retentativas, espera_retentativas_ms)
+           SELECT $1, $2, $3, $4, $5, $6, $7, q.*
+           FROM unnest($8::integer[], $9::integer[], $10::text[], $11::integer[], $12::integer[],
+                       $13::integer[], $14::double precision[], $15::double precision[],
+                       $16::double precision[], $17::text[], $18::integer[],
+                       $19::double precision[]) AS q'''
+    ),
+}
+
+
+def identificador(nome_qualificado):
+    """sql.Identifier para 'esquema.tabela' (ou só 'tabela')"""
+    sql = _psycopg2().sql
+    esquema, _, tabela = nome_qualificado.rpartition('.')
+    return sql.Identifier(esquema, tabela) if esquema else sql.Identifier(tabela)
+
+
+class RegistroInstrucoes:
+    """Prepara cada instrução uma vez por conexão e a executa com parâmetros vinculados"""
+
+    def __init__(self, instrucoes=INSTRUCOES, prefixo='organizador'):
+        self._instrucoes = instrucoes
+        self._prefixo = prefixo
+        self._nomes = {}
+        self._preparadas = weakref.WeakKeyDictionary()
+        self._trava = threading.Lock()
+
+    def _nome_servidor(self, chave):
+        nome = self._nomes.get(chave)
+        if nome is None:
+            with self._trava:
+                nome = self._nomes.setdefault(chave, f'{self._prefixo}_{chave[0]}_{len(self._nomes)}')
+        return nome
+
+    def executar(self, cursor, nome, parametros=(), **tabelas):
+        """
+        Executa a instrução 'nome' com 'parametros'. 'tabelas' dá o nome
+        qualificado de cada identificador do SQL (ex.: tabela='comercial_umc.novaordem',
+        quadra='ins_quadra'); cada combinação é uma instrução preparada distinta.
+        """
+        tipos, texto = self._instrucoes[nome]
+        chave = (nome,) + tuple(sorted(tabelas.items()))
+        nome_servidor = self._nome_servidor(chave)
+
+        conn = cursor.connection
+        preparadas = self._preparadas.get(conn)
+        if preparadas is None:
+            with self._trava:
+                preparadas = self._preparadas.setdefault(conn, set())
+
+        if nome_servidor not in preparadas:
+            sql = _psycopg2().sql
+            corpo = sql.SQL(texto).format(**{chave_tabela: identificador(valor)
+                                             for chave_tabela, valor in tabelas.items()})
+            cursor.execute(sql.SQL('PREPARE {} ({}) AS ').format(sql.Identifier(nome_servidor),
+                                                                 sql.SQL(', '.join(tipos))) + corpo)
+            # Instruções preparadas pertencem à sessão e sobrevivem a ROLLBACK
+            with self._trava:
+                preparadas.add(nome_servidor)
+
+        marcadores = ', '.join(['%s'] * len(tipos))
+        cursor.execute(f'EXECUTE "{nome_servidor}" ({marcadores})', tuple(parametros))
+
+    def preparadas(self, conn):
+        """Nomes das instruções já preparadas na conexão"""
+        with self._trava:
+            return set(self._preparadas.get(conn, ()))
+
+
+REGISTRO = RegistroInstrucoes()
@@ -0,0 +1,191 @@
+# -*- coding: utf-8 -*-
+"""
+OrganizadorDeLotes - linhas de testada e de confrontação por quadra
+Versão sem QGIS do núcleo dos algoritmos 'Linhas de testada'
+(e_testadas_algorithm) e 'Linhas de confrontação' (e_confrontacoes_algorithm),
+reescritos a partir do Cad_FrontLotLine e do Cad_AdjoinerLine do umcgeo.
+
+Os originais comparavam os lotes dois a dois (diferenças e interseções de
+geometrias, depois junção das partes também dois a dois) num só fio. Aqui
+cada quadra tem um índice de segmentos, SegmentosQuadra: as pontas de cada
+segmento são encaixadas numa grade do tamanho da tolerância e o segmento vira
+uma chave de hash, então achar os segmentos repetidos é quase linear:
+
+- segmento de um só lote: testada (voltado para a rua);
+- segmento de dois ou mais lotes: divisa (confrontação) entre eles.
+
+Isso pede lotes conectados (os vértices de um lote presentes no vizinho);
+com 'conectar' os grupos passam antes por conectar_poligonos.conectar_grupo.
+Os grupos de vizinhança do índice espacial vão para processos em paralelo
+(conectar_poligonos.executar_grupos) e, dentro de cada um, as quadras são os
+lotes ligados por vértices em comum. Só o anel externo é usado, orientado no
+sentido horário a partir do vértice mais ao norte, como nos originais.
+"""
+from math import hypot
+
+from .conectar_poligonos import (conectar_grupo, executar_grupos, grupos_vizinhanca, tarefas_por_grupo,
+                                 TOLERANCIA)
+from .orientacao_poligonos import orientar_anel, HORARIO, NORTE, SUL, LESTE, OESTE
+
+TESTADA = 'testada'
+CONFRONTACAO = 'confrontacao'
+
+
+def chave(ponto, tolerancia):
+    """Ponto encaixado na grade de lado 'tolerancia'"""
+    return round(ponto[0] / tolerancia), round(ponto[1] / tolerancia)
+
+
+def comprimento(coordenadas):
+    return sum(hypot(x2 - x1, y2 - y1) for (x1, y1), (x2, y2) in zip(coordenadas, coordenadas[1:]))
+
+
+class SegmentosQuadra:
+    """Índice dos segmentos dos lotes de uma quadra ({id: anel fechado}) pelas pontas encaixadas"""
+
+    def __init__(self, aneis, tolerancia=TOLERANCIA):
+        self.aneis = aneis
+        self.tolerancia = tolerancia
+        self.donos = {}
+        for ident, anel in aneis.items():
+            for segmento in self._segmentos(anel):
+                donos = self.donos.setdefault(segmento, [])
+                if ident not in donos:
+                    donos.append(ident)
+
+    def _segmentos(self, anel):
+        chaves = [chave(ponto, self.tolerancia) for ponto in anel]
+        # Sem direção: a divisa é percorrida em sentidos opostos pelos dois lotes
+        return [(a, b) if a <= b else (b, a) for a, b in zip(chaves, chaves[1:])]
+
+    def trechos(self, ident):
+        """
+        (vizinho, coordenadas) dos trechos contínuos do anel de 'ident' com os
+        mesmos confrontantes; vizinho None é testada.
+        """
+        anel = self.aneis[ident]
+        rotulos = [tuple(dono for dono in self.donos[segmento] if dono != ident)
+                   for segmento in self._segmentos(anel)]
+        if not rotulos:
+            return []
+        # Começa numa troca de rótulo para não partir um trecho no fechamento do anel
+        inicio = next((i for i in range(len(rotulos)) if rotulos[i] != rotulos[i - 1]), 0)
+        vertices = anel[:-1]
+        n = len(rotulos)
+        trechos = []
+        i = 0
+        while i < n:
+            rotulo = rotulos[(inicio + i) % n]
+            j = i
+            while j + 1 < n and rotulos[(inicio + j + 1) % n] == rotulo:
+                j += 1
+            coordenadas = [vertices[(inicio + k) % n] for k in range(i, j + 2)]
+            for vizinho in rotulo or (None,):
+                trechos.append((vizinho, coordenadas))
+            i = j + 1
+        return trechos
+
+
+def quadras_por_vertices(aneis, tolerancia=TOLERANCIA):
+    """Lotes ligados por vértices em comum (encaixados), como listas de ids"""
+    por_vertice = {}
+    for ident, anel in aneis.items():
+        for ponto in anel[:-1]:
+            por_vertice.setdefault(chave(ponto, tolerancia), set()).add(ident)
+    vizinhos = {ident: set() for ident in aneis}
+    for idents in por_vertice.values():
+        idents = list(idents)
+        for a, b in zip(idents, idents[1:]):
+            vizinhos[a].add(b)
+            vizinhos[b].add(a)
+    return grupos_vizinhanca(vizinhos)
+
+
+def _extremo(pontos, primeiro):
+    chave_extremo = {NORTE: lambda p: p[1], SUL: lambda p: -p[1],
+                     LESTE: lambda p: p[0], OESTE: lambda p: -p[0]}[primeiro]
+    return max(pontos, key=chave_extremo)
+
+
+def sequenciar_testadas(linhas, primeiro=NORTE, tolerancia=TOLERANCIA):
+    """
+    Ordena as testadas de uma quadra ([(id, coordenadas)]): a primeira é a que
+    passa pelo vértice extremo ('primeiro') sem terminar nele; as seguintes
+    começam onde a anterior termina. Testadas fora desse encadeamento (pátios
+    internos, quadras que se tocam só num ponto) seguem em novas cadeias.
+    """
+    restantes = list(range(len(linhas)))
+    por_inicio = {}
+    for i in restantes:
+        por_inicio.setdefault(chave(linhas[i][1][0], tolerancia), []).append(i)
+    usadas = set()
+    sequencia = []
+    while len(usadas) < len(linhas):
+        candidatas = [i for i in restantes if i not in usadas]
+        extremo = _extremo([ponto for i in candidatas for ponto in linhas[i][1][:-1]], primeiro)
+        atual = next(i for i in candidatas if extremo in linhas[i][1][:-1])
+        while atual is not None:
+            usadas.add(atual)
+            sequencia.append(linhas[atual])
+            fim = chave(linhas[atual][1][-1], tolerancia)
+            atual = next((i for i in por_inicio.get(fim, ()) if i not in usadas), None)
+    return sequencia
+
+
+def testadas_quadra(aneis, primeiro=NORTE, tolerancia=TOLERANCIA):
+    """[(id, coordenadas, sequencia, comprimento, acumulado)] das testadas de uma quadra"""
+    indice = SegmentosQuadra(aneis, tolerancia)
+    linhas = [(ident, coordenadas) for ident in aneis
+              for vizinho, coordenadas in indice.trechos(ident) if vizinho is None]
+    resultado = []
+    acumulado = 0.0
+    for sequencia, (ident, coordenadas) in enumerate(sequenciar_testadas(linhas, primeiro, tolerancia), 1):
+        medida = comprimento(coordenadas)
+        acumulado += medida
+        resultado.append((ident, coordenadas, sequencia, medida, acumulado))
+    return resultado
+
+
+def confrontacoes_quadra(aneis, tolerancia=TOLERANCIA):
+    """
+    [(id1, id2, coordenadas)] de uma quadra: cada divisa aparece uma vez para
+    cada lado, no sentido do anel de id1; testadas têm id1 == id2, como no original.
+    """
+    indice = SegmentosQuadra(aneis, tolerancia)
+    return [(ident, ident if vizinho is None else vizinho, coordenadas)
+            for ident in aneis for vizinho, coordenadas in indice.trechos(ident)]
+
+
+def _aneis_externos(poligonos, vizinhos, tolerancia, conectar):
+    if conectar:
+        poligonos = {ident: aneis for ident, (aneis, _) in conectar_grupo(poligonos, vizinhos, tolerancia).items()}
+    return {ident: orientar_anel(aneis[0], NORTE, HORARIO) for ident, aneis in poligonos.items()}
+
+
+def _linhas_grupos(tarefas, tipo, primeiro, tolerancia, conectar):
+    linhas = []
+    for poligonos, vizinhos in tarefas:
+        aneis = _aneis_externos(poligonos, vizinhos, tolerancia, conectar)
+        for quadra in quadras_por_vertices(aneis, tolerancia):
+            da_quadra = {ident: aneis[ident] for ident in quadra}
+            if tipo == TESTADA:
+                linhas.extend(testadas_quadra(da_quadra, primeiro, tolerancia))
+            else:
+                linhas.extend(confrontacoes_quadra(da_quadra, tolerancia))
+    return linhas
+
+
+def linhas_lotes(poligonos, vizinhos, tipo=TESTADA, primeiro=NORTE, tolerancia=TOLERANCIA, conectar=True,
+                 processos=1, progresso=None, cancelado=None):
+    """
+    Linhas de testada (tipo TESTADA, ver testadas_quadra) ou de confrontação
+    (CONFRONTACAO, ver confrontacoes_quadra) de todos os lotes ({id: anéis}),
+    com os vizinhos candidatos do índice espacial ({id: ids}). Os grupos vão
+    para executar_grupos (processos, progresso e cancelamento). Gera as linhas
+    grupo a grupo, na ordem das quadras.
+    """
+    if tipo not in (TESTADA, CONFRONTACAO):
+        raise Exception(f"Tipo de linha desconhecido: {tipo}")
+    for linhas in executar_grupos(_linhas_grupos, tarefas_por_grupo(poligonos, vizinhos),
+                                  (tipo, primeiro, tolerancia, conectar), processos, progresso, cancelado):
+        yield from linhas
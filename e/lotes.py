@@ -0,0 +1,168 @@
+# -*- coding: utf-8 -*-
+"""
+OrganizadorDeLotes - representação compacta dos lotes
+Só matricula, ins_quadra e ordem importam para a reordenação; em vez de
+QgsFeature (geometria + todos os atributos) os lotes circulam como:
+
+- Lote: registro único com __slots__;
+- LotesColunares: lote de muitos lotes em três colunas array('q')
+  (24 bytes por lote), usado pelo cálculo, pela leitura e pela gravação;
+- IndiceOrdem: ordens de uma quadra já ordenadas, para a prévia do diálogo.
+
+Valores NULL são guardados nas colunas como ordem.NULO.
+"""
+from array import array
+from bisect import bisect_left
+
+from .ordem import NULO, calcular_nova_ordem_array, calcular_offset_ordenado
+
+
+def _para_coluna(valor):
+    # NULL dos atributos do QGIS chega como QVariant nulo, não como None
+    if valor is None or (hasattr(valor, 'isNull') and valor.isNull()):
+        return NULO
+    return int(valor)
+
+
+def _da_coluna(valor):
+    return None if valor == NULO else valor
+
+
+class Lote:
+    """Um lote: matricula, ins_quadra e ordem (ou n_ordem, depois de reordenado)"""
+    __slots__ = ('matricula', 'ins_quadra', 'ordem')
+
+    def __init__(self, matricula, ins_quadra, ordem):
+        self.matricula = matricula
+        self.ins_quadra = ins_quadra
+        self.ordem = ordem
+
+    def __iter__(self):
+        return iter((self.matricula, self.ins_quadra, self.ordem))
+
+    def __eq__(self, outro):
+        return isinstance(outro, Lote) and tuple(self) == tuple(outro)
+
+    def __repr__(self):
+        return f'Lote(matricula={self.matricula}, ins_quadra={self.ins_quadra}, ordem={self.ordem})'
+
+
+class LotesColunares:
+    """Coleção de lotes em colunas array('q') (matriculas, ins_quadras, ordens)"""
+    __slots__ = ('matriculas', 'ins_quadras', 'ordens')
+
+    def __init__(self, matriculas=None, ins_quadras=None, ordens=None):
+        self.matriculas = matriculas if matriculas is not None else array('q')
+        self.ins_quadras = ins_quadras if ins_quadras is not None else array('q')
+        self.ordens = ordens if ordens is not None else array('q')
+
+    @classmethod
+    def de_tuplas(cls, tuplas):
+        """Cria a partir de um iterável de (matricula, ins_quadra, ordem), sem materializá-lo"""
+        lotes = cls()
+        for matricula, ins_quadra, ordem in tuplas:
+            lotes.append(matricula, ins_quadra, ordem)
+        return lotes
+
+    @classmethod
+    def de_quadra(cls, ins_quadra, pares):
+        """Cria a partir de pares (matricula, ordem) de uma mesma quadra"""
+        lotes = cls()
+        matriculas, ordens = lotes.matriculas, lotes.ordens
+        for matricula, ordem in pares:
+            matriculas.append(_para_coluna(matricula))
+            ordens.append(_para_coluna(ordem))
+        lotes.ins_quadras = array('q', [int(ins_quadra)]) * len(matriculas)
+        return lotes
+
+    def append(self, matricula, ins_quadra, ordem):
+        self.matriculas.append(_para_coluna(matricula))
+        self.ins_quadras.append(_para_coluna(ins_quadra))
+        self.ordens.append(_para_coluna(ordem))
+
+    def __len__(self):
+        return len(self.matriculas)
+
+    def __getitem__(self, indice):
+        return Lote(_da_coluna(self.matriculas[indice]), _da_coluna(self.ins_quadras[indice]),
+                    _da_coluna(self.ordens[indice]))
+
+    def __iter__(self):
+        return (Lote(*tupla) for tupla in self.tuplas())
+
+    def tuplas(self):
+        """Itera (matricula, ins_quadra, ordem) com None no lugar de NULL (formato do writer)"""
+        for matricula, ins_quadra, ordem in zip(self.matriculas, self.ins_quadras, self.ordens):
+            yield _da_coluna(matricula), _da_coluna(ins_quadra), _da_coluna(ordem)
+
+    def lista_matriculas(self):
+        return [_da_coluna(matricula) for matricula in self.matriculas]
+
+    def listas(self):
+        """As três colunas como listas (None no lugar de NULL), para parâmetros unnest()"""
+        return tuple([_da_coluna(valor) for valor in coluna]
+                     for coluna in (self.matriculas, self.ins_quadras, self.ordens))
+
+    def reordenados(self, ordem_primeira):
+        """Novo LotesColunares cuja coluna de ordem contém o n_ordem calculado"""
+        return LotesColunares(self.matriculas, self.ins_quadras,
+                              calcular_nova_ordem_array(self.ordens, ordem_primeira))
+
+    def bytes_ocupados(self):
+        """Memória ocupada pelos buffers das colunas"""
+        return sum(coluna.buffer_info()[1] * coluna.itemsize
+                   for coluna in (self.matriculas, self.ins_quadras, self.ordens))
+
+
+class IndiceOrdem:
+    """
+    Ordens não nulas de uma quadra em ordem crescente, com a matrícula e o id
+    da feição de cada lote. O offset e a prévia da nova sequência para qualquer
+    ordem_primeira saem por busca binária, sem percorrer a quadra.
+    """
+    __slots__ = ('ordens', 'matriculas', 'ids')
+
+    def __init__(self, ordens, matriculas, ids):
+        self.ordens = ordens
+        self.matriculas = matriculas
+        self.ids = ids
+
+    @classmethod
+    def de_lotes(cls, lotes, ids=None):
+        """Cria a partir de LotesColunares; 'ids' (opcional) acompanha os lotes posição a posição"""
+        ordens = lotes.ordens
+        posicoes = sorted((i for i in range(len(ordens)) if ordens[i] != NULO), key=ordens.__getitem__)
+        return cls(array('q', (ordens[i] for i in posicoes)),
+                   array('q', (lotes.matriculas[i] for i in posicoes)),
+                   array('q', (ids[i] for i in posicoes)) if ids is not None else None)
+
+    def __len__(self):
+        return len(self.ordens)
+
+    def offset(self, ordem_primeira):
+        return calcular_offset_ordenado(self.ordens, ordem_primeira)
+
+    def primeiro(self, ordem_primeira):
+        """Posição do lote que passa a ser o 1 (menor ordem >= ordem_primeira), ou None"""
+        posicao = bisect_left(self.ordens, ordem_primeira)
+        return posicao if posicao < len(self.ordens) else None
+
+    def previa(self, ordem_primeira, quantidade=3):
+        """
+        Início e fim da nova sequência: duas listas de (n_ordem, ordem, matricula)
+        com até 'quantidade' lotes cada (o fim é vazio se a quadra couber no início)
+        """
+        total = len(self.ordens)
+        corte = bisect_left(self.ordens, ordem_primeira)
+        offset = total - corte
+        recuo = ordem_primeira - 1
+
+        def item(indice):
+            posicao = (corte + indice) % total
+            ordem = self.ordens[posicao]
+            n_ordem = ordem - recuo if ordem >= ordem_primeira else ordem + offset
+            return n_ordem, ordem, _da_coluna(self.matriculas[posicao])
+
+        inicio = [item(i) for i in range(min(quantidade, total))]
+        fim = [item(i) for i in range(max(quantidade, total - quantidade), total)]
+        return inicio, fim
@@ -0,0 +1,215 @@
+# -*- coding: utf-8 -*-
+"""
+OrganizadorDeLotes - municípios (perfis nomeados)
+O mesmo plugin atende vários municípios, cada um com seu banco ou esquema, sua
+tabela de lotes e seus nomes de campos. Um Municipio reúne o que muda de um
+para outro e é o que o diálogo, os algoritmos de processamento, a linha de
+comando, a execução em lote e a escuta usam:
+
+- conexao / conexao_leitura: conexão de gravação e réplica (nome do QGIS ou DSN);
+- esquema / tabela_novaordem: onde ficam a novaordem, o livro de execuções e
+  os pontos de controle;
+- tabela_lotes e campos (matricula, quadra, ordem) da origem, no banco e na
+  camada do projeto;
+- coluna_geometria da tabela de lotes (exportação e camada de rótulos; vazia:
+  sem geometria) e srid das geometrias dela que não o declaram;
+- camada_quadras / camada_lotes: nomes das camadas no projeto do QGIS;
+- canal: canal de notificação do gatilho (um por município, para que escutas
+  de municípios no mesmo banco não recebam as quadras umas das outras);
+- conexoes: orçamento de conexões do município na execução em lote.
+
+Os perfis ficam num arquivo JSON (--municipios, ORGANIZADOR_MUNICIPIOS ou
+QSettings 'OrganizadorDeLotes/municipios'), um objeto por nome:
+
+    {
+      "mogi": {"conexao": "service=mogi", "conexoes": 4},
+      "suzano": {"conexao": "service=suzano", "esquema": "cadastro_suzano",
+                 "tabela_lotes": "cadastro_suzano.lotes", "coluna_geometria": "the_geom", "srid": 31983,
+                 "campos": {"matricula": "inscricao", "quadra": "cod_quadra", "ordem": "seq"},
+                 "camada_lotes": "Lotes Suzano", "canal": "lotes_suzano", "conexoes": 2}
+    }
+
+Chaves omitidas ficam com os valores de Municipio() (os nomes fixos de antes
+dos perfis). O município ativo no QGIS é o da chave 'OrganizadorDeLotes/municipio'
+(ou ORGANIZADOR_MUNICIPIO).
+
+executar_municipios reorganiza vários municípios ao mesmo tempo: uma thread
+por município, cada uma com até 'conexoes' conexões próprias.
+"""
+import json
+import logging
+import os
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+from .escuta import CANAL
+from .execucao_quadras import executar_quadras, ERRO
+from .exportacao import COLUNA_GEOMETRIA, SRID
+from .novaordem import ESQUEMA_NOVAORDEM, TABELA_NOVAORDEM
+from .reorganizacao import TABELA_LOTES, CAMPOS_LOTES, CamposLotes
+
+LOGGER = logging.getLogger('OrganizadorDeLotes')
+
+PADRAO = 'padrao'
+TODOS = 'todos'
+
+CAMADA_QUADRAS = 'Quadra'
+CAMADA_LOTES = 'gis_boletim_lote'
+
+
+class Municipio:
+    """Perfil de um município (ver as chaves no início do módulo)"""
+
+    CHAVES = ('conexao', 'conexao_leitura', 'esquema', 'tabela_novaordem', 'tabela_lotes', 'campos',
+              'coluna_geometria', 'srid', 'camada_quadras', 'camada_lotes', 'canal', 'conexoes')
+
+    def __init__(self, nome=PADRAO, conexao=None, conexao_leitura=None, esquema=ESQUEMA_NOVAORDEM,
+                 tabela_novaordem=TABELA_NOVAORDEM, tabela_lotes=TABELA_LOTES, campos=CAMPOS_LOTES,
+                 coluna_geometria=COLUNA_GEOMETRIA, srid=SRID, camada_quadras=CAMADA_QUADRAS,
+                 camada_lotes=CAMADA_LOTES, canal=CANAL, conexoes=1):
+        if conexoes < 1:
+            raise Exception(f"O município {nome} precisa de pelo menos uma conexão (conexoes={conexoes})")
+        self.nome = nome
+        self.conexao = conexao
+        self.conexao_leitura = conexao_leitura
+        self.esquema = esquema
+        self.tabela_novaordem = tabela_novaordem
+        self.tabela_lotes = tabela_lotes
+        self.campos = campos
+        self.coluna_geometria = coluna_geometria
+        self.srid = srid
+        self.camada_quadras = camada_quadras
+        self.camada_lotes = camada_lotes
+        self.canal = canal
+        self.conexoes = conexoes
+
+    @classmethod
+    def de_dicionario(cls, nome, dados):
+        """Município a partir do objeto JSON do perfil; chaves desconhecidas são erro"""
+        if not isinstance(dados, dict):
+            raise Exception(f"O perfil do município {nome} deve ser um objeto JSON")
+        desconhecidas = set(dados) - set(cls.CHAVES)
+        if desconhecidas:
+            raise Exception(f"Chaves desconhecidas no município {nome}: {', '.join(sorted(desconhecidas))}")
+        dados = dict(dados)
+        if 'campos' in dados:
+            campos = dados['campos']
+            desconhecidos = set(campos) - set(CamposLotes._fields)
+            if desconhecidos:
+                raise Exception(f"Campos desconhecidos no município {nome}: {', '.join(sorted(desconhecidos))}")
+            dados['campos'] = CAMPOS_LOTES._replace(**campos)
+        for chave in ('srid', 'conexoes'):
+            if chave in dados:
+                dados[chave] = int(dados[chave])
+        return cls(nome, **dados)
+
+    def com(self, **alteracoes):
+        """Cópia do município com os valores de 'alteracoes' (None mantém o do perfil)"""
+        valores = {chave: getattr(self, chave) for chave in self.CHAVES}
+        valores.update((chave, valor) for chave, valor in alteracoes.items() if valor is not None)
+        return Municipio(self.nome, **valores)
+
+    @property
+    def novaordem(self):
+        """Nome qualificado da tabela novaordem do município"""
+        return f'{self.esquema}.{self.tabela_novaordem}'
+
+    def __repr__(self):
+        return f'Municipio({self.nome!r}, esquema={self.esquema!r}, tabela_lotes={self.tabela_lotes!r})'
+
+
+def carregar_municipios(caminho):
+    """{nome: Municipio} do arquivo JSON de perfis, na ordem do arquivo"""
+    with open(caminho, encoding='utf-8') as arquivo:
+        dados = json.load(arquivo, object_pairs_hook=OrderedDict)
+    if not isinstance(dados, dict) or not dados:
+        raise Exception(f"{caminho}: o arquivo de municípios deve ser um objeto JSON com pelo menos um perfil")
+    return OrderedDict((nome, Municipio.de_dicionario(nome, perfil)) for nome, perfil in dados.items())
+
+
+def _configuracao_texto(variavel, chave):
+    valor = os.environ.get(variavel)
+    if valor is None:
+        try:
+            from qgis.PyQt.QtCore import QSettings
+        except ImportError:
+            return None
+        valor = QSettings().value(chave, None)
+    return valor or None
+
+
+def arquivo_municipios():
+    """Arquivo de perfis configurado (ORGANIZADOR_MUNICIPIOS ou QSettings), ou None"""
+    return _configuracao_texto('ORGANIZADOR_MUNICIPIOS', 'OrganizadorDeLotes/municipios')
+
+
+def obter_municipio(nome=None, caminho=None):
+    """
+    Município 'nome' (padrão: ORGANIZADOR_MUNICIPIO ou QSettings
+    'OrganizadorDeLotes/municipio') do arquivo de perfis. Sem arquivo nem nome,
+    retorna Municipio() com os nomes fixos de antes dos perfis.
+    """
+    nome = nome or _configuracao_texto('ORGANIZADOR_MUNICIPIO', 'OrganizadorDeLotes/municipio')
+    caminho = caminho or arquivo_municipios()
+    if caminho is None:
+        if nome in (None, PADRAO):
+            return Municipio()
+        raise Exception(f"Município {nome} sem arquivo de municípios configurado")
+    municipios = carregar_municipios(caminho)
+    if nome is None:
+        return next(iter(municipios.values()))
+    if nome not in municipios:
+        raise Exception(f"Município {nome} não está em {caminho}")
+    return municipios[nome]
+
+
+def selecionar_municipios(municipios, nomes):
+    """Municípios de 'nomes' (separados por vírgula, ou 'todos'), na ordem pedida"""
+    if nomes.strip() == TODOS:
+        return list(municipios.values())
+    selecionados = []
+    for nome in (valor.strip() for valor in nomes.split(',')):
+        if not nome:
+            continue
+        if nome not in municipios:
+            raise Exception(f"Município desconhecido: {nome} (disponíveis: {', '.join(municipios)})")
+        selecionados.append(municipios[nome])
+    return selecionados
+
+
+def executar_municipio(municipio, tarefas, trabalhadores=None, **opcoes):
+    """
+    execucao_quadras.executar_quadras com a conexão, as tabelas e os campos do
+    município, em 'trabalhadores' conexões limitadas ao orçamento municipio.conexoes.
+    """
+    trabalhadores = municipio.conexoes if trabalhadores is None else min(trabalhadores, municipio.conexoes)
+    return executar_quadras(municipio.conexao, tarefas, trabalhadores, tabela_lotes=municipio.tabela_lotes,
+                            conexao_leitura=municipio.conexao_leitura, esquema=municipio.esquema,
+                            tabela=municipio.tabela_novaordem, campos=municipio.campos, **opcoes)
+
+
+def _executar_isolado(municipio, tarefas, trabalhadores, opcoes):
+    try:
+        return executar_municipio(municipio, tarefas, trabalhadores, **opcoes)
+    except Exception as e:
+        # A falha de um município (banco fora do ar, tabela ausente) não interrompe os outros
+        LOGGER.error("Erro ao executar o município %s: %s", municipio.nome, e)
+        return [{'ins_quadra': ins_quadra, 'ordem_primeira': ordem_primeira, 'situacao': ERRO,
+                 'mensagem': str(e)} for ins_quadra, ordem_primeira in tarefas]
+
+
+def executar_municipios(execucoes, trabalhadores=None, **opcoes):
+    """
+    Reorganiza vários municípios ao mesmo tempo. execucoes: sequência de
+    (Municipio, tarefas, lote); cada município roda na sua própria thread, com
+    o seu orçamento de conexões (ver executar_municipio). 'opcoes' valem para
+    todos (executar_quadras). Retorna {nome do município: resultados}.
+    """
+    execucoes = [(municipio, list(tarefas), lote) for municipio, tarefas, lote in execucoes]
+    if not execucoes:
+        return {}
+    with ThreadPoolExecutor(max_workers=len(execucoes)) as executor:
+        futuros = {municipio.nome: executor.submit(_executar_isolado, municipio, tarefas, trabalhadores,
+                                                   dict(opcoes, lote=lote))
+                   for municipio, tarefas, lote in execucoes}
+    return {nome: futuro.result() for nome, futuro in futuros.items()}
@@ -0,0 +1,300 @@
+# -*- coding: utf-8 -*-
+"""
+OrganizadorDeLotes - gravação na tabela novaordem
+Cada quadra é gravada numa única transação protegida por pg_advisory_xact_lock,
+de modo que dois operadores ou trabalhadores em lote nunca intercalem a escrita
+da mesma ins_quadra. Todo SQL passa pelo registro de instruções preparadas
+(instrucoes.REGISTRO). Há dois modos de gravação:
+
+- MODO_SUBSTITUIR: DELETE de toda a quadra seguido de INSERT (comportamento original);
+- MODO_UPSERT: INSERT ... ON CONFLICT (ins_quadra, matricula) que só reescreve as
+  linhas cujo n_ordem mudou, seguido de um único DELETE anti-join das matrículas
+  que saíram da quadra. Gera muito menos tuplas mortas; requer o índice único
+  criado por provisionamento.provisionar_novaordem.
+
+Com a tabela de histórico provisionada ({tabela}_historico, ver
+provisionamento.provisionar_historico), a versão anterior de cada quadra é
+guardada na mesma transação da gravação: no modo substituir o próprio
+DELETE ... RETURNING alimenta o histórico. desfazer_quadras volta as quadras
+às versões guardadas numa única instrução.
+
+inserir_lote e remover_lote mudam um só lote (desmembramento, unificação)
+sem regravar a quadra: só as linhas depois da posição são deslocadas
+(n_ordem ± 1), na transação e sob o bloqueio da quadra. Com o histórico,
+a versão anterior da quadra é copiada antes, como no modo upsert.
+"""
+import threading
+import weakref
+
+from .instrucoes import REGISTRO
+from .lotes import LotesColunares
+
+ESQUEMA_NOVAORDEM = 'comercial_umc'
+TABELA_NOVAORDEM = 'novaordem'
+# Pontos de controle dos lotes retomáveis (ver retomada)
+TABELA_CHECKPOINTS = 'novaordem_checkpoints'
+# Sufixo da tabela de histórico de cada novaordem
+SUFIXO_HISTORICO = '_historico'
+
+# Situações possíveis ao gravar uma quadra
+GRAVADA = 'gravada'
+OCUPADA = 'ocupada'
+
+# Modos de gravação
+MODO_SUBSTITUIR = 'substituir'
+MODO_UPSERT = 'upsert'
+MODOS_GRAVACAO = (MODO_SUBSTITUIR, MODO_UPSERT)
+
+
+def _tabela(esquema, tabela):
+    return f'{esquema}.{tabela}'
+
+
+def _chave_bloqueio(esquema, tabela):
+    # A chave é calculada no servidor (hashtextextended) para que qualquer
+    # cliente que escreva na mesma tabela use exatamente o mesmo bloqueio.
+    return f'{esquema}.{tabela}:'
+
+
+def tabela_historico(tabela=TABELA_NOVAORDEM):
+    return f'{tabela}{SUFIXO_HISTORICO}'
+
+
+# Conexão -> {tabela de histórico: existe}, consultado uma vez por conexão
+_historicos = weakref.WeakKeyDictionary()
+_trava_historicos = threading.Lock()
+
+
+def historico_disponivel(conn, esquema=ESQUEMA_NOVAORDEM, tabela=TABELA_NOVAORDEM, recarregar=False):
+    """
+    Nome qualificado da tabela de histórico da novaordem, se ela existir, ou
+    None. A resposta fica guardada para a conexão; 'recarregar' consulta de novo.
+    """
+    historico = _tabela(esquema, tabela_historico(tabela))
+    with _trava_historicos:
+        conhecidos = _historicos.setdefault(conn, {})
+        existe = None if recarregar else conhecidos.get(historico)
+    if existe is None:
+        with conn:
+            with conn.cursor() as cursor:
+                cursor.execute('SELECT to_regclass(%s) IS NOT NULL', (historico,))
+                existe = cursor.fetchone()[0]
+        with _trava_historicos:
+            conhecidos[historico] = existe
+    return historico if existe else None
+
+
+def bloquear_quadra(cursor, ins_quadra, aguardar=True,
+                    esquema=ESQUEMA_NOVAORDEM, tabela=TABELA_NOVAORDEM):
+    """
+    Obtém o bloqueio consultivo da quadra até o fim da transação corrente.
+    Com aguardar=False não espera: retorna False se outra sessão já o detém.
+    """
+    nome = 'bloquear_quadra' if aguardar else 'tentar_bloquear_quadra'
+    REGISTRO.executar(cursor, nome, (_chave_bloqueio(esquema, tabela), ins_quadra))
+    if aguardar:
+        return True
+    return bool(cursor.fetchone()[0])
+
+
+def existe_quadra(conn, ins_quadra, esquema=ESQUEMA_NOVAORDEM, tabela=TABELA_NOVAORDEM):
+    """Indica se a novaordem já tem registros da quadra"""
+    with conn:
+        with conn.cursor() as cursor:
+            REGISTRO.executar(cursor, 'existe_quadra', (ins_quadra,), tabela=_tabela(esquema, tabela))
+            return cursor.fetchone()[0]
+
+
+def ler_novaordem_quadra(conn, ins_quadra, esquema=ESQUEMA_NOVAORDEM, tabela=TABELA_NOVAORDEM):
+    """[(matricula, n_ordem)] da quadra na novaordem, em ordem de n_ordem"""
+    with conn:
+        with conn.cursor() as cursor:
+            REGISTRO.executar(cursor, 'ler_novaordem_quadra', (ins_quadra,), tabela=_tabela(esquema, tabela))
+            return cursor.fetchall()
+
+
+def excluir_quadra(conn, ins_quadra, aguardar=True,
+                   esquema=ESQUEMA_NOVAORDEM, tabela=TABELA_NOVAORDEM):
+    """
+    Exclui todos os registros da quadra na novaordem, sob o bloqueio da quadra
+    (guardando-os no histórico, se houver). Retorna a quantidade excluída, ou
+    None se a quadra estiver ocupada (aguardar=False).
+    """
+    historico = historico_disponivel(conn, esquema, tabela)
+    with conn:
+        with conn.cursor() as cursor:
+            if not bloquear_quadra(cursor, ins_quadra, aguardar, esquema, tabela):
+                return None
+            return _excluir(cursor, ins_quadra, _tabela(esquema, tabela), historico)
+
+
+def _excluir(cursor, ins_quadra, tabela, historico):
+    if historico is None:
+        REGISTRO.executar(cursor, 'excluir_quadra', (ins_quadra,), tabela=tabela)
+        return cursor.rowcount
+    REGISTRO.executar(cursor, 'arquivar_quadra', (ins_quadra,), tabela=tabela, historico=historico)
+    return cursor.fetchone()[0]
+
+
+def _substituir(cursor, ins_quadra, lotes, tabela, resultado, historico=None):
+    resultado['excluidos'] = _excluir(cursor, ins_quadra, tabela, historico)
+
+    if lotes:
+        REGISTRO.executar(cursor, 'inserir_quadra', lotes.listas(), tabela=tabela)
+    resultado['inseridos'] = len(lotes)
+
+
+def _upsert(cursor, ins_quadra, lotes, tabela, resultado, historico=None):
+    if historico is not None:
+        REGISTRO.executar(cursor, 'copiar_quadra_historico', (ins_quadra,), tabela=tabela, historico=historico)
+    # Remove, num único DELETE anti-join, as matrículas que não estão mais na quadra
+    REGISTRO.executar(cursor, 'excluir_ausentes', (ins_quadra, lotes.lista_matriculas()),
+                      tabela=tabela)
+    resultado['excluidos'] = cursor.rowcount
+
+    if lotes:
+        REGISTRO.executar(cursor, 'upsert_quadra', lotes.listas(), tabela=tabela)
+        retornos = cursor.fetchall()
+        inseridos = sum(1 for (inserido,) in retornos if inserido)
+        resultado['inseridos'] = inseridos
+        resultado['atualizados'] = len(retornos) - inseridos
+        resultado['inalterados'] = len(lotes) - len(retornos)
+
+
+def gravar_quadra(conn, ins_quadra, lotes, aguardar=True, modo=MODO_SUBSTITUIR,
+                  esquema=ESQUEMA_NOVAORDEM, tabela=TABELA_NOVAORDEM, ponto_controle=None):
+    """
+    Grava 'lotes' (LotesColunares já reordenados, ou tuplas (matricula, ins_quadra,
+    n_ordem)) como o conteúdo completo da quadra na novaordem, em uma transação.
+
+    Com aguardar=False a quadra é pulada se outro processo estiver gravando nela.
+    Retorna {'situacao': GRAVADA|OCUPADA, 'excluidos', 'inseridos'} e, no modo
+    upsert, também 'atualizados' e 'inalterados'. No modo upsert as matrículas
+    devem ser únicas dentro da quadra.
+
+    ponto_controle: (lote, ordem_primeira) de um lote retomável; a quadra é
+    marcada como concluída no lote na mesma transação (ver retomada).
+
+    Se a novaordem tiver histórico, a versão anterior da quadra é guardada
+    nele na mesma transação (ver desfazer_quadras).
+    """
+    if modo not in MODOS_GRAVACAO:
+        raise Exception(f"Modo de gravação desconhecido: {modo}")
+
+    if not isinstance(lotes, LotesColunares):
+        lotes = LotesColunares.de_tuplas(lotes)
+    resultado = {'situacao': OCUPADA, 'excluidos': 0, 'inseridos': 0}
+    if modo == MODO_UPSERT:
+        resultado.update(atualizados=0, inalterados=0)
+
+    historico = historico_disponivel(conn, esquema, tabela)
+    with conn:
+        with conn.cursor() as cursor:
+            if not bloquear_quadra(cursor, ins_quadra, aguardar, esquema, tabela):
+                return resultado
+
+            gravar = _upsert if modo == MODO_UPSERT else _substituir
+            gravar(cursor, ins_quadra, lotes, _tabela(esquema, tabela), resultado, historico)
+            if ponto_controle is not None:
+                lote, ordem_primeira = ponto_controle
+                REGISTRO.executar(cursor, 'registrar_checkpoint', (lote, ins_quadra, ordem_primeira),
+                                  checkpoints=_tabela(esquema, TABELA_CHECKPOINTS))
+
+    resultado['situacao'] = GRAVADA
+    return resultado
+
+
+def posicao_lote(conn, ins_quadra, matricula, esquema=ESQUEMA_NOVAORDEM, tabela=TABELA_NOVAORDEM):
+    """(n_ordem da matrícula na quadra ou None, maior n_ordem da quadra ou None)"""
+    with conn:
+        with conn.cursor() as cursor:
+            REGISTRO.executar(cursor, 'posicao_lote', (ins_quadra, matricula), tabela=_tabela(esquema, tabela))
+            return cursor.fetchone()
+
+
+def inserir_lote(conn, ins_quadra, matricula, n_ordem, aguardar=True,
+                 esquema=ESQUEMA_NOVAORDEM, tabela=TABELA_NOVAORDEM):
+    """
+    Insere a matrícula na quadra na posição 'n_ordem' (de 1 até a última + 1),
+    deslocando para n_ordem + 1 só os lotes dali em diante. Falha se a
+    matrícula já estiver na quadra ou se a posição deixar uma lacuna.
+    Retorna {'situacao': GRAVADA|OCUPADA, 'deslocados', 'n_ordem'}.
+    """
+    return _alterar_lote(conn, ins_quadra, matricula, n_ordem, aguardar, esquema, tabela)
+
+
+def remover_lote(conn, ins_quadra, matricula, aguardar=True, esquema=ESQUEMA_NOVAORDEM, tabela=TABELA_NOVAORDEM):
+    """
+    Remove a matrícula da quadra e fecha a posição (n_ordem - 1 só nos lotes
+    depois dela). Falha se a matrícula não estiver na quadra. Retorna
+    {'situacao': GRAVADA|OCUPADA, 'deslocados', 'n_ordem'} com a posição que ela ocupava.
+    """
+    return _alterar_lote(conn, ins_quadra, matricula, None, aguardar, esquema, tabela)
+
+
+def _alterar_lote(conn, ins_quadra, matricula, n_ordem, aguardar, esquema, tabela):
+    # n_ordem None: remoção
+    resultado = {'situacao': OCUPADA, 'deslocados': 0, 'n_ordem': n_ordem}
+    historico = historico_disponivel(conn, esquema, tabela)
+    nome = _tabela(esquema, tabela)
+    with conn:
+        with conn.cursor() as cursor:
+            if not bloquear_quadra(cursor, ins_quadra, aguardar, esquema, tabela):
+                return resultado
+            REGISTRO.executar(cursor, 'posicao_lote', (ins_quadra, matricula), tabela=nome)
+            atual, ultima = cursor.fetchone()
+            if n_ordem is None and atual is None:
+                raise Exception(f"A matrícula {matricula} não está na quadra {ins_quadra}")
+            if n_ordem is not None and atual is not None:
+                raise Exception(f"A matrícula {matricula} já está na quadra {ins_quadra} (ordem {atual})")
+            if n_ordem is not None and not 1 <= n_ordem <= (ultima or 0) + 1:
+                raise Exception(f"Posição {n_ordem} fora da quadra {ins_quadra} (de 1 a {(ultima or 0) + 1})")
+
+            if historico is not None:
+                REGISTRO.executar(cursor, 'copiar_quadra_historico', (ins_quadra,), tabela=nome,
+                                  historico=historico)
+            if n_ordem is None:
+                REGISTRO.executar(cursor, 'remover_lote', (ins_quadra, matricula), tabela=nome)
+                REGISTRO.executar(cursor, 'fechar_posicao', (ins_quadra, atual), tabela=nome)
+                resultado.update(n_ordem=atual, deslocados=cursor.rowcount)
+            else:
+                REGISTRO.executar(cursor, 'abrir_posicao', (ins_quadra, n_ordem), tabela=nome)
+                resultado['deslocados'] = cursor.rowcount
+                REGISTRO.executar(cursor, 'inserir_lote', (matricula, ins_quadra, n_ordem), tabela=nome)
+
+    resultado['situacao'] = GRAVADA
+    return resultado
+
+
+def desfazer_quadras(conn, quadras, versoes=1, esquema=ESQUEMA_NOVAORDEM, tabela=TABELA_NOVAORDEM):
+    """
+    Volta cada uma das 'quadras' ao conteúdo de antes das suas 'versoes'
+    últimas gravações (ou à versão mais antiga guardada, se houver menos),
+    numa transação, sob os bloqueios das quadras e numa única instrução. As
+    versões restauradas saem do histórico: desfazer de novo recua mais.
+    Retorna {ins_quadra: (excluidos, restaurados)} das quadras com histórico.
+    """
+    if versoes < 1:
+        raise Exception(f"Quantidade de versões inválida: {versoes}")
+    historico = historico_disponivel(conn, esquema, tabela)
+    if historico is None:
+        raise Exception(f"A novaordem {_tabela(esquema, tabela)} não tem histórico "
+                        "(provisionamento.provisionar_historico)")
+    quadras = sorted(set(quadras))
+    with conn:
+        with conn.cursor() as cursor:
+            REGISTRO.executar(cursor, 'bloquear_quadras', (_chave_bloqueio(esquema, tabela), quadras))
+            REGISTRO.executar(cursor, 'desfazer_quadras', (quadras, versoes), tabela=_tabela(esquema, tabela),
+                              historico=historico)
+            return {ins_quadra: (excluidos, restaurados) for ins_quadra, excluidos, restaurados in cursor.fetchall()}
+
+
+def podar_historico(conn, manter, esquema=ESQUEMA_NOVAORDEM, tabela=TABELA_NOVAORDEM):
+    """Deixa no histórico só as 'manter' versões mais recentes de cada quadra; retorna quantas saíram"""
+    historico = historico_disponivel(conn, esquema, tabela)
+    if historico is None:
+        return 0
+    with conn:
+        with conn.cursor() as cursor:
+            REGISTRO.executar(cursor, 'podar_historico', (manter,), historico=historico)
+            return cursor.rowcount
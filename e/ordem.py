@@ -0,0 +1,50 @@
+# -*- coding: utf-8 -*-
+"""
+OrganizadorDeLotes - regra de reordenação
+Cálculo puro (sem QGIS nem banco) da nova ordem dos lotes de uma quadra.
+"""
+from array import array
+from bisect import bisect_left
+
+# Valor usado nas colunas array('q') para representar NULL
+NULO = -2 ** 63
+
+
+def calcular_offset(ordens, ordem_primeira):
+    """Quantidade de lotes com ordem >= ordem_primeira (deslocamento dos anteriores)"""
+    return sum(1 for ordem in ordens if ordem is not None and ordem != NULO and ordem >= ordem_primeira)
+
+
+def calcular_offset_ordenado(ordens_ordenadas, ordem_primeira):
+    """calcular_offset por busca binária, para ordens já ordenadas e sem NULL"""
+    return len(ordens_ordenadas) - bisect_left(ordens_ordenadas, ordem_primeira)
+
+
+def calcular_nova_ordem(ordens, ordem_primeira):
+    """
+    Aplica a rotação usada em organizar_ordem_lote:
+    o lote com ordem = ordem_primeira passa a ser o 1 e os lotes anteriores
+    vão para o fim da sequência, mantendo a ordem relativa.
+    Ordens nulas continuam nulas (como no CASE original).
+    """
+    ordens = list(ordens)
+    offset = calcular_offset(ordens, ordem_primeira)
+    novas = []
+    for ordem in ordens:
+        if ordem is None:
+            novas.append(None)
+        elif ordem >= ordem_primeira:
+            novas.append(ordem - (ordem_primeira - 1))
+        else:
+            novas.append(ordem + offset)
+    return novas
+
+
+def calcular_nova_ordem_array(ordens, ordem_primeira):
+    """Mesma rotação de calcular_nova_ordem sobre uma coluna array('q') (NULL = NULO)"""
+    offset = calcular_offset(ordens, ordem_primeira)
+    recuo = ordem_primeira - 1
+    return array('q', (NULO if ordem == NULO else
+                       ordem - recuo if ordem >= ordem_primeira else
+                       ordem + offset
+                       for ordem in ordens))
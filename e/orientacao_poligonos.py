@@ -0,0 +1,139 @@
+# -*- coding: utf-8 -*-
+"""
+OrganizadorDeLotes - orientação de polígonos e primeiro vértice de testada
+Versão sem QGIS do núcleo do algoritmo 'Orientar polígonos'
+(e_orientacao_algorithm), reescrito a partir do Cad_PolygonOrientation do umcgeo:
+
+- orienta os anéis no sentido pedido (horário / anti-horário) e começa cada um
+  no vértice mais ao norte, sul, leste ou oeste;
+- opcionalmente, começa o anel externo no primeiro vértice de testada: o
+  vértice em que termina uma divisa com um lote vizinho e começa um trecho
+  voltado para a rua.
+
+O original percorria a camada inteira para cada lote (e, por um erro de
+indentação, fazia isso de novo para cada feição orientada). Aqui os vizinhos
+de cada lote vêm de um índice espacial montado uma vez, e cada lote é
+resolvido numa única passada: um segmento é de divisa quando o seu ponto
+médio está a até 'tolerancia' da fronteira de um vizinho. A orientação não
+muda as fronteiras, então os anéis originais dos vizinhos servem para isso.
+
+Anéis circulam como em conectar_poligonos: listas de tuplas (x, y) fechadas
+(primeiro ponto = último), o externo primeiro.
+"""
+from .conectar_poligonos import TOLERANCIA
+
+# Sentido
+HORARIO, ANTI_HORARIO, MANTER = range(3)
+
+# Primeiro vértice
+SEQUENCIA, NORTE, SUL, LESTE, OESTE = range(5)
+
+
+def area_assinada(anel):
+    """Área pela fórmula de Gauss: positiva no sentido anti-horário (anel aberto ou fechado)"""
+    soma = 0.0
+    for (x1, y1), (x2, y2) in zip(anel, anel[1:] + anel[:1]):
+        soma += x1 * y2 - x2 * y1
+    return soma / 2
+
+
+def _aberto(anel):
+    return anel[:-1] if len(anel) > 1 and anel[0] == anel[-1] else list(anel)
+
+
+def _fechado(anel):
+    return anel + anel[:1]
+
+
+def orientar_anel(anel, primeiro=NORTE, sentido=HORARIO):
+    """Anel fechado no 'sentido' pedido, começando no vértice 'primeiro'"""
+    vertices = _aberto(anel)
+    if not vertices:
+        return list(anel)
+    area = area_assinada(vertices)
+    if (sentido == HORARIO and area > 0) or (sentido == ANTI_HORARIO and area < 0):
+        # Inverte mantendo o primeiro vértice
+        vertices = vertices[:1] + vertices[:0:-1]
+    if primeiro != SEQUENCIA:
+        chave = {NORTE: lambda p: p[1], SUL: lambda p: -p[1],
+                 LESTE: lambda p: p[0], OESTE: lambda p: -p[0]}[primeiro]
+        inicio = max(range(len(vertices)), key=lambda i: chave(vertices[i]))
+        vertices = vertices[inicio:] + vertices[:inicio]
+    return _fechado(vertices)
+
+
+def _distancia2(px, py, x1, y1, x2, y2):
+    dx, dy = x2 - x1, y2 - y1
+    comprimento2 = dx * dx + dy * dy
+    t = ((px - x1) * dx + (py - y1) * dy) / comprimento2 if comprimento2 else 0.0
+    t = 0.0 if t < 0.0 else 1.0 if t > 1.0 else t
+    ex, ey = x1 + t * dx - px, y1 + t * dy - py
+    return ex * ex + ey * ey
+
+
+def segmentos_divisa(anel, aneis_vizinhos, tolerancia=TOLERANCIA):
+    """
+    Para cada segmento do anel fechado, True se ele é divisa com algum vizinho
+    (o ponto médio está a até 'tolerancia' de um segmento de 'aneis_vizinhos').
+    """
+    tolerancia2 = tolerancia * tolerancia
+    segmentos = []
+    for vizinho in aneis_vizinhos:
+        for (x1, y1), (x2, y2) in zip(vizinho, vizinho[1:]):
+            segmentos.append((min(x1, x2) - tolerancia, min(y1, y2) - tolerancia,
+                              max(x1, x2) + tolerancia, max(y1, y2) + tolerancia, x1, y1, x2, y2))
+    divisas = []
+    for (xa, ya), (xb, yb) in zip(anel, anel[1:]):
+        mx, my = (xa + xb) / 2, (ya + yb) / 2
+        divisas.append(any(xmin <= mx <= xmax and ymin <= my <= ymax
+                           and _distancia2(mx, my, x1, y1, x2, y2) <= tolerancia2
+                           for xmin, ymin, xmax, ymax, x1, y1, x2, y2 in segmentos))
+    return divisas
+
+
+def primeiro_vertice_testada(divisas):
+    """Índice do primeiro vértice em que uma divisa termina e a testada começa, ou None"""
+    for k, divisa in enumerate(divisas):
+        if divisas[k - 1] and not divisa:
+            return k
+    return None
+
+
+def orientar_poligono(partes, aneis_vizinhos=(), primeiro=NORTE, sentido=HORARIO, testada=False,
+                      tolerancia=TOLERANCIA):
+    """
+    Orienta um polígono (lista de partes, cada uma uma lista de anéis fechados).
+    Com 'testada', o anel externo de cada parte começa no primeiro vértice de
+    testada em relação a 'aneis_vizinhos' (os anéis dos lotes vizinhos); sem
+    divisa ou sem testada, fica o vértice de 'primeiro'. Retorna (partes,
+    quantidade de partes que começaram na testada).
+    """
+    orientadas = []
+    na_testada = 0
+    for aneis in partes:
+        aneis = [orientar_anel(anel, primeiro, sentido) for anel in aneis]
+        if testada and aneis:
+            externo = aneis[0]
+            inicio = primeiro_vertice_testada(segmentos_divisa(externo, aneis_vizinhos, tolerancia))
+            if inicio is not None:
+                vertices = externo[:-1]
+                aneis[0] = _fechado(vertices[inicio:] + vertices[:inicio])
+                na_testada += 1
+        orientadas.append(aneis)
+    return orientadas, na_testada
+
+
+def orientar_poligonos(poligonos, vizinhos, primeiro=NORTE, sentido=HORARIO, testada=False,
+                       tolerancia=TOLERANCIA, selecionados=None):
+    """
+    Orienta {id: partes} em uma passada, usando os vizinhos candidatos do
+    índice espacial ({id: ids}). 'selecionados' limita os lotes orientados (os
+    demais só contam como vizinhos). Gera (id, partes, na_testada).
+    """
+    for ident in (poligonos if selecionados is None else selecionados):
+        aneis_vizinhos = [anel for vizinho in vizinhos.get(ident, ()) if vizinho in poligonos
+                          for partes in poligonos[vizinho] for anel in partes] if testada else ()
+        partes, na_testada = orientar_poligono(poligonos[ident], aneis_vizinhos, primeiro, sentido, testada,
+                                               tolerancia)
+        yield ident, partes, na_testada
+
@@ -0,0 +1,336 @@
+# -*- coding: utf-8 -*-
+"""
+OrganizadorDeLotes - novaordem particionada por faixas de ins_quadra
+Com provisionamento.provisionar_novaordem(particionada=True) a novaordem é
+criada como tabela particionada (PARTITION BY RANGE (ins_quadra)), com uma
+partição padrão ({tabela}_padrao) para as quadras fora de qualquer faixa.
+Cada partição é uma faixa [inicio, fim) de ins_quadra, em geral um distrito
+(as inscrições de um distrito ocupam uma faixa contínua de quadras); a
+tabela de cada uma é {tabela}_{nome}, no mesmo esquema.
+
+A gravação quadra a quadra não muda (o índice único (ins_quadra, matricula)
+existe em cada partição e o upsert continua valendo), mas a rotatividade de
+cada distrito fica nos índices e no autovacuum da sua partição. Além disso um
+distrito inteiro pode ser refeito sem DELETE linha a linha
+(recarregar_particao): as quadras são gravadas numa tabela de carga e, numa
+transação curta, a partição antiga é desanexada e a carga é anexada no lugar
+(ATTACH PARTITION), já com índices e a restrição da faixa, sem varredura.
+
+Requer PostgreSQL 11+.
+"""
+import re
+import unicodedata
+from collections import namedtuple
+
+from .conexao_pg import _psycopg2
+from .instrucoes import REGISTRO, identificador
+from .novaordem import GRAVADA, ESQUEMA_NOVAORDEM, TABELA_NOVAORDEM, MODO_SUBSTITUIR, historico_disponivel
+from .reorganizacao import DestinoNovaOrdem, reorganizar
+
+# nome: sufixo da tabela da partição; inicio/fim: faixa [inicio, fim) de ins_quadra (None na padrão)
+Particao = namedtuple('Particao', ('nome', 'inicio', 'fim'))
+
+PADRAO = 'padrao'
+
+_LIMITES = re.compile(r'FROM \((-?\d+)\) TO \((-?\d+)\)')
+
+
+def nome_particao(texto):
+    """Sufixo válido de tabela a partir de um nome de distrito ('Vila São João' -> 'vila_sao_joao')"""
+    texto = unicodedata.normalize('NFKD', str(texto)).encode('ascii', 'ignore').decode('ascii')
+    nome = re.sub(r'[^a-z0-9]+', '_', texto.lower()).strip('_')
+    if not nome:
+        raise Exception(f"Nome de partição inválido: {texto!r}")
+    return nome
+
+
+def tipo_tabela(conn, esquema=ESQUEMA_NOVAORDEM, tabela=TABELA_NOVAORDEM):
+    """'p' (particionada), 'r' (comum) ou None (não existe)"""
+    with conn:
+        with conn.cursor() as cursor:
+            cursor.execute('SELECT relkind FROM pg_class WHERE oid = to_regclass(%s)',
+                           (_psycopg2().sql.Identifier(esquema, tabela).as_string(cursor),))
+            linha = cursor.fetchone()
+    return linha[0] if linha else None
+
+
+def criar_particionada(cursor, esquema=ESQUEMA_NOVAORDEM, tabela=TABELA_NOVAORDEM, sequencia=None):
+    """
+    Cria a novaordem particionada e a partição padrão (a tabela não deve
+    existir). 'sequencia': sequência existente para os ids (padrão: serial).
+    """
+    sql = _psycopg2().sql
+    novaordem = sql.Identifier(esquema, tabela)
+    coluna_id = (sql.SQL('integer NOT NULL DEFAULT nextval({}::regclass)').format(sql.Literal(sequencia))
+                 if sequencia else sql.SQL('serial'))
+    # A chave primária de uma tabela particionada precisa conter a chave de partição
+    cursor.execute(sql.SQL('''
+        CREATE TABLE {} (
+            id {},
+            matricula integer,
+            ins_quadra integer,
+            n_ordem bigint,
+            PRIMARY KEY (ins_quadra, id)
+        ) PARTITION BY RANGE (ins_quadra)
+    ''').format(novaordem, coluna_id))
+    if sequencia:
+        cursor.execute(sql.SQL('ALTER SEQUENCE {} OWNED BY {}.id').format(sql.SQL(sequencia), novaordem))
+    cursor.execute(sql.SQL('CREATE TABLE {} PARTITION OF {} DEFAULT').format(
+        sql.Identifier(esquema, f'{tabela}_{PADRAO}'), novaordem))
+
+
+def converter_particionada(cursor, esquema=ESQUEMA_NOVAORDEM, tabela=TABELA_NOVAORDEM):
+    """
+    Converte uma novaordem comum em particionada (só com a partição padrão),
+    copiando os registros e mantendo os ids e a sequência. Roda na transação
+    de 'cursor' (ver provisionamento.provisionar_novaordem); as faixas vêm
+    depois, com criar_particoes.
+    """
+    sql = _psycopg2().sql
+    novaordem = sql.Identifier(esquema, tabela)
+    antiga = sql.Identifier(esquema, f'{tabela}_antiga')
+    cursor.execute(sql.SQL('LOCK TABLE {} IN EXCLUSIVE MODE').format(novaordem))
+    cursor.execute(sql.SQL('SELECT count(*) FROM {} WHERE ins_quadra IS NULL').format(novaordem))
+    sem_quadra, = cursor.fetchone()
+    if sem_quadra:
+        raise Exception(f"{esquema}.{tabela} tem {sem_quadra} registros sem ins_quadra; "
+                        "remova-os antes de particionar")
+    cursor.execute('SELECT pg_get_serial_sequence(%s, %s)', (novaordem.as_string(cursor), 'id'))
+    sequencia, = cursor.fetchone()
+    if sequencia:
+        # Senão a sequência iria embora junto com a tabela antiga
+        cursor.execute(sql.SQL('ALTER SEQUENCE {} OWNED BY NONE').format(sql.SQL(sequencia)))
+    cursor.execute(sql.SQL('ALTER TABLE {} RENAME TO {}').format(novaordem,
+                                                                  sql.Identifier(f'{tabela}_antiga')))
+    # Restrições e índices da antiga liberam os nomes para os da nova
+    cursor.execute("SELECT conname FROM pg_constraint WHERE conrelid = to_regclass(%s) AND contype IN ('p', 'u')",
+                   (antiga.as_string(cursor),))
+    for restricao, in cursor.fetchall():
+        cursor.execute(sql.SQL('ALTER TABLE {} DROP CONSTRAINT {}').format(antiga, sql.Identifier(restricao)))
+    cursor.execute('SELECT indexrelid::regclass::text FROM pg_index WHERE indrelid = to_regclass(%s)',
+                   (antiga.as_string(cursor),))
+    for indice, in cursor.fetchall():
+        cursor.execute(sql.SQL('DROP INDEX {}').format(sql.SQL(indice)))
+    criar_particionada(cursor, esquema, tabela, sequencia)
+    cursor.execute(sql.SQL('INSERT INTO {} (id, matricula, ins_quadra, n_ordem) '
+                           'SELECT id, matricula, ins_quadra, n_ordem FROM {}').format(novaordem, antiga))
+    cursor.execute(sql.SQL('DROP TABLE {}').format(antiga))
+
+
+def listar_particoes(conn, esquema=ESQUEMA_NOVAORDEM, tabela=TABELA_NOVAORDEM):
+    """Partições da novaordem (Particao), em ordem de faixa; a padrão por último"""
+    sql = _psycopg2().sql
+    prefixo = f'{tabela}_'
+    particoes = []
+    with conn:
+        with conn.cursor() as cursor:
+            cursor.execute('''SELECT c.relname, pg_get_expr(c.relpartbound, c.oid)
+                              FROM pg_inherits i JOIN pg_class c ON c.oid = i.inhrelid
+                              WHERE i.inhparent = to_regclass(%s)''',
+                           (sql.Identifier(esquema, tabela).as_string(cursor),))
+            for relname, limites in cursor.fetchall():
+                nome = relname[len(prefixo):] if relname.startswith(prefixo) else relname
+                faixa = _LIMITES.search(limites or '')
+                particoes.append(Particao(nome, *(map(int, faixa.groups()) if faixa else (None, None))))
+    return sorted(particoes, key=lambda p: (p.inicio is None, p.inicio or 0, p.nome))
+
+
+def obter_particao(conn, nome, esquema=ESQUEMA_NOVAORDEM, tabela=TABELA_NOVAORDEM):
+    for particao in listar_particoes(conn, esquema, tabela):
+        if particao.nome == nome:
+            return particao
+    raise Exception(f"A partição {nome} não existe em {esquema}.{tabela}")
+
+
+def faixas(inicio, fim, tamanho):
+    """Partições de 'tamanho' quadras cobrindo [inicio, fim)"""
+    if tamanho < 1 or fim <= inicio:
+        raise Exception(f"Faixa inválida: {inicio}:{fim}:{tamanho}")
+    return [Particao(f'{a}_{min(a + tamanho, fim) - 1}', a, min(a + tamanho, fim))
+            for a in range(inicio, fim, tamanho)]
+
+
+def faixas_por_distrito(conn, tabela_lotes, coluna_distrito, coluna_quadra='ins_quadra'):
+    """
+    Uma partição por distrito da tabela de lotes, com a faixa das suas quadras.
+    Falha se as faixas de dois distritos se sobrepuserem.
+    """
+    sql = _psycopg2().sql
+    with conn:
+        with conn.cursor() as cursor:
+            cursor.execute(sql.SQL('''SELECT {distrito}, min({quadra}), max({quadra}) + 1 FROM {lotes}
+                                      WHERE {distrito} IS NOT NULL AND {quadra} IS NOT NULL
+                                      GROUP BY 1 ORDER BY 2''').format(
+                distrito=sql.Identifier(coluna_distrito), quadra=sql.Identifier(coluna_quadra),
+                lotes=identificador(tabela_lotes)))
+            linhas = cursor.fetchall()
+    particoes = [Particao(nome_particao(distrito), inicio, fim) for distrito, inicio, fim in linhas]
+    for anterior, seguinte in zip(particoes, particoes[1:]):
+        if seguinte.inicio < anterior.fim:
+            raise Exception(f"As quadras dos distritos {anterior.nome} ({anterior.inicio}-{anterior.fim - 1}) e "
+                            f"{seguinte.nome} ({seguinte.inicio}-{seguinte.fim - 1}) se sobrepõem")
+    return particoes
+
+
+def _criar_carga(cursor, sql, esquema, tabela, carga):
+    cursor.execute(sql.SQL('DROP TABLE IF EXISTS {}').format(sql.Identifier(esquema, carga)))
+    cursor.execute(sql.SQL('CREATE TABLE {} (LIKE {} INCLUDING DEFAULTS)').format(
+        sql.Identifier(esquema, carga), sql.Identifier(esquema, tabela)))
+    # Os mesmos índices da novaordem: o ATTACH os reaproveita em vez de criá-los
+    cursor.execute(sql.SQL('ALTER TABLE {} ADD PRIMARY KEY (ins_quadra, id)').format(
+        sql.Identifier(esquema, carga)))
+    cursor.execute(sql.SQL('CREATE UNIQUE INDEX ON {} (ins_quadra, matricula)').format(
+        sql.Identifier(esquema, carga)))
+
+
+def _anexar(cursor, sql, particao, esquema, tabela, carga):
+    # Com a restrição da faixa, o ATTACH não precisa varrer a carga
+    restricao = sql.Identifier(f'{carga}_faixa')
+    cursor.execute(sql.SQL('ALTER TABLE {} ADD CONSTRAINT {} CHECK (ins_quadra >= {} AND ins_quadra < {})').format(
+        sql.Identifier(esquema, carga), restricao, sql.Literal(particao.inicio), sql.Literal(particao.fim)))
+    cursor.execute(sql.SQL('ALTER TABLE {} ATTACH PARTITION {} FOR VALUES FROM ({}) TO ({})').format(
+        sql.Identifier(esquema, tabela), sql.Identifier(esquema, carga),
+        sql.Literal(particao.inicio), sql.Literal(particao.fim)))
+    cursor.execute(sql.SQL('ALTER TABLE {} DROP CONSTRAINT {}').format(sql.Identifier(esquema, carga), restricao))
+
+
+def _anexar_nova(cursor, sql, particao, esquema, tabela):
+    """Cria a partição e traz para ela as quadras da faixa que estavam na padrão"""
+    nome = f'{tabela}_{particao.nome}'
+    _criar_carga(cursor, sql, esquema, tabela, nome)
+    padrao = sql.Identifier(esquema, f'{tabela}_{PADRAO}')
+    cursor.execute('SELECT to_regclass(%s)', (padrao.as_string(cursor),))
+    if cursor.fetchone()[0]:
+        cursor.execute(sql.SQL('''
+            WITH movidos AS (DELETE FROM {} WHERE ins_quadra >= %s AND ins_quadra < %s RETURNING *)
+            INSERT INTO {} SELECT * FROM movidos
+        ''').format(padrao, sql.Identifier(esquema, nome)), (particao.inicio, particao.fim))
+    _anexar(cursor, sql, particao, esquema, tabela, nome)
+
+
+def criar_particoes(conn, particoes, esquema=ESQUEMA_NOVAORDEM, tabela=TABELA_NOVAORDEM):
+    """
+    Cria as 'particoes' que ainda não existem (mesmo nome), movendo para elas
+    as quadras da faixa que estavam na partição padrão. Retorna as criadas.
+    """
+    sql = _psycopg2().sql
+    existentes = {particao.nome for particao in listar_particoes(conn, esquema, tabela)}
+    criadas = []
+    for particao in particoes:
+        if particao.nome in existentes:
+            continue
+        with conn:
+            with conn.cursor() as cursor:
+                _anexar_nova(cursor, sql, particao, esquema, tabela)
+        criadas.append(particao)
+    return criadas
+
+
+def remover_particao(conn, nome, esquema=ESQUEMA_NOVAORDEM, tabela=TABELA_NOVAORDEM, manter_registros=True):
+    """
+    Desanexa e exclui a partição 'nome'. Com manter_registros, as quadras
+    dela voltam para a novaordem (partição padrão) na mesma transação.
+    """
+    if nome == PADRAO:
+        raise Exception("A partição padrão não pode ser removida")
+    obter_particao(conn, nome, esquema, tabela)
+    sql = _psycopg2().sql
+    particao = sql.Identifier(esquema, f'{tabela}_{nome}')
+    with conn:
+        with conn.cursor() as cursor:
+            cursor.execute(sql.SQL('ALTER TABLE {} DETACH PARTITION {}').format(
+                sql.Identifier(esquema, tabela), particao))
+            if manter_registros:
+                cursor.execute(sql.SQL('INSERT INTO {} SELECT * FROM {}').format(
+                    sql.Identifier(esquema, tabela), particao))
+            cursor.execute(sql.SQL('DROP TABLE {}').format(particao))
+
+
+class DestinoCarga(DestinoNovaOrdem):
+    """
+    Tabela de carga de uma partição: cada quadra é só inserida (a carga começa
+    vazia e ninguém mais a vê), sem bloqueio consultivo nem DELETE.
+    """
+
+    def __init__(self, conn, esquema, carga):
+        self.conn = conn
+        self.tabela = f'{esquema}.{carga}'
+
+    def gravar(self, ins_quadra, lotes, aguardar=True, modo=MODO_SUBSTITUIR, ponto_controle=None):
+        with self.conn:
+            with self.conn.cursor() as cursor:
+                if lotes:
+                    REGISTRO.executar(cursor, 'inserir_quadra', lotes.listas(), tabela=self.tabela)
+        return {'situacao': GRAVADA, 'excluidos': 0, 'inseridos': len(lotes)}
+
+
+def recarregar_particao(conn, nome, tarefas, fonte, esquema=ESQUEMA_NOVAORDEM, tabela=TABELA_NOVAORDEM,
+                        manter_demais=True):
+    """
+    Refaz as quadras de 'tarefas' ((ins_quadra, ordem_primeira), todas na
+    faixa da partição 'nome') lendo os lotes de 'fonte' (reorganizacao.FonteLotes)
+    para uma tabela de carga e troca a partição pela carga numa transação:
+    DETACH da antiga, ATTACH da carga, DROP da antiga. Com manter_demais, as
+    quadras da partição que não estão nas tarefas são copiadas para a carga
+    (na transação da troca, com a partição bloqueada para escrita). Com o
+    histórico provisionado, a versão anterior de cada quadra refeita é
+    guardada nele na mesma transação, como numa gravação quadra a quadra.
+    Gravações quadra a quadra na partição durante a carga são perdidas na troca.
+    Retorna os resultados por quadra, como execucao_quadras.executar_quadras.
+    """
+    particao = obter_particao(conn, nome, esquema, tabela)
+    if particao.inicio is None:
+        raise Exception("A partição padrão não pode ser recarregada")
+    tarefas = list(tarefas)
+    fora = sorted({ins_quadra for ins_quadra, _ in tarefas
+                   if not particao.inicio <= ins_quadra < particao.fim})
+    if fora:
+        raise Exception(f"Quadras fora da faixa da partição {nome} "
+                        f"({particao.inicio}-{particao.fim - 1}): {', '.join(map(str, fora))}")
+    quadras = [ins_quadra for ins_quadra, _ in tarefas]
+    if len(set(quadras)) != len(quadras):
+        raise Exception(f"Quadras repetidas na recarga da partição {nome}")
+
+    sql = _psycopg2().sql
+    nome_tabela = f'{tabela}_{nome}'
+    carga = f'{nome_tabela}_carga'
+    with conn:
+        with conn.cursor() as cursor:
+            _criar_carga(cursor, sql, esquema, tabela, carga)
+
+    historico = historico_disponivel(conn, esquema, tabela, recarregar=True)
+    destino = DestinoCarga(conn, esquema, carga)
+    resultados = []
+    try:
+        for ins_quadra, ordem_primeira in tarefas:
+            resultado = reorganizar(fonte, destino, ins_quadra, ordem_primeira)
+            resultado.update(ins_quadra=ins_quadra, ordem_primeira=ordem_primeira)
+            resultados.append(resultado)
+
+        with conn:
+            with conn.cursor() as cursor:
+                atual = sql.Identifier(esquema, nome_tabela)
+                if manter_demais or historico is not None:
+                    cursor.execute(sql.SQL('LOCK TABLE {} IN EXCLUSIVE MODE').format(atual))
+                if historico is not None:
+                    # A versão que sai com a partição antiga, para desfazer_quadras
+                    for ins_quadra in quadras:
+                        REGISTRO.executar(cursor, 'copiar_quadra_historico', (ins_quadra,),
+                                          tabela=f'{esquema}.{tabela}', historico=historico)
+                if manter_demais:
+                    cursor.execute(sql.SQL('INSERT INTO {} SELECT * FROM {} WHERE ins_quadra <> ALL(%s)').format(
+                        sql.Identifier(esquema, carga), atual), (quadras,))
+                cursor.execute(sql.SQL('ALTER TABLE {} DETACH PARTITION {}').format(
+                    sql.Identifier(esquema, tabela), atual))
+                cursor.execute(sql.SQL('DROP TABLE {}').format(atual))
+                cursor.execute(sql.SQL('ALTER TABLE {} RENAME TO {}').format(
+                    sql.Identifier(esquema, carga), sql.Identifier(nome_tabela)))
+                _anexar(cursor, sql, particao, esquema, tabela, nome_tabela)
+    except Exception:
+        if not conn.closed:
+            conn.rollback()
+            with conn:
+                with conn.cursor() as cursor:
+                    cursor.execute(sql.SQL('DROP TABLE IF EXISTS {}').format(sql.Identifier(esquema, carga)))
+        raise
+    return resultados
@@ -0,0 +1,185 @@
+# -*- coding: utf-8 -*-
+"""
+OrganizadorDeLotes - modo de perfilamento
+Quando ligado, cada execução (diálogo, lote ou linha de comando) roda sob
+cProfile e tracemalloc e deixa numa pasta própria:
+
+- perfil.prof (e trabalhador-N.prof, um por thread do executor em lote),
+  para abrir com pstats/snakeviz;
+- memoria.snapshot: tracemalloc.Snapshot (tracemalloc.Snapshot.load);
+- resumo.txt: duração, pico de memória e as N funções/linhas mais caras.
+
+Liga-se pela variável de ambiente ORGANIZADOR_PERFIL=1 ou pela chave
+QSettings 'OrganizadorDeLotes/perfil'. As pastas ficam em
+<perfil do QGIS>/OrganizadorDeLotes/perfis (fora do QGIS, em
+~/.organizador_lotes/perfis, ou em ORGANIZADOR_PERFIL_DIR).
+Desligado, o custo é uma consulta à configuração por execução.
+"""
+import cProfile
+import functools
+import io
+import logging
+import os
+import pstats
+import threading
+import time
+import tracemalloc
+from contextlib import contextmanager
+from datetime import datetime
+
+LOGGER = logging.getLogger('OrganizadorDeLotes')
+
+VARIAVEL_AMBIENTE = 'ORGANIZADOR_PERFIL'
+VARIAVEL_PASTA = 'ORGANIZADOR_PERFIL_DIR'
+CHAVE_CONFIGURACAO = 'OrganizadorDeLotes/perfil'
+
+# Quantas entradas vão para o resumo.txt (ORGANIZADOR_PERFIL_TOP)
+TOP_PADRAO = 25
+# Quadros de pilha guardados por alocação no tracemalloc
+QUADROS_TRACEMALLOC = 10
+
+_VERDADEIROS = ('1', 'true', 'sim', 'yes', 'on')
+
+# Pasta da execução perfilada em andamento (uma por vez no processo)
+_atual = None
+_trava = threading.Lock()
+
+
+def perfil_ativo():
+    """Indica se o modo de perfilamento está ligado (variável de ambiente ou QSettings)"""
+    valor = os.environ.get(VARIAVEL_AMBIENTE)
+    if valor is not None:
+        return valor.strip().lower() in _VERDADEIROS
+    try:
+        from qgis.PyQt.QtCore import QSettings
+    except ImportError:
+        return False
+    return str(QSettings().value(CHAVE_CONFIGURACAO, '')).strip().lower() in _VERDADEIROS
+
+
+def pasta_perfis():
+    """Pasta onde as execuções perfiladas são gravadas"""
+    pasta = os.environ.get(VARIAVEL_PASTA)
+    if pasta:
+        return pasta
+    try:
+        from qgis.core import QgsApplication
+        return os.path.join(QgsApplication.qgisSettingsDirPath(), 'OrganizadorDeLotes', 'perfis')
+    except ImportError:
+        return os.path.join(os.path.expanduser('~'), '.organizador_lotes', 'perfis')
+
+
+def _avisar(mensagem):
+    LOGGER.info(mensagem)
+    try:
+        from qgis.core import QgsMessageLog, Qgis
+        QgsMessageLog.logMessage(mensagem, 'OrganizadorDeLotes', Qgis.Info)
+    except ImportError:
+        pass
+
+
+def _resumir(pasta, nome, duracao, pico, snapshot, top):
+    perfis = sorted(arquivo for arquivo in os.listdir(pasta) if arquivo.endswith('.prof'))
+    saida = io.StringIO()
+    saida.write(f'Execução: {nome}\nDuração: {duracao:.3f} s\n'
+                f'Pico de memória (tracemalloc): {pico / 2 ** 20:.1f} MiB\n\n')
+    if perfis:
+        estatisticas = pstats.Stats(*(os.path.join(pasta, arquivo) for arquivo in perfis), stream=saida)
+        saida.write(f'== {top} funções com maior tempo acumulado ({", ".join(perfis)}) ==\n')
+        estatisticas.sort_stats('cumulative').print_stats(top)
+    saida.write(f'== {top} linhas com mais memória alocada ao final ==\n')
+    for estatistica in snapshot.statistics('lineno')[:top]:
+        saida.write(f'{estatistica}\n')
+    with open(os.path.join(pasta, 'resumo.txt'), 'w', encoding='utf-8') as arquivo:
+        arquivo.write(saida.getvalue())
+
+
+@contextmanager
+def perfilar(nome, ativo=None):
+    """
+    Executa o bloco sob cProfile e tracemalloc se o perfilamento estiver ligado
+    (ou se ativo=True) e produz a pasta da execução; senão não faz nada.
+    Dentro de outra execução perfilada também não faz nada (não se aninham).
+    Retorna (via 'as') a pasta da execução ou None.
+    """
+    global _atual
+    if ativo is None:
+        ativo = perfil_ativo()
+    if not ativo:
+        yield None
+        return
+    with _trava:
+        if _atual is not None:
+            aninhado = True
+        else:
+            aninhado = False
+            pasta = os.path.join(pasta_perfis(), f'{datetime.now():%Y%m%d-%H%M%S}-{nome}-{os.getpid()}')
+            os.makedirs(pasta, exist_ok=True)
+            _atual = pasta
+    if aninhado:
+        yield None
+        return
+
+    top = int(os.environ.get('ORGANIZADOR_PERFIL_TOP', TOP_PADRAO))
+    ja_rastreava = tracemalloc.is_tracing()
+    if not ja_rastreava:
+        tracemalloc.start(QUADROS_TRACEMALLOC)
+    tracemalloc.reset_peak()
+    perfilador = cProfile.Profile()
+    inicio = time.perf_counter()
+    perfilador.enable()
+    try:
+        yield pasta
+    finally:
+        perfilador.disable()
+        duracao = time.perf_counter() - inicio
+        snapshot = tracemalloc.take_snapshot()
+        pico = tracemalloc.get_traced_memory()[1]
+        if not ja_rastreava:
+            tracemalloc.stop()
+        with _trava:
+            _atual = None
+        try:
+            perfilador.dump_stats(os.path.join(pasta, 'perfil.prof'))
+            snapshot.dump(os.path.join(pasta, 'memoria.snapshot'))
+            _resumir(pasta, nome, duracao, pico, snapshot, top)
+            _avisar(f"Perfil da execução '{nome}' gravado em {pasta}")
+        except Exception as e:
+            LOGGER.warning("Não foi possível gravar o perfil em %s: %s", pasta, e)
+
+
+@contextmanager
+def perfilar_trabalhador(nome):
+    """
+    cProfile da thread corrente, gravado como <nome>.prof na pasta da execução
+    perfilada em andamento (cProfile só enxerga a thread em que foi ligado).
+    Sem execução perfilada não faz nada.
+    """
+    pasta = _atual
+    if pasta is None:
+        yield
+        return
+    perfilador = cProfile.Profile()
+    try:
+        perfilador.enable()
+    except ValueError:
+        # Python 3.12+ (sys.monitoring): só um perfilador por vez, e o da
+        # execução já enxerga todas as threads
+        perfilador = None
+    try:
+        yield
+    finally:
+        if perfilador is not None:
+            perfilador.disable()
+            perfilador.dump_stats(os.path.join(pasta, f'{nome}.prof'))
+
+
+def perfilado(nome):
+    """Decorador: executa a função dentro de perfilar(nome)"""
+    def decorador(funcao):
+        @functools.wraps(funcao)
+        def envoltorio(*args, **kwargs):
+            with perfilar(nome):
+                return funcao(*args, **kwargs)
+        return envoltorio
+    return decorador
@@ -0,0 +1,124 @@
+# -*- coding: utf-8 -*-
+"""
+OrganizadorDeLotes - pré-carga da quadra sob o cursor
+A ferramenta de seleção de quadra (FerramentaQuadra) identifica a quadra em
+que o cursor parou (ESPERA_MS sem movimento) e pede a pré-carga dela; a
+TarefaPreCarga lê em segundo plano os lotes da quadra na camada (por uma
+QgsVectorLayerFeatureSource, segura fora da linha principal) e as linhas
+atuais da novaordem, para o cache_quadras.CacheQuadras. Quando o cursor vai
+para outra quadra, ou sai de todas, a pré-carga em andamento é cancelada.
+"""
+from qgis.PyQt.QtCore import QTimer
+from qgis.core import QgsTask, QgsFeatureRequest, QgsExpression, QgsVectorLayerFeatureSource, QgsMessageLog, Qgis
+from qgis.gui import QgsMapToolIdentify, QgsMapToolIdentifyFeature
+
+from .cache_quadras import QuadraPreCarregada
+from .lotes import LotesColunares
+from .novaordem import ler_novaordem_quadra
+
+# Tempo parado sobre uma quadra antes de pré-carregá-la
+ESPERA_MS = 300
+
+
+class TarefaPreCarga(QgsTask):
+    """
+    Lê os lotes da quadra ('campos' da camada) e as linhas dela na novaordem
+    ('abrir' abre a conexão de leitura) e entrega QuadraPreCarregada a
+    ao_concluir(chave, quadra), na linha principal.
+    """
+
+    def __init__(self, chave, ins_quadra, camada, campos, abrir, esquema, tabela, ao_concluir):
+        super().__init__(f'OrganizadorDeLotes: pré-carga da quadra {ins_quadra}', QgsTask.CanCancel)
+        self.chave = chave
+        self.ins_quadra = ins_quadra
+        # A fonte é criada aqui, na linha principal; a leitura, em run()
+        self.fonte = QgsVectorLayerFeatureSource(camada)
+        self.request = QgsFeatureRequest()
+        self.request.setFilterExpression(QgsExpression.createFieldEqualityExpression(campos.quadra, ins_quadra))
+        self.request.setFlags(QgsFeatureRequest.NoGeometry)
+        self.request.setSubsetOfAttributes([campos.matricula, campos.ordem], camada.fields())
+        self.campos = campos
+        self.abrir = abrir
+        self.esquema = esquema
+        self.tabela = tabela
+        self.ao_concluir = ao_concluir
+        self.quadra = None
+        self.erro = None
+
+    def run(self):
+        try:
+            ids, pares = [], []
+            for feicao in self.fonte.getFeatures(self.request):
+                if self.isCanceled():
+                    return False
+                ids.append(feicao.id())
+                pares.append((feicao[self.campos.matricula], feicao[self.campos.ordem]))
+            if self.isCanceled():
+                return False
+            conn = self.abrir()
+            try:
+                novaordem = ler_novaordem_quadra(conn, self.ins_quadra, self.esquema, self.tabela)
+            finally:
+                conn.close()
+            self.quadra = QuadraPreCarregada(LotesColunares.de_quadra(self.ins_quadra, pares), ids, novaordem)
+        except Exception as e:
+            self.erro = e
+            return False
+        return not self.isCanceled()
+
+    def finished(self, resultado):
+        if resultado:
+            self.ao_concluir(self.chave, self.quadra)
+        elif self.erro is not None:
+            QgsMessageLog.logMessage(f"Pré-carga da quadra {self.ins_quadra} falhou: {str(self.erro)}",
+                                     'OrganizadorDeLotes', Qgis.Warning)
+
+
+class FerramentaQuadra(QgsMapToolIdentifyFeature):
+    """
+    Identifica a quadra clicada (featureIdentified) e, com o cursor parado
+    sobre uma quadra, chama pre_carregar(ins_quadra); ao sair dela (ou ao
+    trocar de ferramenta sem clicar), cancelar().
+    """
+
+    def __init__(self, canvas, camada, campo_quadra, pre_carregar, cancelar):
+        super().__init__(canvas)
+        self.setLayer(camada)
+        self.camada = camada
+        self.campo_quadra = campo_quadra
+        self.pre_carregar = pre_carregar
+        self.cancelar = cancelar
+        self.quadra = None
+        self.posicao = None
+        self.clicada = False
+        self.espera = QTimer()
+        self.espera.setSingleShot(True)
+        self.espera.timeout.connect(self._parado)
+
+    def canvasMoveEvent(self, evento):
+        self.posicao = evento.pos()
+        self.espera.start(ESPERA_MS)
+
+    def canvasReleaseEvent(self, evento):
+        self.clicada = True
+        super().canvasReleaseEvent(evento)
+
+    def deactivate(self):
+        self.espera.stop()
+        if not self.clicada and self.quadra is not None:
+            self.cancelar()
+        super().deactivate()
+
+    def _parado(self):
+        if self.posicao is None:
+            return
+        resultados = self.identify(self.posicao.x(), self.posicao.y(), [self.camada],
+                                   QgsMapToolIdentify.TopDownStopAtFirst)
+        quadra = resultados[0].mFeature[self.campo_quadra] if resultados else None
+        if quadra == self.quadra:
+            return
+        if self.quadra is not None:
+            self.cancelar()
+        self.quadra = quadra
+        if quadra is not None:
+            self.pre_carregar(quadra)
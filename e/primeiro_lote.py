@@ -0,0 +1,70 @@
+# -*- coding: utf-8 -*-
+"""
+OrganizadorDeLotes - clique no lote que passa a ser o primeiro
+Com a quadra capturada, o operador clica no lote que deve ser o número 1 e
+o diálogo recebe a ordem dele em spinOrdemPrimeira. O clique é resolvido num
+índice espacial só dos lotes da quadra (IndiceLotesQuadra, lido uma vez e
+guardado pelo plugin), sem identificar na camada de lotes inteira.
+"""
+from qgis.core import QgsFeatureRequest, QgsExpression, QgsSpatialIndex, QgsGeometry, QgsRectangle
+from qgis.gui import QgsMapTool
+
+
+class IndiceLotesQuadra:
+    """QgsSpatialIndex dos lotes de uma quadra da camada, com a geometria e a ordem de cada um"""
+
+    def __init__(self, camada, ins_quadra, campos):
+        self.camada = camada
+        self.ins_quadra = ins_quadra
+        self.indice = QgsSpatialIndex(QgsSpatialIndex.FlagStoreFeatureGeometries)
+        self.geometrias = {}
+        self.ordens = {}
+        request = QgsFeatureRequest()
+        request.setFilterExpression(QgsExpression.createFieldEqualityExpression(campos.quadra, ins_quadra))
+        request.setSubsetOfAttributes([campos.ordem], camada.fields())
+        for feicao in camada.getFeatures(request):
+            if not feicao.hasGeometry():
+                continue
+            self.indice.addFeature(feicao)
+            self.geometrias[feicao.id()] = feicao.geometry()
+            self.ordens[feicao.id()] = feicao[campos.ordem]
+
+    def __len__(self):
+        return len(self.geometrias)
+
+    def lote_em(self, ponto, tolerancia=0.0):
+        """
+        Id do lote que contém 'ponto' (nas coordenadas da camada) ou, se
+        nenhum contiver, do mais próximo a até 'tolerancia'; None se não houver.
+        """
+        retangulo = QgsRectangle(ponto.x() - tolerancia, ponto.y() - tolerancia,
+                                 ponto.x() + tolerancia, ponto.y() + tolerancia)
+        geometria = QgsGeometry.fromPointXY(ponto)
+        for ident in self.indice.intersects(retangulo):
+            if self.geometrias[ident].contains(geometria):
+                return ident
+        if tolerancia > 0:
+            proximos = self.indice.nearestNeighbor(ponto, 1, tolerancia)
+            if proximos:
+                return proximos[0]
+        return None
+
+
+class FerramentaPrimeiroLote(QgsMapTool):
+    """Cada clique chama ao_escolher(id do lote ou None) pelo IndiceLotesQuadra 'indice'"""
+
+    def __init__(self, canvas, indice, ao_escolher):
+        super().__init__(canvas)
+        self.indice = indice
+        self.ao_escolher = ao_escolher
+
+    def canvasReleaseEvent(self, evento):
+        camada = self.indice.camada
+        ponto_mapa = evento.mapPoint()
+        # O raio de busca do QGIS, para cliques na divisa ou um pouco fora do lote. Ele
+        # vem em unidades do mapa: o retângulo dele vai para o SRC da camada com o ponto
+        raio = QgsMapTool.searchRadiusMU(self.canvas())
+        busca = self.toLayerCoordinates(camada, QgsRectangle(ponto_mapa.x() - raio, ponto_mapa.y() - raio,
+                                                             ponto_mapa.x() + raio, ponto_mapa.y() + raio))
+        tolerancia = max(busca.width(), busca.height()) / 2
+        self.ao_escolher(self.indice.lote_em(self.toLayerCoordinates(camada, ponto_mapa), tolerancia))
@@ -0,0 +1,228 @@
+# -*- coding: utf-8 -*-
+"""
+OrganizadorDeLotes - provisionamento do esquema
+Cria a tabela novaordem (se ainda não existir; opcionalmente particionada
+por faixas de ins_quadra, ver particoes) e o índice único
+(ins_quadra, matricula) exigido pelo modo de gravação upsert, o livro de
+execuções novaordem_runs, os pontos de controle novaordem_checkpoints e o
+histórico das quadras gravadas ({tabela}_historico, ver novaordem.desfazer_quadras).
+Instala (opcionalmente) o gatilho que notifica as quadras alteradas na
+tabela de lotes para a escuta (ver escuta).
+"""
+from .conexao_pg import _psycopg2
+from .instrucoes import identificador
+from .novaordem import (ESQUEMA_NOVAORDEM, TABELA_NOVAORDEM, TABELA_CHECKPOINTS, tabela_historico,
+                        historico_disponivel)
+from .particoes import tipo_tabela, criar_particionada, converter_particionada
+from .execucoes import TABELA_EXECUCOES
+from .reorganizacao import CAMPOS_LOTES
+
+
+def provisionar_novaordem(conn, esquema=ESQUEMA_NOVAORDEM, tabela=TABELA_NOVAORDEM, particionada=False):
+    """
+    Garante a tabela e o índice único da novaordem. Falha se a tabela já tiver
+    matrículas duplicadas numa mesma quadra (elas precisam ser removidas antes).
+    Com particionada=True a tabela é criada particionada, ou convertida se já
+    existir sem partições (ver particoes.converter_particionada); as faixas
+    vêm depois, com particoes.criar_particoes.
+    """
+    sql = _psycopg2().sql
+    identificador = sql.Identifier(esquema, tabela)
+    indice = sql.Identifier(f'{tabela}_ins_quadra_matricula_key')
+    tipo = tipo_tabela(conn, esquema, tabela) if particionada else None
+
+    with conn:
+        with conn.cursor() as cursor:
+            cursor.execute(sql.SQL('CREATE SCHEMA IF NOT EXISTS {}').format(sql.Identifier(esquema)))
+            if particionada and tipo is None:
+                criar_particionada(cursor, esquema, tabela)
+            elif particionada and tipo != 'p':
+                converter_particionada(cursor, esquema, tabela)
+            cursor.execute(sql.SQL('''
+                CREATE TABLE IF NOT EXISTS {} (
+                    id serial PRIMARY KEY,
+                    matricula integer,
+                    ins_quadra integer,
+                    n_ordem bigint
+                )
+            ''').format(identificador))
+            cursor.execute(sql.SQL('CREATE UNIQUE INDEX IF NOT EXISTS {} ON {} (ins_quadra, matricula)')
+                           .format(indice, identificador))
+
+
+def provisionar_historico(conn, esquema=ESQUEMA_NOVAORDEM, tabela=TABELA_NOVAORDEM):
+    """
+    Garante a tabela de histórico da novaordem: uma linha por versão de
+    quadra, com matrículas e n_ordem em arrays. A partir daí cada gravação
+    guarda a versão anterior da quadra (ver novaordem.gravar_quadra).
+    """
+    sql = _psycopg2().sql
+    historico = tabela_historico(tabela)
+
+    with conn:
+        with conn.cursor() as cursor:
+            cursor.execute(sql.SQL('CREATE SCHEMA IF NOT EXISTS {}').format(sql.Identifier(esquema)))
+            cursor.execute(sql.SQL('''
+                CREATE TABLE IF NOT EXISTS {} (
+                    id bigserial PRIMARY KEY,
+                    ins_quadra integer NOT NULL,
+                    gravada_em timestamptz NOT NULL DEFAULT now(),
+                    matriculas integer[] NOT NULL,
+                    n_ordens bigint[] NOT NULL
+                )
+            ''').format(sql.Identifier(esquema, historico)))
+            cursor.execute(sql.SQL('CREATE INDEX IF NOT EXISTS {} ON {} (ins_quadra, id)')
+                           .format(sql.Identifier(f'{historico}_ins_quadra_id_idx'),
+                                   sql.Identifier(esquema, historico)))
+    # A conexão pode ter guardado que o histórico não existia
+    historico_disponivel(conn, esquema, tabela, recarregar=True)
+
+
+def provisionar_execucoes(conn, esquema=ESQUEMA_NOVAORDEM, tabela=TABELA_EXECUCOES):
+    """Garante a tabela do livro de execuções (ver execucoes.Execucao)"""
+    sql = _psycopg2().sql
+    identificador = sql.Identifier(esquema, tabela)
+
+    with conn:
+        with conn.cursor() as cursor:
+            cursor.execute(sql.SQL('CREATE SCHEMA IF NOT EXISTS {}').format(sql.Identifier(esquema)))
+            cursor.execute(sql.SQL('''
+                CREATE TABLE IF NOT EXISTS {} (
+                    id bigserial PRIMARY KEY,
+                    execucao uuid NOT NULL,
+                    inicio timestamptz NOT NULL,
+                    fim timestamptz NOT NULL,
+                    operador text,
+                    conexao text,
+                    motor text,
+                    modo text,
+                    ins_quadra integer,
+                    ordem_primeira integer,
+                    situacao text,
+                    excluidos integer,
+                    inseridos integer,
+                    atualizados integer,
+                    leitura_ms double precision,
+                    calculo_ms double precision,
+                    gravacao_ms double precision,
+                    mensagem text,
+                    retentativas integer,
+                    espera_retentativas_ms double precision
+                )
+            ''').format(identificador))
+            # Livros criados antes das colunas de retentativas
+            cursor.execute(sql.SQL('''
+                ALTER TABLE {}
+                    ADD COLUMN IF NOT EXISTS retentativas integer,
+                    ADD COLUMN IF NOT EXISTS espera_retentativas_ms double precision
+            ''').format(identificador))
+            cursor.execute(sql.SQL('CREATE INDEX IF NOT EXISTS {} ON {} (execucao)')
+                           .format(sql.Identifier(f'{tabela}_execucao_idx'), identificador))
+            cursor.execute(sql.SQL('CREATE INDEX IF NOT EXISTS {} ON {} (ins_quadra, inicio)')
+                           .format(sql.Identifier(f'{tabela}_ins_quadra_inicio_idx'), identificador))
+
+
+def provisionar_checkpoints(conn, esquema=ESQUEMA_NOVAORDEM, tabela=TABELA_CHECKPOINTS):
+    """Garante a tabela de pontos de controle dos lotes retomáveis (ver retomada)"""
+    sql = _psycopg2().sql
+
+    with conn:
+        with conn.cursor() as cursor:
+            cursor.execute(sql.SQL('CREATE SCHEMA IF NOT EXISTS {}').format(sql.Identifier(esquema)))
+            cursor.execute(sql.SQL('''
+                CREATE TABLE IF NOT EXISTS {} (
+                    lote text NOT NULL,
+                    ins_quadra integer NOT NULL,
+                    ordem_primeira integer,
+                    concluida_em timestamptz NOT NULL DEFAULT now(),
+                    PRIMARY KEY (lote, ins_quadra)
+                )
+            ''').format(sql.Identifier(esquema, tabela)))
+
+
+# Quadras por notificação (o payload do NOTIFY é limitado a 8000 bytes)
+QUADRAS_POR_NOTIFICACAO = 500
+
+# Só as quadras em que (quadra, matrícula, ordem) mudou: um UPDATE que só
+# mexe na geometria ou em outras colunas não notifica. O canal é o argumento
+# do gatilho; a notificação só é entregue quando a transação é confirmada.
+SQL_FUNCAO_GATILHO = '''
+CREATE OR REPLACE FUNCTION {funcao}() RETURNS trigger LANGUAGE plpgsql AS $$
+DECLARE
+    quadras integer[];
+    i integer;
+BEGIN
+    IF TG_OP = 'INSERT' THEN
+        SELECT array_agg(DISTINCT {quadra}) INTO quadras FROM novos WHERE {quadra} IS NOT NULL;
+    ELSIF TG_OP = 'DELETE' THEN
+        SELECT array_agg(DISTINCT {quadra}) INTO quadras FROM velhos WHERE {quadra} IS NOT NULL;
+    ELSE
+        SELECT array_agg(DISTINCT {quadra}) INTO quadras FROM (
+            (SELECT {quadra}, {matricula}, {ordem} FROM novos
+             EXCEPT ALL SELECT {quadra}, {matricula}, {ordem} FROM velhos)
+            UNION ALL
+            (SELECT {quadra}, {matricula}, {ordem} FROM velhos
+             EXCEPT ALL SELECT {quadra}, {matricula}, {ordem} FROM novos)
+        ) alteradas WHERE {quadra} IS NOT NULL;
+    END IF;
+    IF quadras IS NOT NULL THEN
+        FOR i IN 1 .. array_length(quadras, 1) BY {por_notificacao} LOOP
+            PERFORM pg_notify(TG_ARGV[0], json_build_object(
+                'quadras', quadras[i:i + {por_notificacao} - 1],
+                'em', extract(epoch FROM clock_timestamp()))::text);
+        END LOOP;
+    END IF;
+    RETURN NULL;
+END
+$$
+'''
+
+# nome do gatilho: (evento, tabelas de transição)
+GATILHOS = {
+    'organizador_notificar_insercao': ('INSERT', 'NEW TABLE AS novos'),
+    'organizador_notificar_atualizacao': ('UPDATE', 'OLD TABLE AS velhos NEW TABLE AS novos'),
+    'organizador_notificar_exclusao': ('DELETE', 'OLD TABLE AS velhos'),
+}
+
+
+def _funcao_gatilho(tabela_lotes):
+    # Uma função por tabela: o corpo dela traz os nomes das colunas ('campos') da tabela
+    esquema, _, tabela = tabela_lotes.rpartition('.')
+    funcao = f'organizador_notificar_{tabela}'
+    return f'{esquema}.{funcao}' if esquema else funcao
+
+
+def provisionar_gatilho(conn, tabela_lotes, canal, campos=CAMPOS_LOTES):
+    """
+    Instala em 'tabela_lotes' os gatilhos por instrução (um por evento, com
+    tabelas de transição) que fazem NOTIFY 'canal' com as quadras alteradas:
+    {"quadras": [ins_quadra, ...], "em": epoch do servidor}. 'campos' são as
+    colunas de matrícula, quadra e ordem da tabela. Requer PostgreSQL 10+.
+    """
+    sql = _psycopg2().sql
+    funcao = identificador(_funcao_gatilho(tabela_lotes))
+    with conn:
+        with conn.cursor() as cursor:
+            cursor.execute(sql.SQL(SQL_FUNCAO_GATILHO).format(
+                funcao=funcao, por_notificacao=sql.Literal(QUADRAS_POR_NOTIFICACAO),
+                **{chave: sql.Identifier(coluna) for chave, coluna in campos._asdict().items()}))
+            for nome, (evento, transicao) in GATILHOS.items():
+                cursor.execute(sql.SQL('DROP TRIGGER IF EXISTS {} ON {}').format(
+                    sql.Identifier(nome), identificador(tabela_lotes)))
+                cursor.execute(sql.SQL(
+                    'CREATE TRIGGER {} AFTER {} ON {} REFERENCING {} '
+                    'FOR EACH STATEMENT EXECUTE PROCEDURE {}({})').format(
+                    sql.Identifier(nome), sql.SQL(evento), identificador(tabela_lotes), sql.SQL(transicao),
+                    funcao, sql.Literal(canal)))
+
+
+def remover_gatilho(conn, tabela_lotes):
+    """Remove os gatilhos e a função instalados por provisionar_gatilho"""
+    sql = _psycopg2().sql
+    with conn:
+        with conn.cursor() as cursor:
+            for nome in GATILHOS:
+                cursor.execute(sql.SQL('DROP TRIGGER IF EXISTS {} ON {}').format(
+                    sql.Identifier(nome), identificador(tabela_lotes)))
+            cursor.execute(sql.SQL('DROP FUNCTION IF EXISTS {}()').format(
+                identificador(_funcao_gatilho(tabela_lotes))))
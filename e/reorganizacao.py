@@ -0,0 +1,243 @@
+# -*- coding: utf-8 -*-
+"""
+OrganizadorDeLotes - fluxo de reorganização de uma quadra
+Leitura -> cálculo da nova ordem -> gravação, com os dois extremos atrás de
+interfaces, para que o mesmo fluxo rode no QGIS, em lote e nos testes:
+
+- FonteLotes: de onde vêm os lotes da quadra (FonteLotesBanco, a camada do
+  projeto no plugin, FonteLotesMemoria);
+- DestinoNovaOrdem: onde a nova ordem é gravada (DestinoBanco, DestinoMemoria).
+
+As implementações em memória seguem a mesma semântica de
+novaordem.gravar_quadra (modos, contagens, quadra ocupada, ponto de
+controle) e permitem testar e medir o fluxo inteiro sem QGIS nem banco.
+
+reorganizar repete a quadra inteira (leitura, cálculo e gravação) após um
+erro transitório, segundo a conexao_pg.PoliticaRetentativa; como a gravação
+é uma única transação, nenhuma tentativa deixa a quadra pela metade.
+"""
+import abc
+import threading
+from collections import defaultdict, namedtuple
+from contextlib import contextmanager, nullcontext
+from functools import partial
+
+from .conexao_pg import abrir_conexao, abrir_conexao_leitura, ATRASO_MAXIMO_REPLICA, PoliticaRetentativa, Sessao
+from .instrucoes import REGISTRO
+from .lotes import LotesColunares
+from .novaordem import (gravar_quadra, GRAVADA, OCUPADA, MODO_SUBSTITUIR, MODO_UPSERT, MODOS_GRAVACAO,
+                        ESQUEMA_NOVAORDEM, TABELA_NOVAORDEM)
+from .execucoes import LEITURA, CALCULO, GRAVACAO, cronometrar
+
+TABELA_LOTES = 'comercial_umc.gis_boletim_lote'
+
+# Nomes das colunas (ou campos da camada) de matrícula, quadra e ordem na origem
+CamposLotes = namedtuple('CamposLotes', 'matricula quadra ordem')
+CAMPOS_LOTES = CamposLotes('matricula', 'ins_quadra', 'ordem')
+
+
+class FonteLotes(abc.ABC):
+    """Interface: lotes (matricula, ordem) de uma quadra"""
+
+    @abc.abstractmethod
+    def ler_quadra(self, ins_quadra):
+        """Retorna os lotes da quadra como LotesColunares"""
+
+    def reconectar(self):
+        """Reabre a conexão perdida, se houver uma"""
+
+
+class DestinoNovaOrdem(abc.ABC):
+    """Interface: gravação do conteúdo completo de uma quadra na novaordem"""
+
+    @abc.abstractmethod
+    def gravar(self, ins_quadra, lotes, aguardar=True, modo=MODO_SUBSTITUIR, ponto_controle=None):
+        """Mesmo contrato e resultado de novaordem.gravar_quadra"""
+
+    def reconectar(self):
+        """Reabre a conexão perdida, se houver uma"""
+
+
+class FonteLotesBanco(FonteLotes):
+    """Lotes lidos da tabela de origem no PostgreSQL ('sessao' permite reconectar)"""
+
+    def __init__(self, conn, tabela_lotes=TABELA_LOTES, sessao=None, campos=CAMPOS_LOTES):
+        self.conn = conn
+        self.tabela_lotes = tabela_lotes
+        self.sessao = sessao
+        self.campos = campos
+
+    def reconectar(self):
+        if self.sessao is not None:
+            self.conn = self.sessao.reabrir(self.conn)
+
+    def ler_quadra(self, ins_quadra):
+        try:
+            with self.conn.cursor() as cursor:
+                REGISTRO.executar(cursor, 'ler_lotes_quadra', (ins_quadra,), lotes=self.tabela_lotes,
+                                  **self.campos._asdict())
+                return LotesColunares.de_quadra(ins_quadra, cursor)
+        except Exception:
+            # Uma falha na leitura deixaria a transação abortada para as próximas quadras
+            if not self.conn.closed:
+                self.conn.rollback()
+            raise
+
+
+class DestinoBanco(DestinoNovaOrdem):
+    """novaordem no PostgreSQL (novaordem.gravar_quadra; 'sessao' permite reconectar)"""
+
+    def __init__(self, conn, esquema=ESQUEMA_NOVAORDEM, tabela=TABELA_NOVAORDEM, sessao=None):
+        self.conn = conn
+        self.esquema = esquema
+        self.tabela = tabela
+        self.sessao = sessao
+
+    def reconectar(self):
+        if self.sessao is not None:
+            self.conn = self.sessao.reabrir(self.conn)
+
+    def gravar(self, ins_quadra, lotes, aguardar=True, modo=MODO_SUBSTITUIR, ponto_controle=None):
+        return gravar_quadra(self.conn, ins_quadra, lotes, aguardar=aguardar, modo=modo,
+                             esquema=self.esquema, tabela=self.tabela, ponto_controle=ponto_controle)
+
+
+def _abrir_leitura(conexao, conexao_leitura, atraso_maximo):
+    conn = abrir_conexao_leitura(conexao, conexao_leitura, atraso_maximo)
+    # Sem transação aberta entre as quadras, para não segurar a reprodução na réplica
+    conn.autocommit = True
+    return conn
+
+
+@contextmanager
+def backend_banco(conexao, tabela_lotes=TABELA_LOTES, conexao_leitura=None, atraso_maximo=ATRASO_MAXIMO_REPLICA,
+                  esquema=ESQUEMA_NOVAORDEM, tabela=TABELA_NOVAORDEM, campos=CAMPOS_LOTES):
+    """
+    Abre uma conexão e fornece (FonteLotesBanco, DestinoBanco) sobre ela. Com
+    'conexao_leitura', os lotes são lidos por uma segunda conexão, na réplica
+    (ou no primário, se ela estiver atrasada; ver conexao_pg.abrir_conexao_leitura).
+    Se a conexão cair, fonte e destino a reabrem pela mesma Sessao.
+    """
+    sessao = Sessao(partial(abrir_conexao, conexao))
+    leitura = None
+    try:
+        if conexao_leitura:
+            leitura = Sessao(partial(_abrir_leitura, conexao, conexao_leitura, atraso_maximo))
+        fonte_sessao = leitura or sessao
+        yield (FonteLotesBanco(fonte_sessao.conn, tabela_lotes, fonte_sessao, campos),
+               DestinoBanco(sessao.conn, esquema, tabela, sessao))
+    finally:
+        if leitura is not None:
+            leitura.close()
+        sessao.close()
+
+
+class FonteLotesMemoria(FonteLotes):
+    """Lotes em memória: {ins_quadra: [(matricula, ordem), ...]}"""
+
+    def __init__(self, quadras):
+        self.quadras = quadras
+        self.leituras = 0
+
+    def ler_quadra(self, ins_quadra):
+        self.leituras += 1
+        return LotesColunares.de_quadra(ins_quadra, self.quadras.get(ins_quadra, ()))
+
+
+class DestinoMemoria(DestinoNovaOrdem):
+    """
+    novaordem em memória: {ins_quadra: {matricula: n_ordem}}. Um threading.Lock
+    por quadra faz o papel do bloqueio consultivo; checkpoints guarda os
+    pontos de controle {(lote, ins_quadra): ordem_primeira}.
+    """
+
+    def __init__(self):
+        self.quadras = {}
+        self.checkpoints = {}
+        self._travas = defaultdict(threading.Lock)
+        self._trava = threading.Lock()
+
+    def gravar(self, ins_quadra, lotes, aguardar=True, modo=MODO_SUBSTITUIR, ponto_controle=None):
+        if modo not in MODOS_GRAVACAO:
+            raise Exception(f"Modo de gravação desconhecido: {modo}")
+        if not isinstance(lotes, LotesColunares):
+            lotes = LotesColunares.de_tuplas(lotes)
+        resultado = {'situacao': OCUPADA, 'excluidos': 0, 'inseridos': 0}
+        if modo == MODO_UPSERT:
+            resultado.update(atualizados=0, inalterados=0)
+
+        with self._trava:
+            trava = self._travas[ins_quadra]
+        if not trava.acquire(blocking=aguardar):
+            return resultado
+        try:
+            atuais = self.quadras.get(ins_quadra, {})
+            novos = {matricula: n_ordem for matricula, _, n_ordem in lotes.tuplas()}
+            if modo == MODO_UPSERT:
+                resultado['excluidos'] = sum(1 for matricula in atuais if matricula not in novos)
+                for matricula, n_ordem in novos.items():
+                    if matricula not in atuais:
+                        resultado['inseridos'] += 1
+                    elif atuais[matricula] != n_ordem:
+                        resultado['atualizados'] += 1
+                    else:
+                        resultado['inalterados'] += 1
+            else:
+                resultado['excluidos'] = len(atuais)
+                resultado['inseridos'] = len(lotes)
+            self.quadras[ins_quadra] = novos
+            if ponto_controle is not None:
+                lote, ordem_primeira = ponto_controle
+                self.checkpoints[(lote, ins_quadra)] = ordem_primeira
+        finally:
+            trava.release()
+
+        resultado['situacao'] = GRAVADA
+        return resultado
+
+
+def backend_memoria(fonte, destino):
+    """Fábrica de backend para execucao_quadras.executar_quadras sobre uma fonte e um destino compartilhados"""
+    return partial(nullcontext, (fonte, destino))
+
+
+def reorganizar_lotes(destino, ins_quadra, lotes, ordem_primeira, aguardar=True, modo=MODO_SUBSTITUIR,
+                      ponto_controle=None, duracoes=None):
+    """
+    Calcula a nova ordem de 'lotes' (já lidos) e grava a quadra em 'destino'.
+    O resultado do destino ganha 'duracoes' (segundos por etapa).
+    """
+    duracoes = {} if duracoes is None else duracoes
+    with cronometrar(duracoes, CALCULO):
+        reordenados = lotes.reordenados(ordem_primeira)
+    with cronometrar(duracoes, GRAVACAO):
+        resultado = destino.gravar(ins_quadra, reordenados, aguardar=aguardar, modo=modo,
+                                   ponto_controle=ponto_controle)
+    resultado['duracoes'] = duracoes
+    return resultado
+
+
+def reorganizar(fonte, destino, ins_quadra, ordem_primeira, aguardar=True, modo=MODO_SUBSTITUIR,
+                ponto_controle=None, politica=None):
+    """
+    Lê os lotes da quadra em 'fonte', calcula a nova ordem e grava em 'destino',
+    repetindo tudo após erros transitórios ('politica', padrão
+    PoliticaRetentativa()). O resultado ganha 'retentativas' e
+    'espera_retentativas' (segundos).
+    """
+    politica = PoliticaRetentativa() if politica is None else politica
+    duracoes = {}
+
+    def tentativa():
+        with cronometrar(duracoes, LEITURA):
+            lotes = fonte.ler_quadra(ins_quadra)
+        return reorganizar_lotes(destino, ins_quadra, lotes, ordem_primeira, aguardar, modo,
+                                 ponto_controle, duracoes)
+
+    def reconectar():
+        fonte.reconectar()
+        destino.reconectar()
+
+    resultado, retentativas, espera = politica.executar(tentativa, reconectar)
+    resultado.update(retentativas=retentativas, espera_retentativas=espera)
+    return resultado
@@ -0,0 +1,122 @@
+# -*- coding: utf-8 -*-
+"""
+OrganizadorDeLotes - resumo das quadras
+Cache, em memória, do resumo de todas as quadras: quantidade de lotes,
+ordem mínima/máxima, se a novaordem já tem registros da quadra e quando ela
+foi reorganizada pela última vez (segundo o livro de execuções). É carregado
+com uma única consulta agregada quando o diálogo abre e atualizado localmente,
+sem ir ao banco, depois de cada reorganização; assim o diálogo limita e valida
+spinOrdemPrimeira assim que a quadra é escolhida.
+"""
+import time
+from datetime import datetime, timezone
+
+from .conexao_pg import _psycopg2
+from .instrucoes import identificador
+from .ordem import NULO
+from .novaordem import ESQUEMA_NOVAORDEM, TABELA_NOVAORDEM, GRAVADA
+from .execucoes import TABELA_EXECUCOES
+from .reorganizacao import CAMPOS_LOTES
+
+# Depois desse tempo (segundos) o resumo é recarregado ao abrir o diálogo,
+# para refletir o que outros operadores gravaram
+VALIDADE_RESUMO = 600
+
+SQL_RESUMO = '''
+    SELECT l.ins_quadra, l.lotes, l.ordem_minima, l.ordem_maxima,
+           EXISTS (SELECT 1 FROM {novaordem} n WHERE n.ins_quadra = l.ins_quadra),
+           {ultima}
+    FROM (SELECT {quadra} AS ins_quadra, count(*) AS lotes, min({ordem}) AS ordem_minima,
+                 max({ordem}) AS ordem_maxima
+          FROM {lotes} WHERE {quadra} IS NOT NULL GROUP BY 1) l
+'''
+
+SQL_ULTIMA = '''(SELECT max(e.fim) FROM {execucoes} e
+                 WHERE e.ins_quadra = l.ins_quadra AND e.situacao = {gravada})'''
+
+
+class ResumoQuadra:
+    """Resumo de uma quadra (ordem_minima/ordem_maxima são None se todas as ordens forem nulas)"""
+    __slots__ = ('lotes', 'ordem_minima', 'ordem_maxima', 'reorganizada', 'ultima_reorganizacao')
+
+    def __init__(self, lotes, ordem_minima, ordem_maxima, reorganizada=False, ultima_reorganizacao=None):
+        self.lotes = lotes
+        self.ordem_minima = ordem_minima
+        self.ordem_maxima = ordem_maxima
+        self.reorganizada = reorganizada
+        self.ultima_reorganizacao = ultima_reorganizacao
+
+    def __repr__(self):
+        return (f'ResumoQuadra(lotes={self.lotes}, ordem_minima={self.ordem_minima}, '
+                f'ordem_maxima={self.ordem_maxima}, reorganizada={self.reorganizada}, '
+                f'ultima_reorganizacao={self.ultima_reorganizacao})')
+
+
+class CacheResumoQuadras:
+    """Resumo de todas as quadras, por ins_quadra"""
+
+    def __init__(self):
+        self._resumos = {}
+        self.conexao = None
+        self.carregado_em = None
+
+    def __len__(self):
+        return len(self._resumos)
+
+    def __contains__(self, ins_quadra):
+        return ins_quadra in self._resumos
+
+    def get(self, ins_quadra):
+        return self._resumos.get(ins_quadra)
+
+    def vencido(self, conexao):
+        """Indica se o cache precisa ser (re)carregado para a conexão"""
+        return (self.carregado_em is None or conexao != self.conexao
+                or time.monotonic() - self.carregado_em > VALIDADE_RESUMO)
+
+    def carregar(self, conn, tabela_lotes, conexao=None, esquema=ESQUEMA_NOVAORDEM,
+                 tabela_novaordem=TABELA_NOVAORDEM, tabela_execucoes=TABELA_EXECUCOES, campos=CAMPOS_LOTES):
+        """Substitui o cache pelo resumo de todas as quadras, lido em uma consulta"""
+        sql = _psycopg2().sql
+        with conn:
+            with conn.cursor() as cursor:
+                execucoes = f'{esquema}.{tabela_execucoes}'
+                cursor.execute('SELECT to_regclass(%s) IS NOT NULL', (execucoes,))
+                if cursor.fetchone()[0]:
+                    ultima = sql.SQL(SQL_ULTIMA).format(execucoes=identificador(execucoes),
+                                                        gravada=sql.Literal(GRAVADA))
+                else:
+                    ultima = sql.SQL('NULL::timestamptz')
+                cursor.execute(sql.SQL(SQL_RESUMO).format(
+                    lotes=identificador(tabela_lotes),
+                    quadra=sql.Identifier(campos.quadra), ordem=sql.Identifier(campos.ordem),
+                    novaordem=identificador(f'{esquema}.{tabela_novaordem}'),
+                    ultima=ultima))
+                self._resumos = {ins_quadra: ResumoQuadra(*valores) for ins_quadra, *valores in cursor}
+        self.conexao = conexao
+        self.carregado_em = time.monotonic()
+        return len(self._resumos)
+
+    def registrar_reorganizacao(self, ins_quadra, lotes, quando=None):
+        """
+        Atualiza o resumo da quadra depois de reorganizá-la, a partir dos lotes
+        lidos (LotesColunares com a ordem original), sem consultar o banco.
+        """
+        ordens = [ordem for ordem in lotes.ordens if ordem != NULO]
+        self._resumos[ins_quadra] = ResumoQuadra(
+            len(lotes), min(ordens) if ordens else None, max(ordens) if ordens else None,
+            True, quando or datetime.now(timezone.utc))
+
+    def validar_ordem_primeira(self, ins_quadra, ordem_primeira):
+        """Mensagem de erro se ordem_primeira não couber na quadra, ou None"""
+        resumo = self._resumos.get(ins_quadra)
+        if resumo is None:
+            if self.carregado_em is None:
+                return None
+            return f"A quadra {ins_quadra} não tem lotes na tabela de origem!"
+        if resumo.ordem_maxima is None:
+            return f"Os lotes da quadra {ins_quadra} não têm ordem preenchida!"
+        if not resumo.ordem_minima <= ordem_primeira <= resumo.ordem_maxima:
+            return (f"A ordem da primeira deve estar entre {resumo.ordem_minima} e "
+                    f"{resumo.ordem_maxima} (a quadra {ins_quadra} tem {resumo.lotes} lotes)!")
+        return None
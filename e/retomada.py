@@ -0,0 +1,67 @@
+# -*- coding: utf-8 -*-
+"""
+OrganizadorDeLotes - lotes retomáveis
+Um lote (conjunto de tarefas (ins_quadra, ordem_primeira) de uma execução em
+lote) registra cada quadra concluída na tabela novaordem_checkpoints, na
+mesma transação em que a quadra é gravada (novaordem.gravar_quadra com
+ponto_controle). Se a execução cair no meio, a retomada pula exatamente as
+quadras já confirmadas: nenhuma quadra fica gravada sem o ponto de controle,
+nem marcada sem ter sido gravada.
+
+O identificador do lote, se não for informado, é derivado das próprias
+tarefas, da tabela de origem e do modo; repetir o mesmo comando com
+--retomar continua de onde parou.
+"""
+import hashlib
+
+from .instrucoes import REGISTRO
+from .novaordem import ESQUEMA_NOVAORDEM, TABELA_CHECKPOINTS
+
+
+def identificar_lote(tarefas, tabela_lotes, modo):
+    """Identificador estável do lote para as mesmas tarefas, tabela de origem e modo"""
+    resumo = hashlib.sha1(f'{tabela_lotes}|{modo}'.encode('utf-8'))
+    for ins_quadra, ordem_primeira in sorted(tarefas):
+        resumo.update(f'|{ins_quadra}:{ordem_primeira}'.encode('utf-8'))
+    return resumo.hexdigest()[:16]
+
+
+def _tabela(esquema, tabela):
+    return f'{esquema}.{tabela}'
+
+
+def checkpoints_disponiveis(conn, esquema=ESQUEMA_NOVAORDEM, tabela=TABELA_CHECKPOINTS):
+    """Indica se a tabela de pontos de controle existe (provisionamento.provisionar_checkpoints)"""
+    with conn:
+        with conn.cursor() as cursor:
+            cursor.execute('SELECT to_regclass(%s) IS NOT NULL', (_tabela(esquema, tabela),))
+            return cursor.fetchone()[0]
+
+
+def quadras_concluidas(conn, lote, esquema=ESQUEMA_NOVAORDEM, tabela=TABELA_CHECKPOINTS):
+    """{ins_quadra: ordem_primeira} das quadras já concluídas no lote"""
+    with conn:
+        with conn.cursor() as cursor:
+            REGISTRO.executar(cursor, 'quadras_concluidas', (lote,), checkpoints=_tabela(esquema, tabela))
+            return dict(cursor.fetchall())
+
+
+def reiniciar_lote(conn, lote, esquema=ESQUEMA_NOVAORDEM, tabela=TABELA_CHECKPOINTS):
+    """Descarta os pontos de controle do lote (a próxima execução refaz todas as quadras)"""
+    with conn:
+        with conn.cursor() as cursor:
+            REGISTRO.executar(cursor, 'reiniciar_lote', (lote,), checkpoints=_tabela(esquema, tabela))
+            return cursor.rowcount
+
+
+def preparar_lote(conn, lote, tarefas, retomar=False, esquema=ESQUEMA_NOVAORDEM, tabela=TABELA_CHECKPOINTS):
+    """
+    Retorna as tarefas a executar no lote. Com retomar=True, tira as quadras já
+    concluídas com a mesma ordem_primeira; senão reinicia o lote.
+    """
+    if not retomar:
+        reiniciar_lote(conn, lote, esquema, tabela)
+        return list(tarefas)
+    concluidas = quadras_concluidas(conn, lote, esquema, tabela)
+    return [(ins_quadra, ordem_primeira) for ins_quadra, ordem_primeira in tarefas
+            if concluidas.get(ins_quadra) != ordem_primeira]
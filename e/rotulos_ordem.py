@@ -0,0 +1,64 @@
+# -*- coding: utf-8 -*-
+"""
+OrganizadorDeLotes - pontos de rótulo da novaordem
+Consulta leve para a camada de rótulos de n_ordem (ver camada_ordem): em vez
+da geometria de cada lote, só as coordenadas de um ponto dentro dele
+(ST_PointOnSurface), já no 'srid' do município, com a matrícula, a quadra e
+o n_ordem. Carrega-se o município inteiro uma vez e depois só as quadras
+regravadas.
+"""
+from .conexao_pg import _psycopg2
+from .exportacao import COLUNA_GEOMETRIA, SRID
+from .instrucoes import identificador
+from .novaordem import ESQUEMA_NOVAORDEM, TABELA_NOVAORDEM
+from .reorganizacao import TABELA_LOTES, CAMPOS_LOTES
+
+# Lotes que saíram da tabela de origem não têm onde ser rotulados
+SQL_ROTULOS = '''
+    SELECT n.ins_quadra, n.matricula, n.n_ordem, {x}, {y}
+    FROM {novaordem} n
+    JOIN {lotes} l ON l.{quadra} = n.ins_quadra AND l.{matricula} = n.matricula
+    {ponto}
+    {filtro}
+'''
+
+
+def consulta_rotulos(quadras=None, coluna_geometria=COLUNA_GEOMETRIA, tabela_lotes=TABELA_LOTES,
+                     esquema=ESQUEMA_NOVAORDEM, tabela=TABELA_NOVAORDEM, campos=CAMPOS_LOTES, srid=SRID):
+    """SQL composto (psycopg2.sql) dos pontos de rótulo e seus parâmetros; sem coluna de geometria, x e y nulos"""
+    sql = _psycopg2().sql
+    if coluna_geometria:
+        # Geometrias sem SRID declarado estão no do município (como na exportação)
+        ponto = sql.SQL('CROSS JOIN LATERAL (SELECT ST_PointOnSurface(ST_Transform(CASE WHEN ST_SRID(l.{coluna}) = 0 '
+                        'THEN ST_SetSRID(l.{coluna}, {srid}) ELSE l.{coluna} END, {srid})) AS ponto) p').format(
+            coluna=sql.Identifier(coluna_geometria), srid=sql.Literal(srid))
+        x, y = sql.SQL('ST_X(p.ponto)'), sql.SQL('ST_Y(p.ponto)')
+    else:
+        ponto = sql.SQL('')
+        x = y = sql.SQL('NULL::double precision')
+
+    filtro, parametros = sql.SQL(''), {}
+    if quadras is not None:
+        filtro, parametros = sql.SQL('WHERE n.ins_quadra = ANY(%(quadras)s)'), {'quadras': list(quadras)}
+
+    consulta = sql.SQL(SQL_ROTULOS).format(
+        x=x, y=y, ponto=ponto, filtro=filtro,
+        novaordem=identificador(f'{esquema}.{tabela}'), lotes=identificador(tabela_lotes),
+        **{chave: sql.Identifier(coluna) for chave, coluna in campos._asdict().items()})
+    return consulta, parametros
+
+
+def ler_rotulos(conn, quadras=None, coluna_geometria=COLUNA_GEOMETRIA, tabela_lotes=TABELA_LOTES,
+                esquema=ESQUEMA_NOVAORDEM, tabela=TABELA_NOVAORDEM, campos=CAMPOS_LOTES, srid=SRID):
+    """
+    {ins_quadra: [(matricula, n_ordem, x, y)]} das 'quadras' (ou de todas),
+    numa única consulta.
+    """
+    consulta, parametros = consulta_rotulos(quadras, coluna_geometria, tabela_lotes, esquema, tabela, campos, srid)
+    rotulos = {} if quadras is None else {ins_quadra: [] for ins_quadra in quadras}
+    with conn:
+        with conn.cursor() as cursor:
+            cursor.execute(consulta, parametros)
+            for ins_quadra, matricula, n_ordem, x, y in cursor:
+                rotulos.setdefault(ins_quadra, []).append((matricula, n_ordem, x, y))
+    return rotulos
@@ -0,0 +1,46 @@
+# -*- coding: utf-8 -*-
+"""
+OrganizadorDeLotes - escuta em segundo plano no QGIS
+QgsTask que roda a escuta.Escuta enquanto o plugin está carregado. Liga-se
+pelas chaves QSettings 'OrganizadorDeLotes/escutar' (true) e
+'OrganizadorDeLotes/conexao_escuta' (nome da conexão ou DSN); o gatilho é
+instalado pelo algoritmo 'Instalar gatilho de notificação'.
+"""
+from qgis.core import QgsTask, QgsMessageLog, Qgis
+
+from .escuta import Escuta
+
+
+class TarefaEscuta(QgsTask):
+
+    def __init__(self, conexao, **opcoes):
+        super().__init__('OrganizadorDeLotes: reorganização contínua', QgsTask.CanCancel)
+        self.escuta = Escuta(conexao, ao_processar=self.relatar, **opcoes)
+        self.erro = None
+
+    def run(self):
+        try:
+            self.escuta.executar()
+        except Exception as e:
+            self.erro = e
+            return False
+        return True
+
+    def cancel(self):
+        self.escuta.parar.set()
+        super().cancel()
+
+    def relatar(self, resumo):
+        if resumo['reorganizadas']:
+            mensagem = (f"Reorganização contínua: {resumo['reorganizadas']} de {resumo['notificadas']} quadras, "
+                        f"defasagem média {resumo['defasagem_media']:.1f} s, "
+                        f"máxima {resumo['defasagem_maxima']:.1f} s")
+        else:
+            mensagem = f"Reorganização contínua: nenhuma das {resumo['notificadas']} quadras notificadas reorganizada"
+        nivel = Qgis.Warning if resumo['falhas'] else Qgis.Info
+        QgsMessageLog.logMessage(mensagem, 'OrganizadorDeLotes', nivel)
+
+    def finished(self, resultado):
+        if not resultado and self.erro is not None:
+            QgsMessageLog.logMessage(f"Reorganização contínua interrompida: {str(self.erro)}",
+                                     'OrganizadorDeLotes', Qgis.Critical)
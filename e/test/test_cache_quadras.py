@@ -0,0 +1,57 @@
+# coding=utf-8
+"""Testes do cache das quadras pré-carregadas."""
+
+import unittest
+
+from ..cache_quadras import CacheQuadras, QuadraPreCarregada
+
+
+class Relogio:
+
+    def __init__(self):
+        self.agora = 0.0
+
+    def __call__(self):
+        return self.agora
+
+
+def quadra(ins_quadra):
+    return QuadraPreCarregada(None, [ins_quadra], [])
+
+
+class CacheQuadrasTest(unittest.TestCase):
+
+    def test_capacidade(self):
+        """Saem as menos usadas"""
+        cache = CacheQuadras(capacidade=2)
+        cache.guardar(('m', 'c', 1), quadra(1))
+        cache.guardar(('m', 'c', 2), quadra(2))
+        self.assertEqual(cache.obter(('m', 'c', 1)).ids, [1])
+        cache.guardar(('m', 'c', 3), quadra(3))
+        self.assertEqual(len(cache), 2)
+        self.assertIn(('m', 'c', 1), cache)
+        self.assertNotIn(('m', 'c', 2), cache)
+
+    def test_validade(self):
+        relogio = Relogio()
+        cache = CacheQuadras(validade=10, relogio=relogio)
+        cache.guardar(1, quadra(1))
+        relogio.agora = 10
+        self.assertIsNotNone(cache.obter(1))
+        relogio.agora = 10.5
+        self.assertIsNone(cache.obter(1))
+        self.assertEqual(len(cache), 0)
+
+    def test_descartar(self):
+        cache = CacheQuadras()
+        cache.guardar(1, quadra(1))
+        cache.guardar(2, quadra(2))
+        cache.descartar(1)
+        cache.descartar(3)
+        self.assertEqual((1 in cache, 2 in cache), (False, True))
+        cache.limpar()
+        self.assertEqual(len(cache), 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,98 @@
+# coding=utf-8
+"""Teste de carga: vários escritores concorrentes na mesma quadra.
+
+Requer um PostgreSQL local descartável, informado em ORGANIZADOR_PG_DSN
+(ex.: "host=localhost dbname=teste user=postgres"). Sem ele o teste é pulado.
+"""
+
+import os
+import threading
+import unittest
+
+from ..novaordem import gravar_quadra, bloquear_quadra, GRAVADA, OCUPADA
+
+DSN = os.environ.get('ORGANIZADOR_PG_DSN')
+ESQUEMA = 'organizador_teste_%d' % os.getpid()
+ESCRITORES = int(os.environ.get('ORGANIZADOR_ESCRITORES', '8'))
+REPETICOES = 20
+
+try:
+    import psycopg2
+except ImportError:
+    psycopg2 = None
+
+
+@unittest.skipUnless(DSN and psycopg2, 'ORGANIZADOR_PG_DSN/psycopg2 indisponíveis')
+class ConcorrenciaTest(unittest.TestCase):
+    """Escritas concorrentes não podem gerar duplicatas na novaordem"""
+
+    def setUp(self):
+        self.conn = psycopg2.connect(DSN)
+        with self.conn, self.conn.cursor() as cursor:
+            cursor.execute('CREATE SCHEMA %s' % ESQUEMA)
+            cursor.execute('CREATE TABLE %s.novaordem (id serial PRIMARY KEY, matricula integer, '
+                           'ins_quadra integer, n_ordem bigint)' % ESQUEMA)
+
+    def tearDown(self):
+        with self.conn, self.conn.cursor() as cursor:
+            cursor.execute('DROP SCHEMA %s CASCADE' % ESQUEMA)
+        self.conn.close()
+
+    def _escritor(self, indice, aguardar, situacoes):
+        conn = psycopg2.connect(DSN)
+        try:
+            for repeticao in range(REPETICOES):
+                # Cada escritor grava uma ordem diferente para os mesmos 50 lotes
+                registros = [(matricula, 7, (matricula + indice + repeticao) % 50 + 1)
+                             for matricula in range(50)]
+                resultado = gravar_quadra(conn, 7, registros, aguardar=aguardar, esquema=ESQUEMA)
+                situacoes.append(resultado['situacao'])
+        finally:
+            conn.close()
+
+    def _executar_escritores(self, aguardar):
+        situacoes = []
+        threads = [threading.Thread(target=self._escritor, args=(i, aguardar, situacoes))
+                   for i in range(ESCRITORES)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return situacoes
+
+    def _assert_sem_duplicatas(self):
+        with self.conn, self.conn.cursor() as cursor:
+            cursor.execute('SELECT count(*), count(DISTINCT matricula), count(DISTINCT n_ordem) '
+                           'FROM %s.novaordem WHERE ins_quadra = 7' % ESQUEMA)
+            self.assertEqual(cursor.fetchone(), (50, 50, 50))
+
+    def test_escritores_aguardando(self):
+        """Com bloqueio bloqueante todas as escritas acontecem, uma de cada vez"""
+        situacoes = self._executar_escritores(aguardar=True)
+        self.assertEqual(situacoes.count(GRAVADA), ESCRITORES * REPETICOES)
+        self._assert_sem_duplicatas()
+
+    def test_escritores_pulando_ocupadas(self):
+        """Com 'pular se ocupada' nenhuma escrita espera e o resultado continua íntegro"""
+        situacoes = self._executar_escritores(aguardar=False)
+        self.assertEqual(len(situacoes), ESCRITORES * REPETICOES)
+        self.assertGreater(situacoes.count(GRAVADA), 0)
+        self._assert_sem_duplicatas()
+
+    def test_quadra_ocupada_e_pulada(self):
+        """Uma quadra bloqueada por outra transação é reportada como ocupada"""
+        outra = psycopg2.connect(DSN)
+        try:
+            with outra.cursor() as cursor:
+                bloquear_quadra(cursor, 7, esquema=ESQUEMA)
+                resultado = gravar_quadra(self.conn, 7, [(1, 7, 1)], aguardar=False, esquema=ESQUEMA)
+                self.assertEqual(resultado['situacao'], OCUPADA)
+            outra.rollback()
+            resultado = gravar_quadra(self.conn, 7, [(1, 7, 1)], aguardar=False, esquema=ESQUEMA)
+            self.assertEqual(resultado['situacao'], GRAVADA)
+        finally:
+            outra.close()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,97 @@
+# coding=utf-8
+"""Testes do núcleo do algoritmo 'Conectar polígonos'."""
+
+import unittest
+
+from ..conectar_poligonos import (conectar_poligonos, conectar_grupo, grupos_vizinhanca, vizinhos_por_envelope,
+                                  contexto_processos, GradeVertices)
+
+
+def retangulo(xmin, ymin, xmax, ymax):
+    return [(xmin, ymin), (xmax, ymin), (xmax, ymax), (xmin, ymax), (xmin, ymin)]
+
+
+def quadra(x0, frente=3, largura=10.0, profundidade=20.0):
+    """Fileira da frente com 'frente' lotes e um único lote nos fundos: junções em T"""
+    poligonos = {(x0, 'frente', i): [retangulo(x0 + i * largura, 0, x0 + (i + 1) * largura, profundidade)]
+                 for i in range(frente)}
+    poligonos[(x0, 'fundos')] = [retangulo(x0, profundidade, x0 + frente * largura, 2 * profundidade)]
+    return poligonos
+
+
+class ConectarPoligonosTest(unittest.TestCase):
+
+    def test_juncao_t(self):
+        """O lote dos fundos recebe, em ordem, os vértices das divisas da frente"""
+        poligonos = quadra(0)
+        resultado = conectar_poligonos(poligonos, vizinhos_por_envelope(poligonos))
+        aneis, inseridos = resultado[(0, 'fundos')]
+        self.assertEqual(inseridos, 2)
+        # O segmento de baixo vai de (0, 20) a (30, 20): recebe x=10 e x=20 nessa ordem
+        self.assertEqual(aneis[0][:4], [(0, 20.0), (10.0, 20.0), (20.0, 20.0), (30, 20.0)])
+        # Os da frente já tinham os cantos do lote dos fundos (ou nada a receber)
+        self.assertEqual(sum(resultado[(0, 'frente', i)][1] for i in range(3)), 0)
+
+    def test_tolerancia(self):
+        """Vértice a menos da tolerância do segmento é inserido; além dela, não"""
+        base = retangulo(0, 0, 10, 10)
+        perto = [retangulo(4, 10.005, 6, 12)]
+        longe = [retangulo(4, 10.05, 6, 12)]
+        for vizinho, esperado in ((perto, 2), (longe, 0)):
+            poligonos = {'a': [base], 'b': vizinho}
+            resultado = conectar_grupo(poligonos, {'a': {'b'}, 'b': {'a'}}, 0.01)
+            self.assertEqual(resultado['a'][1], esperado)
+
+    def test_furos(self):
+        """Os furos são mantidos e também recebem os vértices de quem encosta neles"""
+        externo = retangulo(0, 0, 30, 30)
+        furo = retangulo(10, 10, 20, 20)[::-1]
+        dentro = [retangulo(10, 10, 15, 20), retangulo(15, 10, 20, 20)]
+        poligonos = {'a': [externo, furo], 'b': [dentro[0]], 'c': [dentro[1]]}
+        resultado = conectar_poligonos(poligonos, vizinhos_por_envelope(poligonos))
+        aneis, inseridos = resultado['a']
+        self.assertEqual(len(aneis), 2)
+        self.assertEqual(aneis[0], externo)
+        self.assertEqual(inseridos, 2)
+        self.assertIn((15, 10), aneis[1])
+        self.assertIn((15, 20), aneis[1])
+
+    def test_grupos(self):
+        """Quadras separadas por ruas formam grupos de vizinhança distintos"""
+        poligonos = {}
+        for x0 in (0, 100, 200):
+            poligonos.update(quadra(x0))
+        grupos = grupos_vizinhanca(vizinhos_por_envelope(poligonos))
+        self.assertEqual(sorted(len(grupo) for grupo in grupos), [4, 4, 4])
+        self.assertEqual(sorted({ident[0] for ident in grupo}.pop() for grupo in grupos), [0, 100, 200])
+
+    def test_processos(self):
+        """Em processos paralelos o resultado é o mesmo"""
+        poligonos = {}
+        for x0 in range(0, 100 * 150, 100):
+            poligonos.update(quadra(x0, frente=x0 % 4 + 2))
+        vizinhos = vizinhos_por_envelope(poligonos)
+        progresso = []
+        sequencial = conectar_poligonos(poligonos, vizinhos)
+        paralelo = conectar_poligonos(poligonos, vizinhos, processos=2,
+                                      progresso=lambda feitos, total: progresso.append((feitos, total)))
+        self.assertEqual(paralelo, sequencial)
+        self.assertEqual(progresso[-1], (150, 150))
+
+    def test_contexto_processos(self):
+        """Os processos são sempre criados por spawn, nunca por fork do processo atual"""
+        self.assertEqual(contexto_processos().get_start_method(), 'spawn')
+
+    def test_cancelado(self):
+        poligonos = quadra(0)
+        self.assertEqual(conectar_poligonos(poligonos, vizinhos_por_envelope(poligonos), cancelado=lambda: True), {})
+
+    def test_grade(self):
+        grade = GradeVertices(1.0)
+        grade.adicionar(0.5, 0.5, 'a')
+        grade.adicionar(5.5, 5.5, 'b')
+        self.assertEqual(list(grade.no_envelope(0, 0, 1, 1)), [(0.5, 0.5, 'a')])
+
+
+if __name__ == '__main__':
+    unittest.main()
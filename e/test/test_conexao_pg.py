@@ -0,0 +1,163 @@
+# coding=utf-8
+"""Testes da camada de conexão: réplica de leitura, tempos-limite e retentativas.
+
+Os testes com banco requerem um PostgreSQL local descartável em
+ORGANIZADOR_PG_DSN; ele faz o papel de réplica (fora de recuperação o
+atraso é 0) e de primário.
+"""
+
+import os
+import unittest
+from functools import partial
+
+from ..conexao_pg import (abrir_conexao, abrir_conexao_leitura, atraso_replica, PoliticaRetentativa, Sessao)
+from ..novaordem import bloquear_quadra, GRAVADA
+from ..provisionamento import provisionar_novaordem
+from ..reorganizacao import FonteLotesMemoria, DestinoBanco, reorganizar
+
+DSN = os.environ.get('ORGANIZADOR_PG_DSN')
+INACESSIVEL = 'host=/nao/existe dbname=postgres connect_timeout=1'
+
+try:
+    import psycopg2
+except ImportError:
+    psycopg2 = None
+
+
+class ErroTransitorio(Exception):
+    pgcode = '40001'
+
+
+class PoliticaRetentativaTest(unittest.TestCase):
+
+    def _politica(self, tentativas=4):
+        self.esperas = []
+        return PoliticaRetentativa(tentativas, espera_inicial=0.1, espera_maxima=0.3,
+                                   sortear=lambda: 1.0, dormir=self.esperas.append)
+
+    def test_backoff_exponencial_limitado(self):
+        falhas = iter([ErroTransitorio(), ErroTransitorio(), ErroTransitorio()])
+
+        def operacao():
+            erro = next(falhas, None)
+            if erro:
+                raise erro
+            return 'ok'
+
+        self.assertEqual(self._politica().executar(operacao), ('ok', 3, 0.1 + 0.2 + 0.3))
+        self.assertEqual(self.esperas, [0.1, 0.2, 0.3])
+
+    def test_esgota_tentativas(self):
+        chamadas = []
+
+        def operacao():
+            chamadas.append(1)
+            raise ErroTransitorio()
+
+        with self.assertRaises(ErroTransitorio):
+            self._politica(tentativas=3).executar(operacao)
+        self.assertEqual(len(chamadas), 3)
+
+    def test_nao_repete_erro_permanente(self):
+        chamadas = []
+
+        def operacao():
+            chamadas.append(1)
+            raise ValueError('permanente')
+
+        with self.assertRaises(ValueError):
+            self._politica().executar(operacao)
+        self.assertEqual((len(chamadas), self.esperas), (1, []))
+
+    def test_jitter(self):
+        politica = PoliticaRetentativa(espera_inicial=1.0, espera_maxima=8.0, sortear=lambda: 0.5)
+        self.assertEqual([politica.espera(n) for n in range(5)], [0.5, 1.0, 2.0, 4.0, 4.0])
+
+
+@unittest.skipUnless(DSN and psycopg2, 'ORGANIZADOR_PG_DSN/psycopg2 indisponíveis')
+class TempoLimiteTest(unittest.TestCase):
+    """Esperas por bloqueio e instruções longas terminam; conexões perdidas são reabertas"""
+
+    def setUp(self):
+        self.esquema = 'organizador_teste_conexao_%d' % os.getpid()
+        self.conn = abrir_conexao(DSN, tempo_limite=1, tempo_limite_bloqueio=0.2)
+        provisionar_novaordem(self.conn, esquema=self.esquema)
+
+    def tearDown(self):
+        self.conn.close()
+        conn = psycopg2.connect(DSN)
+        with conn, conn.cursor() as cursor:
+            cursor.execute('DROP SCHEMA %s CASCADE' % self.esquema)
+        conn.close()
+
+    def test_tempo_limite_instrucao(self):
+        with self.assertRaises(psycopg2.extensions.QueryCanceledError):
+            with self.conn, self.conn.cursor() as cursor:
+                cursor.execute('SELECT pg_sleep(5)')
+
+    def test_espera_por_bloqueio_repetida_e_limitada(self):
+        outra = psycopg2.connect(DSN)
+        try:
+            with outra.cursor() as cursor:
+                bloquear_quadra(cursor, 1, esquema=self.esquema)
+            destino = DestinoBanco(self.conn, esquema=self.esquema)
+            politica = PoliticaRetentativa(3, espera_inicial=0.01)
+            with self.assertLogs('OrganizadorDeLotes', 'WARNING') as logs:
+                with self.assertRaises(psycopg2.errors.LockNotAvailable):
+                    reorganizar(FonteLotesMemoria({1: [(10, 1)]}), destino, 1, 1, politica=politica)
+            self.assertEqual(len(logs.output), 2)
+        finally:
+            outra.rollback()
+            outra.close()
+
+    def test_reconecta(self):
+        sessao = Sessao(partial(abrir_conexao, DSN))
+        self.addCleanup(sessao.close)
+        destino = DestinoBanco(sessao.conn, esquema=self.esquema, sessao=sessao)
+        with self.conn, self.conn.cursor() as cursor:
+            cursor.execute('SELECT pg_terminate_backend(%s)', (sessao.conn.info.backend_pid,))
+
+        with self.assertLogs('OrganizadorDeLotes', 'WARNING'):
+            resultado = reorganizar(FonteLotesMemoria({1: [(10, 1)]}), destino, 1, 1,
+                                    politica=PoliticaRetentativa(3, espera_inicial=0.01))
+        self.assertEqual((resultado['situacao'], resultado['retentativas']), (GRAVADA, 1))
+        self.assertIs(destino.conn, sessao.conn)
+        self.assertFalse(destino.conn.closed)
+
+
+@unittest.skipUnless(DSN and psycopg2, 'ORGANIZADOR_PG_DSN/psycopg2 indisponíveis')
+class LeituraReplicaTest(unittest.TestCase):
+
+    def _abrir(self, *args, **kwargs):
+        conn = abrir_conexao_leitura(*args, **kwargs)
+        self.addCleanup(conn.close)
+        with conn, conn.cursor() as cursor:
+            cursor.execute("SELECT current_setting('application_name'), current_setting('transaction_read_only')")
+            return cursor.fetchone()
+
+    def test_atraso_fora_de_replica(self):
+        conn = psycopg2.connect(DSN)
+        try:
+            self.assertEqual(atraso_replica(conn), 0)
+        finally:
+            conn.close()
+
+    def test_usa_replica(self):
+        self.assertEqual(self._abrir(INACESSIVEL, DSN), ('OrganizadorDeLotes (leitura)', 'on'))
+
+    def test_sem_replica_usa_primario(self):
+        self.assertEqual(self._abrir(DSN), ('OrganizadorDeLotes', 'on'))
+
+    def test_replica_inacessivel_usa_primario(self):
+        with self.assertLogs('OrganizadorDeLotes', 'WARNING'):
+            self.assertEqual(self._abrir(DSN, INACESSIVEL), ('OrganizadorDeLotes', 'on'))
+
+    def test_replica_atrasada_usa_primario(self):
+        with self.assertLogs('OrganizadorDeLotes', 'WARNING') as logs:
+            # DSN + ' ': a mesma base, mas não a mesma conexão (que dispensaria a réplica)
+            self.assertEqual(self._abrir(DSN, DSN + ' ', atraso_maximo=-1), ('OrganizadorDeLotes', 'on'))
+        self.assertIn('atrasada', logs.output[0])
+
+
+if __name__ == '__main__':
+    unittest.main()
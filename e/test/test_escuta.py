@@ -0,0 +1,133 @@
+# coding=utf-8
+"""Testes da reorganização contínua (gatilho de notificação e acumulador).
+
+Os testes do gatilho requerem um PostgreSQL local descartável em
+ORGANIZADOR_PG_DSN; sem ele são pulados.
+"""
+
+import os
+import select
+import unittest
+
+from ..escuta import Acumulador, decodificar
+from ..provisionamento import provisionar_gatilho, remover_gatilho, QUADRAS_POR_NOTIFICACAO
+from ..reorganizacao import CamposLotes
+
+DSN = os.environ.get('ORGANIZADOR_PG_DSN')
+ESQUEMA = 'organizador_teste_escuta_%d' % os.getpid()
+CANAL = 'organizador_teste_%d' % os.getpid()
+
+try:
+    import psycopg2
+except ImportError:
+    psycopg2 = None
+
+
+class AcumuladorTest(unittest.TestCase):
+
+    def test_debounce(self):
+        acumulador = Acumulador(espera=2, espera_maxima=30, tamanho_lote=100)
+        self.assertIsNone(acumulador.prazo(0))
+        acumulador.adicionar([1, 2], 100.0, agora=0)
+        acumulador.adicionar([2, 3], 99.0, agora=1)
+        self.assertEqual(acumulador.prazo(1), 2)
+        self.assertFalse(acumulador.pronto(2.5))
+        self.assertTrue(acumulador.pronto(3))
+        # Coalescidas, com o instante mais antigo de cada quadra
+        self.assertEqual(acumulador.retirar(), {1: 100.0, 2: 99.0, 3: 99.0})
+        self.assertIsNone(acumulador.prazo(3))
+
+    def test_espera_maxima(self):
+        """Notificações contínuas não adiam o lote além da espera máxima"""
+        acumulador = Acumulador(espera=2, espera_maxima=5, tamanho_lote=100)
+        for agora in range(5):
+            acumulador.adicionar([agora], 0.0, agora)
+            self.assertFalse(acumulador.pronto(agora))
+        self.assertTrue(acumulador.pronto(5))
+
+    def test_tamanho_lote(self):
+        acumulador = Acumulador(espera=2, espera_maxima=30, tamanho_lote=3)
+        acumulador.adicionar([1, 2, 3], 0.0, 0)
+        self.assertTrue(acumulador.pronto(0))
+
+    def test_decodificar(self):
+        self.assertEqual(decodificar('{"quadras": [7, 8], "em": 1700000000.5}'), ([7, 8], 1700000000.5))
+
+
+@unittest.skipUnless(DSN and psycopg2, 'ORGANIZADOR_PG_DSN/psycopg2 indisponíveis')
+class GatilhoTest(unittest.TestCase):
+    """O gatilho notifica, na confirmação, só as quadras com ordem/matrícula alteradas"""
+
+    def setUp(self):
+        self.conn = psycopg2.connect(DSN)
+        self.tabela = f'{ESQUEMA}.lotes'
+        with self.conn, self.conn.cursor() as cursor:
+            cursor.execute(f'CREATE SCHEMA {ESQUEMA}')
+            cursor.execute(f'CREATE TABLE {self.tabela} (matricula bigint, ins_quadra integer, ordem integer, '
+                           'obs text)')
+            cursor.execute(f'INSERT INTO {self.tabela} SELECT q * 100 + i, q, i, NULL '
+                           'FROM generate_series(1, 3) q, generate_series(1, 5) i')
+        provisionar_gatilho(self.conn, self.tabela, CANAL)
+        self.escuta = psycopg2.connect(DSN)
+        self.escuta.autocommit = True
+        with self.escuta.cursor() as cursor:
+            cursor.execute(f'LISTEN {CANAL}')
+
+    def tearDown(self):
+        self.escuta.close()
+        remover_gatilho(self.conn, self.tabela)
+        with self.conn, self.conn.cursor() as cursor:
+            cursor.execute(f'DROP SCHEMA {ESQUEMA} CASCADE')
+        self.conn.close()
+
+    def _executar(self, instrucao):
+        with self.conn, self.conn.cursor() as cursor:
+            cursor.execute(instrucao)
+
+    def _notificadas(self):
+        quadras = []
+        while select.select([self.escuta], [], [], 0.5)[0]:
+            self.escuta.poll()
+            while self.escuta.notifies:
+                quadras.extend(decodificar(self.escuta.notifies.pop(0).payload)[0])
+        return sorted(quadras)
+
+    def test_eventos(self):
+        self._executar(f'INSERT INTO {self.tabela} VALUES (999, 4, 1, NULL)')
+        self.assertEqual(self._notificadas(), [4])
+        self._executar(f'UPDATE {self.tabela} SET ordem = ordem + 1 WHERE ins_quadra IN (1, 2)')
+        self.assertEqual(self._notificadas(), [1, 2])
+        self._executar(f'DELETE FROM {self.tabela} WHERE ins_quadra = 3')
+        self.assertEqual(self._notificadas(), [3])
+
+    def test_sem_mudanca_relevante(self):
+        self._executar(f"UPDATE {self.tabela} SET obs = 'x', ordem = ordem")
+        self.assertEqual(self._notificadas(), [])
+
+    def test_so_na_confirmacao(self):
+        with self.conn.cursor() as cursor:
+            cursor.execute(f'UPDATE {self.tabela} SET ordem = 0 WHERE ins_quadra = 1')
+        self.conn.rollback()
+        self.assertEqual(self._notificadas(), [])
+
+    def test_muitas_quadras(self):
+        """Quadras além do limite de uma notificação vão em várias"""
+        total = QUADRAS_POR_NOTIFICACAO + 10
+        self._executar(f'INSERT INTO {self.tabela} SELECT q, q, 1, NULL FROM generate_series(10, {9 + total}) q')
+        self.assertEqual(self._notificadas(), list(range(10, 10 + total)))
+
+    def test_outra_tabela_no_esquema(self):
+        """Outra tabela de lotes do esquema, com outras colunas, não quebra nem remove o gatilho desta"""
+        outra = f'{ESQUEMA}.lotes_suzano'
+        self._executar(f'CREATE TABLE {outra} (inscricao bigint, cod_quadra integer, seq integer)')
+        provisionar_gatilho(self.conn, outra, CANAL, CamposLotes('inscricao', 'cod_quadra', 'seq'))
+        self._executar(f'INSERT INTO {outra} VALUES (1, 7, 1)')
+        self._executar(f'INSERT INTO {self.tabela} VALUES (999, 4, 1, NULL)')
+        self.assertEqual(self._notificadas(), [4, 7])
+        remover_gatilho(self.conn, outra)
+        self._executar(f'DELETE FROM {self.tabela} WHERE ins_quadra = 3')
+        self.assertEqual(self._notificadas(), [3])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,83 @@
+# coding=utf-8
+"""Testes do livro de execuções (novaordem_runs).
+
+Requer um PostgreSQL local descartável em ORGANIZADOR_PG_DSN; sem ele os testes são pulados.
+"""
+
+import os
+import unittest
+
+from ..execucoes import Execucao, MOTOR_BANCO, ETAPAS, cronometrar
+from ..novaordem import GRAVADA, OCUPADA, MODO_UPSERT
+from ..provisionamento import provisionar_execucoes
+
+DSN = os.environ.get('ORGANIZADOR_PG_DSN')
+ESQUEMA = 'organizador_teste_execucoes_%d' % os.getpid()
+
+try:
+    import psycopg2
+except ImportError:
+    psycopg2 = None
+
+
+class CronometroTest(unittest.TestCase):
+
+    def test_acumula_por_etapa(self):
+        duracoes = {}
+        for _ in range(2):
+            with cronometrar(duracoes, 'leitura'):
+                pass
+        self.assertEqual(list(duracoes), ['leitura'])
+        self.assertGreaterEqual(duracoes['leitura'], 0.0)
+
+
+@unittest.skipUnless(DSN and psycopg2, 'ORGANIZADOR_PG_DSN/psycopg2 indisponíveis')
+class LivroExecucoesTest(unittest.TestCase):
+    """Uma execução vira uma linha por quadra, gravadas de uma vez"""
+
+    def setUp(self):
+        self.conn = psycopg2.connect(DSN)
+        provisionar_execucoes(self.conn, esquema=ESQUEMA)
+
+    def tearDown(self):
+        with self.conn, self.conn.cursor() as cursor:
+            cursor.execute('DROP SCHEMA %s CASCADE' % ESQUEMA)
+        self.conn.close()
+
+    def test_gravar(self):
+        execucao = Execucao('host=localhost dbname=cadastro password=segredo', MOTOR_BANCO,
+                            MODO_UPSERT, operador='fulano')
+        execucao.adicionar({'ins_quadra': 1, 'ordem_primeira': 3, 'situacao': GRAVADA, 'excluidos': 2,
+                            'inseridos': 5, 'atualizados': 1, 'retentativas': 2, 'espera_retentativas': 0.25,
+                            'duracoes': {etapa: 0.5 for etapa in ETAPAS}})
+        execucao.adicionar({'ins_quadra': 2, 'ordem_primeira': 1, 'situacao': OCUPADA})
+        self.assertTrue(execucao.gravar(self.conn, esquema=ESQUEMA))
+
+        with self.conn, self.conn.cursor() as cursor:
+            cursor.execute('SELECT DISTINCT execucao::text, operador, conexao, motor, modo '
+                           'FROM %s.novaordem_runs' % ESQUEMA)
+            linhas = cursor.fetchall()
+            self.assertEqual(len(linhas), 1)
+            self.assertEqual(linhas[0][0], execucao.id)
+            self.assertEqual(linhas[0][1], 'fulano')
+            self.assertNotIn('segredo', linhas[0][2])
+            self.assertEqual(linhas[0][3:], (MOTOR_BANCO, MODO_UPSERT))
+
+            cursor.execute('SELECT ins_quadra, situacao, excluidos, inseridos, atualizados, leitura_ms, '
+                           'calculo_ms, gravacao_ms, retentativas, espera_retentativas_ms '
+                           'FROM %s.novaordem_runs ORDER BY ins_quadra' % ESQUEMA)
+            self.assertEqual(cursor.fetchall(), [(1, GRAVADA, 2, 5, 1, 500.0, 500.0, 500.0, 2, 250.0),
+                                                 (2, OCUPADA, None, None, None, None, None, None, None, None)])
+
+    def test_falha_nao_propaga(self):
+        """Sem a tabela, gravar() retorna False e a conexão continua utilizável"""
+        execucao = Execucao('cadastro', MOTOR_BANCO, MODO_UPSERT)
+        execucao.adicionar({'ins_quadra': 1, 'situacao': GRAVADA})
+        self.assertFalse(execucao.gravar(self.conn, esquema=ESQUEMA, tabela='inexistente'))
+        with self.conn, self.conn.cursor() as cursor:
+            cursor.execute('SELECT 1')
+            self.assertEqual(cursor.fetchone(), (1,))
+
+
+if __name__ == "__main__":
+    unittest.main()
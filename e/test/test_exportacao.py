@@ -0,0 +1,117 @@
+# coding=utf-8
+"""Testes da exportação das rotas.
+
+Requer um PostgreSQL local descartável em ORGANIZADOR_PG_DSN; sem ele os
+testes com banco são pulados. A geometria (PostGIS) não é exercitada aqui.
+"""
+
+import csv
+import gzip
+import io
+import json
+import os
+import shutil
+import tempfile
+import unittest
+
+from ..exportacao import exportar, nome_arquivo, EscritorGeojsonSeq, CSV, GEOJSONSEQ, POR_DISTRITO
+from ..provisionamento import provisionar_novaordem
+
+DSN = os.environ.get('ORGANIZADOR_PG_DSN')
+ESQUEMA = 'organizador_teste_exportacao_%d' % os.getpid()
+
+try:
+    import psycopg2
+except ImportError:
+    psycopg2 = None
+
+
+class EscritoresTest(unittest.TestCase):
+
+    def test_nome_arquivo(self):
+        self.assertEqual(nome_arquivo('quadra', 12, CSV), 'quadra_12.csv')
+        self.assertEqual(nome_arquivo('distrito', 'Zona Sul/2', GEOJSONSEQ, True), 'distrito_Zona_Sul_2.geojsons.gz')
+        self.assertEqual(nome_arquivo('distrito', None, CSV), 'distrito_sem_distrito.csv')
+        self.assertNotEqual(nome_arquivo('distrito', 'Vila A/B', CSV, desambiguar=True),
+                            nome_arquivo('distrito', 'Vila A B', CSV, desambiguar=True))
+
+    def test_geojsonseq(self):
+        saida = io.StringIO()
+        escritor = EscritorGeojsonSeq(saida, True)
+        escritor.escrever(1, 2, 30, 4, '{"type":"Point","coordinates":[-46.6,-23.5]}')
+        escritor.escrever(1, 3, 31, None, None)
+        primeira, segunda = (json.loads(linha) for linha in saida.getvalue().splitlines())
+        self.assertEqual(primeira['geometry']['coordinates'], [-46.6, -23.5])
+        self.assertEqual(primeira['properties'], {'ins_quadra': 1, 'n_ordem': 2, 'matricula': 30, 'ordem': 4})
+        self.assertIsNone(segunda['geometry'])
+
+
+@unittest.skipUnless(DSN and psycopg2, 'ORGANIZADOR_PG_DSN/psycopg2 indisponíveis')
+class ExportacaoTest(unittest.TestCase):
+
+    def setUp(self):
+        self.pasta = tempfile.mkdtemp()
+        self.conn = psycopg2.connect(DSN)
+        provisionar_novaordem(self.conn, esquema=ESQUEMA)
+        with self.conn, self.conn.cursor() as cursor:
+            cursor.execute(f'CREATE TABLE {ESQUEMA}.lotes (matricula integer, ins_quadra integer, ordem integer, '
+                           'distrito text)')
+            cursor.execute(f"INSERT INTO {ESQUEMA}.lotes SELECT q * 100 + i, q, i, CASE WHEN q < 3 THEN 'A' "
+                           "ELSE 'B' END FROM generate_series(1, 4) q, generate_series(1, 10) i")
+            # Nova ordem invertida em relação à ordem original
+            cursor.execute(f'INSERT INTO {ESQUEMA}.novaordem (matricula, ins_quadra, n_ordem) '
+                           f'SELECT matricula, ins_quadra, 11 - ordem FROM {ESQUEMA}.lotes')
+
+    def tearDown(self):
+        shutil.rmtree(self.pasta)
+        with self.conn, self.conn.cursor() as cursor:
+            cursor.execute('DROP SCHEMA %s CASCADE' % ESQUEMA)
+        self.conn.close()
+
+    def _exportar(self, **opcoes):
+        return exportar(self.conn, self.pasta, coluna_geometria=None, tabela_lotes=f'{ESQUEMA}.lotes',
+                        esquema=ESQUEMA, tamanho_bloco=7, **opcoes)
+
+    def test_por_quadra(self):
+        resultado = self._exportar()
+        self.assertEqual(resultado['lotes'], 40)
+        self.assertEqual([os.path.basename(c) for c in resultado['arquivos']],
+                         [f'quadra_{q}.csv' for q in range(1, 5)])
+        with open(resultado['arquivos'][1], newline='') as arquivo:
+            linhas = list(csv.reader(arquivo))
+        self.assertEqual(linhas[0], ['ins_quadra', 'n_ordem', 'matricula', 'ordem'])
+        self.assertEqual([int(linha[1]) for linha in linhas[1:]], list(range(1, 11)))
+        self.assertEqual([int(linha[3]) for linha in linhas[1:]], list(range(10, 0, -1)))
+
+    def test_por_distrito_gzip(self):
+        progresso = []
+        resultado = self._exportar(formato=GEOJSONSEQ, agrupamento=POR_DISTRITO, coluna_distrito='distrito',
+                                   compactar=True, progresso=lambda *a: progresso.append(a))
+        self.assertEqual([os.path.basename(c) for c in resultado['arquivos']],
+                         ['distrito_A.geojsons.gz', 'distrito_B.geojsons.gz'])
+        self.assertEqual(progresso, [(1, 20), (2, 40)])
+        with gzip.open(resultado['arquivos'][1], 'rt') as arquivo:
+            propriedades = [json.loads(linha)['properties'] for linha in arquivo]
+        self.assertEqual([(p['ins_quadra'], p['n_ordem']) for p in propriedades],
+                         [(q, n) for q in (3, 4) for n in range(1, 11)])
+
+    def test_distritos_com_mesmo_nome(self):
+        """Distritos que dariam o mesmo nome de arquivo não se sobrescrevem"""
+        with self.conn, self.conn.cursor() as cursor:
+            cursor.execute(f"UPDATE {ESQUEMA}.lotes SET distrito = CASE WHEN ins_quadra < 3 THEN 'Vila A/B' "
+                           "ELSE 'Vila A B' END")
+        resultado = self._exportar(agrupamento=POR_DISTRITO, coluna_distrito='distrito')
+        nomes = [os.path.basename(c) for c in resultado['arquivos']]
+        self.assertEqual(len(set(nomes)), 2)
+        self.assertIn('distrito_Vila_A_B.csv', nomes)
+        for caminho in resultado['arquivos']:
+            with open(caminho, newline='') as arquivo:
+                self.assertEqual(len(list(csv.reader(arquivo))), 21)
+
+    def test_quadras_e_cancelamento(self):
+        self.assertEqual(self._exportar(quadras=[2, 4])['lotes'], 20)
+        self.assertEqual(self._exportar(cancelado=lambda: True), {'arquivos': [], 'lotes': 0})
+
+
+if __name__ == '__main__':
+    unittest.main()
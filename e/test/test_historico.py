@@ -0,0 +1,96 @@
+# coding=utf-8
+"""Testes do histórico por quadra da novaordem e de desfazer_quadras.
+
+Requer um PostgreSQL local descartável em ORGANIZADOR_PG_DSN; sem ele os testes são pulados.
+"""
+
+import os
+import unittest
+
+from ..novaordem import (gravar_quadra, excluir_quadra, desfazer_quadras, podar_historico, historico_disponivel,
+                         MODO_UPSERT)
+from ..provisionamento import provisionar_novaordem, provisionar_historico
+
+DSN = os.environ.get('ORGANIZADOR_PG_DSN')
+ESQUEMA = 'organizador_teste_historico_%d' % os.getpid()
+
+try:
+    import psycopg2
+except ImportError:
+    psycopg2 = None
+
+
+def registros(ins_quadra, matriculas):
+    return [(matricula, ins_quadra, n_ordem) for n_ordem, matricula in enumerate(matriculas, 1)]
+
+
+@unittest.skipUnless(DSN and psycopg2, 'ORGANIZADOR_PG_DSN/psycopg2 indisponíveis')
+class HistoricoTest(unittest.TestCase):
+
+    def setUp(self):
+        self.conn = psycopg2.connect(DSN)
+        provisionar_novaordem(self.conn, esquema=ESQUEMA)
+
+    def tearDown(self):
+        with self.conn, self.conn.cursor() as cursor:
+            cursor.execute('DROP SCHEMA %s CASCADE' % ESQUEMA)
+        self.conn.close()
+
+    def _conteudo(self, ins_quadra):
+        with self.conn, self.conn.cursor() as cursor:
+            cursor.execute('SELECT matricula FROM %s.novaordem WHERE ins_quadra = %%s ORDER BY n_ordem'
+                           % ESQUEMA, (ins_quadra,))
+            return [matricula for matricula, in cursor.fetchall()]
+
+    def _versoes(self, ins_quadra):
+        with self.conn, self.conn.cursor() as cursor:
+            cursor.execute('SELECT matriculas FROM %s.novaordem_historico WHERE ins_quadra = %%s ORDER BY id'
+                           % ESQUEMA, (ins_quadra,))
+            return [matriculas for matriculas, in cursor.fetchall()]
+
+    def test_sem_historico(self):
+        """Sem a tabela de histórico a gravação não muda e não há o que desfazer"""
+        self.assertIsNone(historico_disponivel(self.conn, ESQUEMA))
+        resultado = gravar_quadra(self.conn, 1, registros(1, [10, 11]), esquema=ESQUEMA)
+        self.assertEqual(resultado['inseridos'], 2)
+        with self.assertRaises(Exception):
+            desfazer_quadras(self.conn, [1], esquema=ESQUEMA)
+
+    def test_versoes(self):
+        """Cada gravação guarda a versão anterior, nos dois modos e na exclusão"""
+        gravar_quadra(self.conn, 1, registros(1, [10, 11, 12]), esquema=ESQUEMA)
+        provisionar_historico(self.conn, esquema=ESQUEMA)
+        resultado = gravar_quadra(self.conn, 1, registros(1, [12, 10, 11]), esquema=ESQUEMA)
+        self.assertEqual(resultado['excluidos'], 3)
+        gravar_quadra(self.conn, 1, registros(1, [11, 12, 10]), modo=MODO_UPSERT, esquema=ESQUEMA)
+        self.assertEqual(excluir_quadra(self.conn, 1, esquema=ESQUEMA), 3)
+        self.assertEqual(self._versoes(1), [[10, 11, 12], [12, 10, 11], [11, 12, 10]])
+
+    def test_desfazer(self):
+        provisionar_historico(self.conn, esquema=ESQUEMA)
+        gravar_quadra(self.conn, 1, registros(1, [10, 11, 12]), esquema=ESQUEMA)
+        gravar_quadra(self.conn, 1, registros(1, [12, 10, 11]), esquema=ESQUEMA)
+        gravar_quadra(self.conn, 1, registros(1, [11, 12]), esquema=ESQUEMA)
+        gravar_quadra(self.conn, 2, registros(2, [20, 21]), esquema=ESQUEMA)
+        gravar_quadra(self.conn, 2, registros(2, [21, 20]), esquema=ESQUEMA)
+
+        # As duas últimas gravações da quadra 1 e as (só duas) da quadra 2, numa instrução
+        self.assertEqual(desfazer_quadras(self.conn, [1, 2, 3], versoes=2, esquema=ESQUEMA),
+                         {1: (2, 3), 2: (2, 0)})
+        self.assertEqual(self._conteudo(1), [10, 11, 12])
+        self.assertEqual(self._conteudo(2), [])
+        # As versões restauradas saem do histórico: desfazer de novo recua mais
+        self.assertEqual(self._versoes(1), [[]])
+        self.assertEqual(desfazer_quadras(self.conn, [1], esquema=ESQUEMA), {1: (3, 0)})
+        self.assertEqual(desfazer_quadras(self.conn, [1], esquema=ESQUEMA), {})
+
+    def test_podar(self):
+        provisionar_historico(self.conn, esquema=ESQUEMA)
+        for ordem in range(5):
+            gravar_quadra(self.conn, 1, registros(1, [10 + ordem]), esquema=ESQUEMA)
+        self.assertEqual(podar_historico(self.conn, 2, esquema=ESQUEMA), 3)
+        self.assertEqual(self._versoes(1), [[12], [13]])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,106 @@
+# coding=utf-8
+"""Testes do núcleo dos algoritmos 'Linhas de testada' e 'Linhas de confrontação'."""
+
+import unittest
+
+from ..conectar_poligonos import vizinhos_por_envelope
+from ..linhas_lotes import testadas_quadra as calcular_testadas
+from ..linhas_lotes import (linhas_lotes, sequenciar_testadas, quadras_por_vertices,
+                            SegmentosQuadra, TESTADA, CONFRONTACAO)
+from ..orientacao_poligonos import orientar_anel, HORARIO, NORTE, OESTE
+
+
+def retangulo(xmin, ymin, xmax, ymax):
+    return [(xmin, ymin), (xmax, ymin), (xmax, ymax), (xmin, ymax), (xmin, ymin)]
+
+
+def quadra(x0=0):
+    """Três lotes na frente e um nos fundos, sem os vértices das divisas da frente (junções em T)"""
+    poligonos = {(x0, i): [retangulo(x0 + 10 * i, 0, x0 + 10 * (i + 1), 20)] for i in range(3)}
+    poligonos[(x0, 'fundos')] = [retangulo(x0, 20, x0 + 30, 40)]
+    return poligonos
+
+
+def horarios(poligonos):
+    return {ident: orientar_anel(aneis[0], NORTE, HORARIO) for ident, aneis in poligonos.items()}
+
+
+class SegmentosQuadraTest(unittest.TestCase):
+
+    def test_trechos(self):
+        aneis = horarios({'a': [retangulo(0, 0, 10, 10)], 'b': [retangulo(10, 0, 20, 10)]})
+        indice = SegmentosQuadra(aneis)
+        self.assertEqual(indice.trechos('a'), [('b', [(10, 10), (10, 0)]),
+                                               (None, [(10, 0), (0, 0), (0, 10), (10, 10)])])
+
+    def test_encaixe(self):
+        """Pontas a menos da tolerância uma da outra são o mesmo segmento"""
+        aneis = horarios({'a': [retangulo(0, 0, 10, 10)], 'b': [retangulo(10.001, 0, 20, 10)]})
+        self.assertIn('b', [vizinho for vizinho, _ in SegmentosQuadra(aneis, 0.01).trechos('a')])
+
+    def test_quadras(self):
+        poligonos = quadra(0)
+        poligonos[('x', 0)] = [retangulo(100, 0, 110, 10)]
+        quadras = quadras_por_vertices(horarios(poligonos))
+        self.assertEqual(sorted(len(q) for q in quadras), [1, 4])
+
+
+class TestadasTest(unittest.TestCase):
+
+    def test_sequencia(self):
+        """Começa no norte e segue no sentido horário pelo contorno da quadra"""
+        linhas = list(linhas_lotes(quadra(), vizinhos_por_envelope(quadra()), TESTADA))
+        self.assertEqual([(ident, sequencia) for ident, _, sequencia, _, _ in linhas],
+                         [((0, 'fundos'), 1), ((0, 2), 2), ((0, 1), 3), ((0, 0), 4)])
+        self.assertEqual([comprimento for _, _, _, comprimento, _ in linhas], [70, 30, 10, 30])
+        self.assertEqual(linhas[-1][4], 140)
+        # A testada dos fundos não é partida pelas junções em T da conexão
+        self.assertEqual(linhas[0][1], [(0, 20), (0, 40), (30, 40), (30, 20)])
+
+    def test_inicio(self):
+        aneis = horarios({'a': [retangulo(0, 0, 10, 10)], 'b': [retangulo(10, 0, 20, 10)]})
+        self.assertEqual([ident for ident, *_ in calcular_testadas(aneis, OESTE)], ['a', 'b'])
+
+    def test_cadeias(self):
+        """Testadas fora do encadeamento principal seguem numa nova cadeia"""
+        linhas = [('a', [(0, 10), (10, 10)]), ('b', [(50, 5), (60, 5)]), ('c', [(10, 10), (10, 0)])]
+        self.assertEqual([ident for ident, _ in sequenciar_testadas(linhas)], ['a', 'c', 'b'])
+
+
+class ConfrontacoesTest(unittest.TestCase):
+
+    def test_divisas(self):
+        poligonos = quadra()
+        linhas = list(linhas_lotes(poligonos, vizinhos_por_envelope(poligonos), CONFRONTACAO))
+        pares = {(id1, id2) for id1, id2, _ in linhas}
+        # Cada divisa nos dois sentidos e as testadas com ID1 == ID2
+        self.assertIn(((0, 0), (0, 'fundos')), pares)
+        self.assertIn(((0, 'fundos'), (0, 0)), pares)
+        self.assertIn(((0, 1), (0, 1)), pares)
+        self.assertNotIn(((0, 0), (0, 2)), pares)
+        self.assertEqual(len(linhas), 14)
+
+    def test_sem_conectar(self):
+        """Sem a conexão, a junção em T não é divisa"""
+        poligonos = quadra()
+        linhas = list(linhas_lotes(poligonos, vizinhos_por_envelope(poligonos), CONFRONTACAO, conectar=False))
+        self.assertNotIn((0, 1), {id2 for id1, id2, _ in linhas if id1 == (0, 'fundos')})
+
+    def test_processos(self):
+        poligonos = {}
+        for x0 in range(0, 100 * 150, 100):
+            poligonos.update(quadra(x0))
+        vizinhos = vizinhos_por_envelope(poligonos)
+        for tipo in (TESTADA, CONFRONTACAO):
+            self.assertEqual(list(linhas_lotes(poligonos, vizinhos, tipo, processos=2)),
+                             list(linhas_lotes(poligonos, vizinhos, tipo)))
+
+    def test_cancelado(self):
+        poligonos = quadra()
+        self.assertEqual(list(linhas_lotes(poligonos, vizinhos_por_envelope(poligonos), cancelado=lambda: True)), [])
+        with self.assertRaises(Exception):
+            list(linhas_lotes(poligonos, {}, 'outro'))
+
+
+if __name__ == '__main__':
+    unittest.main()
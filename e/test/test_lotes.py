@@ -0,0 +1,66 @@
+# coding=utf-8
+"""Testes da representação compacta dos lotes."""
+
+import random
+import unittest
+
+from ..lotes import Lote, LotesColunares, IndiceOrdem
+from ..ordem import calcular_nova_ordem, calcular_offset
+
+
+class LotesTest(unittest.TestCase):
+    """Lote e LotesColunares"""
+
+    def test_ida_e_volta(self):
+        """Tuplas entram e saem iguais, com None preservado"""
+        tuplas = [(10, 7, 2), (11, 7, None), (12, 7, 1)]
+        lotes = LotesColunares.de_tuplas(tuplas)
+        self.assertEqual(len(lotes), 3)
+        self.assertEqual(list(lotes.tuplas()), tuplas)
+        self.assertEqual(lotes[1], Lote(11, 7, None))
+
+    def test_reordenados(self):
+        """A rotação colunar é a mesma do cálculo sobre listas"""
+        ordens = [5, 1, None, 3, 2, 4]
+        lotes = LotesColunares.de_quadra(7, enumerate(ordens))
+        for ordem_primeira in range(1, 7):
+            self.assertEqual([lote.ordem for lote in lotes.reordenados(ordem_primeira)],
+                             calcular_nova_ordem(ordens, ordem_primeira))
+
+    def test_compacto(self):
+        """Três colunas de 8 bytes por lote"""
+        lotes = LotesColunares.de_quadra(7, ((i, i) for i in range(1000)))
+        self.assertLess(lotes.bytes_ocupados(), 1000 * 24 * 1.2)
+
+
+class IndiceOrdemTest(unittest.TestCase):
+    """Prévia por busca binária igual ao cálculo completo"""
+
+    def test_previa(self):
+        aleatorio = random.Random(3)
+        # Ordens com lacunas, repetições e nulos
+        ordens = [aleatorio.choice([None] + list(range(1, 30))) for _ in range(40)]
+        lotes = LotesColunares.de_quadra(7, ((100 + i, ordem) for i, ordem in enumerate(ordens)))
+        indice = IndiceOrdem.de_lotes(lotes, ids=list(range(len(ordens))))
+        for ordem_primeira in range(1, 32):
+            novas = calcular_nova_ordem(ordens, ordem_primeira)
+            self.assertEqual(indice.offset(ordem_primeira), calcular_offset(ordens, ordem_primeira))
+            inicio, fim = indice.previa(ordem_primeira, quantidade=4)
+            self.assertEqual(len(inicio) + len(fim), 8)
+            for n_ordem, ordem, matricula in inicio + fim:
+                self.assertEqual(ordens[matricula - 100], ordem)
+                self.assertEqual(novas[matricula - 100], n_ordem)
+            primeiro = indice.primeiro(ordem_primeira)
+            if primeiro is None:
+                self.assertFalse(any(o is not None and o >= ordem_primeira for o in ordens))
+            else:
+                self.assertEqual(indice.matriculas[primeiro], inicio[0][2])
+                self.assertEqual(ordens[indice.ids[primeiro]], inicio[0][1])
+
+    def test_quadra_pequena(self):
+        indice = IndiceOrdem.de_lotes(LotesColunares.de_quadra(7, [(1, 2), (2, 1)]))
+        self.assertEqual(indice.previa(2), ([(1, 2, 1), (2, 1, 2)], []))
+
+
+if __name__ == '__main__':
+    unittest.main()
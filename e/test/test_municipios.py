@@ -0,0 +1,187 @@
+# coding=utf-8
+"""Testes dos perfis de municípios.
+
+Os testes com banco requerem um PostgreSQL local descartável em
+ORGANIZADOR_PG_DSN; sem ele são pulados.
+"""
+
+import json
+import os
+import shutil
+import tempfile
+import unittest
+from unittest import mock
+
+from .. import cli
+from ..municipios import (Municipio, carregar_municipios, obter_municipio, selecionar_municipios,
+                          executar_municipios, PADRAO)
+from ..provisionamento import provisionar_novaordem
+from ..reorganizacao import CAMPOS_LOTES, TABELA_LOTES
+from ..validacao import validar_sql
+
+DSN = os.environ.get('ORGANIZADOR_PG_DSN')
+PREFIXO = 'organizador_teste_municipio_%d' % os.getpid()
+
+try:
+    import psycopg2
+except ImportError:
+    psycopg2 = None
+
+
+def _perfis(conexao):
+    """Dois municípios no mesmo banco: um com os nomes de sempre, outro com colunas próprias"""
+    return {
+        'mogi': {'conexao': conexao, 'esquema': f'{PREFIXO}_mogi', 'tabela_lotes': f'{PREFIXO}_mogi.lotes',
+                 'conexoes': 2},
+        'suzano': {'conexao': conexao, 'esquema': f'{PREFIXO}_suzano', 'tabela_lotes': f'{PREFIXO}_suzano.lotes',
+                   'campos': {'matricula': 'inscricao', 'quadra': 'cod_quadra', 'ordem': 'seq'},
+                   'coluna_geometria': '', 'srid': 31983, 'canal': 'lotes_suzano'},
+    }
+
+
+class MunicipioTest(unittest.TestCase):
+
+    def setUp(self):
+        self.pasta = tempfile.mkdtemp()
+        self.caminho = os.path.join(self.pasta, 'municipios.json')
+        with open(self.caminho, 'w', encoding='utf-8') as arquivo:
+            json.dump(_perfis('service=teste'), arquivo)
+
+    def tearDown(self):
+        shutil.rmtree(self.pasta)
+
+    def test_carregar(self):
+        municipios = carregar_municipios(self.caminho)
+        self.assertEqual(list(municipios), ['mogi', 'suzano'])
+        suzano = municipios['suzano']
+        self.assertEqual(suzano.campos, ('inscricao', 'cod_quadra', 'seq'))
+        self.assertEqual((suzano.srid, suzano.conexoes, suzano.canal), (31983, 1, 'lotes_suzano'))
+        self.assertEqual(suzano.novaordem, f'{PREFIXO}_suzano.novaordem')
+        # Chaves omitidas ficam com os nomes de sempre
+        self.assertEqual(municipios['mogi'].campos, CAMPOS_LOTES)
+        self.assertEqual(municipios['mogi'].camada_quadras, 'Quadra')
+        self.assertEqual((municipios['mogi'].coluna_geometria, suzano.coluna_geometria), ('geom', ''))
+
+    def test_chaves_desconhecidas(self):
+        with self.assertRaises(Exception):
+            Municipio.de_dicionario('x', {'tabela': 'lotes'})
+        with self.assertRaises(Exception):
+            Municipio.de_dicionario('x', {'campos': {'lote': 'id'}})
+        with self.assertRaises(Exception):
+            Municipio.de_dicionario('x', {'conexoes': 0})
+
+    def test_selecionar(self):
+        municipios = carregar_municipios(self.caminho)
+        self.assertEqual([m.nome for m in selecionar_municipios(municipios, 'todos')], ['mogi', 'suzano'])
+        self.assertEqual([m.nome for m in selecionar_municipios(municipios, 'suzano, mogi')], ['suzano', 'mogi'])
+        with self.assertRaises(Exception):
+            selecionar_municipios(municipios, 'aruja')
+
+    def test_obter(self):
+        with mock.patch.dict(os.environ, {'ORGANIZADOR_MUNICIPIOS': self.caminho,
+                                          'ORGANIZADOR_MUNICIPIO': 'suzano'}):
+            self.assertEqual(obter_municipio().nome, 'suzano')
+            self.assertEqual(obter_municipio('mogi').nome, 'mogi')
+        with mock.patch.dict(os.environ, {'ORGANIZADOR_MUNICIPIOS': '', 'ORGANIZADOR_MUNICIPIO': ''}):
+            padrao = obter_municipio()
+            self.assertEqual((padrao.nome, padrao.tabela_lotes), (PADRAO, TABELA_LOTES))
+
+    def test_com(self):
+        municipio = carregar_municipios(self.caminho)['suzano'].com(conexao='service=outra', tabela_lotes=None)
+        self.assertEqual(municipio.conexao, 'service=outra')
+        self.assertEqual(municipio.tabela_lotes, f'{PREFIXO}_suzano.lotes')
+
+
+@unittest.skipUnless(DSN and psycopg2, 'ORGANIZADOR_PG_DSN/psycopg2 indisponíveis')
+class ExecucaoMunicipiosTest(unittest.TestCase):
+    """Dois municípios reorganizados ao mesmo tempo, cada um nas suas tabelas e colunas"""
+
+    def setUp(self):
+        self.pasta = tempfile.mkdtemp()
+        self.caminho = os.path.join(self.pasta, 'municipios.json')
+        with open(self.caminho, 'w', encoding='utf-8') as arquivo:
+            json.dump(_perfis(DSN), arquivo)
+        self.municipios = carregar_municipios(self.caminho)
+        self.conn = psycopg2.connect(DSN)
+        with self.conn, self.conn.cursor() as cursor:
+            for municipio in self.municipios.values():
+                matricula, quadra, ordem = municipio.campos
+                cursor.execute(f'CREATE SCHEMA {municipio.esquema}')
+                cursor.execute(f'CREATE TABLE {municipio.tabela_lotes} '
+                               f'({matricula} bigint, {quadra} integer, {ordem} integer)')
+                cursor.execute(f'INSERT INTO {municipio.tabela_lotes} SELECT q * 100 + i, q, i '
+                               'FROM generate_series(1, 4) q, generate_series(1, 6) i')
+
+    def tearDown(self):
+        shutil.rmtree(self.pasta)
+        with self.conn, self.conn.cursor() as cursor:
+            for municipio in self.municipios.values():
+                cursor.execute(f'DROP SCHEMA IF EXISTS {municipio.esquema} CASCADE')
+        self.conn.close()
+
+    def _novaordem(self, municipio):
+        with self.conn, self.conn.cursor() as cursor:
+            cursor.execute(f'SELECT n_ordem FROM {municipio.novaordem} WHERE ins_quadra = 2 ORDER BY matricula')
+            return [n_ordem for n_ordem, in cursor]
+
+    def test_cli(self):
+        codigo = cli.main(['--municipios', self.caminho, '--municipio', 'todos', '--quadras', '1,2,3',
+                           '--ordem-primeira', '3', '--provisionar'])
+        self.assertEqual(codigo, 0)
+        for municipio in self.municipios.values():
+            self.assertEqual(self._novaordem(municipio), [5, 6, 1, 2, 3, 4])
+            with self.conn, self.conn.cursor() as cursor:
+                cursor.execute(f'SELECT count(*) FROM {municipio.esquema}.novaordem_runs')
+                self.assertEqual(cursor.fetchone()[0], 3)
+            linhas, estatisticas = validar_sql(self.conn, municipio.tabela_lotes, municipio.novaordem,
+                                               campos=municipio.campos)
+            self.assertEqual((linhas, estatisticas['quadras']), ([], 3))
+        self.assertEqual(cli.main(['--municipios', self.caminho, '--municipio', 'suzano', '--validar']), 0)
+
+    def test_falha_isolada(self):
+        """Um município com a tabela de lotes ausente não impede os outros"""
+        mogi = self.municipios['mogi']
+        ausente = self.municipios['suzano'].com(tabela_lotes=f'{PREFIXO}_suzano.nao_existe')
+        for municipio in (mogi, ausente):
+            provisionar_novaordem(self.conn, municipio.esquema)
+        resultados = executar_municipios([(mogi, [(2, 3)], None), (ausente, [(2, 3)], None)], registrar=False)
+        self.assertEqual([r['situacao'] for r in resultados['mogi']], ['gravada'])
+        self.assertEqual([r['situacao'] for r in resultados['suzano']], ['erro'])
+        self.assertEqual(self._novaordem(mogi), [5, 6, 1, 2, 3, 4])
+
+    def test_cli_so_provisionar(self):
+        """--provisionar sem quadras só provisiona as tabelas de cada município"""
+        codigo = cli.main(['--municipios', self.caminho, '--municipio', 'todos', '--provisionar', '--historico'])
+        self.assertEqual(codigo, 0)
+        with self.conn, self.conn.cursor() as cursor:
+            for municipio in self.municipios.values():
+                cursor.execute('SELECT table_name FROM information_schema.tables WHERE table_schema = %s '
+                               'ORDER BY table_name', (municipio.esquema,))
+                self.assertEqual([nome for nome, in cursor], ['lotes', 'novaordem', 'novaordem_checkpoints',
+                                                              'novaordem_historico', 'novaordem_runs'])
+
+    def test_cli_exportar(self):
+        """--exportar usa a coluna de geometria do perfil (a de suzano é vazia: sem geometria)"""
+        self.assertEqual(cli.main(['--municipios', self.caminho, '--municipio', 'suzano', '--quadras', '1,2',
+                                   '--ordem-primeira', '3', '--provisionar']), 0)
+        pasta = os.path.join(self.pasta, 'rotas')
+        with mock.patch('sys.stdout'):
+            codigo = cli.main(['--municipios', self.caminho, '--municipio', 'suzano', '--exportar', pasta])
+        self.assertEqual(codigo, 0)
+        self.assertEqual(len(os.listdir(pasta)), 2)
+
+    def test_cli_falha_ao_preparar(self):
+        """Um município que não conecta nem na preparação não impede os outros"""
+        perfis = _perfis(DSN)
+        perfis['suzano']['conexao'] = 'host=/tmp/organizador_nao_existe dbname=nenhum'
+        with open(self.caminho, 'w', encoding='utf-8') as arquivo:
+            json.dump(perfis, arquivo)
+        with mock.patch('sys.stderr'):
+            codigo = cli.main(['--municipios', self.caminho, '--municipio', 'todos', '--quadras', '1,2,3',
+                               '--ordem-primeira', '3', '--provisionar'])
+        self.assertEqual(codigo, 1)
+        self.assertEqual(self._novaordem(self.municipios['mogi']), [5, 6, 1, 2, 3, 4])
+
+
+if __name__ == '__main__':
+    unittest.main()
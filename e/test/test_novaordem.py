@@ -0,0 +1,105 @@
+# coding=utf-8
+"""Testes dos modos de gravação da novaordem.
+
+Requer um PostgreSQL local descartável em ORGANIZADOR_PG_DSN; sem ele os testes são pulados.
+"""
+
+import os
+import unittest
+
+from ..instrucoes import REGISTRO
+from ..novaordem import (gravar_quadra, existe_quadra, inserir_lote, remover_lote, posicao_lote,
+                         ler_novaordem_quadra, MODO_UPSERT, MODO_SUBSTITUIR)
+from ..provisionamento import provisionar_novaordem
+
+DSN = os.environ.get('ORGANIZADOR_PG_DSN')
+ESQUEMA = 'organizador_teste_gravacao_%d' % os.getpid()
+
+try:
+    import psycopg2
+except ImportError:
+    psycopg2 = None
+
+
+@unittest.skipUnless(DSN and psycopg2, 'ORGANIZADOR_PG_DSN/psycopg2 indisponíveis')
+class GravacaoTest(unittest.TestCase):
+    """Substituir e upsert deixam a quadra com o mesmo conteúdo"""
+
+    def setUp(self):
+        self.conn = psycopg2.connect(DSN)
+        provisionar_novaordem(self.conn, esquema=ESQUEMA)
+
+    def tearDown(self):
+        with self.conn, self.conn.cursor() as cursor:
+            cursor.execute('DROP SCHEMA %s CASCADE' % ESQUEMA)
+        self.conn.close()
+
+    def _conteudo(self, ins_quadra):
+        with self.conn, self.conn.cursor() as cursor:
+            cursor.execute('SELECT matricula, ins_quadra, n_ordem FROM %s.novaordem '
+                           'WHERE ins_quadra = %%s ORDER BY matricula' % ESQUEMA, (ins_quadra,))
+            return cursor.fetchall()
+
+    def test_upsert(self):
+        """O upsert só toca as linhas alteradas e remove as matrículas que saíram"""
+        gravar_quadra(self.conn, 5, [(10, 5, 1), (11, 5, 2), (12, 5, 3)],
+                      modo=MODO_UPSERT, esquema=ESQUEMA)
+        resultado = gravar_quadra(self.conn, 5, [(10, 5, 1), (12, 5, 2), (13, 5, 3)],
+                                  modo=MODO_UPSERT, esquema=ESQUEMA)
+        self.assertEqual((resultado['excluidos'], resultado['inseridos'],
+                          resultado['atualizados'], resultado['inalterados']), (1, 1, 1, 1))
+        self.assertEqual(self._conteudo(5), [(10, 5, 1), (12, 5, 2), (13, 5, 3)])
+
+    def test_modos_equivalentes(self):
+        """Os dois modos produzem o mesmo conteúdo final"""
+        registros = [(20 + i, 6, 5 - i) for i in range(5)]
+        gravar_quadra(self.conn, 6, registros, modo=MODO_SUBSTITUIR, esquema=ESQUEMA)
+        substituido = self._conteudo(6)
+        gravar_quadra(self.conn, 6, registros[::-1], modo=MODO_UPSERT, esquema=ESQUEMA)
+        self.assertEqual(self._conteudo(6), substituido)
+
+    def test_instrucoes_preparadas(self):
+        """Cada instrução é preparada uma vez por conexão e os valores nunca viram SQL"""
+        gravar_quadra(self.conn, 8, [(1, 8, 1)], esquema=ESQUEMA)
+        preparadas = REGISTRO.preparadas(self.conn)
+        gravar_quadra(self.conn, 9, [(2, 9, 1)], esquema=ESQUEMA)
+        self.assertEqual(REGISTRO.preparadas(self.conn), preparadas)
+        with self.conn.cursor() as cursor:
+            cursor.execute('SELECT count(*) FROM pg_prepared_statements')
+            self.assertEqual(cursor.fetchone()[0], len(preparadas))
+        self.conn.rollback()
+
+        with self.assertRaises(psycopg2.DataError):
+            existe_quadra(self.conn, '8; DROP TABLE novaordem', esquema=ESQUEMA)
+        self.assertTrue(existe_quadra(self.conn, 8, esquema=ESQUEMA))
+
+    def test_inserir_remover_lote(self):
+        """Só os lotes depois da posição são deslocados"""
+        gravar_quadra(self.conn, 7, [(70 + i, 7, i) for i in range(1, 6)], esquema=ESQUEMA)
+        resultado = inserir_lote(self.conn, 7, 99, 4, esquema=ESQUEMA)
+        self.assertEqual((resultado['deslocados'], resultado['n_ordem']), (2, 4))
+        self.assertEqual([m for m, _, _ in self._conteudo(7)], [71, 72, 73, 74, 75, 99])
+        self.assertEqual(posicao_lote(self.conn, 7, 99, esquema=ESQUEMA), (4, 6))
+        self.assertEqual(posicao_lote(self.conn, 7, 75, esquema=ESQUEMA), (6, 6))
+
+        resultado = remover_lote(self.conn, 7, 72, esquema=ESQUEMA)
+        self.assertEqual((resultado['deslocados'], resultado['n_ordem']), (4, 2))
+        self.assertEqual(self._conteudo(7), [(71, 7, 1), (73, 7, 2), (74, 7, 4), (75, 7, 5), (99, 7, 3)])
+
+        inserir_lote(self.conn, 7, 100, 6, esquema=ESQUEMA)
+        self.assertEqual(posicao_lote(self.conn, 7, 100, esquema=ESQUEMA), (6, 6))
+        for operacao in (lambda: inserir_lote(self.conn, 7, 71, 1, esquema=ESQUEMA),
+                         lambda: inserir_lote(self.conn, 7, 101, 8, esquema=ESQUEMA),
+                         lambda: remover_lote(self.conn, 7, 72, esquema=ESQUEMA)):
+            with self.assertRaises(Exception):
+                operacao()
+        self.assertEqual(len(self._conteudo(7)), 6)
+
+    def test_ler_novaordem_quadra(self):
+        gravar_quadra(self.conn, 4, [(41, 4, 2), (42, 4, 1)], esquema=ESQUEMA)
+        self.assertEqual(ler_novaordem_quadra(self.conn, 4, esquema=ESQUEMA), [(42, 1), (41, 2)])
+        self.assertEqual(ler_novaordem_quadra(self.conn, 5, esquema=ESQUEMA), [])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,27 @@
+# coding=utf-8
+"""Testes da regra de reordenação dos lotes."""
+
+import unittest
+
+from ..ordem import calcular_nova_ordem, calcular_offset
+
+
+class OrdemTest(unittest.TestCase):
+    """Rotação da sequência a partir da ordem da primeira"""
+
+    def test_rotacao(self):
+        """O lote com ordem_primeira vira o 1 e os anteriores vão para o fim"""
+        self.assertEqual(calcular_nova_ordem([1, 2, 3, 4, 5], 3), [4, 5, 1, 2, 3])
+
+    def test_ordem_primeira_um(self):
+        """ordem_primeira = 1 mantém a sequência"""
+        self.assertEqual(calcular_nova_ordem([3, 1, 2], 1), [3, 1, 2])
+
+    def test_ordem_nula(self):
+        """Ordens nulas continuam nulas e não contam no deslocamento"""
+        self.assertEqual(calcular_offset([None, 2, 3], 2), 2)
+        self.assertEqual(calcular_nova_ordem([None, 1, 2, 3], 2), [None, 3, 1, 2])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,81 @@
+# coding=utf-8
+"""Testes do núcleo do algoritmo 'Orientar polígonos'."""
+
+import unittest
+
+from ..conectar_poligonos import vizinhos_por_envelope
+from ..orientacao_poligonos import (orientar_anel, orientar_poligonos, area_assinada, segmentos_divisa,
+                                    primeiro_vertice_testada, HORARIO, ANTI_HORARIO, MANTER, SEQUENCIA, NORTE,
+                                    SUL, OESTE)
+
+
+def retangulo(xmin, ymin, xmax, ymax):
+    """Anel fechado no sentido anti-horário, começando no canto sudoeste"""
+    return [(xmin, ymin), (xmax, ymin), (xmax, ymax), (xmin, ymax), (xmin, ymin)]
+
+
+class OrientarAnelTest(unittest.TestCase):
+
+    def test_sentido(self):
+        anel = retangulo(0, 0, 10, 5)
+        self.assertGreater(area_assinada(anel), 0)
+        horario = orientar_anel(anel, SEQUENCIA, HORARIO)
+        self.assertLess(area_assinada(horario), 0)
+        # Inverter mantém o primeiro vértice e o anel fechado
+        self.assertEqual(horario, [(0, 0), (0, 5), (10, 5), (10, 0), (0, 0)])
+        self.assertEqual(orientar_anel(anel, SEQUENCIA, ANTI_HORARIO), anel)
+        self.assertEqual(orientar_anel(horario, SEQUENCIA, MANTER), horario)
+
+    def test_primeiro(self):
+        anel = [(0, 0), (10, 0), (12, 6), (4, 9), (-3, 4), (0, 0)]
+        self.assertEqual(orientar_anel(anel, NORTE, ANTI_HORARIO)[0], (4, 9))
+        self.assertEqual(orientar_anel(anel, SUL, ANTI_HORARIO)[0], (0, 0))
+        self.assertEqual(orientar_anel(anel, OESTE, HORARIO)[:2], [(-3, 4), (4, 9)])
+
+
+class TestadaTest(unittest.TestCase):
+    """Quadra de 2 x 2 lotes: cada um faz divisa com dois vizinhos e tem duas testadas"""
+
+    def setUp(self):
+        self.lotes = {
+            'sw': [[retangulo(0, 0, 10, 10)]], 'se': [[retangulo(10, 0, 20, 10)]],
+            'nw': [[retangulo(0, 10, 10, 20)]], 'ne': [[retangulo(10, 10, 20, 20)]],
+        }
+        self.vizinhos = vizinhos_por_envelope({ident: partes[0] for ident, partes in self.lotes.items()})
+
+    def test_divisas(self):
+        anel = orientar_anel(self.lotes['sw'][0][0], NORTE, HORARIO)
+        # (0,10) -> (10,10) -> (10,0) -> (0,0): divisa com nw, divisa com se, rua, rua
+        vizinhos = [self.lotes['nw'][0][0], self.lotes['se'][0][0]]
+        divisas = segmentos_divisa(anel, vizinhos)
+        self.assertEqual(divisas, [True, True, False, False])
+        self.assertEqual(primeiro_vertice_testada(divisas), 2)
+        self.assertIsNone(primeiro_vertice_testada([False] * 4))
+        self.assertIsNone(primeiro_vertice_testada([True] * 4))
+        # A divisa no fim do anel conta para o primeiro vértice (o anel é circular)
+        self.assertEqual(primeiro_vertice_testada([False, False, True]), 0)
+
+    def test_uma_passada(self):
+        resultado = {ident: (partes, quantidade) for ident, partes, quantidade
+                     in orientar_poligonos(self.lotes, self.vizinhos, NORTE, HORARIO, testada=True)}
+        self.assertEqual(sum(quantidade for _, quantidade in resultado.values()), 4)
+        # Começam onde a divisa termina e a rua começa, no sentido horário
+        self.assertEqual(resultado['sw'][0][0][0][:2], [(10, 0), (0, 0)])
+        self.assertEqual(resultado['ne'][0][0][0][:2], [(10, 20), (20, 20)])
+        for partes, _ in resultado.values():
+            self.assertLess(area_assinada(partes[0][0]), 0)
+
+    def test_selecionados(self):
+        """Só os selecionados saem, mas os demais continuam vizinhos"""
+        resultado = list(orientar_poligonos(self.lotes, self.vizinhos, testada=True, selecionados=['se']))
+        self.assertEqual([(ident, quantidade) for ident, _, quantidade in resultado], [('se', 1)])
+
+    def test_sem_testada(self):
+        """Lote isolado (ou sem a opção) fica no vértice de 'primeiro'"""
+        lotes = {'a': [[retangulo(0, 0, 10, 10)]]}
+        (_, partes, quantidade), = orientar_poligonos(lotes, {'a': []}, NORTE, HORARIO, testada=True)
+        self.assertEqual((partes[0][0][0], quantidade), ((0, 10), 0))
+
+
+if __name__ == '__main__':
+    unittest.main()
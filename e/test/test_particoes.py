@@ -0,0 +1,118 @@
+# coding=utf-8
+"""Testes da novaordem particionada por faixas de ins_quadra.
+
+Os testes com banco requerem um PostgreSQL local descartável em ORGANIZADOR_PG_DSN;
+sem ele são pulados.
+"""
+
+import os
+import unittest
+
+from ..novaordem import gravar_quadra, desfazer_quadras, MODO_UPSERT
+from ..particoes import (Particao, faixas, nome_particao, tipo_tabela, listar_particoes, criar_particoes,
+                         remover_particao, recarregar_particao, PADRAO)
+from ..provisionamento import provisionar_novaordem, provisionar_historico
+from ..reorganizacao import FonteLotesMemoria
+
+DSN = os.environ.get('ORGANIZADOR_PG_DSN')
+ESQUEMA = 'organizador_teste_particoes_%d' % os.getpid()
+
+try:
+    import psycopg2
+except ImportError:
+    psycopg2 = None
+
+
+class FaixasTest(unittest.TestCase):
+
+    def test_faixas(self):
+        self.assertEqual(faixas(0, 25, 10), [Particao('0_9', 0, 10), Particao('10_19', 10, 20),
+                                             Particao('20_24', 20, 25)])
+        with self.assertRaises(Exception):
+            faixas(10, 10, 5)
+
+    def test_nome(self):
+        self.assertEqual(nome_particao('Vila São João'), 'vila_sao_joao')
+
+
+@unittest.skipUnless(DSN and psycopg2, 'ORGANIZADOR_PG_DSN/psycopg2 indisponíveis')
+class ParticoesTest(unittest.TestCase):
+
+    def setUp(self):
+        self.conn = psycopg2.connect(DSN)
+        provisionar_novaordem(self.conn, esquema=ESQUEMA)
+        for ins_quadra in (5, 15, 25):
+            gravar_quadra(self.conn, ins_quadra, [(ins_quadra * 10 + i, ins_quadra, i) for i in (1, 2, 3)],
+                          esquema=ESQUEMA)
+
+    def tearDown(self):
+        with self.conn, self.conn.cursor() as cursor:
+            cursor.execute('DROP SCHEMA %s CASCADE' % ESQUEMA)
+        self.conn.close()
+
+    def _por_particao(self):
+        with self.conn, self.conn.cursor() as cursor:
+            cursor.execute('SELECT tableoid::regclass::text, ins_quadra, count(*) FROM %s.novaordem '
+                           'GROUP BY 1, 2 ORDER BY 2' % ESQUEMA)
+            return [(tabela.split('.')[-1], ins_quadra, total) for tabela, ins_quadra, total in cursor.fetchall()]
+
+    def test_converter(self):
+        """A novaordem existente é convertida e as partições novas recebem as quadras da padrão"""
+        self.assertEqual(tipo_tabela(self.conn, ESQUEMA), 'r')
+        provisionar_novaordem(self.conn, esquema=ESQUEMA, particionada=True)
+        self.assertEqual(tipo_tabela(self.conn, ESQUEMA), 'p')
+        self.assertEqual({tabela for tabela, _, _ in self._por_particao()}, {'novaordem_padrao'})
+        criadas = criar_particoes(self.conn, faixas(10, 30, 10), ESQUEMA)
+        self.assertEqual([particao.nome for particao in criadas], ['10_19', '20_29'])
+        self.assertEqual(criar_particoes(self.conn, faixas(10, 30, 10), ESQUEMA), [])
+        self.assertEqual(self._por_particao(), [('novaordem_padrao', 5, 3), ('novaordem_10_19', 15, 3),
+                                                ('novaordem_20_29', 25, 3)])
+        # Upsert numa partição
+        resultado = gravar_quadra(self.conn, 15, [(151, 15, 2), (152, 15, 1), (159, 15, 3)],
+                                  modo=MODO_UPSERT, esquema=ESQUEMA)
+        self.assertEqual((resultado['excluidos'], resultado['inseridos'], resultado['atualizados']), (1, 1, 2))
+
+    def test_recarregar(self):
+        provisionar_novaordem(self.conn, esquema=ESQUEMA, particionada=True)
+        criar_particoes(self.conn, faixas(10, 20, 10), ESQUEMA)
+        fonte = FonteLotesMemoria({12: [(121, 1), (122, 2)], 15: [(151, 1), (152, 2)]})
+        resultados = recarregar_particao(self.conn, '10_19', [(12, 1), (15, 2)], fonte, ESQUEMA)
+        self.assertEqual([r['inseridos'] for r in resultados], [2, 2])
+        self.assertEqual(self._por_particao(), [('novaordem_padrao', 5, 3), ('novaordem_10_19', 12, 2),
+                                                ('novaordem_10_19', 15, 2), ('novaordem_padrao', 25, 3)])
+        # Sem manter_demais só ficam as quadras recarregadas
+        recarregar_particao(self.conn, '10_19', [(15, 1)], fonte, ESQUEMA, manter_demais=False)
+        self.assertEqual(self._por_particao(), [('novaordem_padrao', 5, 3), ('novaordem_10_19', 15, 2),
+                                                ('novaordem_padrao', 25, 3)])
+        with self.assertRaises(Exception):
+            recarregar_particao(self.conn, '10_19', [(25, 1)], fonte, ESQUEMA)
+
+    def test_recarregar_com_historico(self):
+        """A troca guarda no histórico a versão anterior das quadras refeitas, para desfazer"""
+        provisionar_novaordem(self.conn, esquema=ESQUEMA, particionada=True)
+        provisionar_historico(self.conn, esquema=ESQUEMA)
+        criar_particoes(self.conn, faixas(10, 20, 10), ESQUEMA)
+        fonte = FonteLotesMemoria({15: [(151, 1), (152, 2)]})
+        recarregar_particao(self.conn, '10_19', [(15, 2)], fonte, ESQUEMA)
+        self.assertEqual(self._conteudo(15), [152, 151])
+        self.assertEqual(desfazer_quadras(self.conn, [15], esquema=ESQUEMA), {15: (2, 3)})
+        self.assertEqual(self._conteudo(15), [151, 152, 153])
+
+    def _conteudo(self, ins_quadra):
+        with self.conn, self.conn.cursor() as cursor:
+            cursor.execute('SELECT matricula FROM %s.novaordem WHERE ins_quadra = %%s ORDER BY n_ordem'
+                           % ESQUEMA, (ins_quadra,))
+            return [matricula for matricula, in cursor.fetchall()]
+
+    def test_remover(self):
+        provisionar_novaordem(self.conn, esquema=ESQUEMA, particionada=True)
+        criar_particoes(self.conn, faixas(10, 20, 10), ESQUEMA)
+        remover_particao(self.conn, '10_19', ESQUEMA)
+        self.assertEqual([particao.nome for particao in listar_particoes(self.conn, ESQUEMA)], [PADRAO])
+        self.assertIn(('novaordem_padrao', 15, 3), self._por_particao())
+        with self.assertRaises(Exception):
+            remover_particao(self.conn, PADRAO, ESQUEMA)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,61 @@
+# coding=utf-8
+"""Testes do modo de perfilamento."""
+
+import os
+import shutil
+import tempfile
+import threading
+import unittest
+from unittest import mock
+
+from .. import perfil
+from ..perfil import perfilar, perfilado, perfilar_trabalhador, VARIAVEL_AMBIENTE, VARIAVEL_PASTA
+
+
+class PerfilTest(unittest.TestCase):
+
+    def setUp(self):
+        self.pasta = tempfile.mkdtemp()
+        self.ambiente = mock.patch.dict(os.environ, {VARIAVEL_PASTA: self.pasta})
+        self.ambiente.start()
+
+    def tearDown(self):
+        self.ambiente.stop()
+        shutil.rmtree(self.pasta)
+
+    def test_desligado(self):
+        """Desligado, nada é gravado e o resultado passa direto"""
+        os.environ[VARIAVEL_AMBIENTE] = '0'
+        self.assertEqual(perfilado('teste')(lambda x: x + 1)(1), 2)
+        self.assertEqual(os.listdir(self.pasta), [])
+
+    def test_ligado(self):
+        os.environ[VARIAVEL_AMBIENTE] = '1'
+
+        def trabalho():
+            with perfilar_trabalhador('trabalhador-0'):
+                sum(range(10000))
+
+        with perfilar('teste') as pasta:
+            self.assertIsNotNone(pasta)
+            # Execuções não se aninham
+            with perfilar('interna') as interna:
+                self.assertIsNone(interna)
+            thread = threading.Thread(target=trabalho)
+            thread.start()
+            thread.join()
+            dados = [bytearray(1024) for _ in range(100)]
+        self.assertEqual(len(dados), 100)
+
+        self.assertEqual(os.listdir(self.pasta), [os.path.basename(pasta)])
+        arquivos = set(os.listdir(pasta))
+        self.assertTrue({'perfil.prof', 'memoria.snapshot', 'resumo.txt'} <= arquivos)
+        with open(os.path.join(pasta, 'resumo.txt'), encoding='utf-8') as arquivo:
+            resumo = arquivo.read()
+        self.assertIn('Execução: teste', resumo)
+        self.assertIn('Pico de memória', resumo)
+        self.assertIsNone(perfil._atual)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -15,10 +15,13 @@ __copyright__ = ('Copyright 2012, Australia Indonesia Facility for '
 
 import os
 import unittest
-from qgis.core import (
-    QgsProviderRegistry,
-    QgsCoordinateReferenceSystem,
-    QgsRasterLayer)
+try:
+    from qgis.core import (
+        QgsProviderRegistry,
+        QgsCoordinateReferenceSystem,
+        QgsRasterLayer)
+except ImportError:
+    raise unittest.SkipTest('QGIS indisponível')
 
 from .utilities import get_qgis_app
 QGIS_APP = get_qgis_app()
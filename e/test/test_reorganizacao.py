@@ -0,0 +1,124 @@
+# coding=utf-8
+"""Testes do fluxo leitura -> cálculo -> gravação com fonte e destino em memória.
+
+Rodam sem QGIS nem banco. A comparação do destino em memória com o
+PostgreSQL requer ORGANIZADOR_PG_DSN; sem ele esse teste é pulado.
+"""
+
+import os
+import threading
+import unittest
+
+from ..execucao_quadras import executar_quadras
+from ..novaordem import GRAVADA, OCUPADA, MODO_SUBSTITUIR, MODO_UPSERT
+from ..ordem import calcular_nova_ordem
+from ..provisionamento import provisionar_novaordem
+from ..reorganizacao import (FonteLotesMemoria, DestinoMemoria, DestinoBanco, backend_memoria,
+                             reorganizar, reorganizar_lotes)
+
+DSN = os.environ.get('ORGANIZADOR_PG_DSN')
+ESQUEMA = 'organizador_teste_fluxo_%d' % os.getpid()
+
+try:
+    import psycopg2
+except ImportError:
+    psycopg2 = None
+
+
+def _quadras(quantidade=20, lotes=15):
+    return {q: [(q * 1000 + i, i + 1) for i in range(lotes)] for q in range(1, quantidade + 1)}
+
+
+class FluxoMemoriaTest(unittest.TestCase):
+    """O fluxo completo sem QGIS e sem banco"""
+
+    def test_reorganizar(self):
+        fonte = FonteLotesMemoria({7: [(10, 1), (11, 2), (12, 3), (13, None)]})
+        destino = DestinoMemoria()
+        resultado = reorganizar(fonte, destino, 7, 2)
+        self.assertEqual(resultado['situacao'], GRAVADA)
+        self.assertEqual((resultado['excluidos'], resultado['inseridos']), (0, 4))
+        self.assertEqual(set(resultado['duracoes']), {'leitura', 'calculo', 'gravacao'})
+        self.assertEqual(destino.quadras[7], dict(zip([10, 11, 12, 13],
+                                                      calcular_nova_ordem([1, 2, 3, None], 2))))
+
+        # Substituir exclui tudo; upsert só conta o que mudou
+        self.assertEqual(reorganizar(fonte, destino, 7, 2)['excluidos'], 4)
+        resultado = reorganizar(fonte, destino, 7, 3, modo=MODO_UPSERT)
+        self.assertEqual((resultado['excluidos'], resultado['inseridos'], resultado['atualizados'],
+                          resultado['inalterados']), (0, 0, 3, 1))
+
+    def test_quadra_ocupada(self):
+        destino = DestinoMemoria()
+        destino._travas[7].acquire()
+        try:
+            resultado = reorganizar(FonteLotesMemoria({7: [(10, 1)]}), destino, 7, 1, aguardar=False)
+        finally:
+            destino._travas[7].release()
+        self.assertEqual(resultado['situacao'], OCUPADA)
+        self.assertNotIn(7, destino.quadras)
+
+    def test_executar_quadras(self):
+        """O executor em lote, com várias threads, sobre o backend em memória"""
+        quadras = _quadras()
+        fonte, destino = FonteLotesMemoria(quadras), DestinoMemoria()
+        tarefas = [(q, (q % 15) + 1) for q in quadras]
+        resultados = executar_quadras(None, tarefas, trabalhadores=4, registrar=False, lote='l',
+                                      backend=backend_memoria(fonte, destino))
+        self.assertEqual(sorted(r['ins_quadra'] for r in resultados), sorted(quadras))
+        self.assertTrue(all(r['situacao'] == GRAVADA for r in resultados))
+        self.assertEqual(destino.checkpoints, {('l', q): p for q, p in tarefas})
+        for q, p in tarefas:
+            ordens = [ordem for _, ordem in quadras[q]]
+            self.assertEqual(list(destino.quadras[q].values()), calcular_nova_ordem(ordens, p))
+
+    def test_escritores_concorrentes(self):
+        """O bloqueio por quadra do destino em memória serializa os escritores"""
+        destino = DestinoMemoria()
+        fonte = FonteLotesMemoria(_quadras(1, 50))
+        situacoes = []
+
+        def escritor(ordem_primeira):
+            for _ in range(20):
+                situacoes.append(reorganizar(fonte, destino, 1, ordem_primeira)['situacao'])
+
+        threads = [threading.Thread(target=escritor, args=(i + 1,)) for i in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(situacoes.count(GRAVADA), 160)
+        self.assertEqual(sorted(destino.quadras[1].values()), list(range(1, 51)))
+
+
+@unittest.skipUnless(DSN and psycopg2, 'ORGANIZADOR_PG_DSN/psycopg2 indisponíveis')
+class DestinoEquivalenteTest(unittest.TestCase):
+    """DestinoMemoria e DestinoBanco dão os mesmos resultados"""
+
+    def setUp(self):
+        self.conn = psycopg2.connect(DSN)
+        provisionar_novaordem(self.conn, esquema=ESQUEMA)
+
+    def tearDown(self):
+        with self.conn, self.conn.cursor() as cursor:
+            cursor.execute('DROP SCHEMA %s CASCADE' % ESQUEMA)
+        self.conn.close()
+
+    def test_mesmos_resultados(self):
+        memoria, banco = DestinoMemoria(), DestinoBanco(self.conn, esquema=ESQUEMA)
+        fonte = FonteLotesMemoria({5: [(10, 1), (11, 2), (12, 3)]})
+        chaves = ('situacao', 'excluidos', 'inseridos', 'atualizados', 'inalterados')
+        for modo, ordem_primeira in ((MODO_SUBSTITUIR, 1), (MODO_UPSERT, 2), (MODO_UPSERT, 2),
+                                     (MODO_SUBSTITUIR, 3)):
+            lotes = fonte.ler_quadra(5)
+            esperado = reorganizar_lotes(memoria, 5, lotes, ordem_primeira, modo=modo)
+            obtido = reorganizar_lotes(banco, 5, lotes, ordem_primeira, modo=modo)
+            self.assertEqual({c: esperado.get(c) for c in chaves}, {c: obtido.get(c) for c in chaves})
+
+        with self.conn, self.conn.cursor() as cursor:
+            cursor.execute('SELECT matricula, n_ordem FROM %s.novaordem WHERE ins_quadra = 5' % ESQUEMA)
+            self.assertEqual(dict(cursor.fetchall()), memoria.quadras[5])
+
+
+if __name__ == '__main__':
+    unittest.main()
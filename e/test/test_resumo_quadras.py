@@ -0,0 +1,96 @@
+# coding=utf-8
+"""Testes do cache de resumo das quadras.
+
+O carregamento requer um PostgreSQL local descartável em ORGANIZADOR_PG_DSN;
+sem ele esses testes são pulados.
+"""
+
+import os
+import unittest
+
+from ..execucoes import Execucao, MOTOR_BANCO
+from ..lotes import LotesColunares
+from ..novaordem import gravar_quadra, GRAVADA, MODO_SUBSTITUIR
+from ..provisionamento import provisionar_novaordem, provisionar_execucoes
+from ..resumo_quadras import CacheResumoQuadras
+
+DSN = os.environ.get('ORGANIZADOR_PG_DSN')
+ESQUEMA = 'organizador_teste_resumo_%d' % os.getpid()
+
+try:
+    import psycopg2
+except ImportError:
+    psycopg2 = None
+
+
+class ResumoLocalTest(unittest.TestCase):
+    """Atualização incremental e validação, sem banco"""
+
+    def test_registrar_reorganizacao(self):
+        cache = CacheResumoQuadras()
+        cache.registrar_reorganizacao(5, LotesColunares.de_quadra(5, [(1, 3), (2, None), (3, 7)]))
+        resumo = cache.get(5)
+        self.assertEqual((resumo.lotes, resumo.ordem_minima, resumo.ordem_maxima, resumo.reorganizada),
+                         (3, 3, 7, True))
+        self.assertIsNotNone(resumo.ultima_reorganizacao)
+
+    def test_validar_ordem_primeira(self):
+        cache = CacheResumoQuadras()
+        # Antes de carregar não há como validar
+        self.assertIsNone(cache.validar_ordem_primeira(5, 100))
+        cache.registrar_reorganizacao(5, LotesColunares.de_quadra(5, [(1, 1), (2, 2), (3, 3)]))
+        self.assertIsNone(cache.validar_ordem_primeira(5, 3))
+        self.assertIn('entre 1 e 3', cache.validar_ordem_primeira(5, 4))
+        # Quadra desconhecida só é erro depois de um carregamento completo
+        self.assertIsNone(cache.validar_ordem_primeira(6, 1))
+
+
+@unittest.skipUnless(DSN and psycopg2, 'ORGANIZADOR_PG_DSN/psycopg2 indisponíveis')
+class ResumoCarregamentoTest(unittest.TestCase):
+    """O resumo de todas as quadras vem de uma consulta"""
+
+    def setUp(self):
+        self.conn = psycopg2.connect(DSN)
+        provisionar_novaordem(self.conn, esquema=ESQUEMA)
+        with self.conn, self.conn.cursor() as cursor:
+            cursor.execute('CREATE TABLE %s.lotes (matricula integer, ins_quadra integer, ordem integer)'
+                           % ESQUEMA)
+            cursor.execute('INSERT INTO %s.lotes VALUES (1, 1, 2), (2, 1, 3), (3, 1, 9), (4, 2, NULL)'
+                           % ESQUEMA)
+
+    def tearDown(self):
+        with self.conn, self.conn.cursor() as cursor:
+            cursor.execute('DROP SCHEMA %s CASCADE' % ESQUEMA)
+        self.conn.close()
+
+    def _carregar(self):
+        cache = CacheResumoQuadras()
+        self.assertEqual(cache.carregar(self.conn, ESQUEMA + '.lotes', 'teste', esquema=ESQUEMA), 2)
+        self.assertFalse(cache.vencido('teste'))
+        self.assertTrue(cache.vencido('outra'))
+        return cache
+
+    def test_sem_livro_de_execucoes(self):
+        cache = self._carregar()
+        resumo = cache.get(1)
+        self.assertEqual((resumo.lotes, resumo.ordem_minima, resumo.ordem_maxima, resumo.reorganizada,
+                          resumo.ultima_reorganizacao), (3, 2, 9, False, None))
+        self.assertIsNone(cache.get(2).ordem_maxima)
+        self.assertIn('não têm ordem', cache.validar_ordem_primeira(2, 1))
+        self.assertIn('não tem lotes', cache.validar_ordem_primeira(3, 1))
+
+    def test_reorganizada(self):
+        provisionar_execucoes(self.conn, esquema=ESQUEMA)
+        gravar_quadra(self.conn, 1, [(1, 1, 1), (2, 1, 2), (3, 1, 3)], esquema=ESQUEMA)
+        execucao = Execucao('teste', MOTOR_BANCO, MODO_SUBSTITUIR)
+        execucao.adicionar({'ins_quadra': 1, 'situacao': GRAVADA})
+        execucao.gravar(self.conn, esquema=ESQUEMA)
+
+        cache = self._carregar()
+        self.assertTrue(cache.get(1).reorganizada)
+        self.assertEqual(cache.get(1).ultima_reorganizacao, execucao.fim)
+        self.assertFalse(cache.get(2).reorganizada)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,91 @@
+# coding=utf-8
+"""Testes dos lotes retomáveis.
+
+Requer um PostgreSQL local descartável em ORGANIZADOR_PG_DSN; sem ele os
+testes com banco são pulados.
+"""
+
+import os
+import unittest
+
+from ..novaordem import gravar_quadra, bloquear_quadra, GRAVADA, OCUPADA
+from ..provisionamento import provisionar_novaordem, provisionar_checkpoints
+from ..retomada import identificar_lote, preparar_lote, quadras_concluidas
+
+DSN = os.environ.get('ORGANIZADOR_PG_DSN')
+ESQUEMA = 'organizador_teste_retomada_%d' % os.getpid()
+
+try:
+    import psycopg2
+except ImportError:
+    psycopg2 = None
+
+
+class IdentificadorTest(unittest.TestCase):
+
+    def test_estavel(self):
+        """A ordem das tarefas não muda o lote; quadra, ordem, tabela e modo mudam"""
+        tarefas = [(1, 1), (2, 3), (3, 1)]
+        lote = identificar_lote(tarefas, 'a.lotes', 'upsert')
+        self.assertEqual(lote, identificar_lote(tarefas[::-1], 'a.lotes', 'upsert'))
+        self.assertNotEqual(lote, identificar_lote([(1, 1), (2, 4), (3, 1)], 'a.lotes', 'upsert'))
+        self.assertNotEqual(lote, identificar_lote(tarefas, 'b.lotes', 'upsert'))
+        self.assertNotEqual(lote, identificar_lote(tarefas, 'a.lotes', 'substituir'))
+
+
+@unittest.skipUnless(DSN and psycopg2, 'ORGANIZADOR_PG_DSN/psycopg2 indisponíveis')
+class RetomadaTest(unittest.TestCase):
+    """Só as quadras confirmadas ficam marcadas e a retomada faz o resto"""
+
+    def setUp(self):
+        self.conn = psycopg2.connect(DSN)
+        provisionar_novaordem(self.conn, esquema=ESQUEMA)
+        provisionar_checkpoints(self.conn, esquema=ESQUEMA)
+
+    def tearDown(self):
+        with self.conn, self.conn.cursor() as cursor:
+            cursor.execute('DROP SCHEMA %s CASCADE' % ESQUEMA)
+        self.conn.close()
+
+    def _gravar(self, ins_quadra, ordem_primeira, lote, aguardar=True):
+        return gravar_quadra(self.conn, ins_quadra, [(ins_quadra * 10, ins_quadra, 1)], aguardar=aguardar,
+                             esquema=ESQUEMA, ponto_controle=(lote, ordem_primeira))
+
+    def test_retomar(self):
+        tarefas = [(q, 1) for q in range(1, 6)]
+        lote = identificar_lote(tarefas, 'lotes', 'substituir')
+        self.assertEqual(preparar_lote(self.conn, lote, tarefas, esquema=ESQUEMA), tarefas)
+
+        # A execução "cai" depois de duas quadras; a terceira estava ocupada
+        for ins_quadra, ordem_primeira in tarefas[:2]:
+            self.assertEqual(self._gravar(ins_quadra, ordem_primeira, lote)['situacao'], GRAVADA)
+        outra = psycopg2.connect(DSN)
+        try:
+            with outra.cursor() as cursor:
+                bloquear_quadra(cursor, 3, esquema=ESQUEMA)
+                self.assertEqual(self._gravar(3, 1, lote, aguardar=False)['situacao'], OCUPADA)
+            outra.rollback()
+        finally:
+            outra.close()
+
+        self.assertEqual(quadras_concluidas(self.conn, lote, esquema=ESQUEMA), {1: 1, 2: 1})
+        self.assertEqual(preparar_lote(self.conn, lote, tarefas, retomar=True, esquema=ESQUEMA), tarefas[2:])
+
+    def test_mesma_transacao(self):
+        """Se o ponto de controle falha, a gravação da quadra é desfeita junto"""
+        with self.assertRaises(psycopg2.Error):
+            # ordem_primeira fora do intervalo de integer
+            gravar_quadra(self.conn, 1, [(10, 1, 1)], esquema=ESQUEMA, ponto_controle=('lote', 2 ** 40))
+        with self.conn, self.conn.cursor() as cursor:
+            cursor.execute('SELECT count(*) FROM %s.novaordem' % ESQUEMA)
+            self.assertEqual(cursor.fetchone(), (0,))
+        self.assertEqual(quadras_concluidas(self.conn, 'lote', esquema=ESQUEMA), {})
+
+    def test_sem_retomar_reinicia(self):
+        self._gravar(1, 1, 'lote')
+        self.assertEqual(preparar_lote(self.conn, 'lote', [(1, 1)], esquema=ESQUEMA), [(1, 1)])
+        self.assertEqual(quadras_concluidas(self.conn, 'lote', esquema=ESQUEMA), {})
+
+
+if __name__ == '__main__':
+    unittest.main()
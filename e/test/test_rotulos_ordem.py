@@ -0,0 +1,60 @@
+# coding=utf-8
+"""Testes da consulta dos pontos de rótulo da novaordem.
+
+Requer um PostgreSQL local descartável em ORGANIZADOR_PG_DSN; sem ele os
+testes são pulados. A geometria (PostGIS) não é exercitada aqui.
+"""
+
+import os
+import unittest
+
+from ..provisionamento import provisionar_novaordem
+from ..rotulos_ordem import ler_rotulos
+
+DSN = os.environ.get('ORGANIZADOR_PG_DSN')
+ESQUEMA = 'organizador_teste_rotulos_%d' % os.getpid()
+
+try:
+    import psycopg2
+except ImportError:
+    psycopg2 = None
+
+
+@unittest.skipUnless(DSN and psycopg2, 'ORGANIZADOR_PG_DSN/psycopg2 indisponíveis')
+class RotulosTest(unittest.TestCase):
+
+    def setUp(self):
+        self.conn = psycopg2.connect(DSN)
+        provisionar_novaordem(self.conn, esquema=ESQUEMA)
+        with self.conn, self.conn.cursor() as cursor:
+            cursor.execute(f'CREATE TABLE {ESQUEMA}.lotes (matricula integer, ins_quadra integer, ordem integer)')
+            cursor.execute(f'INSERT INTO {ESQUEMA}.lotes SELECT q * 100 + i, q, i '
+                           'FROM generate_series(1, 3) q, generate_series(1, 4) i')
+            # A matrícula 104 saiu da origem, mas continua na novaordem
+            cursor.execute(f'DELETE FROM {ESQUEMA}.lotes WHERE matricula = 104')
+            cursor.execute(f'INSERT INTO {ESQUEMA}.novaordem (matricula, ins_quadra, n_ordem) '
+                           f'SELECT q * 100 + i, q, 5 - i FROM generate_series(1, 2) q, generate_series(1, 4) i')
+
+    def tearDown(self):
+        with self.conn, self.conn.cursor() as cursor:
+            cursor.execute('DROP SCHEMA %s CASCADE' % ESQUEMA)
+        self.conn.close()
+
+    def _ler(self, quadras=None):
+        return ler_rotulos(self.conn, quadras, coluna_geometria=None, tabela_lotes=f'{ESQUEMA}.lotes',
+                           esquema=ESQUEMA)
+
+    def test_todas(self):
+        rotulos = self._ler()
+        self.assertEqual(sorted(rotulos), [1, 2])
+        self.assertEqual(sorted(rotulos[1]), [(101, 4, None, None), (102, 3, None, None), (103, 2, None, None)])
+
+    def test_quadras(self):
+        """Quadras pedidas sem lotes na novaordem voltam vazias (as feições delas saem da camada)"""
+        rotulos = self._ler([2, 3])
+        self.assertEqual(len(rotulos[2]), 4)
+        self.assertEqual(rotulos[3], [])
+
+
+if __name__ == '__main__':
+    unittest.main()
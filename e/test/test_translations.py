@@ -16,7 +16,10 @@ __copyright__ = ('Copyright 2012, Australia Indonesia Facility for '
 import unittest
 import os
 
-from qgis.PyQt.QtCore import QCoreApplication, QTranslator
+try:
+    from qgis.PyQt.QtCore import QCoreApplication, QTranslator
+except ImportError:
+    raise unittest.SkipTest('QGIS indisponível')
 
 QGIS_APP = get_qgis_app()
 
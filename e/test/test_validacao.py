@@ -0,0 +1,99 @@
+# coding=utf-8
+"""Testes da validação da novaordem.
+
+A validação vetorizada requer numpy; a comparação com a validação SQL requer
+um PostgreSQL local descartável em ORGANIZADOR_PG_DSN. Sem eles os testes são pulados.
+"""
+
+import os
+import unittest
+
+from ..lotes import LotesColunares
+from ..provisionamento import provisionar_novaordem
+from ..validacao import (validar_colunas, validar_sql, validar_local, N_ORDEM_DUPLICADO, LACUNA,
+                         MATRICULA_FALTANTE, MATRICULA_SOBRANDO, REGRA_ROTACAO)
+
+DSN = os.environ.get('ORGANIZADOR_PG_DSN')
+ESQUEMA = 'organizador_teste_validacao_%d' % os.getpid()
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+try:
+    import psycopg2
+except ImportError:
+    psycopg2 = None
+
+
+def _dados():
+    """Quadra 1 correta (rotação a partir da ordem 3), quadra 2 com um erro de cada tipo"""
+    lotes = [(10, 1, 1), (11, 1, 2), (12, 1, 3), (13, 1, 4),
+             (20, 2, 1), (21, 2, 2), (22, 2, 3), (23, 2, 4)]
+    novaordem = [(10, 1, 3), (11, 1, 4), (12, 1, 1), (13, 1, 2),
+                 # 23 faltando, 24 sobrando, n_ordem 2 repetido e 3 ausente
+                 (20, 2, 1), (21, 2, 2), (22, 2, 2), (24, 2, 4)]
+    return lotes, novaordem
+
+
+@unittest.skipUnless(numpy, 'numpy indisponível')
+class ValidacaoColunasTest(unittest.TestCase):
+    """Validação vetorizada sobre LotesColunares"""
+
+    def test_quadra_correta(self):
+        lotes, novaordem = _dados()
+        linhas, estatisticas = validar_colunas(LotesColunares.de_tuplas(novaordem[:4]),
+                                               LotesColunares.de_tuplas(lotes[:4]))
+        self.assertEqual(linhas, [])
+        self.assertEqual(estatisticas, {'quadras': 1, 'registros': 4})
+
+    def test_problemas(self):
+        lotes, novaordem = _dados()
+        linhas, _ = validar_colunas(LotesColunares.de_tuplas(novaordem),
+                                    LotesColunares.de_tuplas(lotes))
+        problemas = {(linha[0], linha[1]) for linha in linhas}
+        self.assertEqual(problemas, {(N_ORDEM_DUPLICADO, 2), (LACUNA, 2), (MATRICULA_FALTANTE, 2),
+                                     (MATRICULA_SOBRANDO, 2), (REGRA_ROTACAO, 2)})
+        self.assertIn((MATRICULA_FALTANTE, 2, 23), {tuple(linha[:3]) for linha in linhas})
+        self.assertIn((MATRICULA_SOBRANDO, 2, 24), {tuple(linha[:3]) for linha in linhas})
+
+
+@unittest.skipUnless(DSN and psycopg2 and numpy, 'ORGANIZADOR_PG_DSN/psycopg2/numpy indisponíveis')
+class ValidacaoSqlTest(unittest.TestCase):
+    """validar_sql e validar_colunas dão o mesmo resultado"""
+
+    def setUp(self):
+        self.conn = psycopg2.connect(DSN)
+        provisionar_novaordem(self.conn, esquema=ESQUEMA)
+        lotes, novaordem = _dados()
+        with self.conn, self.conn.cursor() as cursor:
+            cursor.execute('CREATE TABLE %s.lotes (matricula integer, ins_quadra integer, ordem integer)'
+                           % ESQUEMA)
+            cursor.executemany('INSERT INTO %s.lotes VALUES (%%s, %%s, %%s)' % ESQUEMA, lotes)
+            cursor.executemany('INSERT INTO %s.novaordem (matricula, ins_quadra, n_ordem) '
+                               'VALUES (%%s, %%s, %%s)' % ESQUEMA, novaordem)
+        self.lotes, self.novaordem = lotes, novaordem
+
+    def tearDown(self):
+        with self.conn, self.conn.cursor() as cursor:
+            cursor.execute('DROP SCHEMA %s CASCADE' % ESQUEMA)
+        self.conn.close()
+
+    def test_equivalencia(self):
+        sql = validar_sql(self.conn, ESQUEMA + '.lotes', ESQUEMA + '.novaordem')
+        colunas = validar_colunas(LotesColunares.de_tuplas(self.novaordem),
+                                  LotesColunares.de_tuplas(self.lotes))
+        self.assertEqual(sql, colunas)
+
+    def test_local(self):
+        """As tabelas lidas para a máquina (em blocos pequenos) dão o mesmo resultado do SQL"""
+        with self.conn, self.conn.cursor() as cursor:
+            # Lote de uma quadra fora da novaordem: não entra na leitura
+            cursor.execute('INSERT INTO %s.lotes VALUES (30, 3, 1)' % ESQUEMA)
+        self.assertEqual(validar_local(self.conn, ESQUEMA + '.lotes', ESQUEMA + '.novaordem', tamanho_bloco=3),
+                         validar_sql(self.conn, ESQUEMA + '.lotes', ESQUEMA + '.novaordem'))
+
+
+if __name__ == "__main__":
+    unittest.main()
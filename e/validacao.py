@@ -0,0 +1,310 @@
+# -*- coding: utf-8 -*-
+"""
+OrganizadorDeLotes - validação da novaordem
+Confere, em uma única passada sobre todas as quadras já reorganizadas:
+
+- N_ORDEM_DUPLICADO: o mesmo n_ordem mais de uma vez na quadra;
+- LACUNA: valor de 1..N (N = registros da quadra) ausente da sequência;
+- MATRICULA_FALTANTE: lote da camada de origem que não está na novaordem;
+- MATRICULA_SOBRANDO: matrícula da novaordem que não está mais na origem;
+- REGRA_ROTACAO: n_ordem diferente do que a rotação de organizar_ordem_lote
+  daria, tomando como ordem_primeira a ordem do lote com n_ordem = 1.
+
+Há duas implementações com o mesmo resultado: validar_sql (set-based, com
+funções de janela e EXCEPT, no PostgreSQL) e validar_colunas (group-bys
+vetorizados com numpy, para dados locais já carregados em LotesColunares).
+Ambas retornam linhas (problema, ins_quadra, matricula, n_ordem, valor).
+validar_local traz as duas tabelas para LotesColunares (ler_novaordem_colunas,
+ler_lotes_colunas) e valida com validar_colunas, sem carga no servidor além
+da leitura; a origem também pode ser uma camada (e_validacao_algorithm).
+"""
+from .conexao_pg import _psycopg2
+from .instrucoes import identificador
+from .lotes import LotesColunares
+from .ordem import NULO
+from .novaordem import ESQUEMA_NOVAORDEM, TABELA_NOVAORDEM
+from .reorganizacao import CAMPOS_LOTES
+
+N_ORDEM_DUPLICADO = 'n_ordem_duplicado'
+LACUNA = 'lacuna'
+MATRICULA_FALTANTE = 'matricula_faltante'
+MATRICULA_SOBRANDO = 'matricula_sobrando'
+REGRA_ROTACAO = 'regra_rotacao'
+PROBLEMAS = (N_ORDEM_DUPLICADO, LACUNA, MATRICULA_FALTANTE, MATRICULA_SOBRANDO, REGRA_ROTACAO)
+
+# Linhas trazidas do servidor por FETCH na leitura para a validação local
+TAMANHO_BLOCO = 50000
+
+SQL_VALIDACAO = '''
+WITH n AS (
+    SELECT ins_quadra::bigint, matricula::bigint, n_ordem::bigint FROM {tabela}
+),
+l AS (
+    SELECT l.{quadra}::bigint AS ins_quadra, l.{matricula}::bigint AS matricula, l.{ordem}::bigint AS ordem
+    FROM {lotes} l
+    WHERE l.{quadra} IN (SELECT ins_quadra FROM n)
+),
+-- Uma única junção completa resolve faltantes, sobrando e a ordem original de cada lote
+j AS (
+    SELECT coalesce(n.ins_quadra, l.ins_quadra) AS ins_quadra,
+           coalesce(n.matricula, l.matricula) AS matricula,
+           n.n_ordem, l.ordem,
+           n.matricula IS NOT NULL AS na_novaordem,
+           l.matricula IS NOT NULL AS na_origem
+    FROM n FULL JOIN l ON l.ins_quadra = n.ins_quadra AND l.matricula = n.matricula
+),
+-- Todas as janelas compartilham a mesma ordenação (ins_quadra, n_ordem)
+s AS MATERIALIZED (
+    SELECT j.*,
+           count(*) FILTER (WHERE na_novaordem) OVER quadra AS total,
+           min(ordem) FILTER (WHERE na_novaordem AND n_ordem = 1) OVER quadra AS primeira,
+           count(*) FILTER (WHERE na_novaordem) OVER valor AS repeticoes,
+           lag(n_ordem) OVER sequencia AS anterior
+    FROM j
+    WINDOW quadra AS (PARTITION BY ins_quadra),
+           valor AS (PARTITION BY ins_quadra, n_ordem),
+           sequencia AS (PARTITION BY ins_quadra ORDER BY n_ordem)
+),
+rotacao AS (
+    SELECT *, CASE WHEN ordem >= primeira THEN ordem - (primeira - 1)
+                   WHEN ordem < primeira THEN ordem + deslocamento END AS esperado
+    FROM (
+        SELECT ins_quadra, matricula, n_ordem, ordem, primeira,
+               count(*) FILTER (WHERE ordem >= primeira) OVER (PARTITION BY ins_quadra) AS deslocamento
+        FROM s WHERE na_novaordem AND na_origem AND primeira IS NOT NULL
+    ) r
+),
+-- Quadras com menos valores distintos em 1..N do que registros
+lacunosas AS (
+    SELECT ins_quadra, max(total) AS total
+    FROM s WHERE na_novaordem
+    GROUP BY ins_quadra
+    HAVING count(*) FILTER (WHERE n_ordem BETWEEN 1 AND total
+                              AND n_ordem IS DISTINCT FROM anterior) < max(total)
+)
+SELECT DISTINCT %(duplicado)s, ins_quadra, NULL::bigint, n_ordem, repeticoes
+FROM s WHERE na_novaordem AND repeticoes > 1
+UNION ALL
+SELECT %(lacuna)s, ins_quadra, NULL, n_ordem, NULL FROM (
+    SELECT ins_quadra, generate_series(1, total) AS n_ordem FROM lacunosas
+    EXCEPT
+    SELECT ins_quadra, n_ordem FROM s WHERE na_novaordem AND ins_quadra IN (SELECT ins_quadra FROM lacunosas)
+) g
+UNION ALL
+SELECT %(faltante)s, ins_quadra, matricula, NULL, NULL FROM s WHERE NOT na_novaordem
+UNION ALL
+SELECT %(sobrando)s, ins_quadra, matricula, NULL, NULL FROM s WHERE NOT na_origem
+UNION ALL
+SELECT %(regra)s, ins_quadra, matricula, n_ordem, esperado
+FROM rotacao WHERE esperado IS DISTINCT FROM n_ordem
+'''
+
+
+def _numpy():
+    try:
+        import numpy
+    except ImportError as e:
+        raise Exception("A validação local requer numpy (incluído nas instalações do QGIS).") from e
+    return numpy
+
+
+def validar_sql(conn, tabela_lotes, tabela_novaordem=f'{ESQUEMA_NOVAORDEM}.{TABELA_NOVAORDEM}', work_mem='256MB',
+                campos=CAMPOS_LOTES):
+    """Valida a novaordem inteira com uma consulta set-based; retorna (linhas, estatísticas)"""
+    sql = _psycopg2().sql
+    consulta = sql.SQL(SQL_VALIDACAO).format(tabela=identificador(tabela_novaordem),
+                                             lotes=identificador(tabela_lotes),
+                                             **{chave: sql.Identifier(coluna)
+                                                for chave, coluna in campos._asdict().items()})
+    with conn:
+        with conn.cursor() as cursor:
+            # Agregações e EXCEPT sobre a cidade inteira: evita que ordenações e
+            # hashes caiam em disco com o work_mem padrão (4MB)
+            cursor.execute('SET LOCAL work_mem = %s', (work_mem,))
+            # O tempo-limite da sessão é para as instruções por quadra; esta percorre tudo
+            cursor.execute('SET LOCAL statement_timeout = 0')
+            cursor.execute(consulta, {'duplicado': N_ORDEM_DUPLICADO, 'lacuna': LACUNA,
+                                      'faltante': MATRICULA_FALTANTE, 'sobrando': MATRICULA_SOBRANDO,
+                                      'regra': REGRA_ROTACAO})
+            linhas = cursor.fetchall()
+            cursor.execute(sql.SQL('SELECT count(DISTINCT ins_quadra), count(*) FROM {}')
+                           .format(identificador(tabela_novaordem)))
+            quadras, registros = cursor.fetchone()
+    return sorted(linhas, key=_ordenacao), {'quadras': quadras, 'registros': registros}
+
+
+def _ler_colunas(conn, consulta, tamanho_bloco):
+    """LotesColunares das linhas (matricula, ins_quadra, ordem) de 'consulta', por cursor do lado do servidor"""
+    with conn:
+        with conn.cursor() as cursor:
+            cursor.execute('SET LOCAL statement_timeout = 0')
+        with conn.cursor(name='organizador_validacao') as cursor:
+            cursor.itersize = tamanho_bloco
+            cursor.execute(consulta)
+            return LotesColunares.de_tuplas(cursor)
+
+
+def ler_novaordem_colunas(conn, tabela_novaordem=f'{ESQUEMA_NOVAORDEM}.{TABELA_NOVAORDEM}',
+                          tamanho_bloco=TAMANHO_BLOCO):
+    """A novaordem inteira como LotesColunares, com n_ordem na coluna de ordem"""
+    sql = _psycopg2().sql
+    consulta = sql.SQL('SELECT matricula, ins_quadra, n_ordem FROM {}').format(identificador(tabela_novaordem))
+    return _ler_colunas(conn, consulta, tamanho_bloco)
+
+
+def ler_lotes_colunas(conn, tabela_lotes, tabela_novaordem=f'{ESQUEMA_NOVAORDEM}.{TABELA_NOVAORDEM}',
+                      campos=CAMPOS_LOTES, tamanho_bloco=TAMANHO_BLOCO):
+    """Lotes de origem das quadras presentes na novaordem, como LotesColunares"""
+    sql = _psycopg2().sql
+    consulta = sql.SQL('SELECT l.{matricula}, l.{quadra}, l.{ordem} FROM {lotes} l '
+                       'WHERE l.{quadra} IN (SELECT ins_quadra FROM {tabela})').format(
+        lotes=identificador(tabela_lotes), tabela=identificador(tabela_novaordem),
+        **{chave: sql.Identifier(coluna) for chave, coluna in campos._asdict().items()})
+    return _ler_colunas(conn, consulta, tamanho_bloco)
+
+
+def validar_local(conn, tabela_lotes, tabela_novaordem=f'{ESQUEMA_NOVAORDEM}.{TABELA_NOVAORDEM}',
+                  campos=CAMPOS_LOTES, tamanho_bloco=TAMANHO_BLOCO):
+    """Mesmo resultado de validar_sql, com as tabelas lidas para a máquina e validar_colunas"""
+    novaordem = ler_novaordem_colunas(conn, tabela_novaordem, tamanho_bloco)
+    lotes = ler_lotes_colunas(conn, tabela_lotes, tabela_novaordem, campos, tamanho_bloco)
+    return validar_colunas(novaordem, lotes)
+
+
+def _chaves(np, bloco, matriculas, base, largura):
+    """
+    Chave inteira única de (quadra, matrícula): bloco * largura + (matricula - base).
+    Ordenar e comparar int64 é bem mais rápido que arrays estruturados; estes só
+    são usados quando a faixa de matrículas não cabe na chave de 64 bits.
+    """
+    if largura and len(bloco) and (int(bloco.max()) + 1) * largura < 2 ** 62:
+        return bloco.astype(np.int64) * largura + (matriculas - base)
+    chaves = np.empty(len(bloco), dtype=[('q', '<i8'), ('m', '<i8')])
+    chaves['q'] = bloco
+    chaves['m'] = matriculas
+    return chaves
+
+
+def _unicos(np, valores):
+    # Equivalente a np.unique por ordenação: em versões recentes do numpy o
+    # np.unique de inteiros usa tabela hash e fica várias vezes mais lento
+    ordenados = np.sort(valores, kind='stable')
+    if not len(ordenados):
+        return ordenados
+    return ordenados[np.concatenate(([True], ordenados[1:] != ordenados[:-1]))]
+
+
+def _diferenca(np, a, b):
+    """Valores únicos de a que não estão em b (np.setdiff1d por ordenação)"""
+    a, b = _unicos(np, a), _unicos(np, b)
+    if not len(b):
+        return a
+    pos = np.minimum(np.searchsorted(b, a), len(b) - 1)
+    return a[b[pos] != a]
+
+
+def _decodificar(chave, base, largura):
+    if chave.dtype.names:
+        return int(chave['q']), int(chave['m'])
+    return int(chave // largura), int(chave % largura + base)
+
+
+def _nulo(valor):
+    return None if valor == NULO else int(valor)
+
+
+def validar_colunas(novaordem, lotes):
+    """
+    Mesma validação de validar_sql sobre dados locais.
+    novaordem: LotesColunares com n_ordem na coluna de ordem;
+    lotes: LotesColunares da camada de origem (ordem original).
+    """
+    np = _numpy()
+    q = np.frombuffer(novaordem.ins_quadras, dtype=np.int64)
+    m = np.frombuffer(novaordem.matriculas, dtype=np.int64)
+    n = np.frombuffer(novaordem.ordens, dtype=np.int64)
+    linhas = []
+
+    quadras, bloco, totais = np.unique(q, return_inverse=True, return_counts=True)
+    if not len(quadras):
+        return linhas, {'quadras': 0, 'registros': 0}
+
+    # n_ordem duplicado: corridas de (quadra, n_ordem) iguais na ordem lexicográfica
+    indice = np.lexsort((n, q))
+    qs, ns = q[indice], n[indice]
+    inicio = np.concatenate(([True], (qs[1:] != qs[:-1]) | (ns[1:] != ns[:-1])))
+    posicoes = np.flatnonzero(inicio)
+    tamanhos = np.diff(np.append(posicoes, len(qs)))
+    for p, tamanho in zip(posicoes[tamanhos > 1], tamanhos[tamanhos > 1]):
+        linhas.append((N_ORDEM_DUPLICADO, int(qs[p]), None, _nulo(ns[p]), int(tamanho)))
+
+    # Lacunas: chaves bloco*K + n esperadas (1..total) menos as presentes
+    k = int(totais.max()) + 1
+    validos = (n >= 1) & (n <= totais[bloco])
+    presentes = bloco[validos].astype(np.int64) * k + n[validos]
+    esperados_bloco = np.repeat(np.arange(len(quadras), dtype=np.int64), totais)
+    esperados_n = np.arange(len(q), dtype=np.int64) - np.repeat(np.cumsum(totais) - totais, totais) + 1
+    for chave in _diferenca(np, esperados_bloco * k + esperados_n, presentes):
+        linhas.append((LACUNA, int(quadras[chave // k]), None, int(chave % k), None))
+
+    # Matrículas faltantes/sobrando, só nas quadras presentes na novaordem
+    lq = np.frombuffer(lotes.ins_quadras, dtype=np.int64)
+    lm = np.frombuffer(lotes.matriculas, dtype=np.int64)
+    lo = np.frombuffer(lotes.ordens, dtype=np.int64)
+    pos_quadra = np.minimum(np.searchsorted(quadras, lq), len(quadras) - 1)
+    nas_quadras = quadras[pos_quadra] == lq
+    lq, lm, lo = lq[nas_quadras], lm[nas_quadras], lo[nas_quadras]
+    lbloco = pos_quadra[nas_quadras]
+
+    todas = np.concatenate((m, lm))
+    base = int(todas.min())
+    largura = int(todas.max()) - base + 1
+    chaves_n = _chaves(np, bloco, m, base, largura)
+    chaves_l = _chaves(np, lbloco, lm, base, largura)
+    for problema, chaves in ((MATRICULA_FALTANTE, _diferenca(np, chaves_l, chaves_n)),
+                             (MATRICULA_SOBRANDO, _diferenca(np, chaves_n, chaves_l))):
+        for chave in chaves:
+            b, matricula = _decodificar(chave, base, largura)
+            linhas.append((problema, int(quadras[b]), matricula, None, None))
+
+    # Regra de rotação: junção novaordem x lotes pela mesma chave
+    ordenacao_l = np.argsort(chaves_l, kind='stable')
+    ordenadas_l = chaves_l[ordenacao_l]
+    pos = np.searchsorted(ordenadas_l, chaves_n)
+    pos_valida = np.minimum(pos, max(len(ordenadas_l) - 1, 0))
+    casou = (pos < len(ordenadas_l)) & (ordenadas_l[pos_valida] == chaves_n) if len(ordenadas_l) else \
+        np.zeros(len(q), dtype=bool)
+    ordem = np.full(len(q), NULO, dtype=np.int64)
+    ordem[casou] = lo[ordenacao_l[pos_valida[casou]]]
+
+    nulo = ordem == NULO
+    primeira = np.full(len(quadras), np.iinfo(np.int64).max, dtype=np.int64)
+    e_primeiro = casou & (n == 1) & ~nulo
+    np.minimum.at(primeira, bloco[e_primeiro], ordem[e_primeiro])
+    tem_primeira = primeira != np.iinfo(np.int64).max
+    p = primeira[bloco]
+    apos = casou & ~nulo & (ordem >= p)
+    deslocamento = np.bincount(bloco[apos], minlength=len(quadras))[bloco]
+    esperado = np.where(nulo, NULO, np.where(ordem >= p, ordem - (p - 1), ordem + deslocamento))
+    divergente = casou & tem_primeira[bloco] & (esperado != n)
+    for i in np.flatnonzero(divergente):
+        linhas.append((REGRA_ROTACAO, int(q[i]), int(m[i]), _nulo(n[i]), _nulo(esperado[i])))
+
+    return sorted(linhas, key=_ordenacao), {'quadras': len(quadras), 'registros': len(q)}
+
+
+def _ordenacao(linha):
+    return tuple(-1 if valor is None else valor for valor in (PROBLEMAS.index(linha[0]),) + tuple(linha[1:4]))
+
+
+def resumir(linhas, estatisticas, exemplos=5):
+    """Texto de relatório: totais por problema e alguns exemplos de cada"""
+    texto = [f"Quadras verificadas: {estatisticas['quadras']} "
+             f"({estatisticas['registros']} registros na novaordem)"]
+    for problema in PROBLEMAS:
+        do_problema = [linha for linha in linhas if linha[0] == problema]
+        quadras = len({linha[1] for linha in do_problema})
+        texto.append(f"{problema}: {len(do_problema)} ocorrências em {quadras} quadras")
+        for _, ins_quadra, matricula, n_ordem, valor in do_problema[:exemplos]:
+            texto.append(f"    quadra {ins_quadra} matricula {matricula} n_ordem {n_ordem} valor {valor}")
+    return '\n'.join(texto)